@@ -1,403 +1,2744 @@
-# Backend_fft.py
-
-import psycopg2
-import os
-from datetime import date, timedelta
-
-# --- Database Connection ---
-# Replace with your actual PostgreSQL connection details
-DB_NAME = "fitness_tracker"
-DB_USER = "postgres"
-DB_PASS = "root"
-DB_HOST = "localhost"
-DB_PORT = "5432"
-
-def get_db_connection():
-    """Establishes and returns a connection to the PostgreSQL database."""
-    try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS,
-            host=DB_HOST,
-            port=DB_PORT
-        )
-        return conn
-    except psycopg2.OperationalError as e:
-        print(f"Error connecting to the database: {e}")
-        return None
-
-def create_tables():
-    """Creates all necessary tables in the database if they don't already exist."""
-    conn = get_db_connection()
-    if not conn:
-        return
-    
-    commands = (
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            user_id SERIAL PRIMARY KEY,
-            name VARCHAR(255) NOT NULL,
-            email VARCHAR(255) UNIQUE NOT NULL,
-            weight_kg NUMERIC(5, 2),
-            height_cm NUMERIC(5, 2),
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS friends (
-            user_id_1 INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-            user_id_2 INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-            PRIMARY KEY (user_id_1, user_id_2)
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS workouts (
-            workout_id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-            workout_date DATE NOT NULL,
-            duration_minutes INTEGER,
-            calories_burned INTEGER,
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS exercises (
-            exercise_id SERIAL PRIMARY KEY,
-            workout_id INTEGER NOT NULL REFERENCES workouts(workout_id) ON DELETE CASCADE,
-            exercise_name VARCHAR(255) NOT NULL,
-            sets INTEGER,
-            reps INTEGER,
-            weight_kg NUMERIC(6, 2)
-        )
-        """,
-        """
-        CREATE TABLE IF NOT EXISTS goals (
-            goal_id SERIAL PRIMARY KEY,
-            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
-            goal_description TEXT NOT NULL,
-            target_value NUMERIC,
-            start_date DATE NOT NULL,
-            end_date DATE NOT NULL,
-            status VARCHAR(50) DEFAULT 'Active'
-        )
-        """
-    )
-    
-    try:
-        with conn.cursor() as cur:
-            for command in commands:
-                cur.execute(command)
-        conn.commit()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error creating tables: {error}")
-    finally:
-        if conn:
-            conn.close()
-
-# --- CRUD Operations ---
-
-# CREATE
-def add_user(name, email, weight, height):
-    """Adds a new user to the database."""
-    sql = "INSERT INTO users(name, email, weight_kg, height_cm) VALUES(%s, %s, %s, %s) RETURNING user_id;"
-    conn = get_db_connection()
-    user_id = None
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (name, email, weight, height))
-            user_id = cur.fetchone()[0]
-            conn.commit()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error adding user: {error}")
-    finally:
-        if conn:
-            conn.close()
-    return user_id
-
-def log_workout(user_id, workout_date, duration, calories, exercises):
-    """Logs a new workout and its associated exercises."""
-    workout_sql = "INSERT INTO workouts(user_id, workout_date, duration_minutes, calories_burned) VALUES(%s, %s, %s, %s) RETURNING workout_id;"
-    exercise_sql = "INSERT INTO exercises(workout_id, exercise_name, sets, reps, weight_kg) VALUES(%s, %s, %s, %s, %s);"
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(workout_sql, (user_id, workout_date, duration, calories))
-            workout_id = cur.fetchone()[0]
-            for ex in exercises:
-                cur.execute(exercise_sql, (workout_id, ex['name'], ex['sets'], ex['reps'], ex['weight']))
-            conn.commit()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error logging workout: {error}")
-    finally:
-        if conn:
-            conn.close()
-
-def add_friend(user_id, friend_id):
-    """Connects two users as friends."""
-    sql = "INSERT INTO friends(user_id_1, user_id_2) VALUES(%s, %s);"
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            # Insert both ways to make querying easier
-            cur.execute(sql, (user_id, friend_id))
-            cur.execute(sql, (friend_id, user_id))
-            conn.commit()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error adding friend: {error}")
-    finally:
-        if conn:
-            conn.close()
-
-def set_goal(user_id, description, target_value, start_date, end_date):
-    """Sets a new fitness goal for a user."""
-    sql = "INSERT INTO goals(user_id, goal_description, target_value, start_date, end_date) VALUES(%s, %s, %s, %s, %s);"
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (user_id, description, target_value, start_date, end_date))
-            conn.commit()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error setting goal: {error}")
-    finally:
-        if conn:
-            conn.close()
-
-# READ
-def get_all_users():
-    """Retrieves all users from the database."""
-    conn = get_db_connection()
-    users = []
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT user_id, name, email FROM users ORDER BY name;")
-            users = cur.fetchall()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error fetching users: {error}")
-    finally:
-        if conn:
-            conn.close()
-    return users
-    
-def get_user_profile(user_id):
-    """Retrieves a specific user's profile."""
-    conn = get_db_connection()
-    user = None
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT name, email, weight_kg, height_cm FROM users WHERE user_id = %s;", (user_id,))
-            user = cur.fetchone()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error fetching user profile: {error}")
-    finally:
-        if conn:
-            conn.close()
-    return user
-
-def get_user_workouts(user_id):
-    """Retrieves all workouts for a specific user."""
-    sql = """
-        SELECT workout_id, workout_date, duration_minutes, calories_burned 
-        FROM workouts 
-        WHERE user_id = %s 
-        ORDER BY workout_date DESC;
-    """
-    conn = get_db_connection()
-    workouts = []
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
-            workouts = cur.fetchall()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error fetching workouts: {error}")
-    finally:
-        if conn:
-            conn.close()
-    return workouts
-
-def get_workout_details(workout_id):
-    """Retrieves all exercises for a specific workout."""
-    sql = "SELECT exercise_name, sets, reps, weight_kg FROM exercises WHERE workout_id = %s;"
-    conn = get_db_connection()
-    exercises = []
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (workout_id,))
-            exercises = cur.fetchall()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error fetching workout details: {error}")
-    finally:
-        if conn:
-            conn.close()
-    return exercises
-
-def get_user_friends(user_id):
-    """Retrieves all friends for a specific user."""
-    sql = """
-        SELECT u.user_id, u.name 
-        FROM users u
-        JOIN friends f ON u.user_id = f.user_id_2
-        WHERE f.user_id_1 = %s
-        ORDER BY u.name;
-    """
-    conn = get_db_connection()
-    friends = []
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
-            friends = cur.fetchall()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error fetching friends: {error}")
-    finally:
-        if conn:
-            conn.close()
-    return friends
-
-def get_user_goals(user_id):
-    """Retrieves all goals for a specific user."""
-    sql = "SELECT goal_id, goal_description, target_value, start_date, end_date, status FROM goals WHERE user_id = %s;"
-    conn = get_db_connection()
-    goals = []
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (user_id,))
-            goals = cur.fetchall()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error fetching goals: {error}")
-    finally:
-        if conn:
-            conn.close()
-    return goals
-
-# UPDATE
-def update_user_profile(user_id, name, email, weight, height):
-    """Updates a user's profile information."""
-    sql = "UPDATE users SET name = %s, email = %s, weight_kg = %s, height_cm = %s WHERE user_id = %s;"
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (name, email, weight, height, user_id))
-            conn.commit()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error updating profile: {error}")
-    finally:
-        if conn:
-            conn.close()
-
-# DELETE
-def remove_friend(user_id, friend_id):
-    """Removes a friend connection."""
-    sql = "DELETE FROM friends WHERE (user_id_1 = %s AND user_id_2 = %s) OR (user_id_1 = %s AND user_id_2 = %s);"
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (user_id, friend_id, friend_id, user_id))
-            conn.commit()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error removing friend: {error}")
-    finally:
-        if conn:
-            conn.close()
-            
-# --- Business Insights & Leaderboard ---
-
-def get_user_dashboard_stats(user_id):
-    """Calculates key fitness statistics for the user's dashboard."""
-    stats = {}
-    conn = get_db_connection()
-    try:
-        with conn.cursor() as cur:
-            # COUNT: Total workouts
-            cur.execute("SELECT COUNT(*) FROM workouts WHERE user_id = %s;", (user_id,))
-            stats['total_workouts'] = cur.fetchone()[0]
-            
-            # SUM: Total workout minutes
-            cur.execute("SELECT SUM(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
-            stats['total_minutes'] = cur.fetchone()[0] or 0
-
-            # AVG: Average workout duration
-            cur.execute("SELECT AVG(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
-            stats['avg_duration'] = cur.fetchone()[0] or 0
-
-            # MAX: Longest workout
-            cur.execute("SELECT MAX(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
-            stats['max_duration'] = cur.fetchone()[0] or 0
-
-            # MIN: Shortest workout
-            cur.execute("SELECT MIN(duration_minutes) FROM workouts WHERE user_id = %s;", (user_id,))
-            stats['min_duration'] = cur.fetchone()[0] or 0
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error fetching dashboard stats: {error}")
-    finally:
-        if conn:
-            conn.close()
-    return stats
-
-def get_weekly_leaderboard(user_id):
-    """Generates a leaderboard of the user and their friends based on total workout minutes this week."""
-    # The user and their friends
-    friend_ids = [friend[0] for friend in get_user_friends(user_id)]
-    user_and_friends_ids = tuple(friend_ids + [user_id])
-    
-    today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
-    
-    sql = """
-        SELECT u.name, SUM(w.duration_minutes) as total_minutes
-        FROM users u
-        JOIN workouts w ON u.user_id = w.user_id
-        WHERE u.user_id IN %s AND w.workout_date >= %s
-        GROUP BY u.name
-        ORDER BY total_minutes DESC;
-    """
-    
-    leaderboard = []
-    conn = get_db_connection()
-    # Ensure there's at least one ID to prevent SQL error with empty IN clause
-    if not user_and_friends_ids:
-        return []
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, (user_and_friends_ids, start_of_week))
-            leaderboard = cur.fetchall()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print(f"Error fetching leaderboard: {error}")
-    finally:
-        if conn:
-            conn.close()
-    return leaderboard
-
-
-# --- Initial Data Seeding (for demonstration) ---
-def seed_data():
-    """Adds some initial data to the database for demonstration purposes."""
-    if not get_all_users(): # Only seed if users table is empty
-        print("Seeding initial data...")
-        # Users
-        u1 = add_user("Alice", "alice@email.com", 60.5, 165)
-        u2 = add_user("Bob", "bob@email.com", 85.0, 180)
-        u3 = add_user("Charlie", "charlie@email.com", 72.3, 175)
-        
-        # Friendships (Alice is friends with Bob and Charlie)
-        add_friend(u1, u2)
-        add_friend(u1, u3)
-        
-        # Workouts
-        today = date.today()
-        # Alice's Workouts
-        log_workout(u1, today - timedelta(days=1), 60, 300, [{'name': 'Squat', 'sets': 3, 'reps': 10, 'weight': 50}])
-        log_workout(u1, today - timedelta(days=3), 45, 250, [{'name': 'Bench Press', 'sets': 3, 'reps': 8, 'weight': 60}])
-        # Bob's Workouts
-        log_workout(u2, today - timedelta(days=2), 90, 500, [{'name': 'Deadlift', 'sets': 5, 'reps': 5, 'weight': 120}])
-        # Charlie's Workouts
-        log_workout(u3, today, 75, 400, [{'name': 'Running', 'sets': 1, 'reps': 1, 'weight': 0}])
-        
-        # Goals for Alice
-        set_goal(u1, "Workout 3 times this week", 3, today - timedelta(days=today.weekday()), today + timedelta(days=6-today.weekday()))
-        print("Seeding complete.")
-
-
-# Main execution
-if __name__ == "__main__":
-    create_tables()
-    seed_data()
\ No newline at end of file
+# Backend_fft.py
+
+import psycopg2
+import atexit
+import csv
+import io
+import itertools
+import logging
+import numbers
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+import numpy as np
+from psycopg2.extras import execute_values
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency, only needed for Parquet export
+    pa = pq = None
+
+import calories
+import columnar
+import config
+import instrumentation
+import migrations
+from db_pool import ConnectionPool
+from instrumentation import instrumented, page_scope
+from read_cache import ReadCache
+from write_behind import WriteBehindQueue
+
+logger = logging.getLogger("fitness.backend")
+
+# --- Database Connection ---
+# Connection settings and pool sizes come from config.py (environment variables
+# with local development defaults). A single process-wide pool is shared by every
+# backend function so a page render reuses connections instead of reconnecting.
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the shared connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    **config.POOL_SETTINGS, **config.DB_SETTINGS,
+                    cursor_factory=instrumentation.InstrumentedCursor,
+                )
+    return _pool
+
+@contextmanager
+def db_connection():
+    """Checks a connection out of the pool for the duration of a `with` block.
+
+    Uncommitted work is rolled back when the connection is returned. The time
+    spent waiting for the connection is recorded by the instrumentation layer.
+    """
+    started = time.perf_counter()
+    with get_pool().connection() as conn:
+        instrumentation.record_acquire(time.perf_counter() - started)
+        yield conn
+
+def get_pool_stats():
+    """Returns connection pool usage counters (in use, idle, waits, wait time)."""
+    return get_pool().stats()
+
+def _report_error(message, error):
+    """Logs a backend error and counts it against the calling function."""
+    instrumentation.record_error()
+    logger.error("%s: %s", message, error)
+
+def close_pool():
+    """Closes every pooled connection, e.g. on application shutdown."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+# --- Read Cache ---
+# Hot read functions are served from an in-process cache. Every write function
+# invalidates the entries it makes stale right after committing, so changes
+# made through this module are visible immediately.
+
+# Page bundles and the entities each is built from; a write that drops a source
+# entity drops the page too
+_PAGE_ENTITIES = {
+    'insights_page': ('dashboard', 'records', 'activity', 'exercises'),
+    'history_page': ('dashboard', 'exercises'),
+    'social_page': ('friends', 'suggestions', 'leaderboard'),
+}
+_cache = ReadCache(**config.CACHE_SETTINGS, derived=_PAGE_ENTITIES)
+# @_cached(entity) caches a read scoped by its first argument, the user_id
+_cached = _cache.cached
+
+def get_cache_stats():
+    """Returns read cache hit/miss/eviction/invalidation counters."""
+    return _cache.stats()
+
+def clear_cache():
+    """Drops every cached read, e.g. after editing the database by hand."""
+    _cache.clear()
+
+# --- Instrumentation ---
+# Every public function below is wrapped with @instrumented, and every pooled
+# connection uses an instrumented cursor, so each statement's fingerprint,
+# duration and row count is attributed to the backend call that ran it. The
+# frontend wraps each page render in page_scope(name) (re-exported here) to get
+# per-page totals checked against the budgets in config.INSTRUMENTATION_SETTINGS.
+
+def get_metrics_text():
+    """Returns backend and page metrics in the Prometheus text format."""
+    return instrumentation.export_prometheus()
+
+def get_query_stats():
+    """Returns per-fingerprint query totals (calls, total/max ms, rows), most expensive first."""
+    return instrumentation.query_stats()
+
+# --- Schema Setup ---
+# The schema is managed by the versioned migrations in migrations.py. They are
+# applied once per process; later calls to ensure_schema() return immediately.
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+@instrumented
+def ensure_schema():
+    """Applies pending migrations the first time it is called in this process."""
+    global _schema_ready
+    if _schema_ready:
+        return True
+    with _schema_lock:
+        if _schema_ready:
+            return True
+        try:
+            with db_connection() as conn:
+                applied = migrations.migrate(conn)
+                _create_partitions(conn)
+            if applied:
+                logger.info("Applied schema migrations: %s", ", ".join(map(str, applied)))
+            _schema_ready = True
+        except (Exception, psycopg2.DatabaseError) as error:
+            _report_error("Error migrating schema", error)
+    return _schema_ready
+
+def create_tables():
+    """Creates or upgrades all tables by applying any pending migrations."""
+    global _schema_ready
+    _schema_ready = False
+    return ensure_schema()
+
+@instrumented
+def get_pending_migrations():
+    """Lists (version, description) for migrations that have not been applied yet."""
+    pending = []
+    try:
+        with db_connection() as conn:
+            pending = migrations.pending_migrations(conn)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error reading schema version", error)
+    return pending
+
+# Workouts and exercises are partitioned by month (migration 6). Each process
+# keeps PARTITION_SETTINGS['months_ahead'] months created in advance, and writers
+# create any other month they touch (e.g. backdated imports) just before writing.
+_known_partitions = set()
+
+def _create_partitions(conn, start=None, end=None):
+    """Creates the monthly partitions for [start, end] and commits. Returns the count created."""
+    today = date.today()
+    start = _parse_date(start) if start else today
+    if end:
+        end = _parse_date(end)
+    else:
+        months = today.year * 12 + today.month - 1 + config.PARTITION_SETTINGS["months_ahead"]
+        end = date(months // 12, months % 12 + 1, 1)
+    with conn.cursor() as cur:
+        cur.execute("SELECT ensure_workout_partitions(%s, %s);", (start, end))
+        created = cur.fetchone()[0]
+    conn.commit()
+    return created
+
+def _ensure_partitions(conn, days):
+    """Makes sure the partitions for every month in `days` exist before a write.
+
+    Months already seen by this process cost nothing. Missing partitions are
+    created and committed on their own, before the caller's write transaction,
+    so the brief lock on the parent tables is not held for a whole batch.
+    """
+    months = {day.replace(day=1) for day in days} - _known_partitions
+    if not months:
+        return
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT m::date FROM unnest(%s::date[]) AS m
+            WHERE to_regclass('workouts_' || to_char(m, '"y"YYYY"m"MM')) IS NOT NULL
+              AND to_regclass('exercises_' || to_char(m, '"y"YYYY"m"MM')) IS NOT NULL;
+        """, (sorted(months),))
+        existing = {row[0] for row in cur.fetchall()}
+        for month in sorted(months - existing):
+            cur.execute("SELECT ensure_workout_partitions(%s, %s);", (month, month))
+    conn.commit()
+    _known_partitions.update(months)
+
+@instrumented
+def create_partitions(start=None, end=None):
+    """Creates monthly workout partitions from `start` (default: this month) through
+    `end` (default: PARTITION_SETTINGS['months_ahead'] months ahead).
+
+    Run it on a schedule (`python manage.py create-partitions`) so long-lived
+    processes never have to create a partition on the write path.
+    Returns the number of months created, or None on error.
+    """
+    created = None
+    try:
+        with db_connection() as conn:
+            created = _create_partitions(conn, start, end)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error creating workout partitions", error)
+    return created
+
+_bootstrapped = False
+
+def bootstrap():
+    """One-time process startup: migrates the schema and seeds demo data if empty.
+
+    Cheap to call on every Streamlit rerun; only the first call does any work.
+    """
+    global _bootstrapped
+    if not _bootstrapped and ensure_schema():
+        seed_data()
+        _bootstrapped = True
+
+# --- CRUD Operations ---
+
+# CREATE
+@instrumented
+def add_user(name, email, weight, height):
+    """Adds a new user to the database."""
+    sql = "INSERT INTO users(name, email, weight_kg, height_cm) VALUES(%s, %s, %s, %s) RETURNING user_id;"
+    user_id = None
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (name, email, weight, height))
+            user_id = cur.fetchone()[0]
+            conn.commit()
+        _cache.invalidate('users')
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error adding user", error)
+    return user_id
+
+def _parse_date(value):
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip()[:10])
+
+def _optional_int(value, field):
+    if value is None or value == "":
+        return None
+    number = int(float(value))
+    if number < 0:
+        raise ValueError(f"{field} must not be negative")
+    return number
+
+def _normalize_workout(record):
+    """Validates a workout record and returns it in the canonical dict shape.
+
+    Accepts both the log_workout keyword names (duration, calories, name, weight)
+    and the column names (duration_minutes, calories_burned, exercise_name,
+    weight_kg). Raises ValueError describing the first problem found.
+    """
+    if not isinstance(record, dict):
+        raise ValueError(f"not a workout record: {record}")
+    try:
+        user_id = int(record["user_id"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("user_id is missing or not an integer")
+    if user_id <= 0:
+        raise ValueError("user_id must be positive")
+    try:
+        workout_date = _parse_date(record["workout_date"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("workout_date is missing or not an ISO date (YYYY-MM-DD)")
+
+    exercises = []
+    for position, ex in enumerate(record.get("exercises") or [], start=1):
+        name = str(ex.get("name", ex.get("exercise_name")) or "").strip()
+        if not name:
+            raise ValueError(f"exercise #{position} has no name")
+        if len(name) > 255:
+            raise ValueError(f"exercise #{position} name is longer than 255 characters")
+        weight = ex.get("weight", ex.get("weight_kg"))
+        exercises.append({
+            "name": name,
+            "sets": _optional_int(ex.get("sets"), "sets"),
+            "reps": _optional_int(ex.get("reps"), "reps"),
+            "weight": float(weight) if weight not in (None, "") else None,
+        })
+
+    return {
+        "user_id": user_id,
+        "workout_date": workout_date,
+        "duration": _optional_int(record.get("duration", record.get("duration_minutes")), "duration"),
+        "calories": _optional_int(record.get("calories", record.get("calories_burned")), "calories"),
+        "exercises": exercises,
+    }
+
+def _reserve_ids(cur, table, column, count):
+    """Draws `count` ids from a SERIAL column's sequence in one round trip."""
+    cur.execute(
+        "SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s);",
+        (table, column, count),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+def _copy_rows(cur, table, columns, rows):
+    """Streams rows into a table with COPY ... FROM STDIN (CSV format, empty = NULL)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow(["" if value is None else value for value in row])
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+# Looks up (creating when missing) the catalog entry of each distinct exercise
+# name: aliases first, then the entry whose normalized name matches
+_CATALOG_IDS_SQL = """
+    WITH input AS (
+        SELECT DISTINCT name, normalize_exercise_name(name) AS key FROM unnest(%s::text[]) AS name
+    ),
+    known AS (
+        SELECT i.name, i.key, COALESCE(a.catalog_id, c.catalog_id) AS catalog_id
+        FROM input i
+        LEFT JOIN exercise_aliases a ON a.alias = i.key
+        LEFT JOIN exercise_catalog c ON c.normalized_name = i.key
+    ),
+    created AS (
+        INSERT INTO exercise_catalog (name, normalized_name)
+        SELECT DISTINCT ON (key) regexp_replace(btrim(name), '\\s+', ' ', 'g'), key
+        FROM known WHERE catalog_id IS NULL
+        ORDER BY key, name
+        ON CONFLICT (normalized_name) DO NOTHING
+        RETURNING catalog_id, normalized_name
+    )
+    SELECT k.name, COALESCE(k.catalog_id, c.catalog_id)
+    FROM known k
+    LEFT JOIN created c ON c.normalized_name = k.key;
+"""
+
+def _catalog_ids(cur, names):
+    """Returns {name: catalog_id} for exercise names, adding unknown exercises to the catalog."""
+    ids = {}
+    pending = sorted(set(names))
+    while pending:
+        cur.execute(_CATALOG_IDS_SQL, (pending,))
+        ids.update((name, catalog_id) for name, catalog_id in cur.fetchall() if catalog_id is not None)
+        # A name another transaction added concurrently comes back without an
+        # id (ON CONFLICT DO NOTHING); the next statement sees its entry
+        pending = [name for name in pending if name not in ids]
+    return ids
+
+def _needs_calorie_estimate(workout):
+    # Logged without calories (the form's default of 0 counts as none) but with a duration
+    return not workout["calories"] and bool(workout["duration"]) and not workout.get("calories_estimated")
+
+def _estimate_missing_calories(workouts, weights):
+    """Fills in estimated calories for normalized workouts logged without them.
+
+    `weights` maps user_id to weight_kg. Estimated workouts get
+    calories_estimated=True; see calories.py for the estimate.
+    """
+    pending = [w for w in workouts if _needs_calorie_estimate(w)]
+    if not pending:
+        return
+    positions = [position for position, w in enumerate(pending) for _ in w["exercises"]]
+    estimates = calories.estimate_workouts(
+        [w["duration"] for w in pending],
+        [float(weights[w["user_id"]]) if weights.get(w["user_id"]) is not None else np.nan for w in pending],
+        positions,
+        [ex["name"] for w in pending for ex in w["exercises"]],
+        [ex["sets"] if ex["sets"] is not None else np.nan for w in pending for ex in w["exercises"]],
+        config.CALORIE_SETTINGS['default_weight_kg'],
+    )
+    for w, estimate in zip(pending, estimates.tolist()):
+        w["calories"] = estimate
+        w["calories_estimated"] = True
+
+def _fill_missing_calories(cur, workouts):
+    """Estimates calories for the workouts logged without them, when CALORIE_SETTINGS enables it."""
+    if not config.CALORIE_SETTINGS['estimate_on_log']:
+        return
+    user_ids = sorted({w["user_id"] for w in workouts if _needs_calorie_estimate(w)})
+    if user_ids:
+        cur.execute("SELECT user_id, weight_kg FROM users WHERE user_id = ANY(%s);", (user_ids,))
+        _estimate_missing_calories(workouts, dict(cur.fetchall()))
+
+def _insert_workouts(cur, workouts, use_copy=False):
+    """Inserts normalized workouts and their exercises on an open cursor.
+
+    Workout ids are reserved from the sequence up front (unless the workout
+    dicts already carry one), so every exercise row is tied to its workout
+    without relying on RETURNING order. Workouts without calories get an
+    estimate (see _fill_missing_calories). Small writes use multi-row VALUES;
+    bulk loads pass use_copy=True. Returns the new workout ids. Committing is
+    left to the caller, as is calling _ensure_partitions first.
+    """
+    if not workouts:
+        return []
+    _fill_missing_calories(cur, workouts)
+    missing = sum(1 for w in workouts if w.get("workout_id") is None)
+    reserved = iter(_reserve_ids(cur, "workouts", "workout_id", missing) if missing else ())
+    workout_ids = [w.get("workout_id") or next(reserved) for w in workouts]
+    workout_rows = [
+        (workout_id, w["user_id"], w["workout_date"], w["duration"], w["calories"], w.get("calories_estimated", False))
+        for workout_id, w in zip(workout_ids, workouts)
+    ]
+    catalog_ids = _catalog_ids(cur, [ex["name"] for w in workouts for ex in w["exercises"]])
+    exercise_rows = [
+        (workout_id, w["workout_date"], w["user_id"], catalog_ids[ex["name"]], ex["sets"], ex["reps"], ex["weight"])
+        for workout_id, w in zip(workout_ids, workouts)
+        for ex in w["exercises"]
+    ]
+    workout_columns = (
+        "workout_id", "user_id", "workout_date", "duration_minutes", "calories_burned", "calories_estimated",
+    )
+    exercise_columns = ("workout_id", "workout_date", "user_id", "catalog_id", "sets", "reps", "weight_kg")
+    if use_copy:
+        _copy_rows(cur, "workouts", workout_columns, workout_rows)
+        if exercise_rows:
+            _copy_rows(cur, "exercises", exercise_columns, exercise_rows)
+    else:
+        execute_values(cur, f"INSERT INTO workouts({', '.join(workout_columns)}) VALUES %s;", workout_rows)
+        if exercise_rows:
+            execute_values(cur, f"INSERT INTO exercises({', '.join(exercise_columns)}) VALUES %s;", exercise_rows)
+    _apply_rollup_deltas(cur, workouts, sign=1)
+    _apply_activity(cur, workouts, sign=1)
+    _apply_personal_records(cur, exercise_rows)
+    return workout_ids
+
+# Cached entities derived from a user's workouts
+_WORKOUT_ENTITIES = ('dashboard', 'goals', 'exercises', 'records', 'activity')
+
+def _invalidate_workout_reads(*user_ids, cache=_cache):
+    """Drops cached reads derived from workouts after a workout write commits.
+
+    A user's workouts also move their friends' leaderboards, so leaderboard
+    entries are dropped for everyone. `cache` is the engine's read cache.
+    """
+    for entity in _WORKOUT_ENTITIES:
+        cache.invalidate(entity, *user_ids)
+    cache.invalidate('leaderboard')
+
+# --- Write-Behind Logging ---
+# With FITNESS_WRITE_BEHIND=1, log_workout validates the workout, gives it an id
+# from a block reserved in advance and queues it; a background thread commits
+# queued workouts in batches (see write_behind.py). The id is returned at once,
+# but the workout only becomes visible to reads once its batch commits, so call
+# flush_workout_writes() where a caller must read its own write.
+
+class _WorkoutWriter:
+    """An engine's write-behind queue, started on first use, and its reserved workout ids.
+
+    `engine` is the backend module (this one or sqlite_backend) whose
+    db_connection, _reserve_ids, _bulk_insert_batch and _report_error it uses.
+    """
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._queue = None
+        self._lock = threading.Lock()
+        self._reserved_ids = []
+
+    def put(self, workout):
+        """Gives a normalized workout its id and queues it; returns the id."""
+        workout['workout_id'] = self._next_id()
+        self._get_queue().put(workout)
+        return workout['workout_id']
+
+    def flush(self, timeout=None):
+        return self._queue.flush(timeout) if self._queue is not None else True
+
+    def stats(self):
+        return self._queue.stats() if self._queue is not None else None
+
+    def _get_queue(self):
+        if self._queue is None:
+            with self._lock:
+                if self._queue is None:
+                    settings = config.WRITE_BEHIND_SETTINGS
+                    self._queue = WriteBehindQueue(
+                        instrumented(self._write_queued_workouts), max_size=settings['max_queue'],
+                        batch_size=settings['batch_size'], flush_interval=settings['flush_interval'],
+                        put_timeout=settings['put_timeout'],
+                    )
+                    # Queued workouts are written before the process exits
+                    atexit.register(self._queue.shutdown, settings['shutdown_timeout'])
+        return self._queue
+
+    def _next_id(self):
+        # Ids come from the workouts sequence a batch at a time, so queueing a
+        # workout needs a database round trip only once per batch_size workouts
+        with self._lock:
+            if not self._reserved_ids:
+                with self._engine.db_connection() as conn, conn.cursor() as cur:
+                    ids = self._engine._reserve_ids(
+                        cur, "workouts", "workout_id", config.WRITE_BEHIND_SETTINGS['batch_size'],
+                    )
+                    conn.commit()
+                self._reserved_ids.extend(reversed(ids))
+            return self._reserved_ids.pop()
+
+    def _write_queued_workouts(self, workouts):
+        """Commits one batch of queued workouts; logs and returns the number the database refused."""
+        report = {'workouts_inserted': 0, 'exercises_inserted': 0, 'rejected': []}
+        with self._engine.db_connection() as conn:
+            self._engine._bulk_insert_batch(conn, list(enumerate(workouts)), report)
+        for item in report['rejected']:
+            workout_id = workouts[item['index']]['workout_id']
+            self._engine._report_error(f"Queued workout {workout_id} was not saved", item['error'])
+        return len(report['rejected'])
+
+_writer = _WorkoutWriter(sys.modules[__name__])
+
+@instrumented
+def flush_workout_writes(timeout=None):
+    """Waits until every queued workout is committed; returns False on timeout or a failed batch."""
+    return _writer.flush(timeout)
+
+def get_write_queue_stats():
+    """Returns write-behind queue depth, batch and commit latency counters (None when unused)."""
+    return _writer.stats()
+
+@instrumented
+def log_workout(user_id, workout_date, duration, calories, exercises):
+    """Logs a new workout and its associated exercises. Returns the new workout_id.
+
+    In write-behind mode (config.WRITE_BEHIND_SETTINGS) the workout is queued
+    and committed shortly afterwards; the returned id is the one it will have.
+    """
+    workout_id = None
+    try:
+        workout = _normalize_workout({
+            "user_id": user_id, "workout_date": workout_date,
+            "duration": duration, "calories": calories, "exercises": exercises,
+        })
+        if config.WRITE_BEHIND_SETTINGS['enabled']:
+            return _writer.put(workout)
+        with db_connection() as conn:
+            _ensure_partitions(conn, [workout['workout_date']])
+            with conn.cursor() as cur:
+                workout_id = _insert_workouts(cur, [workout])[0]
+            conn.commit()
+        _invalidate_workout_reads(workout['user_id'])
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error logging workout", error)
+    return workout_id
+
+def _suggestion_scopes(cur, user_id, friend_id):
+    """Returns the users whose friend suggestions change when the two users (un)friend.
+
+    Suggestions are friends of friends, so besides the two users themselves
+    every friend of either one gains or loses a candidate.
+    """
+    cur.execute("SELECT user_id_2 FROM friends WHERE user_id_1 IN (%s, %s);", (user_id, friend_id))
+    return {user_id, friend_id, *(row[0] for row in cur.fetchall())}
+
+@instrumented
+def add_friend(user_id, friend_id):
+    """Connects two users as friends."""
+    sql = "INSERT INTO friends(user_id_1, user_id_2) VALUES(%s, %s);"
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            # Insert both ways to make querying easier
+            cur.execute(sql, (user_id, friend_id))
+            cur.execute(sql, (friend_id, user_id))
+            scopes = _suggestion_scopes(cur, user_id, friend_id)
+            conn.commit()
+        _cache.invalidate('friends', user_id, friend_id)
+        _cache.invalidate('leaderboard', user_id, friend_id)
+        _cache.invalidate('suggestions', *scopes)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error adding friend", error)
+
+@instrumented
+def set_goal(user_id, description, target_value, start_date, end_date, metric='workouts'):
+    """Sets a new fitness goal for a user.
+
+    `metric` is what counts towards `target_value` between the start and end
+    dates: 'workouts' (number of sessions), 'minutes' or 'calories'.
+    """
+    if metric not in GOAL_METRICS:
+        raise ValueError(f"metric must be one of {', '.join(GOAL_METRICS)}")
+    sql = """
+        INSERT INTO goals(user_id, goal_description, target_value, start_date, end_date, goal_metric)
+        VALUES(%s, %s, %s, %s, %s, %s);
+    """
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id, description, target_value, start_date, end_date, metric))
+            conn.commit()
+        _cache.invalidate('goals', user_id)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error setting goal", error)
+
+# READ
+# List reads take as_frame=True to return a pandas DataFrame instead of a list of
+# tuples. The frame is built column by column from the cursor (see columnar.py),
+# with NUMERIC columns as floats and dates as datetime64, so large results skip
+# the per-row Python objects. Column names and dtypes are declared next to each
+# query; integer columns that may be NULL are float64.
+
+def _fetch_all(cur, sql, params, columns, as_frame):
+    """Runs a read query and returns all rows, as tuples or as a DataFrame typed by `columns`."""
+    if as_frame:
+        return columnar.read_frame(cur, sql, params, columns)
+    cur.execute(sql, params)
+    return cur.fetchall()
+
+def _no_rows(columns, as_frame):
+    return columnar.empty_frame(columns) if as_frame else []
+
+_USERS_COLUMNS = {'user_id': 'int64', 'name': 'object', 'email': 'object'}
+
+@instrumented
+@_cached('users')
+def get_all_users(*, as_frame=False):
+    """Retrieves all users from the database."""
+    users = _no_rows(_USERS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            users = _fetch_all(cur, "SELECT user_id, name, email FROM users ORDER BY name;", None, _USERS_COLUMNS, as_frame)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching users", error)
+    return users
+    
+# Read queries shared with async_backend.py, which runs them on asyncpg
+_PROFILE_SQL = "SELECT name, email, weight_kg, height_cm FROM users WHERE user_id = %s;"
+
+@instrumented
+@_cached('profile')
+def get_user_profile(user_id):
+    """Retrieves a specific user's profile."""
+    user = None
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_PROFILE_SQL, (user_id,))
+            user = cur.fetchone()
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching user profile", error)
+    return user
+
+_USER_WORKOUTS_SQL = """
+    SELECT workout_id, workout_date, duration_minutes, calories_burned 
+    FROM workouts 
+    WHERE user_id = %s 
+    ORDER BY workout_date DESC, workout_id DESC
+    LIMIT %s;
+"""
+_WORKOUT_COLUMNS = {
+    'workout_id': 'int64', 'workout_date': 'datetime64[D]', 'duration_minutes': 'float64', 'calories_burned': 'float64',
+}
+
+@instrumented
+def get_user_workouts(user_id, limit=None, *, as_frame=False):
+    """Retrieves workouts for a specific user, newest first (all of them unless `limit` is given)."""
+    workouts = _no_rows(_WORKOUT_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            workouts = _fetch_all(cur, _USER_WORKOUTS_SQL, (user_id, limit), _WORKOUT_COLUMNS, as_frame)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error fetching workouts", error)
+    return workouts
+
+_WORKOUT_DETAILS_SQL = """
+    SELECT c.name AS exercise_name, e.sets, e.reps, e.weight_kg
+    FROM exercises e
+    JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+    WHERE e.workout_id = %s
+    ORDER BY e.exercise_id;
+"""
+_EXERCISE_COLUMNS = {'exercise_name': 'object', 'sets': 'float64', 'reps': 'float64', 'weight_kg': 'float64'}
+
+@instrumented
+def get_workout_details(workout_id, *, as_frame=False):
+    """Retrieves all exercises for a specific workout."""
+    exercises = _no_rows(_EXERCISE_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            exercises = _fetch_all(cur, _WORKOUT_DETAILS_SQL, (workout_id,), _EXERCISE_COLUMNS, as_frame)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error fetching workout details", error)
+    return exercises
+
+_HISTORY_PAGE_SQL = """
+    SELECT w.workout_id, w.workout_date, w.duration_minutes, w.calories_burned,
+           COALESCE(e.exercises, '[]'::json) AS exercises
+    FROM workouts w
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_array(c.name, x.sets, x.reps, x.weight_kg)
+                        ORDER BY x.exercise_id) AS exercises
+        FROM exercises x
+        JOIN exercise_catalog c ON c.catalog_id = x.catalog_id
+        WHERE x.workout_id = w.workout_id AND x.workout_date = w.workout_date
+    ) e ON TRUE
+    WHERE w.user_id = %(user_id)s
+      AND (%(before_date)s::date IS NULL
+           OR (w.workout_date, w.workout_id) < (%(before_date)s::date, %(before_id)s::int))
+    ORDER BY w.workout_date DESC, w.workout_id DESC
+    LIMIT %(limit)s;
+"""
+
+def _history_page(rows, page_size):
+    # Splits page_size + 1 fetched rows into (workouts, next_cursor)
+    workouts = [(row[0], row[1], row[2], row[3], [tuple(ex) for ex in row[4]]) for row in rows[:page_size]]
+    next_cursor = (workouts[-1][1], workouts[-1][0]) if len(rows) > page_size else None
+    return workouts, next_cursor
+
+@instrumented
+def get_workout_history_page(user_id, page_size=20, before=None):
+    """Retrieves one page of a user's workouts, newest first, with their exercises.
+
+    Workouts and exercises come back from a single query. `before` is the cursor
+    returned by the previous call (a (workout_date, workout_id) pair); pass None
+    for the first page. Returns (workouts, next_cursor) where each workout is
+    (workout_id, workout_date, duration_minutes, calories_burned, exercises) and
+    exercises is a list of (exercise_name, sets, reps, weight_kg) tuples.
+    next_cursor is None once there are no older workouts.
+    """
+    before_date, before_id = before if before else (None, None)
+    workouts, next_cursor = [], None
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_HISTORY_PAGE_SQL, {
+                'user_id': user_id, 'before_date': before_date, 'before_id': before_id,
+                'limit': page_size + 1,  # one extra row tells us whether another page exists
+            })
+            rows = cur.fetchall()
+        workouts, next_cursor = _history_page(rows, page_size)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error fetching workout history", error)
+    return workouts, next_cursor
+
+# --- Exercise Catalog ---
+# Exercises reference exercise_catalog by id. Names are matched after
+# normalize_exercise_name() (trimmed, single-spaced, lower case), so "Bench
+# press" and "bench  Press" share one entry, and exercise_aliases maps other
+# spellings ("bench", "bp") to an entry. idx_exercises_user_catalog keeps each
+# user's sets of an exercise together, newest first, so the per-exercise
+# history below is one index range scan instead of a scan of every exercise.
+
+# The catalog id of %(catalog_id)s, or else of the exercise named %(name)s
+_RESOLVE_EXERCISE = """
+    COALESCE(
+        %(catalog_id)s::int,
+        (SELECT catalog_id FROM exercise_aliases WHERE alias = normalize_exercise_name(%(name)s)),
+        (SELECT catalog_id FROM exercise_catalog WHERE normalized_name = normalize_exercise_name(%(name)s))
+    )
+"""
+
+def _exercise_params(exercise):
+    # An exercise is given by catalog id or by any spelling of its name
+    if isinstance(exercise, numbers.Integral):
+        return {'catalog_id': int(exercise), 'name': None}
+    return {'catalog_id': None, 'name': exercise}
+
+_USER_EXERCISES_SQL = """
+    SELECT c.catalog_id, c.name, COUNT(DISTINCT e.workout_id) AS sessions, MAX(e.workout_date) AS last_date
+    FROM exercises e
+    JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+    WHERE e.user_id = %s
+    GROUP BY c.catalog_id, c.name
+    ORDER BY last_date DESC, c.name;
+"""
+_USER_EXERCISES_COLUMNS = {'catalog_id': 'int64', 'name': 'object', 'sessions': 'int64', 'last_date': 'datetime64[D]'}
+
+@instrumented
+@_cached('exercises')
+def get_user_exercises(user_id, *, as_frame=False):
+    """Returns (catalog_id, name, sessions, last_date) for each exercise a user has logged, most recent first."""
+    exercises = _no_rows(_USER_EXERCISES_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            exercises = _fetch_all(cur, _USER_EXERCISES_SQL, (user_id,), _USER_EXERCISES_COLUMNS, as_frame)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching exercises", error)
+    return exercises
+
+_EXERCISE_HISTORY_SQL = f"""
+    SELECT e.workout_id, e.workout_date,
+           SUM(COALESCE(e.sets, 1)) AS sets,
+           SUM(COALESCE(e.sets, 1) * COALESCE(e.reps, 0)) AS reps,
+           SUM(COALESCE(e.sets, 1) * COALESCE(e.reps, 0) * COALESCE(e.weight_kg, 0)) AS volume_kg,
+           MAX(e.weight_kg) AS best_weight_kg,
+           (array_agg(e.reps ORDER BY e.weight_kg DESC NULLS LAST, e.reps DESC NULLS LAST))[1] AS best_set_reps
+    FROM exercises e
+    WHERE e.user_id = %(user_id)s AND e.catalog_id = {_RESOLVE_EXERCISE}
+    GROUP BY e.workout_date, e.workout_id
+    ORDER BY e.workout_date DESC, e.workout_id DESC
+    LIMIT %(limit)s;
+"""
+_EXERCISE_HISTORY_COLUMNS = {
+    'workout_id': 'int64', 'workout_date': 'datetime64[D]', 'sets': 'float64', 'reps': 'float64',
+    'volume_kg': 'float64', 'best_weight_kg': 'float64', 'best_set_reps': 'float64',
+}
+
+@instrumented
+def get_exercise_history(user_id, exercise, limit=None, *, as_frame=False):
+    """Returns a user's sessions of one exercise, newest first (all of them unless `limit` is given).
+
+    `exercise` is a catalog id or any name or alias of the exercise. Each row is
+    (workout_id, workout_date, sets, reps, volume_kg, best_weight_kg,
+    best_set_reps): totals over the session's sets, the heaviest weight lifted
+    and the reps done at that weight.
+    """
+    sessions = _no_rows(_EXERCISE_HISTORY_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            params = {'user_id': user_id, 'limit': limit, **_exercise_params(exercise)}
+            sessions = _fetch_all(cur, _EXERCISE_HISTORY_SQL, params, _EXERCISE_HISTORY_COLUMNS, as_frame)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error fetching exercise history", error)
+    return sessions
+
+@instrumented
+def add_exercise_alias(alias, exercise):
+    """Makes `alias` another name of `exercise` (a catalog id or name); returns True on success.
+
+    If the alias already has its own catalog entry (e.g. "BP" was logged before
+    it was declared an alias of "Bench Press"), its exercises (archived ones
+    included) and aliases are moved to `exercise` and the duplicate entry is
+    removed.
+    """
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"SELECT {_RESOLVE_EXERCISE}, normalize_exercise_name(%(alias)s);",
+                        {'alias': alias, **_exercise_params(exercise)})
+            catalog_id, key = cur.fetchone()
+            if catalog_id is None:
+                raise ValueError(f"unknown exercise {exercise!r}")
+            if not key:
+                raise ValueError("alias must not be empty")
+            cur.execute(
+                "SELECT catalog_id FROM exercise_catalog WHERE normalized_name = %s AND catalog_id <> %s;",
+                (key, catalog_id),
+            )
+            duplicate = cur.fetchone()
+            if duplicate:
+                cur.execute("SELECT user_id FROM personal_records WHERE catalog_id = %s;", duplicate)
+                record_users = [row[0] for row in cur.fetchall()]
+                for sql in (
+                    "UPDATE exercises SET catalog_id = %s WHERE catalog_id = %s;",
+                    "UPDATE exercise_aliases SET catalog_id = %s WHERE catalog_id = %s;",
+                    # No foreign key here; restoring them needs a catalog_id that still exists
+                    "UPDATE archived_exercises SET catalog_id = %s WHERE catalog_id = %s;",
+                ):
+                    cur.execute(sql, (catalog_id, duplicate[0]))
+                # Also drops the duplicate's personal records; merge them into the kept entry
+                cur.execute("DELETE FROM exercise_catalog WHERE catalog_id = %s;", duplicate)
+                if record_users:
+                    _rebuild_personal_records(
+                        cur, "user_id = ANY(%(user_ids)s) AND catalog_id = %(catalog_id)s",
+                        {'user_ids': record_users, 'catalog_id': catalog_id},
+                    )
+            cur.execute("SELECT normalized_name FROM exercise_catalog WHERE catalog_id = %s;", (catalog_id,))
+            if cur.fetchone()[0] != key:
+                cur.execute("""
+                    INSERT INTO exercise_aliases (alias, catalog_id) VALUES (%s, %s)
+                    ON CONFLICT (alias) DO UPDATE SET catalog_id = EXCLUDED.catalog_id;
+                """, (key, catalog_id))
+            conn.commit()
+        # Any user's exercise list and records may have changed
+        _cache.invalidate('exercises')
+        _cache.invalidate('records')
+        return True
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error adding exercise alias", error)
+        return False
+
+_FRIENDS_SQL = """
+    SELECT u.user_id, u.name 
+    FROM users u
+    JOIN friends f ON u.user_id = f.user_id_2
+    WHERE f.user_id_1 = %(user_id)s
+    ORDER BY u.name;
+"""
+_FRIENDS_COLUMNS = {'user_id': 'int64', 'name': 'object'}
+
+@instrumented
+@_cached('friends')
+def get_user_friends(user_id, *, as_frame=False):
+    """Retrieves all friends for a specific user."""
+    friends = _no_rows(_FRIENDS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            friends = _fetch_all(cur, _FRIENDS_SQL, {'user_id': user_id}, _FRIENDS_COLUMNS, as_frame)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching friends", error)
+    return friends
+
+# Friends, and friends of each friend, considered per suggestion query, so the
+# cost stays bounded for users connected to very popular accounts
+SUGGESTION_FANOUT = 200
+
+_trigram_search = None
+
+def _trigram_available(cur):
+    """True when migration 7 could install pg_trgm and its name index (checked once)."""
+    global _trigram_search
+    if _trigram_search is None:
+        cur.execute("SELECT to_regclass('idx_users_name_trgm') IS NOT NULL;")
+        _trigram_search = cur.fetchone()[0]
+    return _trigram_search
+
+@instrumented
+def search_users(query, user_id=None, limit=10):
+    """Finds users whose name or email starts with `query` (case-insensitive).
+
+    When user_id is given, that user and their friends are left out. With
+    pg_trgm installed, searches of 3+ characters that find fewer than `limit`
+    users by prefix are topped up with the most similar names. Every branch is
+    an index scan that stops after `limit` rows, so the cost does not grow with
+    the number of users. Returns up to `limit` (user_id, name) tuples.
+    """
+    term = (query or "").strip().lower()
+    if not term:
+        return []
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    params = {"pattern": escaped + "%", "contains": "%" + escaped + "%", "term": term,
+              "user_id": user_id, "limit": limit}
+    not_self_or_friend = """
+        users.user_id IS DISTINCT FROM %(user_id)s
+        AND NOT EXISTS (SELECT 1 FROM friends f WHERE f.user_id_1 = %(user_id)s AND f.user_id_2 = users.user_id)
+    """
+    prefix_sql = f"""
+        SELECT user_id, name FROM (
+            (SELECT user_id, name, lower(name) COLLATE "C" AS sort_key FROM users
+             WHERE lower(name) COLLATE "C" LIKE %(pattern)s AND {not_self_or_friend}
+             ORDER BY lower(name) COLLATE "C" LIMIT %(limit)s)
+            UNION
+            (SELECT user_id, name, lower(name) COLLATE "C" AS sort_key FROM users
+             WHERE lower(email) COLLATE "C" LIKE %(pattern)s AND {not_self_or_friend}
+             ORDER BY lower(email) COLLATE "C" LIMIT %(limit)s)
+        ) matches
+        ORDER BY sort_key, user_id
+        LIMIT %(limit)s;
+    """
+    similar_sql = f"""
+        SELECT user_id, name FROM users
+        WHERE (lower(name) %% %(term)s OR lower(name) LIKE %(contains)s)
+          AND user_id <> ALL(%(found)s) AND {not_self_or_friend}
+        ORDER BY lower(name) <-> %(term)s
+        LIMIT %(remaining)s;
+    """
+    users = []
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(prefix_sql, params)
+            users = cur.fetchall()
+            if len(users) < limit and len(term) >= 3 and _trigram_available(cur):
+                params.update(found=[u[0] for u in users], remaining=limit - len(users))
+                cur.execute(similar_sql, params)
+                users += cur.fetchall()
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error searching users", error)
+    return users
+
+_SUGGESTIONS_SQL = """
+    WITH my_friends AS (
+        SELECT user_id_2 AS friend_id
+        FROM friends
+        WHERE user_id_1 = %(user_id)s
+        LIMIT %(fanout)s
+    ), candidates AS (
+        SELECT fof.user_id_2 AS candidate_id, COUNT(*) AS mutual_friends
+        FROM my_friends m
+        CROSS JOIN LATERAL (
+            SELECT f.user_id_2
+            FROM friends f
+            WHERE f.user_id_1 = m.friend_id
+            LIMIT %(fanout)s
+        ) fof
+        WHERE fof.user_id_2 <> %(user_id)s
+          AND NOT EXISTS (SELECT 1 FROM friends f WHERE f.user_id_1 = %(user_id)s AND f.user_id_2 = fof.user_id_2)
+        GROUP BY fof.user_id_2
+        ORDER BY mutual_friends DESC, candidate_id
+        LIMIT %(limit)s
+    )
+    SELECT u.user_id, u.name, c.mutual_friends
+    FROM candidates c
+    JOIN users u ON u.user_id = c.candidate_id
+    ORDER BY c.mutual_friends DESC, u.name;
+"""
+
+@instrumented
+@_cached('suggestions')
+def get_friend_suggestions(user_id, limit=10):
+    """Suggests friends of the user's friends, most mutual friends first.
+
+    At most SUGGESTION_FANOUT friends, and SUGGESTION_FANOUT friends of each of
+    them, are looked at, all through the friends primary key. Returns
+    (user_id, name, mutual_friends) tuples.
+    """
+    suggestions = []
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_SUGGESTIONS_SQL, {"user_id": user_id, "limit": limit, "fanout": SUGGESTION_FANOUT})
+            suggestions = cur.fetchall()
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching friend suggestions", error)
+    return suggestions
+
+_GOALS_SQL = "SELECT goal_id, goal_description, target_value, start_date, end_date, status FROM goals WHERE user_id = %s;"
+_GOALS_COLUMNS = {
+    'goal_id': 'int64', 'goal_description': 'object', 'target_value': 'float64',
+    'start_date': 'datetime64[D]', 'end_date': 'datetime64[D]', 'status': 'object',
+}
+
+@instrumented
+@_cached('goals')
+def get_user_goals(user_id, *, as_frame=False):
+    """Retrieves all goals for a specific user."""
+    goals = _no_rows(_GOALS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            goals = _fetch_all(cur, _GOALS_SQL, (user_id,), _GOALS_COLUMNS, as_frame)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching goals", error)
+    return goals
+
+# UPDATE
+@instrumented
+def update_user_profile(user_id, name, email, weight, height):
+    """Updates a user's profile information."""
+    sql = "UPDATE users SET name = %s, email = %s, weight_kg = %s, height_cm = %s WHERE user_id = %s;"
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (name, email, weight, height, user_id))
+            conn.commit()
+        _cache.invalidate('profile', user_id)
+        # The name also appears in user lists, friend lists and leaderboards
+        _cache.invalidate('users')
+        _cache.invalidate('friends')
+        _cache.invalidate('leaderboard')
+        _cache.invalidate('suggestions')
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error updating profile", error)
+
+# DELETE
+@instrumented
+def delete_workout(workout_id):
+    """Deletes a workout (and its exercises) and removes it from the user's rollups."""
+    sql = """
+        DELETE FROM workouts WHERE workout_id = %s
+        RETURNING user_id, workout_date, duration_minutes, calories_burned;
+    """
+    deleted = False
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            # The exercises go with the workout; their records are recomputed below
+            cur.execute("SELECT DISTINCT catalog_id FROM exercises WHERE workout_id = %s;", (workout_id,))
+            catalog_ids = [r[0] for r in cur.fetchall()]
+            cur.execute(sql, (workout_id,))
+            row = cur.fetchone()
+            if row:
+                removed = [{'user_id': row[0], 'workout_date': row[1], 'duration': row[2], 'calories': row[3]}]
+                _apply_rollup_deltas(cur, removed, sign=-1)
+                _apply_activity(cur, removed, sign=-1)
+                if catalog_ids:
+                    _rebuild_personal_records(
+                        cur, "user_id = %(user_id)s AND catalog_id = ANY(%(catalog_ids)s)",
+                        {'user_id': row[0], 'catalog_ids': catalog_ids},
+                    )
+                deleted = True
+            conn.commit()
+        if deleted:
+            _invalidate_workout_reads(row[0])
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error deleting workout", error)
+    return deleted
+
+@instrumented
+def remove_friend(user_id, friend_id):
+    """Removes a friend connection."""
+    sql = "DELETE FROM friends WHERE (user_id_1 = %s AND user_id_2 = %s) OR (user_id_1 = %s AND user_id_2 = %s);"
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id, friend_id, friend_id, user_id))
+            scopes = _suggestion_scopes(cur, user_id, friend_id)
+            conn.commit()
+        _cache.invalidate('friends', user_id, friend_id)
+        _cache.invalidate('leaderboard', user_id, friend_id)
+        _cache.invalidate('suggestions', *scopes)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error removing friend", error)
+            
+# --- Business Insights & Leaderboard ---
+
+# Rollups: user_workout_rollups holds lifetime totals per user and
+# user_period_rollups holds weekly/monthly buckets, so the dashboard reads one
+# row per user instead of scanning the workout history.
+
+# The whole history, hot and archived, for rebuilds, day charts and goals
+# (filter on user_id and workout_date outside; both tables are indexed on them)
+_ALL_WORKOUTS_SQL = """(
+    SELECT user_id, workout_date, duration_minutes, calories_burned FROM workouts
+    UNION ALL
+    SELECT user_id, workout_date, duration_minutes, calories_burned FROM archived_workouts
+) AS workouts"""
+_ALL_EXERCISES_SQL = """(
+    SELECT workout_id, workout_date, user_id, catalog_id, sets, reps, weight_kg FROM exercises
+    UNION ALL
+    SELECT workout_id, workout_date, user_id, catalog_id, sets, reps, weight_kg FROM archived_exercises
+) AS exercises"""
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def _month_start(day):
+    return day.replace(day=1)
+
+def _rollup_deltas(workouts):
+    """Sums workouts into per-user totals and per-(user, period) buckets.
+
+    `workouts` are dicts with user_id, workout_date, duration and calories.
+    Returns (totals, periods): totals maps user_id to [workouts, minutes,
+    calories, duration_count, min_duration, max_duration] and periods maps
+    (user_id, period_type, period_start) to [workouts, minutes, calories].
+    """
+    totals = {}
+    periods = {}
+    for w in workouts:
+        minutes = w['duration'] or 0
+        calories = w['calories'] or 0
+        t = totals.setdefault(w['user_id'], [0, 0, 0, 0, None, None])
+        t[0] += 1
+        t[1] += minutes
+        t[2] += calories
+        if w['duration'] is not None:
+            t[3] += 1
+            t[4] = minutes if t[4] is None else min(t[4], minutes)
+            t[5] = minutes if t[5] is None else max(t[5], minutes)
+        for period_type, start in (('week', _week_start(w['workout_date'])), ('month', _month_start(w['workout_date']))):
+            p = periods.setdefault((w['user_id'], period_type, start), [0, 0, 0])
+            p[0] += 1
+            p[1] += minutes
+            p[2] += calories
+    return totals, periods
+
+def _apply_rollup_deltas(cur, workouts, sign):
+    """Adds (sign=1) or subtracts (sign=-1) workouts from the rollup tables.
+
+    Rows are written in user order so concurrent writers lock them consistently.
+    """
+    totals, periods = _rollup_deltas(workouts)
+    if sign > 0:
+        execute_values(cur, """
+            INSERT INTO user_workout_rollups AS r
+                (user_id, total_workouts, total_minutes, total_calories, duration_count, min_duration, max_duration)
+            VALUES %s
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_workouts = r.total_workouts + EXCLUDED.total_workouts,
+                total_minutes = r.total_minutes + EXCLUDED.total_minutes,
+                total_calories = r.total_calories + EXCLUDED.total_calories,
+                duration_count = r.duration_count + EXCLUDED.duration_count,
+                min_duration = LEAST(r.min_duration, EXCLUDED.min_duration),
+                max_duration = GREATEST(r.max_duration, EXCLUDED.max_duration);
+        """, [(user_id, *t) for user_id, t in sorted(totals.items())])
+        execute_values(cur, """
+            INSERT INTO user_period_rollups AS p (user_id, period_type, period_start, workouts, minutes, calories)
+            VALUES %s
+            ON CONFLICT (user_id, period_type, period_start) DO UPDATE SET
+                workouts = p.workouts + EXCLUDED.workouts,
+                minutes = p.minutes + EXCLUDED.minutes,
+                calories = p.calories + EXCLUDED.calories;
+        """, [(*key, *p) for key, p in sorted(periods.items())])
+        return
+
+    # Removal: counts and sums subtract exactly; min/max are recomputed only for
+    # users whose extreme value may have been removed.
+    execute_values(cur, """
+        UPDATE user_workout_rollups AS r SET
+            total_workouts = r.total_workouts - d.workouts,
+            total_minutes = r.total_minutes - d.minutes,
+            total_calories = r.total_calories - d.calories,
+            duration_count = r.duration_count - d.duration_count
+        FROM (VALUES %s) AS d(user_id, workouts, minutes, calories, duration_count)
+        WHERE r.user_id = d.user_id;
+    """, [(user_id, t[0], t[1], t[2], t[3]) for user_id, t in sorted(totals.items())])
+    execute_values(cur, """
+        UPDATE user_period_rollups AS p SET
+            workouts = p.workouts - d.workouts,
+            minutes = p.minutes - d.minutes,
+            calories = p.calories - d.calories
+        FROM (VALUES %s) AS d(user_id, period_type, period_start, workouts, minutes, calories)
+        WHERE p.user_id = d.user_id AND p.period_type = d.period_type AND p.period_start = d.period_start::date;
+    """, [(*key, *p) for key, p in sorted(periods.items())])
+    # A rebuild has no rows for periods or users left without workouts
+    cur.execute("DELETE FROM user_period_rollups WHERE user_id = ANY(%s) AND workouts <= 0;", (sorted(totals),))
+    cur.execute("DELETE FROM user_workout_rollups WHERE user_id = ANY(%s) AND total_workouts <= 0;", (sorted(totals),))
+    execute_values(cur, """
+        UPDATE user_workout_rollups AS r SET
+            min_duration = LEAST(
+                (SELECT MIN(duration_minutes) FROM workouts WHERE user_id = r.user_id),
+                (SELECT MIN(min_duration) FROM workout_summaries WHERE user_id = r.user_id AND period_type = 'month')),
+            max_duration = GREATEST(
+                (SELECT MAX(duration_minutes) FROM workouts WHERE user_id = r.user_id),
+                (SELECT MAX(max_duration) FROM workout_summaries WHERE user_id = r.user_id AND period_type = 'month'))
+        FROM (VALUES %s) AS d(user_id, removed_min, removed_max)
+        WHERE r.user_id = d.user_id
+          AND (r.duration_count = 0 OR d.removed_min::int <= r.min_duration OR d.removed_max::int >= r.max_duration);
+    """, [(user_id, t[4], t[5]) for user_id, t in sorted(totals.items())])
+
+# Rollups as recomputed from the workouts table plus, for archived workouts
+# (see archive_workouts), the summaries they left behind
+_ROLLUP_TOTALS_SQL = """
+    SELECT user_id,
+           SUM(workouts) AS total_workouts,
+           SUM(minutes) AS total_minutes,
+           SUM(calories) AS total_calories,
+           SUM(duration_count) AS duration_count,
+           MIN(min_duration) AS min_duration,
+           MAX(max_duration) AS max_duration
+    FROM (
+        SELECT user_id, COUNT(*) AS workouts,
+               COALESCE(SUM(duration_minutes), 0) AS minutes,
+               COALESCE(SUM(calories_burned), 0) AS calories,
+               COUNT(duration_minutes) AS duration_count,
+               MIN(duration_minutes) AS min_duration,
+               MAX(duration_minutes) AS max_duration
+        FROM workouts {where}
+        GROUP BY user_id
+        UNION ALL
+        SELECT user_id, workouts, minutes, calories, duration_count, min_duration, max_duration
+        FROM (SELECT * FROM workout_summaries WHERE period_type = 'month') AS s {where}
+    ) AS parts
+    GROUP BY user_id
+"""
+
+_ROLLUP_PERIODS_SQL = """
+    SELECT user_id, period_type, period_start,
+           SUM(workouts) AS workouts,
+           SUM(minutes) AS minutes,
+           SUM(calories) AS calories
+    FROM (
+        SELECT user_id, period_type, period_start,
+               COUNT(*) AS workouts,
+               COALESCE(SUM(duration_minutes), 0) AS minutes,
+               COALESCE(SUM(calories_burned), 0) AS calories
+        FROM workouts
+        CROSS JOIN LATERAL (VALUES
+            ('week', date_trunc('week', workout_date)::date),
+            ('month', date_trunc('month', workout_date)::date)
+        ) AS period(period_type, period_start)
+        {where}
+        GROUP BY user_id, period_type, period_start
+        UNION ALL
+        SELECT user_id, period_type, period_start, workouts, minutes, calories FROM workout_summaries {where}
+    ) AS parts
+    GROUP BY user_id, period_type, period_start
+"""
+
+def _rebuild_rollups(cur, user_id=None):
+    where = "WHERE user_id = %(user_id)s" if user_id is not None else ""
+    params = {'user_id': user_id}
+    cur.execute(f"DELETE FROM user_period_rollups {where};", params)
+    cur.execute(f"DELETE FROM user_workout_rollups {where};", params)
+    cur.execute(f"""
+        INSERT INTO user_workout_rollups
+            (user_id, total_workouts, total_minutes, total_calories, duration_count, min_duration, max_duration)
+        {_ROLLUP_TOTALS_SQL.format(where=where)};
+    """, params)
+    cur.execute(f"""
+        INSERT INTO user_period_rollups (user_id, period_type, period_start, workouts, minutes, calories)
+        {_ROLLUP_PERIODS_SQL.format(where=where)};
+    """, params)
+    _rebuild_activity(cur, user_id)
+
+@instrumented
+def rebuild_rollups(user_id=None):
+    """Recomputes the rollup tables (and activity calendars and streaks) from the workouts table."""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            _rebuild_rollups(cur, user_id)
+            conn.commit()
+        if user_id is None:
+            _invalidate_workout_reads()
+        else:
+            _invalidate_workout_reads(user_id)
+        return True
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error rebuilding rollups", error)
+    return False
+
+@instrumented
+def check_rollups(user_id=None):
+    """Compares stored rollups with values recomputed from workouts.
+
+    Returns a list of (table, key, stored, expected) tuples; empty means consistent.
+    """
+    where = "WHERE user_id = %(user_id)s" if user_id is not None else ""
+    params = {'user_id': user_id}
+    mismatches = []
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"""
+                WITH expected AS ({_ROLLUP_TOTALS_SQL.format(where=where)}),
+                     stored AS (
+                        SELECT user_id, total_workouts, total_minutes, total_calories,
+                               duration_count, min_duration, max_duration
+                        FROM user_workout_rollups {where}
+                     )
+                SELECT COALESCE(s.user_id, e.user_id),
+                       ROW(s.total_workouts, s.total_minutes, s.total_calories, s.duration_count, s.min_duration, s.max_duration)::text,
+                       ROW(e.total_workouts, e.total_minutes, e.total_calories, e.duration_count, e.min_duration, e.max_duration)::text
+                FROM stored s
+                FULL OUTER JOIN expected e ON e.user_id = s.user_id
+                WHERE s.user_id IS NULL OR e.user_id IS NULL
+                   OR (s.total_workouts, s.total_minutes, s.total_calories, s.duration_count, s.min_duration, s.max_duration)
+                      IS DISTINCT FROM
+                      (e.total_workouts, e.total_minutes, e.total_calories, e.duration_count, e.min_duration, e.max_duration);
+            """, params)
+            mismatches += [('user_workout_rollups', (row[0],), row[1], row[2]) for row in cur.fetchall()]
+            cur.execute(f"""
+                WITH expected AS ({_ROLLUP_PERIODS_SQL.format(where=where)}),
+                     stored AS (
+                        SELECT user_id, period_type, period_start, workouts, minutes, calories
+                        FROM user_period_rollups {where}
+                     )
+                SELECT COALESCE(s.user_id, e.user_id), COALESCE(s.period_type, e.period_type),
+                       COALESCE(s.period_start, e.period_start),
+                       ROW(s.workouts, s.minutes, s.calories)::text,
+                       ROW(e.workouts, e.minutes, e.calories)::text
+                FROM stored s
+                FULL OUTER JOIN expected e
+                  ON e.user_id = s.user_id AND e.period_type = s.period_type AND e.period_start = s.period_start
+                WHERE s.user_id IS NULL OR e.user_id IS NULL
+                   OR (s.workouts, s.minutes, s.calories) IS DISTINCT FROM (e.workouts, e.minutes, e.calories);
+            """, params)
+            mismatches += [('user_period_rollups', (row[0], row[1], row[2]), row[3], row[4]) for row in cur.fetchall()]
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error checking rollups", error)
+    return mismatches
+
+# Streaks and activity calendar: user_activity_years keeps one byte per day of
+# each year a user worked out in (January 1st is byte 0) holding that day's
+# workout count, and user_streaks the user's current run of consecutive active
+# days and their longest one. Both are updated along with the rollups. A
+# workout on a new day after the last active day just extends or restarts the
+# current streak; a backdated workout on a new day, or removing a day's last
+# workout, recomputes the user's streaks from their day counts (366 bytes per
+# year), so neither path reads the workouts table.
+
+_YEAR_DAYS = 366
+# Days shown in the activity calendar (a year, ending today)
+ACTIVITY_CALENDAR_DAYS = 365
+_MAX_DAY_COUNT = 255  # day counts saturate here; rebuild_rollups recounts from workouts
+
+def _day_index(day):
+    return day.timetuple().tm_yday - 1
+
+def _activity_deltas(workouts, sign):
+    """Returns {(user_id, year): {day_index: change}} for workouts added (sign=1) or removed (sign=-1)."""
+    deltas = {}
+    for w in workouts:
+        changes = deltas.setdefault((w['user_id'], w['workout_date'].year), {})
+        index = _day_index(w['workout_date'])
+        changes[index] = changes.get(index, 0) + sign
+    return deltas
+
+def _active_days(year, day_counts):
+    first = date(year, 1, 1)
+    return [first + timedelta(days=index) for index, count in enumerate(day_counts) if count]
+
+def _fold_streaks(state, days):
+    """Extends a streak state with active days (ascending, all after its last active day).
+
+    A state is (current_start, last_active_date, longest_start, longest_end), or
+    None before the first active day. Of equally long streaks the earliest is kept.
+    """
+    current_start, last_active, longest_start, longest_end = state or (None, None, None, None)
+    for day in days:
+        if last_active is not None and day == last_active + timedelta(days=1):
+            last_active = day
+        else:
+            current_start = last_active = day
+        if longest_start is None or last_active - current_start > longest_end - longest_start:
+            longest_start, longest_end = current_start, last_active
+    return None if last_active is None else (current_start, last_active, longest_start, longest_end)
+
+def _activity_update(year_rows, streaks, deltas):
+    """Applies activity deltas to stored day counts and streaks.
+
+    `year_rows` are all stored (user_id, year, day_counts) rows of the users in
+    `deltas` and `streaks` maps user_id to their stored streak state. Returns
+    the (user_id, year, day_counts) rows to write, the (user_id, year) rows
+    left without any active day (to delete, as a rebuild would not have them),
+    the (user_id, *streak state) rows to write and the users left without any
+    active day at all (whose streak rows are deleted likewise).
+    """
+    counts = {(user_id, year): bytearray(day_counts) for user_id, year, day_counts in year_rows}
+    added, removed = {}, set()
+    for (user_id, year), changes in deltas.items():
+        day_counts = counts.setdefault((user_id, year), bytearray(_YEAR_DAYS))
+        for index, change in changes.items():
+            before = day_counts[index]
+            day_counts[index] = after = min(max(before + change, 0), _MAX_DAY_COUNT)
+            if after and not before:
+                added.setdefault(user_id, []).append(date(year, 1, 1) + timedelta(days=index))
+            elif before and not after:
+                removed.add(user_id)
+
+    streak_rows, inactive_users = [], []
+    for user_id in sorted(added.keys() | removed):
+        state, days = streaks.get(user_id), sorted(added.get(user_id, ()))
+        if user_id in removed or (state and days[0] <= state[1]):
+            # A day was emptied, or filled in before the last active day
+            state = None
+            days = [day for (u, year), day_counts in sorted(counts.items()) if u == user_id
+                    for day in _active_days(year, day_counts)]
+        state = _fold_streaks(state, days)
+        if state is None:
+            inactive_users.append(user_id)
+        else:
+            streak_rows.append((user_id, *state))
+    year_rows = [(user_id, year, bytes(counts[user_id, year])) for user_id, year in sorted(deltas)]
+    return ([row for row in year_rows if any(row[2])], [row[:2] for row in year_rows if not any(row[2])],
+            streak_rows, inactive_users)
+
+def _activity_from_workout_days(day_rows):
+    """Builds activity rows from (user_id, workout_date, workouts) rows ordered by user and date.
+
+    Yields one (year_rows, streak_row) pair per user, shaped as _activity_update returns them.
+    """
+    for user_id, rows in itertools.groupby(day_rows, key=lambda row: row[0]):
+        counts, days = {}, []
+        for _, day, workouts in rows:
+            counts.setdefault(day.year, bytearray(_YEAR_DAYS))[_day_index(day)] = min(workouts, _MAX_DAY_COUNT)
+            days.append(day)
+        yield ([(user_id, year, bytes(day_counts)) for year, day_counts in sorted(counts.items())],
+               (user_id, *_fold_streaks(None, days)))
+
+def _activity_batches(day_rows, users_per_batch=5000):
+    """Groups _activity_from_workout_days output into (year_rows, streak_rows) batches of users."""
+    users = _activity_from_workout_days(day_rows)
+    while True:
+        batch = list(itertools.islice(users, users_per_batch))
+        if not batch:
+            return
+        yield [row for year_rows, _ in batch for row in year_rows], [streak_row for _, streak_row in batch]
+
+def _activity_summary(rows, days, today):
+    """Builds get_activity_summary's result from its query rows."""
+    state, counts = (None, None, None, None), {}
+    for row in rows:
+        state = row[:4]
+        if row[4] is not None:
+            counts[row[4]] = bytes(row[5])
+    current_start, last_active, longest_start, longest_end = state
+    # Today's streak is still alive until the day ends without a workout
+    alive = last_active is not None and last_active >= today - timedelta(days=1)
+    first = today - timedelta(days=days - 1)
+    calendar = []
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        day_counts = counts.get(day.year)
+        calendar.append((day, day_counts[_day_index(day)] if day_counts else 0))
+    return {
+        'current_streak': (last_active - current_start).days + 1 if alive else 0,
+        'current_start': current_start if alive else None,
+        'last_active_date': last_active,
+        'longest_streak': (longest_end - longest_start).days + 1 if longest_start else 0,
+        'longest_start': longest_start,
+        'longest_end': longest_end,
+        'calendar': calendar,
+    }
+
+_ACTIVITY_UPSERT_SQL = """
+    INSERT INTO user_activity_years (user_id, year, day_counts)
+    VALUES %s
+    ON CONFLICT (user_id, year) DO UPDATE SET day_counts = EXCLUDED.day_counts;
+"""
+_STREAKS_UPSERT_SQL = """
+    INSERT INTO user_streaks (user_id, current_start, last_active_date, longest_start, longest_end)
+    VALUES %s
+    ON CONFLICT (user_id) DO UPDATE SET
+        current_start = EXCLUDED.current_start, last_active_date = EXCLUDED.last_active_date,
+        longest_start = EXCLUDED.longest_start, longest_end = EXCLUDED.longest_end;
+"""
+
+def _apply_activity(cur, workouts, sign):
+    """Adds (sign=1) or removes (sign=-1) workouts from day counts and streaks.
+
+    Called right after _apply_rollup_deltas, whose locks on the users' rollup
+    rows keep concurrent writers of the same user from interleaving here.
+    """
+    deltas = _activity_deltas(workouts, sign)
+    user_ids = sorted({user_id for user_id, _ in deltas})
+    cur.execute("SELECT user_id, year, day_counts FROM user_activity_years WHERE user_id = ANY(%s);", (user_ids,))
+    year_rows = cur.fetchall()
+    cur.execute("""
+        SELECT user_id, current_start, last_active_date, longest_start, longest_end
+        FROM user_streaks
+        WHERE user_id = ANY(%s) AND last_active_date IS NOT NULL;
+    """, (user_ids,))
+    streaks = {row[0]: row[1:] for row in cur.fetchall()}
+    year_rows, empty_years, streak_rows, inactive_users = _activity_update(year_rows, streaks, deltas)
+    if year_rows:
+        execute_values(cur, _ACTIVITY_UPSERT_SQL, year_rows)
+    if empty_years:
+        execute_values(cur, """
+            DELETE FROM user_activity_years a USING (VALUES %s) AS e(user_id, year)
+            WHERE a.user_id = e.user_id AND a.year = e.year;
+        """, empty_years)
+    if streak_rows:
+        execute_values(cur, _STREAKS_UPSERT_SQL, streak_rows)
+    if inactive_users:
+        cur.execute("DELETE FROM user_streaks WHERE user_id = ANY(%s);", (inactive_users,))
+
+def _rebuild_activity(cur, user_id=None):
+    """Recomputes day counts and streaks from the workouts, archived ones included (one user or everyone)."""
+    where = "WHERE user_id = %(user_id)s" if user_id is not None else ""
+    params = {'user_id': user_id}
+    cur.execute(f"DELETE FROM user_activity_years {where};", params)
+    cur.execute(f"DELETE FROM user_streaks {where};", params)
+    # Days are streamed from a server-side cursor and written 5000 users at a time
+    with cur.connection.cursor(name="activity_days") as days:
+        days.itersize = 50_000
+        days.execute(f"""
+            SELECT user_id, workout_date, COUNT(*) FROM {_ALL_WORKOUTS_SQL} {where}
+            GROUP BY user_id, workout_date
+            ORDER BY user_id, workout_date;
+        """, params)
+        for year_rows, streak_rows in _activity_batches(days):
+            execute_values(cur, _ACTIVITY_UPSERT_SQL, year_rows)
+            execute_values(cur, _STREAKS_UPSERT_SQL, streak_rows)
+
+_ACTIVITY_SQL = """
+    SELECT s.current_start, s.last_active_date, s.longest_start, s.longest_end, a.year, a.day_counts
+    FROM (SELECT %(user_id)s::int AS user_id) AS u
+    LEFT JOIN user_streaks s ON s.user_id = u.user_id
+    LEFT JOIN user_activity_years a
+      ON a.user_id = u.user_id AND a.year BETWEEN %(first_year)s AND %(last_year)s
+    ORDER BY a.year;
+"""
+
+def _activity_params(user_id, days, today):
+    return {'user_id': user_id, 'first_year': (today - timedelta(days=days - 1)).year, 'last_year': today.year}
+
+@instrumented
+@_cached('activity')
+def get_activity_summary(user_id, days=ACTIVITY_CALENDAR_DAYS):
+    """Returns a user's streaks and their daily workout counts for the last `days` days, in one lookup.
+
+    The dict holds current_streak (0 unless the user worked out today or
+    yesterday), current_start, last_active_date, longest_streak, longest_start,
+    longest_end and calendar: (date, workouts) pairs, oldest first, ending today.
+    """
+    today = date.today()
+    summary = _activity_summary((), days, today)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_ACTIVITY_SQL, _activity_params(user_id, days, today))
+            summary = _activity_summary(cur.fetchall(), days, today)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching activity summary", error)
+    return summary
+
+# Personal records: personal_records holds each user's bests per exercise
+# (heaviest weight, best estimated one-rep max, highest session volume) with the
+# date each was set. Logging a workout can only raise a record, so inserts merge
+# the new sessions' bests with GREATEST-style upserts; deleting a workout
+# recomputes just the user's affected exercises from the exercises index.
+
+def estimated_one_rep_max(weight_kg, reps):
+    """Epley estimate of the one-rep max from a set of `reps` at `weight_kg` (None if not computable)."""
+    if not weight_kg or weight_kg <= 0 or not reps or reps <= 0:
+        return None
+    weight = Decimal(str(weight_kg))
+    # Rounded like PostgreSQL's ROUND(numeric, 2), so stored and rebuilt records agree
+    return float((weight if reps == 1 else weight * (30 + reps) / 30).quantize(Decimal('0.01'), ROUND_HALF_UP))
+
+_RECORD_METRICS = ('max_weight', 'best_e1rm', 'best_volume')
+_RECORD_COLUMNS = ('user_id', 'catalog_id') + tuple(f"{m}_{c}" for m in _RECORD_METRICS for c in ('kg', 'date'))
+
+def _record_candidates(exercise_rows):
+    """Collapses exercise rows into one candidate record row per (user_id, catalog_id).
+
+    `exercise_rows` are (workout_id, workout_date, user_id, catalog_id, sets,
+    reps, weight_kg) tuples. Only weighted sets count; ties keep the earliest date.
+    """
+    sessions = {}
+    for workout_id, workout_date, user_id, catalog_id, sets, reps, weight in exercise_rows:
+        if not weight or weight <= 0:
+            continue
+        weight = round(weight, 2)  # as stored in NUMERIC(6, 2)
+        s = sessions.setdefault((user_id, catalog_id, workout_id), [workout_date, None, None, 0.0])
+        s[1] = max(s[1] or 0, weight)
+        e1rm = estimated_one_rep_max(weight, reps)
+        if e1rm is not None:
+            s[2] = max(s[2] or 0, e1rm)
+        s[3] += (1 if sets is None else sets) * (reps or 0) * weight
+
+    best = {}
+    for (user_id, catalog_id, _), (day, *values) in sorted(sessions.items(), key=lambda item: item[1][0]):
+        b = best.setdefault((user_id, catalog_id), [None, None] * len(_RECORD_METRICS))
+        for i, value in enumerate(values):
+            value = round(value, 2) if value else None
+            if value is not None and (b[2 * i] is None or value > b[2 * i]):
+                b[2 * i], b[2 * i + 1] = value, day
+    return [(*key, *b) for key, b in sorted(best.items())]
+
+# A stored record is replaced when the new one is higher, or equal but set earlier
+_RECORD_UPSERT_SET = ', '.join(
+    f"{m}_{c} = CASE WHEN EXCLUDED.{m}_kg > COALESCE(pr.{m}_kg, 0) "
+    f"OR (EXCLUDED.{m}_kg = pr.{m}_kg AND EXCLUDED.{m}_date < pr.{m}_date) "
+    f"THEN EXCLUDED.{m}_{c} ELSE pr.{m}_{c} END"
+    for m in _RECORD_METRICS for c in ('kg', 'date')
+)
+_RECORD_UPSERT_SQL = f"""
+    INSERT INTO personal_records AS pr ({', '.join(_RECORD_COLUMNS)})
+    VALUES %s
+    ON CONFLICT (user_id, catalog_id) DO UPDATE SET {_RECORD_UPSERT_SET};
+"""
+
+def _apply_personal_records(cur, exercise_rows):
+    """Raises personal records beaten by newly inserted exercise rows."""
+    candidates = _record_candidates(exercise_rows)
+    if candidates:
+        execute_values(cur, _RECORD_UPSERT_SQL, candidates)
+
+# Same values as _record_candidates, computed from the hot and archived exercises
+_RECORDS_SQL = f"""
+    WITH sessions AS (
+        SELECT user_id, catalog_id, workout_date,
+               MAX(weight_kg) AS max_weight,
+               MAX(ROUND(CASE WHEN reps = 1 THEN weight_kg WHEN reps > 1 THEN weight_kg * (30 + reps) / 30 END, 2))
+                   AS best_e1rm,
+               NULLIF(ROUND(SUM(COALESCE(sets, 1) * COALESCE(reps, 0) * weight_kg), 2), 0) AS best_volume
+        FROM {_ALL_EXERCISES_SQL}
+        WHERE weight_kg > 0 AND {{where}}
+        GROUP BY user_id, catalog_id, workout_id, workout_date
+    )
+    SELECT user_id, catalog_id,
+           MAX(max_weight),
+           (array_agg(workout_date ORDER BY max_weight DESC, workout_date))[1],
+           MAX(best_e1rm),
+           (array_agg(workout_date ORDER BY best_e1rm DESC, workout_date) FILTER (WHERE best_e1rm IS NOT NULL))[1],
+           MAX(best_volume),
+           (array_agg(workout_date ORDER BY best_volume DESC, workout_date) FILTER (WHERE best_volume IS NOT NULL))[1]
+    FROM sessions
+    GROUP BY user_id, catalog_id
+"""
+
+def _rebuild_personal_records(cur, where="TRUE", params=None):
+    """Recomputes the personal_records rows matching `where` (on user_id/catalog_id); returns rows written."""
+    cur.execute(f"DELETE FROM personal_records WHERE {where};", params)
+    cur.execute(f"""
+        INSERT INTO personal_records ({', '.join(_RECORD_COLUMNS)})
+        {_RECORDS_SQL.format(where=where)};
+    """, params)
+    return cur.rowcount
+
+@instrumented
+def rebuild_personal_records(user_id=None, batch_users=None):
+    """Recomputes personal records from the exercises table, archived ones included (one user or everyone).
+
+    Everyone's records are rebuilt `batch_users` users per transaction (default
+    config.RECORD_SETTINGS['batch_users']), each batch one set-based statement
+    over an index range of exercises. Returns the number of records written, or
+    None on error.
+    """
+    batch_users = batch_users or config.RECORD_SETTINGS['batch_users']
+    written = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            if user_id is not None:
+                written = _rebuild_personal_records(cur, "user_id = %(user_id)s", {'user_id': user_id})
+                conn.commit()
+            else:
+                after = 0
+                while True:
+                    cur.execute(
+                        "SELECT MAX(user_id) FROM (SELECT user_id FROM users WHERE user_id > %s "
+                        "ORDER BY user_id LIMIT %s) batch;", (after, batch_users),
+                    )
+                    last = cur.fetchone()[0]
+                    if last is None:
+                        break
+                    written += _rebuild_personal_records(
+                        cur, "user_id > %(after)s AND user_id <= %(last)s", {'after': after, 'last': last},
+                    )
+                    conn.commit()
+                    after = last
+        if user_id is None:
+            _cache.invalidate('records')
+        else:
+            _cache.invalidate('records', user_id)
+        return written
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error rebuilding personal records", error)
+    return None
+
+_PERSONAL_RECORDS_SQL = """
+    SELECT c.name AS exercise_name, pr.max_weight_kg, pr.max_weight_date, pr.best_e1rm_kg, pr.best_e1rm_date,
+           pr.best_volume_kg, pr.best_volume_date
+    FROM personal_records pr
+    JOIN exercise_catalog c ON c.catalog_id = pr.catalog_id
+    WHERE pr.user_id = %(user_id)s
+    ORDER BY pr.best_e1rm_kg DESC NULLS LAST, c.name;
+"""
+_PERSONAL_RECORDS_COLUMNS = {
+    'exercise_name': 'object', 'max_weight_kg': 'float64', 'max_weight_date': 'datetime64[D]',
+    'best_e1rm_kg': 'float64', 'best_e1rm_date': 'datetime64[D]',
+    'best_volume_kg': 'float64', 'best_volume_date': 'datetime64[D]',
+}
+
+@instrumented
+@_cached('records')
+def get_personal_records(user_id, *, as_frame=False):
+    """Returns a user's personal record per exercise, strongest estimated 1RM first.
+
+    Rows are (exercise_name, max_weight_kg, max_weight_date, best_e1rm_kg,
+    best_e1rm_date, best_volume_kg, best_volume_date), read from the stored
+    records rather than the exercise history.
+    """
+    records = _no_rows(_PERSONAL_RECORDS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            records = _fetch_all(cur, _PERSONAL_RECORDS_SQL, {'user_id': user_id}, _PERSONAL_RECORDS_COLUMNS, as_frame)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching personal records", error)
+    return records
+
+_DASHBOARD_SQL = """
+    SELECT COALESCE(r.total_workouts, 0) AS total_workouts,
+           COALESCE(r.total_minutes, 0) AS total_minutes,
+           COALESCE(r.total_calories, 0) AS total_calories,
+           COALESCE(r.total_minutes::numeric / NULLIF(r.duration_count, 0), 0) AS avg_duration,
+           COALESCE(r.max_duration, 0) AS max_duration,
+           COALESCE(r.min_duration, 0) AS min_duration,
+           COALESCE(w.workouts, 0) AS workouts_this_week,
+           COALESCE(w.minutes, 0) AS minutes_this_week,
+           COALESCE(w.calories, 0) AS calories_this_week,
+           COALESCE(m.workouts, 0) AS workouts_this_month,
+           COALESCE(m.minutes, 0) AS minutes_this_month,
+           COALESCE(m.calories, 0) AS calories_this_month
+    FROM (SELECT %(user_id)s::int AS user_id) AS u
+    LEFT JOIN user_workout_rollups r ON r.user_id = u.user_id
+    LEFT JOIN user_period_rollups w
+      ON w.user_id = u.user_id AND w.period_type = 'week' AND w.period_start = %(week)s
+    LEFT JOIN user_period_rollups m
+      ON m.user_id = u.user_id AND m.period_type = 'month' AND m.period_start = %(month)s;
+"""
+
+def _dashboard_params(user_id):
+    today = date.today()
+    return {'user_id': user_id, 'week': _week_start(today), 'month': _month_start(today)}
+
+def _dashboard_stats(row):
+    return {
+        'total_workouts': row[0],
+        'total_minutes': row[1],
+        'total_calories': row[2],
+        'avg_duration': float(row[3]),
+        'max_duration': row[4],
+        'min_duration': row[5],
+        'workouts_this_week': row[6],
+        'minutes_this_week': row[7],
+        'calories_this_week': row[8],
+        'workouts_this_month': row[9],
+        'minutes_this_month': row[10],
+        'calories_this_month': row[11],
+    }
+
+@instrumented
+@_cached('dashboard')
+def get_user_dashboard_stats(user_id):
+    """Calculates key fitness statistics for the user's dashboard.
+
+    Reads the precomputed rollups in a single query, so the cost does not grow
+    with the length of the user's history.
+    """
+    stats = {}
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_DASHBOARD_SQL, _dashboard_params(user_id))
+            stats = _dashboard_stats(cur.fetchone())
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching dashboard stats", error)
+    return stats
+
+# Bucket widths for get_workout_timeseries
+TIMESERIES_RESOLUTIONS = {'day': '1 day', 'week': '1 week', 'month': '1 month'}
+
+def _timeseries_query(user_id, resolution, start, end, max_points):
+    # Returns (sql, params) for get_workout_timeseries
+    if resolution not in TIMESERIES_RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {', '.join(TIMESERIES_RESOLUTIONS)}")
+
+    if resolution == 'day':
+        # Days before the archive horizon are in archived_workouts
+        source = f"""
+            SELECT workout_date AS bucket, COUNT(*) AS workouts,
+                   COALESCE(SUM(duration_minutes), 0) AS minutes,
+                   COALESCE(SUM(calories_burned), 0) AS calories
+            FROM {_ALL_WORKOUTS_SQL}
+            WHERE user_id = %(user_id)s
+              AND workout_date <= COALESCE(%(end)s::date, 'infinity')
+              -- Only the last max_points days can be shown; skip older history
+              AND workout_date > (SELECT COALESCE(%(end)s::date, MAX(workout_date))
+                                  FROM {_ALL_WORKOUTS_SQL} WHERE user_id = %(user_id)s) - %(max_points)s::int
+            GROUP BY workout_date
+        """
+    else:
+        source = """
+            SELECT period_start AS bucket, workouts, minutes, calories
+            FROM user_period_rollups
+            WHERE user_id = %(user_id)s AND period_type = %(resolution)s
+        """
+    sql = f"""
+        WITH series AS ({source}),
+        bounds AS (
+            SELECT date_trunc(%(resolution)s, COALESCE(%(start)s::date, MIN(bucket)))::date AS first_bucket,
+                   date_trunc(%(resolution)s, COALESCE(%(end)s::date, MAX(bucket)))::date AS last_bucket
+            FROM series
+        ),
+        window_bounds AS (
+            SELECT GREATEST(first_bucket,
+                            (last_bucket - (%(max_points)s - 1) * %(step)s::text::interval)::date) AS first_bucket,
+                   last_bucket
+            FROM bounds
+        )
+        SELECT b.bucket::date AS bucket, COALESCE(s.workouts, 0) AS workouts,
+               COALESCE(s.minutes, 0) AS minutes, COALESCE(s.calories, 0) AS calories
+        FROM window_bounds wb
+        CROSS JOIN LATERAL generate_series(wb.first_bucket, wb.last_bucket, %(step)s::text::interval) AS b(bucket)
+        LEFT JOIN series s ON s.bucket = b.bucket::date
+        ORDER BY b.bucket;
+    """
+    return sql, {
+        'user_id': user_id, 'resolution': resolution, 'step': TIMESERIES_RESOLUTIONS[resolution],
+        'start': start, 'end': end, 'max_points': max_points,
+    }
+
+_TIMESERIES_COLUMNS = {'bucket': 'datetime64[D]', 'workouts': 'int64', 'minutes': 'int64', 'calories': 'int64'}
+
+@instrumented
+def get_workout_timeseries(user_id, resolution='week', start=None, end=None, max_points=400, *, as_frame=False):
+    """Aggregates a user's workouts into day/week/month buckets for charting.
+
+    Returns a list of (bucket_start, workouts, minutes, calories) rows with empty
+    buckets filled in with zeros. Weekly and monthly series are read from the
+    precomputed period rollups; daily series are aggregated from the hot and archived workouts. At
+    most `max_points` buckets ending at `end` (default: latest workout) are
+    returned, so the payload stays small however long the history is.
+    """
+    sql, params = _timeseries_query(user_id, resolution, start, end, max_points)
+    series = _no_rows(_TIMESERIES_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            series = _fetch_all(cur, sql, params, _TIMESERIES_COLUMNS, as_frame)
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error fetching workout time series", error)
+    return series
+
+_WEEKLY_LEADERBOARD_SQL = """
+    SELECT u.name, p.minutes AS total_minutes
+    FROM (
+        SELECT %(user_id)s::int AS user_id
+        UNION
+        SELECT user_id_2 FROM friends WHERE user_id_1 = %(user_id)s
+    ) AS members
+    JOIN user_period_rollups p
+      ON p.user_id = members.user_id AND p.period_type = 'week' AND p.period_start = %(week)s
+    JOIN users u ON u.user_id = members.user_id
+    ORDER BY total_minutes DESC, u.name;
+"""
+_LEADERBOARD_COLUMNS = {'name': 'object', 'total_minutes': 'int64'}
+
+@instrumented
+@_cached('leaderboard')
+def get_weekly_leaderboard(user_id, week_start=None, *, as_frame=False):
+    """Generates a leaderboard of the user and their friends based on total workout minutes in a week.
+
+    Defaults to the current week; pass any date to rank that date's week instead.
+    Friends are joined directly to the weekly rollups in one query, so the cost
+    depends on the number of friends rather than on how many workouts exist.
+    """
+    week = _week_start(_parse_date(week_start or date.today()))
+    leaderboard = _no_rows(_LEADERBOARD_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            leaderboard = _fetch_all(
+                cur, _WEEKLY_LEADERBOARD_SQL, {'user_id': user_id, 'week': week}, _LEADERBOARD_COLUMNS, as_frame,
+            )
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching leaderboard", error)
+    return leaderboard
+
+
+# Global leaderboard: rankings are precomputed into global_leaderboard by
+# refresh_global_leaderboard (on a schedule via manage.py, or lazily once a
+# snapshot is older than LEADERBOARD_SETTINGS['refresh_seconds']). Reads are then
+# an index range scan for the top K and a primary-key lookup for one user's rank.
+
+def _period_start(period_type, day):
+    if period_type == 'week':
+        return _week_start(day)
+    if period_type == 'month':
+        return _month_start(day)
+    raise ValueError("period_type must be 'week' or 'month'")
+
+def _refresh_global_leaderboard(cur, period_type, period_start):
+    cur.execute(
+        "DELETE FROM global_leaderboard WHERE period_type = %s AND period_start = %s;",
+        (period_type, period_start),
+    )
+    cur.execute("""
+        INSERT INTO global_leaderboard (period_type, period_start, user_id, minutes, rank)
+        SELECT period_type, period_start, user_id, minutes,
+               RANK() OVER (ORDER BY minutes DESC)
+        FROM user_period_rollups
+        WHERE period_type = %s AND period_start = %s AND minutes > 0;
+    """, (period_type, period_start))
+    ranked_users = cur.rowcount
+    cur.execute("""
+        INSERT INTO global_leaderboard_refreshes (period_type, period_start, ranked_users, refreshed_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (period_type, period_start) DO UPDATE SET
+            ranked_users = EXCLUDED.ranked_users, refreshed_at = EXCLUDED.refreshed_at;
+    """, (period_type, period_start, ranked_users))
+    return ranked_users
+
+@instrumented
+def refresh_global_leaderboard(period_type='week', period_start=None):
+    """Recomputes the site-wide ranking for one week or month (default: the current one).
+
+    Returns the number of ranked users, or None on error. Readers keep seeing the
+    previous snapshot until the refresh commits.
+    """
+    start = _period_start(period_type, _parse_date(period_start or date.today()))
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            ranked_users = _refresh_global_leaderboard(cur, period_type, start)
+            conn.commit()
+            return ranked_users
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error refreshing global leaderboard", error)
+    return None
+
+@instrumented
+def get_global_leaderboard(period_type='week', user_id=None, limit=None, period_start=None):
+    """Returns the site-wide top-K for a week or month and, optionally, one user's rank.
+
+    The result is a dict with 'top' (a list of (rank, name, minutes)), 'user_rank'
+    and 'user_minutes' for `user_id` (None if they have no minutes in the period),
+    'ranked_users', 'period_start' and 'refreshed_at'.
+    """
+    limit = limit or config.LEADERBOARD_SETTINGS['top_k']
+    refresh_seconds = config.LEADERBOARD_SETTINGS['refresh_seconds']
+    start = _period_start(period_type, _parse_date(period_start or date.today()))
+    result = {
+        'top': [], 'user_rank': None, 'user_minutes': None, 'ranked_users': 0,
+        'period_start': start, 'refreshed_at': None,
+    }
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            snapshot_sql = """
+                SELECT ranked_users, refreshed_at,
+                       refreshed_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                FROM global_leaderboard_refreshes
+                WHERE period_type = %s AND period_start = %s;
+            """
+            cur.execute(snapshot_sql, (refresh_seconds, period_type, start))
+            snapshot = cur.fetchone()
+            if snapshot is None or (refresh_seconds > 0 and snapshot[2]):
+                # Only one caller rebuilds a stale snapshot; the others read the old one
+                cur.execute("SELECT pg_try_advisory_xact_lock(hashtext('global_leaderboard'), hashtext(%s));",
+                            (f"{period_type}:{start}",))
+                if cur.fetchone()[0]:
+                    _refresh_global_leaderboard(cur, period_type, start)
+                    conn.commit()
+                    cur.execute(snapshot_sql, (refresh_seconds, period_type, start))
+                    snapshot = cur.fetchone()
+            if snapshot:
+                result['ranked_users'], result['refreshed_at'] = snapshot[0], snapshot[1]
+
+            cur.execute("""
+                SELECT g.rank, u.name, g.minutes
+                FROM global_leaderboard g
+                JOIN users u ON u.user_id = g.user_id
+                WHERE g.period_type = %s AND g.period_start = %s AND g.rank <= %s
+                ORDER BY g.rank, u.name;
+            """, (period_type, start, limit))
+            result['top'] = cur.fetchall()
+
+            if user_id is not None:
+                cur.execute("""
+                    SELECT rank, minutes FROM global_leaderboard
+                    WHERE period_type = %s AND period_start = %s AND user_id = %s;
+                """, (period_type, start, user_id))
+                row = cur.fetchone()
+                if row:
+                    result['user_rank'], result['user_minutes'] = row
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error fetching global leaderboard", error)
+    return result
+
+
+# --- Goal Evaluation ---
+# A goal's progress is the number of workouts, minutes or calories the user
+# logged between its start and end dates. Progress is computed set-based: one
+# statement evaluates many goals, each an index-only range scan of
+# idx_workouts_user_date (which also prunes workout partitions outside the
+# window) plus one of archived_workouts' key for any archived part of it. evaluate_goals() stores progress and moves Active goals to Completed
+# (target reached) or Expired (end date passed) in keyset-paginated batches;
+# get_goal_progress() computes the same values live for one user's goals page.
+
+GOAL_METRICS = ('workouts', 'minutes', 'calories')
+
+# Joined to `goals g`; adds p.progress for each goal
+_GOAL_PROGRESS_JOIN = f"""
+    CROSS JOIN LATERAL (
+        SELECT CASE g.goal_metric
+                   WHEN 'minutes' THEN COALESCE(SUM(workouts.duration_minutes), 0)
+                   WHEN 'calories' THEN COALESCE(SUM(workouts.calories_burned), 0)
+                   ELSE COUNT(*)
+               END AS progress
+        FROM {_ALL_WORKOUTS_SQL}
+        WHERE workouts.user_id = g.user_id AND workouts.workout_date BETWEEN g.start_date AND g.end_date
+    ) p
+"""
+
+# A goal's status given its progress p.progress, as of %(today)s
+_GOAL_STATUS = """
+    CASE
+        WHEN g.status <> 'Active' THEN g.status
+        WHEN g.target_value > 0 AND p.progress >= g.target_value THEN 'Completed'
+        WHEN g.end_date < %(today)s THEN 'Expired'
+        ELSE 'Active'
+    END
+"""
+
+_GOAL_PROGRESS_SQL = f"""
+    SELECT g.goal_id, g.goal_description, g.goal_metric, g.target_value, p.progress,
+           g.start_date, g.end_date, {_GOAL_STATUS} AS status
+    FROM goals g
+    {_GOAL_PROGRESS_JOIN}
+    WHERE g.user_id = %(user_id)s
+    ORDER BY g.end_date, g.goal_id;
+"""
+_GOAL_PROGRESS_COLUMNS = {
+    'goal_id': 'int64', 'goal_description': 'object', 'goal_metric': 'object', 'target_value': 'float64',
+    'progress': 'float64', 'start_date': 'datetime64[D]', 'end_date': 'datetime64[D]', 'status': 'object',
+}
+
+@instrumented
+@_cached('goals')
+def get_goal_progress(user_id, *, as_frame=False):
+    """Returns every goal of a user with its current progress, in one query.
+
+    Rows are (goal_id, description, metric, target_value, progress, start_date,
+    end_date, status), soonest deadline first. Progress and status are computed
+    from the workouts as of now, so they are current even between runs of the
+    evaluate_goals() job.
+    """
+    goals = _no_rows(_GOAL_PROGRESS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            goals = _fetch_all(
+                cur, _GOAL_PROGRESS_SQL, {'user_id': user_id, 'today': date.today()}, _GOAL_PROGRESS_COLUMNS, as_frame,
+            )
+    except (Exception, psycopg2.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching goal progress", error)
+    return goals
+
+# Evaluates one batch of Active goals after goal_id %(after)s and writes back
+# only the goals whose progress or status changed
+_EVALUATE_GOALS_SQL = f"""
+    WITH batch AS (
+        SELECT goal_id FROM goals
+        WHERE status = 'Active' AND goal_id > %(after)s
+        ORDER BY goal_id
+        LIMIT %(batch_size)s
+    ),
+    evaluated AS (
+        SELECT g.goal_id, p.progress, {_GOAL_STATUS} AS status
+        FROM batch b
+        JOIN goals g ON g.goal_id = b.goal_id
+        {_GOAL_PROGRESS_JOIN}
+    ),
+    updated AS (
+        UPDATE goals g
+        SET progress = e.progress, status = e.status, progress_updated_at = CURRENT_TIMESTAMP
+        FROM evaluated e
+        WHERE g.goal_id = e.goal_id AND (g.progress <> e.progress OR g.status <> e.status)
+        RETURNING g.user_id, g.status
+    )
+    SELECT (SELECT MAX(goal_id) FROM batch), (SELECT COUNT(*) FROM batch), COUNT(*),
+           COUNT(*) FILTER (WHERE status = 'Completed'), COUNT(*) FILTER (WHERE status = 'Expired'),
+           COALESCE(array_agg(DISTINCT user_id), '{{}}')
+    FROM updated;
+"""
+
+@instrumented
+def evaluate_goals(batch_size=None, today=None):
+    """Recomputes progress for every Active goal and marks reached or past-due ones.
+
+    Goals are processed in goal_id order, `batch_size` (default
+    GOAL_SETTINGS['batch_size']) per transaction, so memory use and lock time
+    stay bounded however many goals exist, and an interrupted run keeps the
+    batches it committed. `today` (default: today) decides which goals have
+    expired. Returns counts of goals 'evaluated', 'updated', 'completed' and
+    'expired', or None on error.
+    """
+    batch_size = batch_size or config.GOAL_SETTINGS['batch_size']
+    today = _parse_date(today or date.today())
+    totals = {'evaluated': 0, 'updated': 0, 'completed': 0, 'expired': 0}
+    after = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            while True:
+                cur.execute(_EVALUATE_GOALS_SQL, {'after': after, 'batch_size': batch_size, 'today': today})
+                last_id, evaluated, updated, completed, expired, user_ids = cur.fetchone()
+                conn.commit()
+                if user_ids:
+                    _cache.invalidate('goals', *user_ids)
+                if last_id is None:
+                    return totals
+                after = last_id
+                for key, count in zip(totals, (evaluated, updated, completed, expired)):
+                    totals[key] += count
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error evaluating goals", error)
+    return None
+
+
+# --- Calorie Backfill ---
+# Workouts stored without calories (before estimates were made at log time, or
+# with CALORIE_SETTINGS['estimate_on_log'] off) are estimated in workout_id
+# order, a batch per transaction; the partial index of migration 12 holds
+# exactly the workouts still waiting, so each batch is an index range scan.
+
+_CALORIE_BACKFILL_SQL = """
+    SELECT w.workout_id, w.workout_date, w.user_id, w.duration_minutes, u.weight_kg
+    FROM workouts w
+    JOIN users u ON u.user_id = w.user_id
+    WHERE w.workout_id > %(after)s
+      AND COALESCE(w.calories_burned, 0) = 0 AND NOT w.calories_estimated AND w.duration_minutes > 0
+    ORDER BY w.workout_id
+    LIMIT %(batch_size)s
+    FOR UPDATE OF w;
+"""
+
+_CALORIE_BACKFILL_COLUMNS = {
+    'workout_id': 'int64', 'workout_date': 'datetime64[D]', 'user_id': 'int64',
+    'duration_minutes': 'float64', 'weight_kg': 'float64',
+}
+
+_CALORIE_EXERCISES_SQL = """
+    SELECT e.workout_id, c.normalized_name, e.sets
+    FROM exercises e
+    JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+    WHERE e.workout_id = ANY(%(workout_ids)s) AND e.workout_date BETWEEN %(first_date)s AND %(last_date)s;
+"""
+
+_CALORIE_EXERCISE_COLUMNS = {'workout_id': 'int64', 'name': 'object', 'sets': 'float64'}
+
+def _estimate_stored_calories(batch, exercises):
+    """Estimates kcal for a batch of stored workouts (columns of _CALORIE_BACKFILL_SQL).
+
+    `exercises` are the batch's exercise rows (columns of _CALORIE_EXERCISES_SQL).
+    """
+    return calories.estimate_workouts(
+        batch['duration_minutes'], batch['weight_kg'],
+        np.searchsorted(batch['workout_id'], exercises['workout_id']), exercises['name'], exercises['sets'],
+        config.CALORIE_SETTINGS['default_weight_kg'],
+    )
+
+def _calorie_changes(batch, estimates):
+    """Returns the estimated workouts as rollup-delta dicts (calories only) with their workout_id."""
+    return [
+        {'workout_id': workout_id, 'user_id': user_id, 'workout_date': workout_date, 'duration': None, 'calories': kcal}
+        for workout_id, user_id, workout_date, kcal in zip(
+            batch['workout_id'].tolist(), batch['user_id'].tolist(),
+            batch['workout_date'].astype(object), estimates.tolist(),
+        )
+    ]
+
+def _apply_calorie_deltas(cur, changes):
+    """Adds the calories of `changes` to the rollup totals and period buckets (in user order)."""
+    totals, periods = _rollup_deltas(changes)
+    execute_values(cur, """
+        UPDATE user_workout_rollups AS r SET total_calories = r.total_calories + d.calories
+        FROM (VALUES %s) AS d(user_id, calories)
+        WHERE r.user_id = d.user_id;
+    """, [(user_id, t[2]) for user_id, t in sorted(totals.items())], page_size=10000)
+    execute_values(cur, """
+        UPDATE user_period_rollups AS p SET calories = p.calories + d.calories
+        FROM (VALUES %s) AS d(user_id, period_type, period_start, calories)
+        WHERE p.user_id = d.user_id AND p.period_type = d.period_type AND p.period_start = d.period_start::date;
+    """, [(*key, p[2]) for key, p in sorted(periods.items())], page_size=10000)
+
+@instrumented
+def backfill_calories(batch_size=None):
+    """Estimates calories for stored workouts that have none and marks them as estimated.
+
+    Workouts are processed in workout_id order, `batch_size` (default
+    CALORIE_SETTINGS['backfill_batch_size']) per transaction, so memory use and
+    lock time stay bounded however long the history is; an interrupted run
+    keeps the batches it committed and the next one carries on from there.
+    Rollups are adjusted by the calories added. Returns counts of 'workouts'
+    estimated, 'calories' added and 'batches', or None on error.
+    """
+    batch_size = batch_size or config.CALORIE_SETTINGS['backfill_batch_size']
+    totals = {'workouts': 0, 'calories': 0, 'batches': 0}
+    after = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            while True:
+                batch = columnar.fetch_columns(
+                    cur, _CALORIE_BACKFILL_SQL, {'after': after, 'batch_size': batch_size}, _CALORIE_BACKFILL_COLUMNS,
+                )
+                if not len(batch['workout_id']):
+                    conn.commit()
+                    return totals
+                exercises = columnar.fetch_columns(cur, _CALORIE_EXERCISES_SQL, {
+                    'workout_ids': batch['workout_id'].tolist(),
+                    'first_date': str(batch['workout_date'].min()), 'last_date': str(batch['workout_date'].max()),
+                }, _CALORIE_EXERCISE_COLUMNS)
+                changes = _calorie_changes(batch, _estimate_stored_calories(batch, exercises))
+                execute_values(cur, """
+                    UPDATE workouts AS w SET calories_burned = d.calories, calories_estimated = TRUE
+                    FROM (VALUES %s) AS d(workout_id, workout_date, calories)
+                    WHERE w.workout_id = d.workout_id AND w.workout_date = d.workout_date::date;
+                """, [(c['workout_id'], c['workout_date'], c['calories']) for c in changes], page_size=10000)
+                _apply_calorie_deltas(cur, changes)
+                conn.commit()
+                user_ids = sorted({c['user_id'] for c in changes})
+                _cache.invalidate('dashboard', *user_ids)
+                _cache.invalidate('goals', *user_ids)
+                after = changes[-1]['workout_id']
+                totals['workouts'] += len(changes)
+                totals['calories'] += sum(c['calories'] for c in changes)
+                totals['batches'] += 1
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error backfilling calories", error)
+    return None
+
+
+# --- Archival ---
+# Workouts from before the archive horizon (ARCHIVE_SETTINGS['horizon_months'])
+# are moved with their exercises into archived_workouts and archived_exercises
+# (migration 13), so the partitions and indexes that every per-user query uses
+# only hold recent history. What the moved workouts added to each user's weekly
+# and monthly buckets is kept in workout_summaries. Archiving leaves the rollups,
+# records and streaks as they are, and rebuilding or checking them counts the
+# summaries and archive too, so dashboards, charts and leaderboards still cover
+# the whole history. A user who opens their archived history gets it moved back
+# (restore_archived_workouts).
+
+def _archive_cutoff(horizon_months, today):
+    # First day of the oldest month kept in the hot tables
+    months = today.year * 12 + today.month - 1 - horizon_months
+    return date(months // 12, months % 12 + 1, 1)
+
+# The next `batch_users` users after %(after)s, except those who restored their
+# archive recently
+_ARCHIVE_USERS_SQL = """
+    SELECT COALESCE(array_agg(user_id ORDER BY user_id), '{}')
+    FROM (
+        SELECT u.user_id FROM users u
+        WHERE u.user_id > %(after)s
+          AND NOT EXISTS (
+              SELECT 1 FROM archive_restores r
+              WHERE r.user_id = u.user_id
+                AND r.restored_at > CURRENT_TIMESTAMP - %(restore_days)s * interval '1 day'
+          )
+        ORDER BY u.user_id
+        LIMIT %(batch_users)s
+    ) AS batch;
+"""
+
+# Moves a batch of users' workouts before %(cutoff)s, and the exercises of
+# exactly those workouts, into the archive, and adds the workouts to the users'
+# period summaries
+_ARCHIVE_BATCH_SQL = """
+    WITH moved AS (
+        DELETE FROM workouts
+        WHERE user_id = ANY(%(user_ids)s) AND workout_date < %(cutoff)s
+        RETURNING user_id, workout_date, workout_id, duration_minutes, calories_burned, calories_estimated, created_at
+    ),
+    archived AS (
+        INSERT INTO archived_workouts
+            (user_id, workout_date, workout_id, duration_minutes, calories_burned, calories_estimated, created_at)
+        SELECT * FROM moved
+    ),
+    deleted_exercises AS (
+        DELETE FROM exercises e
+        USING moved m
+        WHERE m.workout_id = e.workout_id AND m.workout_date = e.workout_date
+          AND e.user_id = ANY(%(user_ids)s) AND e.workout_date < %(cutoff)s
+        RETURNING e.user_id, e.workout_id, e.exercise_id, e.workout_date, e.catalog_id, e.sets, e.reps, e.weight_kg
+    ),
+    moved_exercises AS (
+        INSERT INTO archived_exercises
+            (user_id, workout_id, exercise_id, workout_date, catalog_id, sets, reps, weight_kg)
+        SELECT * FROM deleted_exercises
+        RETURNING 1
+    ),
+    summarized AS (
+        INSERT INTO workout_summaries AS s
+            (user_id, period_type, period_start, workouts, minutes, calories, duration_count, min_duration, max_duration)
+        SELECT user_id, period_type, period_start, COUNT(*),
+               COALESCE(SUM(duration_minutes), 0), COALESCE(SUM(calories_burned), 0),
+               COUNT(duration_minutes), MIN(duration_minutes), MAX(duration_minutes)
+        FROM moved
+        CROSS JOIN LATERAL (VALUES
+            ('week', date_trunc('week', workout_date)::date),
+            ('month', date_trunc('month', workout_date)::date)
+        ) AS period(period_type, period_start)
+        GROUP BY user_id, period_type, period_start
+        ORDER BY user_id, period_type, period_start
+        ON CONFLICT (user_id, period_type, period_start) DO UPDATE SET
+            workouts = s.workouts + EXCLUDED.workouts,
+            minutes = s.minutes + EXCLUDED.minutes,
+            calories = s.calories + EXCLUDED.calories,
+            duration_count = s.duration_count + EXCLUDED.duration_count,
+            min_duration = LEAST(s.min_duration, EXCLUDED.min_duration),
+            max_duration = GREATEST(s.max_duration, EXCLUDED.max_duration)
+    )
+    SELECT (SELECT COUNT(*) FROM moved), (SELECT COUNT(*) FROM moved_exercises),
+           (SELECT COUNT(DISTINCT user_id) FROM moved);
+"""
+
+@instrumented
+def archive_workouts(horizon_months=None, batch_users=None, today=None):
+    """Moves workouts from before the archive horizon, and their exercises, into the archive tables.
+
+    Workouts dated before the first day of the month `horizon_months` (default
+    ARCHIVE_SETTINGS['horizon_months']) months before `today` are moved,
+    `batch_users` (default ARCHIVE_SETTINGS['batch_users']) users per
+    transaction. Users who restored their archive within
+    ARCHIVE_SETTINGS['restore_days'] days are skipped. Returns counts of
+    'workouts' and 'exercises' archived and of 'users' they belonged to, or
+    None on error.
+    """
+    settings = config.ARCHIVE_SETTINGS
+    horizon_months = settings['horizon_months'] if horizon_months is None else horizon_months
+    batch_users = batch_users or settings['batch_users']
+    cutoff = _archive_cutoff(horizon_months, _parse_date(today or date.today()))
+    totals = {'workouts': 0, 'exercises': 0, 'users': 0}
+    after = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            while True:
+                cur.execute(_ARCHIVE_USERS_SQL, {
+                    'after': after, 'batch_users': batch_users, 'restore_days': settings['restore_days'],
+                })
+                user_ids = cur.fetchone()[0]
+                if not user_ids:
+                    break
+                cur.execute(_ARCHIVE_BATCH_SQL, {'user_ids': user_ids, 'cutoff': cutoff})
+                for key, count in zip(totals, cur.fetchone()):
+                    totals[key] += count
+                conn.commit()
+                after = user_ids[-1]
+            conn.commit()
+        # Exercise lists and histories only show what is left in the hot tables
+        _cache.invalidate('exercises')
+        return totals
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error archiving workouts", error)
+    return None
+
+# Moves all of a user's archived workouts and exercises back into the hot tables
+# and drops their summaries (the workouts now count from the workouts table)
+_RESTORE_ARCHIVE_SQL = """
+    WITH workouts_back AS (
+        DELETE FROM archived_workouts WHERE user_id = %(user_id)s
+        RETURNING workout_id, user_id, workout_date, duration_minutes, calories_burned, calories_estimated, created_at
+    ),
+    restored AS (
+        INSERT INTO workouts
+            (workout_id, user_id, workout_date, duration_minutes, calories_burned, calories_estimated, created_at)
+        SELECT * FROM workouts_back
+    ),
+    exercises_back AS (
+        DELETE FROM archived_exercises WHERE user_id = %(user_id)s
+        RETURNING exercise_id, workout_id, workout_date, user_id, catalog_id, sets, reps, weight_kg
+    ),
+    restored_exercises AS (
+        INSERT INTO exercises (exercise_id, workout_id, workout_date, user_id, catalog_id, sets, reps, weight_kg)
+        SELECT * FROM exercises_back
+    ),
+    summaries AS (
+        DELETE FROM workout_summaries WHERE user_id = %(user_id)s
+    ),
+    marked AS (
+        INSERT INTO archive_restores (user_id, restored_at) VALUES (%(user_id)s, CURRENT_TIMESTAMP)
+        ON CONFLICT (user_id) DO UPDATE SET restored_at = EXCLUDED.restored_at
+    )
+    SELECT COUNT(*) FROM workouts_back;
+"""
+
+@instrumented
+def restore_archived_workouts(user_id):
+    """Moves a user's archived workouts and exercises back into the workouts tables.
+
+    Called when the user opens their archived history; the archiver leaves them
+    alone for ARCHIVE_SETTINGS['restore_days'] days afterwards. Returns the
+    number of workouts restored, or None on error.
+    """
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT period_start FROM workout_summaries WHERE user_id = %s AND period_type = 'month';",
+                    (user_id,),
+                )
+                months = [row[0] for row in cur.fetchall()]
+            if not months:
+                return 0
+            _ensure_partitions(conn, months)
+            with conn.cursor() as cur:
+                cur.execute(_RESTORE_ARCHIVE_SQL, {'user_id': user_id})
+                restored = cur.fetchone()[0]
+                conn.commit()
+        _cache.invalidate('exercises', user_id)
+        return restored
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error restoring archived workouts", error)
+    return None
+
+_ARCHIVE_SUMMARY_SQL = """
+    SELECT COALESCE(SUM(workouts), 0), MIN(period_start), MAX(period_start)
+    FROM workout_summaries
+    WHERE user_id = %s AND period_type = 'month';
+"""
+
+def _archive_summary(row):
+    workouts, first_month, last_month = row
+    return {'workouts': int(workouts), 'first_month': first_month, 'last_month': last_month}
+
+@instrumented
+def get_archive_summary(user_id):
+    """Returns how much of a user's history is archived.
+
+    The dict holds 'workouts' (0 when nothing is archived) and the
+    'first_month' and 'last_month' they fall in.
+    """
+    summary = _archive_summary((0, None, None))
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_ARCHIVE_SUMMARY_SQL, (user_id,))
+            summary = _archive_summary(cur.fetchone())
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error fetching archive summary", error)
+    return summary
+
+
+# --- Bulk Ingestion ---
+
+def _bulk_insert_batch(conn, batch, report):
+    """Loads one batch in its own transaction, isolating bad rows on failure."""
+    try:
+        _ensure_partitions(conn, [w['workout_date'] for _, w in batch])
+        with conn.cursor() as cur:
+            _insert_workouts(cur, [w for _, w in batch], use_copy=True)
+        conn.commit()
+        _invalidate_workout_reads(*{w['user_id'] for _, w in batch})
+        report['workouts_inserted'] += len(batch)
+        report['exercises_inserted'] += sum(len(w['exercises']) for _, w in batch)
+        return
+    except psycopg2.DatabaseError:
+        conn.rollback()
+
+    # The batch was rejected as a whole (e.g. an unknown user_id). Retry it row by
+    # row under savepoints so the valid rows still commit together.
+    with conn.cursor() as cur:
+        for index, workout in batch:
+            cur.execute("SAVEPOINT bulk_row;")
+            try:
+                _insert_workouts(cur, [workout])
+                cur.execute("RELEASE SAVEPOINT bulk_row;")
+                report['workouts_inserted'] += 1
+                report['exercises_inserted'] += len(workout['exercises'])
+            except psycopg2.DatabaseError as error:
+                cur.execute("ROLLBACK TO SAVEPOINT bulk_row;")
+                message = error.diag.message_primary or str(error).strip()
+                report['rejected'].append({'index': index, 'error': message})
+    conn.commit()
+    _invalidate_workout_reads(*{w['user_id'] for _, w in batch})
+
+@instrumented
+def bulk_log_workouts(records, batch_size=1000, on_batch=None):
+    """Loads many workouts (with their exercises) from any iterable of dicts.
+
+    Records use the same fields as log_workout (user_id, workout_date, duration,
+    calories, exercises) and are streamed in batches of `batch_size`; each batch
+    is written with COPY in a single transaction. Records that fail validation
+    or are refused by the database are skipped and listed in the report's
+    'rejected' entries with their position in the input. `on_batch`, if given,
+    is called with the running report after every batch.
+
+    Returns a report dict with counts, elapsed seconds and rows per second.
+    """
+    return _bulk_load(sys.modules[__name__], records, batch_size, on_batch)
+
+def _bulk_load(engine, records, batch_size, on_batch):
+    """bulk_log_workouts for `engine` (this module or sqlite_backend), which writes each batch."""
+    report = {
+        'workouts_inserted': 0,
+        'exercises_inserted': 0,
+        'rejected': [],
+        'batches': 0,
+        'elapsed_seconds': 0.0,
+        'rows_per_second': 0.0,
+    }
+    started = time.perf_counter()
+
+    def update_rates():
+        report['elapsed_seconds'] = time.perf_counter() - started
+        rows = report['workouts_inserted'] + report['exercises_inserted']
+        report['rows_per_second'] = rows / report['elapsed_seconds'] if report['elapsed_seconds'] else 0.0
+
+    def write(conn, batch):
+        engine._bulk_insert_batch(conn, batch, report)
+        report['batches'] += 1
+        update_rates()
+        if on_batch:
+            on_batch(report)
+
+    try:
+        with engine.db_connection() as conn:
+            batch = []
+            for index, record in enumerate(records):
+                try:
+                    batch.append((index, _normalize_workout(record)))
+                except (ValueError, TypeError, AttributeError) as error:
+                    report['rejected'].append({'index': index, 'error': str(error)})
+                    continue
+                if len(batch) >= batch_size:
+                    write(conn, batch)
+                    batch = []
+            if batch:
+                write(conn, batch)
+    except Exception as error:
+        engine._report_error("Error during bulk workout load", error)
+    update_rates()
+    return report
+
+
+# --- Export ---
+# Workouts are exported one exercise per row, in the CSV layout bulk_import.py
+# reads (workout_ref is the workout_id), so an export loads into another database
+# as is; a workout without exercises is one row with empty exercise columns. CSV
+# is streamed by COPY ... TO STDOUT and Parquet is written from a server-side
+# cursor a chunk at a time, so memory use does not grow with the export.
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+# Rows per Parquet row group (and per fetch from the server-side cursor)
+EXPORT_CHUNK_ROWS = 50_000
+
+_EXPORT_COLUMNS = {
+    'workout_ref': 'int64', 'user_id': 'int64', 'workout_date': 'datetime64[D]', 'duration_minutes': 'float64',
+    'calories_burned': 'float64', 'exercise_name': 'object', 'sets': 'float64', 'reps': 'float64', 'weight_kg': 'float64',
+}
+
+def available_export_formats():
+    """Returns the export formats usable here ('parquet' only when pyarrow is installed)."""
+    return tuple(fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or pa is not None)
+
+def _export_query(user_id):
+    # Returns (sql, params) for one user's workouts, or everyone's when user_id is None;
+    # archived workouts are exported along with the hot ones
+    where = "WHERE w.user_id = %(user_id)s" if user_id is not None else ""
+    return f"""
+        SELECT workout_ref, user_id, workout_date, duration_minutes, calories_burned,
+               exercise_name, sets, reps, weight_kg
+        FROM (
+            SELECT w.workout_id AS workout_ref, w.user_id, w.workout_date, w.duration_minutes, w.calories_burned,
+                   c.name AS exercise_name, e.sets, e.reps, e.weight_kg, e.exercise_id
+            FROM workouts w
+            LEFT JOIN exercises e ON e.workout_id = w.workout_id AND e.workout_date = w.workout_date
+            LEFT JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+            {where}
+            UNION ALL
+            SELECT w.workout_id, w.user_id, w.workout_date, w.duration_minutes, w.calories_burned,
+                   c.name, e.sets, e.reps, e.weight_kg, e.exercise_id
+            FROM archived_workouts w
+            LEFT JOIN archived_exercises e ON e.user_id = w.user_id AND e.workout_id = w.workout_id
+            LEFT JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+            {where}
+        ) AS history
+        ORDER BY user_id, workout_date, workout_ref, exercise_id
+    """, {'user_id': user_id}
+
+def _parquet_schema():
+    return pa.schema([
+        ('workout_ref', pa.int64()), ('user_id', pa.int32()), ('workout_date', pa.date32()),
+        ('duration_minutes', pa.int32()), ('calories_burned', pa.int32()), ('exercise_name', pa.string()),
+        ('sets', pa.int32()), ('reps', pa.int32()), ('weight_kg', pa.float64()),
+    ])
+
+class _CountingWriter:
+    """Wraps a binary file, counting bytes and lines and calling `on_write` (if given) after each write."""
+
+    def __init__(self, out, on_write=None):
+        self._out = out
+        self._on_write = on_write
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, data):
+        self._out.write(data)
+        self.bytes += len(data)
+        self.lines += data.count(b"\n")
+        if self._on_write:
+            self._on_write()
+        return len(data)
+
+    def __getattr__(self, name):
+        return getattr(self._out, name)
+
+@instrumented
+def export_workouts(out, fmt='csv', user_id=None, on_progress=None, progress_every=EXPORT_CHUNK_ROWS):
+    """Streams one user's (or, with user_id=None, everyone's) workouts and exercises to a file.
+
+    `out` is a binary file object; `fmt` is 'csv' or 'parquet' (which needs
+    pyarrow). Rows are ordered by user, date and workout. `on_progress`, if
+    given, is called with the running report about every `progress_every` rows.
+
+    Returns a report dict with 'rows', 'bytes', 'elapsed_seconds',
+    'rows_per_second' and 'mb_per_second', or None on error.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"fmt must be one of {', '.join(EXPORT_FORMATS)}")
+    if fmt == 'parquet' and pa is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    report = {'rows': 0, 'bytes': 0, 'elapsed_seconds': 0.0, 'rows_per_second': 0.0, 'mb_per_second': 0.0}
+    started = time.perf_counter()
+    next_report = progress_every
+
+    def update(rows):
+        nonlocal next_report
+        report['rows'], report['bytes'] = rows, sink.bytes
+        report['elapsed_seconds'] = time.perf_counter() - started
+        if report['elapsed_seconds']:
+            report['rows_per_second'] = report['rows'] / report['elapsed_seconds']
+            report['mb_per_second'] = report['bytes'] / report['elapsed_seconds'] / 1e6
+        if on_progress and rows >= next_report:
+            next_report = rows + progress_every
+            on_progress(report)
+
+    if fmt == 'csv':
+        # COPY reports no row count until it finishes; count lines (minus the header) as they stream
+        sink = _CountingWriter(out, lambda: update(max(sink.lines - 1, 0)))
+    else:
+        sink = _CountingWriter(out)
+    sql, params = _export_query(user_id)
+    try:
+        with db_connection() as conn:
+            if fmt == 'csv':
+                with conn.cursor() as cur:
+                    query = cur.mogrify(sql, params).decode()
+                    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", sink)
+                    rows = cur.rowcount
+            else:
+                schema = _parquet_schema()
+                rows = 0
+                with conn.cursor(name="export_workouts") as cur, pq.ParquetWriter(sink, schema) as writer:
+                    columnar.register_types(cur)
+                    cur.execute(sql, params)
+                    for chunk in columnar.iter_chunks(cur, _EXPORT_COLUMNS, EXPORT_CHUNK_ROWS):
+                        arrays = [
+                            pa.array(chunk[field.name], from_pandas=True).cast(field.type) for field in schema
+                        ]
+                        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                        rows += len(chunk['workout_ref'])
+                        update(rows)
+        update(rows)
+        return report
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error exporting workouts", error)
+    return None
+
+
+# --- Initial Data Seeding (for demonstration) ---
+def seed_data():
+    """Adds some initial data to the database for demonstration purposes."""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM users);")
+            has_users = cur.fetchone()[0]
+    except (Exception, psycopg2.DatabaseError) as error:
+        _report_error("Error checking for existing users", error)
+        return
+    if not has_users: # Only seed if users table is empty
+        print("Seeding initial data...")
+        # Users
+        u1 = add_user("Alice", "alice@email.com", 60.5, 165)
+        u2 = add_user("Bob", "bob@email.com", 85.0, 180)
+        u3 = add_user("Charlie", "charlie@email.com", 72.3, 175)
+        
+        # Friendships (Alice is friends with Bob and Charlie)
+        add_friend(u1, u2)
+        add_friend(u1, u3)
+        
+        # Workouts
+        today = date.today()
+        # Alice's Workouts
+        log_workout(u1, today - timedelta(days=1), 60, 300, [{'name': 'Squat', 'sets': 3, 'reps': 10, 'weight': 50}])
+        log_workout(u1, today - timedelta(days=3), 45, 250, [{'name': 'Bench Press', 'sets': 3, 'reps': 8, 'weight': 60}])
+        # Bob's Workouts
+        log_workout(u2, today - timedelta(days=2), 90, 500, [{'name': 'Deadlift', 'sets': 5, 'reps': 5, 'weight': 120}])
+        # Charlie's Workouts
+        log_workout(u3, today, 75, 400, [{'name': 'Running', 'sets': 1, 'reps': 1, 'weight': 0}])
+        
+        # Goals for Alice
+        set_goal(u1, "Workout 3 times this week", 3, today - timedelta(days=today.weekday()), today + timedelta(days=6-today.weekday()))
+        print("Seeding complete.")
+
+
+# Main execution
+if __name__ == "__main__":
+    bootstrap()
\ No newline at end of file
@@ -0,0 +1,344 @@
+# async_backend.py
+#
+# asyncio versions of the Backend_fft read functions, on asyncpg with a pool of
+# their own, so a page can issue all of its reads at once and wait for the
+# slowest instead of the sum:
+#
+#   stats, (latest, _) = await asyncio.gather(
+#       get_user_dashboard_stats(user_id), get_workout_history_page(user_id, 1))
+#
+# Synchronous code (the Streamlit frontend) uses gather_reads(), which runs the
+# reads on a background event loop and blocks until all of them are done:
+#
+#   bundle, exercises = gather_reads(
+#       (pb.get_history_bundle, user_id), (be.get_user_exercises, user_id))
+#
+# Queries, result shapes and the read cache are shared with Backend_fft, so both
+# APIs return the same values. asyncpg is optional: without it gather_reads()
+# runs the same reads concurrently on worker threads over the psycopg2 pool, as
+# it does for page bundles, reads without an async twin and every read of the
+# SQLite engine.
+
+import asyncio
+import contextvars
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+try:
+    import asyncpg
+except ImportError:  # optional dependency
+    asyncpg = None
+
+import Backend_fft as be
+import columnar
+import config
+import instrumentation
+from instrumentation import instrumented
+
+# Seconds gather_reads() waits for a page's reads before giving up
+READ_TIMEOUT = config.POOL_SETTINGS["timeout"]
+
+_loop = None
+_loop_lock = threading.Lock()
+_pool = None
+_pool_lock = None
+_executor = None
+
+
+# --- Event Loop and Pool ---
+
+def _get_loop():
+    """Returns the background event loop, starting its thread on first use."""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-backend", daemon=True).start()
+                _loop = loop
+    return _loop
+
+async def _init_connection(conn):
+    # Decode json columns the way psycopg2 does
+    await conn.set_type_codec("json", encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+async def get_pool():
+    """Returns the shared asyncpg pool, creating it on first use (sized like the psycopg2 pool)."""
+    global _pool, _pool_lock
+    if _pool is None:
+        if _pool_lock is None:
+            _pool_lock = asyncio.Lock()
+        async with _pool_lock:
+            if _pool is None:
+                db = config.DB_SETTINGS
+                _pool = await asyncpg.create_pool(
+                    database=db["dbname"], user=db["user"], password=db["password"] or None,
+                    host=db["host"], port=int(db["port"]), timeout=db["connect_timeout"],
+                    min_size=config.POOL_SETTINGS["min_size"], max_size=config.POOL_SETTINGS["max_size"],
+                    init=_init_connection,
+                )
+    return _pool
+
+def close_pool():
+    """Closes the asyncpg pool and stops the background loop."""
+    global _loop, _pool, _pool_lock
+    with _loop_lock:
+        loop, _loop = _loop, None
+    if loop is None:
+        return
+    if _pool is not None:
+        asyncio.run_coroutine_threadsafe(_pool.close(), loop).result(READ_TIMEOUT)
+        _pool = None
+    # The lock belongs to the stopped loop; the next loop makes its own
+    _pool_lock = None
+    loop.call_soon_threadsafe(loop.stop)
+
+
+# --- Query Helpers ---
+
+_PARAM = re.compile(r"%\((\w+)\)s|%s|%%")
+
+def _to_asyncpg(sql):
+    """Rewrites a psycopg2 query (%s / %(name)s placeholders) for asyncpg ($1, $2, ...).
+
+    Returns (sql, names); names is None for positional queries, otherwise the
+    parameter names in $n order.
+    """
+    names, count = [], 0
+
+    def replace(match):
+        nonlocal count
+        if match.group(0) == "%%":
+            return "%"
+        if match.group(1) is None:
+            count += 1
+            return f"${count}"
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+
+    converted = _PARAM.sub(replace, sql)
+    return converted, (names if names else None)
+
+_converted = {}
+
+async def _fetch(sql, params):
+    """Runs a Backend_fft query on a pooled asyncpg connection and returns tuples."""
+    if sql not in _converted:
+        _converted[sql] = _to_asyncpg(sql)
+    query, names = _converted[sql]
+    args = [params[name] for name in names] if names else list(params)
+    started = time.perf_counter()
+    async with (await get_pool()).acquire() as conn:
+        instrumentation.record_acquire(time.perf_counter() - started)
+        started = time.perf_counter()
+        rows = await conn.fetch(query, *args)
+    instrumentation.record_query(sql, time.perf_counter() - started, len(rows))
+    return [tuple(row) for row in rows]
+
+# Same entries as the Backend_fft reads of the same name, so sync and async reads share them
+_cached = be._cache.acached
+
+
+# --- Async Read API ---
+# Same signatures (as_frame included), return values and error handling as the
+# Backend_fft functions of the same name.
+
+async def _fetch_all(sql, params, columns, as_frame):
+    rows = await _fetch(sql, params)
+    return columnar.frame_from_rows(rows, columns) if as_frame else rows
+
+@instrumented
+@_cached('profile')
+async def get_user_profile(user_id):
+    try:
+        rows = await _fetch(be._PROFILE_SQL, (user_id,))
+        return rows[0] if rows else None
+    except Exception as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching user profile", error)
+    return None
+
+@instrumented
+async def get_user_workouts(user_id, limit=None, *, as_frame=False):
+    try:
+        return await _fetch_all(be._USER_WORKOUTS_SQL, (user_id, limit), be._WORKOUT_COLUMNS, as_frame)
+    except Exception as error:
+        be._report_error("Error fetching workouts", error)
+    return be._no_rows(be._WORKOUT_COLUMNS, as_frame)
+
+@instrumented
+async def get_workout_details(workout_id, *, as_frame=False):
+    try:
+        return await _fetch_all(be._WORKOUT_DETAILS_SQL, (workout_id,), be._EXERCISE_COLUMNS, as_frame)
+    except Exception as error:
+        be._report_error("Error fetching workout details", error)
+    return be._no_rows(be._EXERCISE_COLUMNS, as_frame)
+
+@instrumented
+@_cached('exercises')
+async def get_user_exercises(user_id, *, as_frame=False):
+    try:
+        return await _fetch_all(be._USER_EXERCISES_SQL, (user_id,), be._USER_EXERCISES_COLUMNS, as_frame)
+    except Exception as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching exercises", error)
+    return be._no_rows(be._USER_EXERCISES_COLUMNS, as_frame)
+
+@instrumented
+async def get_workout_history_page(user_id, page_size=20, before=None):
+    before_date, before_id = before if before else (None, None)
+    try:
+        rows = await _fetch(be._HISTORY_PAGE_SQL, {
+            'user_id': user_id, 'before_date': before_date, 'before_id': before_id, 'limit': page_size + 1,
+        })
+        return be._history_page(rows, page_size)
+    except Exception as error:
+        be._report_error("Error fetching workout history", error)
+    return [], None
+
+@instrumented
+@_cached('friends')
+async def get_user_friends(user_id, *, as_frame=False):
+    try:
+        return await _fetch_all(be._FRIENDS_SQL, {'user_id': user_id}, be._FRIENDS_COLUMNS, as_frame)
+    except Exception as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching friends", error)
+    return be._no_rows(be._FRIENDS_COLUMNS, as_frame)
+
+@instrumented
+@_cached('suggestions')
+async def get_friend_suggestions(user_id, limit=10):
+    try:
+        return await _fetch(be._SUGGESTIONS_SQL, {"user_id": user_id, "limit": limit, "fanout": be.SUGGESTION_FANOUT})
+    except Exception as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching friend suggestions", error)
+    return []
+
+@instrumented
+@_cached('goals')
+async def get_user_goals(user_id, *, as_frame=False):
+    try:
+        return await _fetch_all(be._GOALS_SQL, (user_id,), be._GOALS_COLUMNS, as_frame)
+    except Exception as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching goals", error)
+    return be._no_rows(be._GOALS_COLUMNS, as_frame)
+
+@instrumented
+@_cached('dashboard')
+async def get_user_dashboard_stats(user_id):
+    try:
+        rows = await _fetch(be._DASHBOARD_SQL, be._dashboard_params(user_id))
+        return be._dashboard_stats(rows[0])
+    except Exception as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching dashboard stats", error)
+    return {}
+
+@instrumented
+async def get_workout_timeseries(user_id, resolution='week', start=None, end=None, max_points=400, *, as_frame=False):
+    sql, params = be._timeseries_query(
+        user_id, resolution, be._parse_date(start) if start else None, be._parse_date(end) if end else None, max_points,
+    )
+    try:
+        return await _fetch_all(sql, params, be._TIMESERIES_COLUMNS, as_frame)
+    except Exception as error:
+        be._report_error("Error fetching workout time series", error)
+    return be._no_rows(be._TIMESERIES_COLUMNS, as_frame)
+
+@instrumented
+@_cached('leaderboard')
+async def get_weekly_leaderboard(user_id, week_start=None, *, as_frame=False):
+    week = be._week_start(be._parse_date(week_start or date.today()))
+    try:
+        return await _fetch_all(
+            be._WEEKLY_LEADERBOARD_SQL, {'user_id': user_id, 'week': week}, be._LEADERBOARD_COLUMNS, as_frame,
+        )
+    except Exception as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching leaderboard", error)
+    return be._no_rows(be._LEADERBOARD_COLUMNS, as_frame)
+
+@instrumented
+async def get_archive_summary(user_id):
+    try:
+        rows = await _fetch(be._ARCHIVE_SUMMARY_SQL, (user_id,))
+        return be._archive_summary(rows[0])
+    except Exception as error:
+        be._report_error("Error fetching archive summary", error)
+    return be._archive_summary((0, None, None))
+
+# Backend_fft function name -> async counterpart, for gather_reads()
+ASYNC_READS = {
+    func.__name__: func for func in (
+        get_user_profile, get_user_workouts, get_workout_details, get_user_exercises, get_workout_history_page,
+        get_user_friends, get_friend_suggestions, get_user_goals, get_user_dashboard_stats,
+        get_workout_timeseries, get_weekly_leaderboard, get_archive_summary,
+    )
+}
+
+
+# --- Sync Facade ---
+
+def available():
+    """True when asyncpg is installed, i.e. gather_reads() uses the async driver."""
+    return asyncpg is not None
+
+async def _gather(page, coroutines):
+    async def in_page(coroutine):
+        # Each task has its own context; attribute its queries to the caller's page
+        instrumentation.bind_page(page)
+        return await coroutine
+    return await asyncio.gather(*(in_page(c) for c in coroutines))
+
+def run(*coroutines):
+    """Runs coroutines from this module concurrently on the background loop and returns their results."""
+    future = asyncio.run_coroutine_threadsafe(_gather(instrumentation.current_page(), coroutines), _get_loop())
+    return future.result(READ_TIMEOUT)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _loop_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(config.POOL_SETTINGS["max_size"], thread_name_prefix="backend-read")
+    return _executor
+
+def gather_reads(*calls):
+    """Runs several reads concurrently and returns their results in order.
+
+    Each call is a tuple of a read function of either storage engine (or a
+    page bundle loader) and its positional arguments, e.g.
+    (be.get_user_workouts, user_id, 1). Backend_fft reads with an async
+    counterpart in this module run on the asyncpg pool; the rest (or all of
+    them, when asyncpg is not installed) run on worker threads over the
+    engine's own connections. Either way the reads overlap, so the page waits
+    for the slowest one rather than for all of them in turn.
+    """
+    results = [None] * len(calls)
+    async_calls, thread_calls = [], []
+    for index, (func, *args) in enumerate(calls):
+        counterpart = ASYNC_READS.get(func.__name__) if available() and func.__module__ == be.__name__ else None
+        if counterpart is not None:
+            async_calls.append((index, counterpart(*args)))
+        else:
+            thread_calls.append((index, func, args))
+
+    futures = [
+        # A copy of the caller's context per call keeps page attribution working
+        (index, _get_executor().submit(contextvars.copy_context().run, func, *args))
+        for index, func, args in thread_calls
+    ]
+    if async_calls:
+        for (index, _), value in zip(async_calls, run(*(c for _, c in async_calls))):
+            results[index] = value
+    for index, future in futures:
+        results[index] = future.result(READ_TIMEOUT)
+    return results
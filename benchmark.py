@@ -0,0 +1,511 @@
+# benchmark.py
+#
+# Synthetic data generator and latency benchmark for the backend API, on either
+# storage engine (see storage.py).
+#
+#   # 1. Point the app at a scratch database (the generator writes a lot of data)
+#   export FITNESS_DB_NAME=fitness_bench
+#
+#   # 2. Generate a dataset (100k users, ~10M workouts, ~30M exercises)
+#   python benchmark.py generate --users 100000 --workouts 10000000 --reset --yes
+#
+#   # 3. Measure every backend function alone and under concurrent callers
+#   python benchmark.py run --concurrency 1,8,32 --output results/today.json
+#
+#   # 4. Compare two runs and fail on regressions
+#   python benchmark.py compare results/yesterday.json results/today.json
+#
+# --engine sqlite generates and runs the same workload on the embedded engine
+# (FITNESS_SQLITE_PATH), so comparing its results file with a PostgreSQL run
+# shows the two engines side by side:
+#
+#   python benchmark.py generate --engine sqlite --users 100000 --workouts 10000000 --reset --yes
+#   python benchmark.py run --engine sqlite --output results/sqlite.json
+#   python benchmark.py compare results/postgres.json results/sqlite.json
+#
+# Results are JSON: one entry per (function, concurrency) with p50/p95/p99
+# latency in milliseconds, throughput in calls/sec and the error count.
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+
+import config
+import storage
+
+be = storage.backend()
+pb = storage.bundles()
+
+# Exercise names, including the spelling variants real users type
+EXERCISE_NAMES = [
+    "Squat", "squat", "Squat ", "Back Squat", "Bench Press", "bench press", "Deadlift", "Overhead Press",
+    "Barbell Row", "Pull Up", "Pull-up", "Push Up", "Lunge", "Leg Press", "Bicep Curl", "Tricep Dip",
+    "Running", "Cycling", "Rowing", "Plank", "Lat Pulldown", "Hip Thrust", "Kettlebell Swing", "Burpee",
+]
+
+TABLES = ["exercises", "workouts", "goals", "friends", "users"]
+
+# Tables derived from TABLES, emptied along with them on SQLite (where
+# TRUNCATE ... CASCADE does not exist)
+DERIVED_TABLES = ["personal_records", "global_leaderboard", "global_leaderboard_refreshes",
+                  "user_period_rollups", "user_workout_rollups", "user_activity_years", "user_streaks",
+                  "archived_exercises", "archived_workouts", "workout_summaries", "archive_restores"]
+
+
+def use_engine(engine):
+    """Points the benchmark (and the backend API) at another storage engine."""
+    global be, pb
+    config.STORAGE_SETTINGS["engine"] = storage.engine_name(engine)
+    be, pb = storage.backend(), storage.bundles()
+
+def _sqlite():
+    return storage.engine_name() == "sqlite"
+
+
+# --- Data Generation ---
+
+def _copy_frame(cur, table, frame):
+    """COPYs a DataFrame into `table` (columns named after the frame's columns).
+
+    SQLite has no COPY; rows are inserted with one prepared statement instead.
+    """
+    if _sqlite():
+        cur.executemany(
+            f"INSERT INTO {table} ({', '.join(frame.columns)}) VALUES ({', '.join('?' * len(frame.columns))});",
+            frame.to_dict("split", index=False)["data"],
+        )
+        return
+    buffer = io.StringIO()
+    frame.to_csv(buffer, header=False, index=False)
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(frame.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+def _next_id(cur, table, column):
+    cur.execute(f"SELECT COALESCE(MAX({column}), 0) + 1 FROM {table};")
+    return cur.fetchone()[0]
+
+def _sync_sequence(cur, table, column):
+    if _sqlite():
+        return  # rowids and the sequences table already continue after MAX(column)
+    cur.execute(
+        f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE((SELECT MAX({column}) FROM {table}), 0) + 1, false);",
+        (table, column),
+    )
+
+def _power_law_counts(rng, n, total, alpha):
+    """Splits `total` into n non-negative counts following a Pareto distribution."""
+    weights = rng.pareto(alpha, n) + 1.0
+    counts = np.floor(weights / weights.sum() * total).astype(np.int64)
+    # Hand out the rounding remainder to random users so the sum is exact
+    remainder = int(total - counts.sum())
+    if remainder > 0:
+        counts[rng.integers(0, n, remainder)] += 1
+    return counts
+
+def generate(users, workouts, exercises_per_workout, friends_per_user, days, seed, chunk_users, reset):
+    """Loads a synthetic dataset with COPY (batched inserts on SQLite), then rebuilds the derived tables."""
+    rng = np.random.default_rng(seed)
+    started = time.perf_counter()
+    today = date.today()
+
+    be.ensure_schema()
+    with be.db_connection() as conn, conn.cursor() as cur:
+        if reset:
+            if _sqlite():
+                for table in DERIVED_TABLES + TABLES:
+                    cur.execute(f"DELETE FROM {table};")
+                cur.execute("UPDATE sequences SET next_id = 1;")
+            else:
+                cur.execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE;")
+            conn.commit()
+
+        # Users
+        first_user = _next_id(cur, "users", "user_id")
+        user_ids = np.arange(first_user, first_user + users, dtype=np.int64)
+        _copy_frame(cur, "users", pd.DataFrame({
+            "user_id": user_ids,
+            "name": [f"User {i}" for i in user_ids],
+            "email": [f"user{i}@bench.example" for i in user_ids],
+            "weight_kg": np.round(rng.normal(75, 12, users).clip(40, 180), 2),
+            "height_cm": np.round(rng.normal(172, 10, users).clip(140, 210), 2),
+        }))
+        _sync_sequence(cur, "users", "user_id")
+        conn.commit()
+        print(f"users: {users:,} loaded", file=sys.stderr)
+
+        # Friends: power-law degrees, targets chosen by popularity (preferential attachment)
+        degrees = np.minimum(rng.zipf(2.0, users) * max(friends_per_user // 2, 1), users - 1)
+        popularity = rng.pareto(1.5, users) + 1.0
+        popularity /= popularity.sum()
+        sources = np.repeat(user_ids, degrees)
+        targets = rng.choice(user_ids, size=len(sources), p=popularity)
+        pairs = np.stack([np.concatenate([sources, targets]), np.concatenate([targets, sources])], axis=1)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        pairs = np.unique(pairs, axis=0)
+        _copy_frame(cur, "friends", pd.DataFrame({"user_id_1": pairs[:, 0], "user_id_2": pairs[:, 1]}))
+        conn.commit()
+        print(f"friends: {len(pairs):,} rows loaded", file=sys.stderr)
+
+        # Workouts and exercises, a chunk of users at a time to bound memory
+        be.create_partitions(today - timedelta(days=days), today)
+        per_user = _power_law_counts(rng, users, workouts, alpha=1.5)
+        next_workout = _next_id(cur, "workouts", "workout_id")
+        catalog_ids = be._catalog_ids(cur, EXERCISE_NAMES)
+        exercise_ids = np.asarray([catalog_ids[name] for name in EXERCISE_NAMES], dtype=np.int64)
+        loaded_workouts = loaded_exercises = 0
+        for offset in range(0, users, chunk_users):
+            counts = per_user[offset:offset + chunk_users]
+            n = int(counts.sum())
+            if n == 0:
+                continue
+            workout_ids = np.arange(next_workout, next_workout + n, dtype=np.int64)
+            next_workout += n
+            durations = rng.normal(45, 20, n).clip(5, 240).astype(np.int64)
+            workout_dates = (pd.to_datetime(today) - pd.to_timedelta(rng.integers(0, days, n), unit="D")).strftime("%Y-%m-%d")
+            workout_users = np.repeat(user_ids[offset:offset + chunk_users], counts)
+            _copy_frame(cur, "workouts", pd.DataFrame({
+                "workout_id": workout_ids,
+                "user_id": workout_users,
+                "workout_date": workout_dates,
+                "duration_minutes": durations,
+                # Roughly a third of sessions were logged without calories
+                "calories_burned": np.where(rng.random(n) < 0.35, 0, (durations * rng.normal(7, 2, n).clip(3, 14)).astype(np.int64)),
+            }))
+            per_workout = rng.poisson(exercises_per_workout, n).clip(0, 10)
+            m = int(per_workout.sum())
+            _copy_frame(cur, "exercises", pd.DataFrame({
+                "workout_id": np.repeat(workout_ids, per_workout),
+                "workout_date": np.repeat(np.asarray(workout_dates), per_workout),
+                "user_id": np.repeat(workout_users, per_workout),
+                "catalog_id": exercise_ids[rng.integers(0, len(EXERCISE_NAMES), m)],
+                "sets": rng.integers(1, 6, m),
+                "reps": rng.integers(1, 16, m),
+                "weight_kg": np.round(rng.gamma(2.0, 25.0, m).clip(0, 300) * 2) / 2,
+            }))
+            conn.commit()
+            loaded_workouts += n
+            loaded_exercises += m
+            elapsed = time.perf_counter() - started
+            print(f"workouts: {loaded_workouts:,} / exercises: {loaded_exercises:,} "
+                  f"({(loaded_workouts + loaded_exercises) / elapsed:,.0f} rows/sec)", file=sys.stderr)
+        _sync_sequence(cur, "workouts", "workout_id")
+        _sync_sequence(cur, "exercises", "exercise_id")
+
+        # One active goal for a tenth of the users
+        goal_users = rng.choice(user_ids, size=max(users // 10, 1), replace=False)
+        _copy_frame(cur, "goals", pd.DataFrame({
+            "user_id": goal_users,
+            "goal_description": "Work out 3 times a week",
+            "target_value": 3,
+            "start_date": (today - timedelta(days=today.weekday())).isoformat(),
+            "end_date": (today + timedelta(days=6 - today.weekday())).isoformat(),
+        }))
+        conn.commit()
+        cur.execute("ANALYZE;")
+        conn.commit()
+
+    print("rebuilding rollups, personal records and leaderboards...", file=sys.stderr)
+    be.rebuild_rollups()
+    be.rebuild_personal_records()
+    be.refresh_global_leaderboard("week")
+    be.refresh_global_leaderboard("month")
+    be.clear_cache()
+    print(f"dataset ready in {time.perf_counter() - started:,.1f}s", file=sys.stderr)
+
+
+# --- Benchmark Cases ---
+
+class Sampler:
+    """Picks realistic arguments (existing users, workouts, weeks) for each call."""
+
+    def __init__(self, seed):
+        self._local = threading.local()
+        self._seed = seed
+        with be.db_connection() as conn, conn.cursor() as cur:
+            # A random sample of active users plus the heaviest ones, so long
+            # histories are always exercised
+            cur.execute("SELECT user_id FROM user_workout_rollups ORDER BY random() LIMIT 5000;")
+            self.user_ids = [row[0] for row in cur.fetchall()] or [1]
+            cur.execute("SELECT user_id FROM user_workout_rollups ORDER BY total_workouts DESC LIMIT 50;")
+            self.user_ids += [row[0] for row in cur.fetchall()]
+            if _sqlite():
+                cur.execute("SELECT workout_id FROM workouts WHERE abs(random()) % 100 = 0 LIMIT 5000;")
+            else:
+                cur.execute("SELECT workout_id FROM workouts TABLESAMPLE SYSTEM (1) LIMIT 5000;")
+            self.workout_ids = [row[0] for row in cur.fetchall()] or [1]
+
+    @property
+    def rng(self):
+        if not hasattr(self._local, "rng"):
+            self._local.rng = random.Random(f"{self._seed}-{threading.get_ident()}")
+        return self._local.rng
+
+    def user(self):
+        return self.rng.choice(self.user_ids)
+
+    def workout(self):
+        return self.rng.choice(self.workout_ids)
+
+    def past_week(self):
+        return date.today() - timedelta(weeks=self.rng.randrange(0, 12))
+
+def _log_workout(s):
+    be.log_workout(
+        s.user(), date.today() - timedelta(days=s.rng.randrange(0, 30)), s.rng.randrange(10, 120), 300,
+        [{'name': s.rng.choice(EXERCISE_NAMES), 'sets': 3, 'reps': 10, 'weight': 50.0} for _ in range(3)],
+    )
+
+# Every public read and write path the app uses, with a realistic argument sampler
+CASES = {
+    "get_user_profile": lambda s: be.get_user_profile(s.user()),
+    "get_all_users": lambda s: be.get_all_users(),
+    "get_user_friends": lambda s: be.get_user_friends(s.user()),
+    "search_users": lambda s: be.search_users(f"User {s.rng.randrange(1, 100)}", user_id=s.user()),
+    "get_friend_suggestions": lambda s: be.get_friend_suggestions(s.user()),
+    "get_user_goals": lambda s: be.get_user_goals(s.user()),
+    "get_goal_progress": lambda s: be.get_goal_progress(s.user()),
+    "get_user_workouts": lambda s: be.get_user_workouts(s.user()),
+    "get_user_workouts_limit_1": lambda s: be.get_user_workouts(s.user(), limit=1),
+    "get_user_workouts_frame": lambda s: be.get_user_workouts(s.user(), as_frame=True),
+    "get_workout_details": lambda s: be.get_workout_details(s.workout()),
+    "get_workout_history_page": lambda s: be.get_workout_history_page(s.user(), 20),
+    "get_user_exercises": lambda s: be.get_user_exercises(s.user()),
+    "get_exercise_history": lambda s: be.get_exercise_history(s.user(), s.rng.choice(EXERCISE_NAMES)),
+    "get_personal_records": lambda s: be.get_personal_records(s.user()),
+    "get_activity_summary": lambda s: be.get_activity_summary(s.user()),
+    "get_workout_timeseries_week": lambda s: be.get_workout_timeseries(s.user(), "week"),
+    "get_workout_timeseries_day": lambda s: be.get_workout_timeseries(s.user(), "day"),
+    "get_user_dashboard_stats": lambda s: be.get_user_dashboard_stats(s.user()),
+    "get_weekly_leaderboard": lambda s: be.get_weekly_leaderboard(s.user()),
+    "get_weekly_leaderboard_past": lambda s: be.get_weekly_leaderboard(s.user(), s.past_week()),
+    "get_global_leaderboard": lambda s: be.get_global_leaderboard("week", user_id=s.user()),
+    "get_insights_bundle": lambda s: pb.get_insights_bundle(s.user()),
+    "get_history_bundle": lambda s: pb.get_history_bundle(s.user()),
+    "get_social_bundle": lambda s: pb.get_social_bundle(s.user()),
+    "log_workout": _log_workout,
+}
+
+# Cases that are too slow to repeat many times on a large dataset
+SLOW_CASES = {"get_all_users", "get_user_workouts", "get_user_workouts_frame"}
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return float(np.percentile(sorted_values, q))
+
+def run_case(name, func, sampler, concurrency, iterations, warmup):
+    """Runs one case `iterations` times spread over `concurrency` threads."""
+    for _ in range(warmup):
+        func(sampler)
+
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(count):
+        nonlocal errors
+        local = []
+        local_errors = 0
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                func(sampler)
+            except Exception:
+                local_errors += 1
+            local.append((time.perf_counter() - started) * 1000.0)
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    per_thread = [iterations // concurrency + (1 if i < iterations % concurrency else 0) for i in range(concurrency)]
+    pool_before = be.get_pool_stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, per_thread))
+    # Throughput counts committed writes when log_workout runs in write-behind mode
+    be.flush_workout_writes()
+    wall = time.perf_counter() - started
+    pool_after = be.get_pool_stats()
+
+    latencies.sort()
+    return {
+        "function": name,
+        "concurrency": concurrency,
+        "iterations": len(latencies),
+        "errors": errors,
+        "p50_ms": _percentile(latencies, 50),
+        "p95_ms": _percentile(latencies, 95),
+        "p99_ms": _percentile(latencies, 99),
+        "mean_ms": float(np.mean(latencies)) if latencies else None,
+        "max_ms": latencies[-1] if latencies else None,
+        "throughput_per_sec": len(latencies) / wall if wall else None,
+        "pool_waits": pool_after["waits"] - pool_before["waits"],
+        "pool_wait_ms": (pool_after["wait_time_total"] - pool_before["wait_time_total"]) * 1000.0,
+    }
+
+def _dataset_summary():
+    with be.db_connection() as conn, conn.cursor() as cur:
+        summary = {}
+        for table in TABLES:
+            if _sqlite():
+                # SQLite keeps no row estimates; COUNT(*) scans the smallest index
+                cur.execute(f"SELECT COUNT(*) FROM {table};")
+            else:
+                # Planner estimates: exact counts on 10M+ rows take too long
+                cur.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s;", (table,))
+            row = cur.fetchone()
+            summary[table] = row[0] if row else None
+        return summary
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(cases, concurrency_levels, iterations, warmup, seed, use_cache):
+    be.ensure_schema()
+    if not use_cache:
+        # Measure the database paths, not the in-process cache
+        be._cache.enabled = False
+    sampler = Sampler(seed)
+    results = []
+    for name in cases:
+        for concurrency in concurrency_levels:
+            n = max(iterations // 10, concurrency) if name in SLOW_CASES else iterations
+            result = run_case(name, CASES[name], sampler, concurrency, n, warmup)
+            results.append(result)
+            print(f"{name:32} c={concurrency:<3} p50={result['p50_ms']:8.2f}ms p95={result['p95_ms']:8.2f}ms "
+                  f"p99={result['p99_ms']:8.2f}ms {result['throughput_per_sec']:9.1f}/s "
+                  f"errors={result['errors']}", file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "host": platform.node(),
+            "engine": storage.engine_name(),
+            "database": (config.SQLITE_SETTINGS if _sqlite() else
+                         {k: v for k, v in config.DB_SETTINGS.items() if k != "password"}),
+            "pool": config.POOL_SETTINGS,
+            "cache_enabled": use_cache,
+            "iterations": iterations,
+            "seed": seed,
+            "dataset": _dataset_summary(),
+        },
+        "results": results,
+    }
+
+
+# --- Comparison ---
+
+def compare(baseline, current, threshold):
+    """Prints p50/p95 changes per case; returns the number of regressions."""
+    old = {(r["function"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = 0
+    # Runs from before engines were recorded are PostgreSQL runs
+    engines = [run["meta"].get("engine", "postgres") for run in (baseline, current)]
+    if engines[0] != engines[1]:
+        print(f"old: {engines[0]} engine, new: {engines[1]} engine")
+    print(f"{'function':32} {'c':>3} {'p50 old':>9} {'p50 new':>9} {'p95 old':>9} {'p95 new':>9}  change")
+    for r in current["results"]:
+        before = old.get((r["function"], r["concurrency"]))
+        if before is None or not before["p95_ms"]:
+            continue
+        change = (r["p95_ms"] - before["p95_ms"]) / before["p95_ms"]
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{r['function']:32} {r['concurrency']:>3} {before['p50_ms']:9.2f} {r['p50_ms']:9.2f} "
+              f"{before['p95_ms']:9.2f} {r['p95_ms']:9.2f}  {change:+.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic data and benchmark the backend.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="load a synthetic dataset into the configured database")
+    gen.add_argument("--users", type=int, default=10_000)
+    gen.add_argument("--workouts", type=int, default=500_000, help="total workouts across all users")
+    gen.add_argument("--exercises-per-workout", type=float, default=3.0, help="mean exercises per workout")
+    gen.add_argument("--friends-per-user", type=int, default=10, help="typical (median-ish) friend count")
+    gen.add_argument("--days", type=int, default=730, help="spread workouts over this many past days")
+    gen.add_argument("--chunk-users", type=int, default=5_000, help="users whose workouts are loaded per COPY")
+    gen.add_argument("--seed", type=int, default=42)
+    gen.add_argument("--reset", action="store_true", help="TRUNCATE all app tables first")
+    gen.add_argument("--yes", action="store_true", help="confirm --reset without prompting")
+    gen.add_argument("--engine", choices=list(storage.ENGINES), help="storage engine (default: FITNESS_STORAGE_ENGINE)")
+
+    bench = commands.add_parser("run", help="measure latency and throughput of every backend function")
+    bench.add_argument("--cases", help=f"comma-separated subset of: {', '.join(CASES)}")
+    bench.add_argument("--concurrency", default="1,8", help="comma-separated caller counts (default: 1,8)")
+    bench.add_argument("--iterations", type=int, default=200, help="calls per case and concurrency level")
+    bench.add_argument("--warmup", type=int, default=5)
+    bench.add_argument("--seed", type=int, default=42)
+    bench.add_argument("--cache", action="store_true", help="keep the read cache enabled")
+    bench.add_argument("--output", help="write JSON results here (default: benchmark_results/<timestamp>.json)")
+    bench.add_argument("--engine", choices=list(storage.ENGINES), help="storage engine (default: FITNESS_STORAGE_ENGINE)")
+
+    cmp_ = commands.add_parser("compare", help="compare two result files")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("current")
+    cmp_.add_argument("--threshold", type=float, default=0.10, help="allowed p95 slowdown (default: 0.10)")
+
+    args = parser.parse_args(argv)
+    if getattr(args, "engine", None):
+        use_engine(args.engine)
+
+    if args.command == "generate":
+        if args.reset and not args.yes:
+            target = config.SQLITE_SETTINGS["path"] if _sqlite() else config.DB_SETTINGS["dbname"]
+            answer = input(f"TRUNCATE all tables in database '{target}'? [y/N] ")
+            if answer.strip().lower() != "y":
+                return 1
+        generate(args.users, args.workouts, args.exercises_per_workout, args.friends_per_user,
+                 args.days, args.seed, args.chunk_users, args.reset)
+        return 0
+
+    if args.command == "run":
+        cases = args.cases.split(",") if args.cases else list(CASES)
+        unknown = [c for c in cases if c not in CASES]
+        if unknown:
+            parser.error(f"unknown cases: {', '.join(unknown)}")
+        levels = [int(c) for c in args.concurrency.split(",")]
+        report = run(cases, levels, args.iterations, args.warmup, args.seed, args.cache)
+        output = args.output or os.path.join(
+            "benchmark_results", datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"results written to {output}")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
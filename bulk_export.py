@@ -0,0 +1,57 @@
+# bulk_export.py
+#
+# Command-line export of workouts and exercises, for backups, analysis or moving
+# data to another database.
+#
+#   python bulk_export.py everything.csv
+#   python bulk_export.py alice.parquet --user-id 1
+#
+# CSV files use the layout bulk_import.py reads (one exercise per row, grouped by
+# workout_ref), so `python bulk_import.py everything.csv` loads an export back.
+# Parquet output needs pyarrow (pip install pyarrow). Rows are streamed from the
+# database, so exports of any size run in constant memory.
+
+import argparse
+import sys
+
+import storage
+
+be = storage.backend()  # Backend_fft or sqlite_backend, per FITNESS_STORAGE_ENGINE
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export workouts and exercises to CSV or Parquet.")
+    parser.add_argument("path", help="file to write")
+    parser.add_argument("--format", choices=be.EXPORT_FORMATS, help="output format (default: from file extension)")
+    parser.add_argument("--user-id", type=int, help="only export this user's workouts (default: everyone's)")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("parquet" if args.path.lower().endswith(".parquet") else "csv")
+
+    def progress(report):
+        print(
+            f"{report['rows']:,} rows, {report['bytes'] / 1e6:,.1f} MB "
+            f"({report['rows_per_second']:,.0f} rows/sec, {report['mb_per_second']:,.1f} MB/sec)",
+            file=sys.stderr,
+        )
+
+    try:
+        with open(args.path, "wb") as out:
+            report = be.export_workouts(out, fmt, user_id=args.user_id, on_progress=progress,
+                                        progress_every=1_000_000)
+    except RuntimeError as error:
+        print(error, file=sys.stderr)
+        return 1
+    if report is None:
+        return 1
+
+    print(
+        f"Exported {report['rows']:,} rows ({report['bytes'] / 1e6:,.1f} MB) to {args.path} "
+        f"in {report['elapsed_seconds']:.1f}s ({report['rows_per_second']:,.0f} rows/sec, "
+        f"{report['mb_per_second']:,.1f} MB/sec)."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
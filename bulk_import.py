@@ -0,0 +1,113 @@
+# bulk_import.py
+#
+# Command-line loader for wearable / gym-machine workout exports.
+#
+#   python bulk_import.py sessions.jsonl
+#   python bulk_import.py sessions.csv --batch-size 5000 --errors rejected.jsonl
+#
+# JSONL: one workout per line, e.g.
+#   {"user_id": 1, "workout_date": "2024-05-01", "duration": 45, "calories": 300,
+#    "exercises": [{"name": "Squat", "sets": 3, "reps": 10, "weight": 60}]}
+#
+# CSV: one exercise per row with the columns
+#   workout_ref, user_id, workout_date, duration_minutes, calories_burned,
+#   exercise_name, sets, reps, weight_kg
+# Consecutive rows sharing a workout_ref belong to the same workout. Without a
+# workout_ref column every row is its own workout. exercise_name may be empty
+# for a workout without exercises.
+
+import argparse
+import csv
+import json
+import sys
+
+import storage
+
+be = storage.backend()  # Backend_fft or sqlite_backend, per FITNESS_STORAGE_ENGINE
+
+
+def read_jsonl(path):
+    """Yields one workout dict per non-empty line of a JSONL file."""
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as error:
+                # Hand the bad line to the loader so it is reported as rejected
+                yield f"line {line_no} is not valid JSON ({error})"
+
+
+def read_csv(path):
+    """Yields workout dicts, grouping consecutive rows that share a workout_ref."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        current, current_ref = None, None
+        for row in reader:
+            ref = row.get("workout_ref")
+            if current is None or not ref or ref != current_ref:
+                if current is not None:
+                    yield current
+                current = {
+                    "user_id": row.get("user_id"),
+                    "workout_date": row.get("workout_date"),
+                    "duration_minutes": row.get("duration_minutes"),
+                    "calories_burned": row.get("calories_burned"),
+                    "exercises": [],
+                }
+                current_ref = ref
+            if (row.get("exercise_name") or "").strip():
+                current["exercises"].append({
+                    "exercise_name": row["exercise_name"],
+                    "sets": row.get("sets"),
+                    "reps": row.get("reps"),
+                    "weight_kg": row.get("weight_kg"),
+                })
+        if current is not None:
+            yield current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load workouts from a CSV or JSONL export.")
+    parser.add_argument("path", help="CSV or JSONL file to import")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="input format (default: from file extension)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="workouts per transaction (default: 1000)")
+    parser.add_argument("--errors", help="write rejected rows to this JSONL file")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "jsonl")
+    records = read_csv(args.path) if fmt == "csv" else read_jsonl(args.path)
+
+    def progress(report):
+        print(
+            f"batch {report['batches']}: {report['workouts_inserted']} workouts, "
+            f"{report['exercises_inserted']} exercises, {len(report['rejected'])} rejected "
+            f"({report['rows_per_second']:,.0f} rows/sec)",
+            file=sys.stderr,
+        )
+
+    report = be.bulk_log_workouts(records, batch_size=args.batch_size, on_batch=progress)
+
+    print(
+        f"Imported {report['workouts_inserted']} workouts and {report['exercises_inserted']} exercises "
+        f"in {report['elapsed_seconds']:.1f}s ({report['rows_per_second']:,.0f} rows/sec); "
+        f"{len(report['rejected'])} rejected."
+    )
+    if report["rejected"]:
+        if args.errors:
+            with open(args.errors, "w", encoding="utf-8") as f:
+                for item in report["rejected"]:
+                    f.write(json.dumps(item) + "\n")
+            print(f"Rejected rows written to {args.errors}")
+        else:
+            for item in report["rejected"][:20]:
+                print(f"  record {item['index']}: {item['error']}")
+            if len(report["rejected"]) > 20:
+                print(f"  ... and {len(report['rejected']) - 20} more (use --errors to save them all)")
+    return 1 if report["rejected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
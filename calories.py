@@ -0,0 +1,104 @@
+# calories.py
+#
+# Calorie estimates for workouts logged without a calorie figure. A workout's
+# intensity is the MET value (metabolic equivalent, from the Compendium of
+# Physical Activities) of its exercises, averaged with each exercise weighted by
+# its number of sets; workouts without exercises use DEFAULT_MET. Energy is the
+# ACSM estimate
+#
+#   kcal = MET * 3.5 * weight_kg / 200 * minutes
+#
+# with the user's weight_kg (default_weight_kg when the profile has none).
+# Everything works on NumPy arrays so a backfill batch of any size is estimated
+# in a handful of vectorized operations.
+
+import re
+
+import numpy as np
+
+# MET of general exercise, used for workouts without exercises and for
+# exercises matching nothing below
+DEFAULT_MET = 5.0
+
+# Weight training (free weights and machines, moderate to vigorous effort)
+STRENGTH_MET = 5.0
+
+# Body weight used when the user's profile has none
+DEFAULT_WEIGHT_KG = 70.0
+
+# MET by word of the normalized exercise name; the first word of the name
+# found here decides, so "barbell row" is weight training and "rowing" is cardio
+EXERCISE_METS = {
+    "running": 9.8, "run": 9.8, "sprint": 11.0, "sprints": 11.0, "jogging": 7.0, "jog": 7.0,
+    "walking": 3.5, "walk": 3.5, "hiking": 6.0, "hike": 6.0, "stairs": 8.8, "stair": 8.8,
+    "cycling": 7.5, "bike": 7.5, "biking": 7.5, "spinning": 8.5,
+    "rowing": 7.0, "rower": 7.0, "erg": 7.0,
+    "swimming": 6.0, "swim": 6.0, "elliptical": 5.0,
+    "jump": 11.0, "skipping": 11.0, "burpee": 8.0, "burpees": 8.0,
+    "hiit": 8.0, "circuit": 8.0, "crossfit": 8.0, "kettlebell": 8.0,
+    "boxing": 7.8, "kickboxing": 7.8, "dance": 5.0, "dancing": 5.0,
+    "yoga": 2.5, "pilates": 3.0, "stretching": 2.3, "stretch": 2.3, "mobility": 2.3,
+    "plank": 3.8, "push": 3.8, "pushup": 3.8, "pull": 3.8, "pullup": 3.8, "chin": 3.8,
+    "dip": 3.8, "dips": 3.8, "crunch": 3.8, "crunches": 3.8, "situp": 3.8, "lunge": 3.8, "lunges": 3.8,
+    "barbell": STRENGTH_MET, "dumbbell": STRENGTH_MET, "machine": STRENGTH_MET, "cable": STRENGTH_MET,
+    "bench": STRENGTH_MET, "squat": STRENGTH_MET, "deadlift": STRENGTH_MET, "press": STRENGTH_MET,
+    "curl": STRENGTH_MET, "row": STRENGTH_MET, "raise": STRENGTH_MET, "extension": STRENGTH_MET,
+    "pulldown": STRENGTH_MET, "thrust": STRENGTH_MET, "fly": STRENGTH_MET, "shrug": STRENGTH_MET,
+    "powerlifting": 6.0, "olympic": 6.0, "clean": 6.0, "snatch": 6.0,
+}
+
+_WORD = re.compile(r"[a-z]+")
+
+def exercise_met(name):
+    """Returns the MET value of one exercise name (DEFAULT_MET when it is not recognized)."""
+    for word in _WORD.findall(str(name or "").lower()):
+        if word in EXERCISE_METS:
+            return EXERCISE_METS[word]
+    return DEFAULT_MET
+
+def exercise_mets(names):
+    """Returns a float64 array with the MET value of each exercise name.
+
+    Each distinct name is looked up once, however often it repeats.
+    """
+    names = np.asarray([str(name or "") for name in names], dtype=object)
+    if not len(names):
+        return np.empty(0, dtype=np.float64)
+    distinct, inverse = np.unique(names, return_inverse=True)
+    return np.array([exercise_met(name) for name in distinct], dtype=np.float64)[inverse.reshape(-1)]
+
+def workout_mets(n_workouts, exercise_workouts, mets, sets=None):
+    """Returns the MET value of each of `n_workouts` workouts.
+
+    `exercise_workouts` holds the workout position (0 .. n_workouts - 1) of each
+    exercise and `mets` its MET value; `sets` (NaN or missing = 1) weights them.
+    """
+    exercise_workouts = np.asarray(exercise_workouts, dtype=np.int64)
+    mets = np.asarray(mets, dtype=np.float64)
+    if sets is None:
+        weights = np.ones(len(mets))
+    else:
+        sets = np.asarray(sets, dtype=np.float64)
+        weights = np.where(np.isnan(sets) | (sets <= 0), 1.0, sets)
+    total = np.bincount(exercise_workouts, weights=weights * mets, minlength=n_workouts)
+    count = np.bincount(exercise_workouts, weights=weights, minlength=n_workouts)
+    return np.where(count > 0, total / np.where(count > 0, count, 1.0), DEFAULT_MET)
+
+def estimate_calories(duration_minutes, weight_kg, mets, default_weight_kg=DEFAULT_WEIGHT_KG):
+    """Returns estimated kcal per workout as an int64 array (0 where the duration is unknown)."""
+    minutes = np.asarray(duration_minutes, dtype=np.float64)
+    weight = np.asarray(weight_kg, dtype=np.float64)
+    weight = np.where(np.isnan(weight) | (weight <= 0), default_weight_kg, weight)
+    kcal = np.asarray(mets, dtype=np.float64) * 3.5 * weight / 200.0 * minutes
+    return np.rint(np.where(np.isnan(kcal) | (kcal < 0), 0.0, kcal)).astype(np.int64)
+
+def estimate_workouts(duration_minutes, weight_kg, exercise_workouts, exercise_names, exercise_sets=None,
+                      default_weight_kg=DEFAULT_WEIGHT_KG):
+    """Estimates kcal for a batch of workouts from their duration, exercise mix and the user's weight.
+
+    `duration_minutes` and `weight_kg` have one entry per workout (NaN when
+    unknown); the exercise arrays have one entry per exercise, with
+    `exercise_workouts` giving the position of its workout in the batch.
+    """
+    mets = workout_mets(len(duration_minutes), exercise_workouts, exercise_mets(exercise_names), exercise_sets)
+    return estimate_calories(duration_minutes, weight_kg, mets, default_weight_kg)
@@ -0,0 +1,122 @@
+# columnar.py
+#
+# Columnar result sets for the backend read functions (as_frame=True). On
+# PostgreSQL, fetch_columns and read_frame run the query through COPY ... TO
+# STDOUT and parse the CSV with pandas' C reader, so no Python object is made per
+# row or per number; NUMERIC columns arrive as floats rather than Decimal, and
+# DATE columns become datetime64 columns (declare every DATE column as
+# datetime64). iter_chunks, which streams a (server-side) cursor, and cursors of
+# other DB-API drivers (the SQLite engine, whose dates arrive as datetime.date)
+# fetch rows a chunk at a time instead and turn each chunk into one NumPy array
+# per column, so a large result is never held as a full list of row tuples.
+#
+# Column types are given as an ordered {name: dtype} mapping matching the
+# query's select list, e.g. {'workout_id': 'int64', 'workout_date': 'datetime64[D]',
+# 'weight_kg': 'float64', 'name': 'object'}. Columns that may be NULL should
+# use float64 (NULL -> NaN), datetime64 (NULL -> NaT) or object (NULL -> None).
+
+import io
+
+import numpy as np
+import pandas as pd
+import psycopg2.extensions
+
+# Rows fetched from the cursor per chunk
+CHUNK_ROWS = 5000
+
+# Typecasters registered only on the cursors used for columnar reads: NUMERIC
+# becomes float rather than Decimal, and DATE stays as its ISO text, which NumPy
+# parses into datetime64 far faster than it converts datetime.date objects
+_FLOAT_NUMERIC = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, "FLOAT_NUMERIC",
+    lambda value, cur: float(value) if value is not None else None,
+)
+_TEXT_DATE = psycopg2.extensions.new_type(
+    psycopg2.extensions.DATE.values, "TEXT_DATE", lambda value, cur: value,
+)
+
+def _column(values, dtype):
+    if dtype == "object":
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    return np.array(values, dtype=dtype)
+
+def empty_columns(columns):
+    """Returns zero-length arrays for every column, typed as in `columns`."""
+    return {name: _column((), dtype) for name, dtype in columns.items()}
+
+def register_types(cur):
+    """Makes `cur` return NUMERIC as float and DATE as text; call before executing a columnar query."""
+    psycopg2.extensions.register_type(_FLOAT_NUMERIC, cur)
+    psycopg2.extensions.register_type(_TEXT_DATE, cur)
+
+def iter_chunks(cur, columns, chunk_rows=CHUNK_ROWS):
+    """Yields the rows of an executed query as {name: NumPy array} chunks of up to `chunk_rows` rows.
+
+    Works with server-side (named) cursors too, so a result of any size can be
+    processed a chunk at a time.
+    """
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            return
+        if len(rows[0]) != len(columns):
+            raise ValueError(f"query returns {len(rows[0])} columns, {len(columns)} types given")
+        yield {name: _column(values, dtype) for (name, dtype), values in zip(columns.items(), zip(*rows))}
+
+def _copy_columns(cur, sql, params, columns):
+    # NULL is written as \N so that an empty string stays an empty string
+    query = cur.mogrify(sql, params).decode().strip().rstrip(";")
+    buffer = io.BytesIO()
+    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, NULL '\\N')", buffer)
+    if not buffer.tell():
+        return empty_columns(columns)
+    buffer.seek(0)
+    # Dates are parsed by NumPy below; pandas would make Timestamp objects
+    dtypes = {index: ("object" if dtype.startswith("datetime64") else dtype)
+              for index, dtype in enumerate(columns.values())}
+    frame = pd.read_csv(buffer, header=None, dtype=dtypes, na_values=[r"\N"], keep_default_na=False)
+    if frame.shape[1] != len(columns):
+        raise ValueError(f"query returns {frame.shape[1]} columns, {len(columns)} types given")
+    result = {}
+    for (name, dtype), (_, values) in zip(columns.items(), frame.items()):
+        if dtype == "object":
+            result[name] = values.to_numpy(dtype=object, na_value=None)
+        elif dtype.startswith("datetime64"):
+            result[name] = values.to_numpy(dtype=object, na_value="NaT").astype(dtype)
+        else:
+            result[name] = values.to_numpy(dtype=dtype)
+    return result
+
+def fetch_columns(cur, sql, params, columns, chunk_rows=CHUNK_ROWS):
+    """Runs a query and returns its result as {name: NumPy array}.
+
+    PostgreSQL results are read with COPY; other cursors are read chunk by
+    chunk with fetchmany().
+    """
+    if isinstance(cur, psycopg2.extensions.cursor) and not cur.name:
+        return _copy_columns(cur, sql, params, columns)
+    cur.execute(sql, params)
+    chunks = list(iter_chunks(cur, columns, chunk_rows))
+    if not chunks:
+        return empty_columns(columns)
+    if len(chunks) == 1:
+        return chunks[0]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in columns}
+
+def read_frame(cur, sql, params, columns, chunk_rows=CHUNK_ROWS):
+    """Runs a query and returns its result as a pandas DataFrame with the dtypes in `columns`."""
+    return pd.DataFrame(fetch_columns(cur, sql, params, columns, chunk_rows), copy=False)
+
+def frame_from_rows(rows, columns):
+    """Returns rows that were already fetched (e.g. asyncpg records) as a DataFrame typed by `columns`."""
+    if not rows:
+        return empty_frame(columns)
+    return pd.DataFrame(
+        {name: _column(values, dtype) for (name, dtype), values in zip(columns.items(), zip(*rows))}, copy=False,
+    )
+
+def empty_frame(columns):
+    """Returns an empty DataFrame with the given columns and dtypes."""
+    return pd.DataFrame(empty_columns(columns), copy=False)
@@ -0,0 +1,162 @@
+# config.py
+
+import json
+import os
+
+# --- Application Configuration ---
+# Every setting can be overridden with an environment variable so the same code
+# runs against a local development database and a deployed one without edits.
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_float(name, default):
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+# Storage engine behind the backend API (see storage.py): "postgres" (Backend_fft)
+# or "sqlite" (sqlite_backend, an embedded database file)
+STORAGE_SETTINGS = {
+    "engine": os.environ.get("FITNESS_STORAGE_ENGINE", "postgres"),
+}
+
+# Embedded SQLite engine settings
+SQLITE_SETTINGS = {
+    "path": os.environ.get("FITNESS_SQLITE_PATH", "fitness_tracker.db"),
+    # Milliseconds a writer waits for another connection's write lock
+    "busy_timeout_ms": _env_int("FITNESS_SQLITE_BUSY_TIMEOUT_MS", 5000),
+    # Page cache per connection, in KiB
+    "cache_size_kb": _env_int("FITNESS_SQLITE_CACHE_KB", 65536),
+    # Bytes of the database file read through mmap (0 = off)
+    "mmap_size": _env_int("FITNESS_SQLITE_MMAP_SIZE", 268435456),
+    # NORMAL is durable across application crashes in WAL mode; FULL also survives power loss
+    "synchronous": os.environ.get("FITNESS_SQLITE_SYNCHRONOUS", "NORMAL"),
+}
+
+# PostgreSQL connection settings (passed straight to psycopg2.connect)
+DB_SETTINGS = {
+    "dbname": os.environ.get("FITNESS_DB_NAME", "fitness_tracker"),
+    "user": os.environ.get("FITNESS_DB_USER", "postgres"),
+    "password": os.environ.get("FITNESS_DB_PASS", "root"),
+    "host": os.environ.get("FITNESS_DB_HOST", "localhost"),
+    "port": os.environ.get("FITNESS_DB_PORT", "5432"),
+    "connect_timeout": _env_int("FITNESS_DB_CONNECT_TIMEOUT", 10),
+}
+
+# Connection pool sizing
+POOL_SETTINGS = {
+    "min_size": _env_int("FITNESS_DB_POOL_MIN", 1),
+    "max_size": _env_int("FITNESS_DB_POOL_MAX", 10),
+    # Seconds a caller waits for a free connection before giving up
+    "timeout": _env_float("FITNESS_DB_POOL_TIMEOUT", 30.0),
+    # Connections idle for longer than this are pinged before being handed out
+    "check_idle_seconds": _env_float("FITNESS_DB_POOL_CHECK_IDLE", 30.0),
+}
+
+# Site-wide leaderboard snapshots
+LEADERBOARD_SETTINGS = {
+    # Snapshots older than this are recomputed on the next read (0 = only via manage.py)
+    "refresh_seconds": _env_int("FITNESS_LEADERBOARD_REFRESH_SECONDS", 300),
+    "top_k": _env_int("FITNESS_LEADERBOARD_TOP_K", 100),
+}
+
+# In-process read cache in front of the backend read functions
+CACHE_SETTINGS = {
+    "enabled": os.environ.get("FITNESS_CACHE_ENABLED", "1") not in ("0", "false", "no"),
+    "max_entries": _env_int("FITNESS_CACHE_MAX_ENTRIES", 2048),
+    "default_ttl": _env_float("FITNESS_CACHE_TTL", 60.0),
+    # Seconds each kind of entry may be served before it is re-read. Writes made
+    # through Backend_fft invalidate the affected entries immediately, so these
+    # only bound staleness from writes made by other processes.
+    "ttls": {
+        "users": _env_float("FITNESS_CACHE_TTL_USERS", 60.0),
+        "profile": _env_float("FITNESS_CACHE_TTL_PROFILE", 300.0),
+        "friends": _env_float("FITNESS_CACHE_TTL_FRIENDS", 300.0),
+        "goals": _env_float("FITNESS_CACHE_TTL_GOALS", 300.0),
+        "exercises": _env_float("FITNESS_CACHE_TTL_EXERCISES", 300.0),
+        "records": _env_float("FITNESS_CACHE_TTL_RECORDS", 300.0),
+        "activity": _env_float("FITNESS_CACHE_TTL_ACTIVITY", 300.0),
+        "dashboard": _env_float("FITNESS_CACHE_TTL_DASHBOARD", 60.0),
+        "leaderboard": _env_float("FITNESS_CACHE_TTL_LEADERBOARD", 30.0),
+        "suggestions": _env_float("FITNESS_CACHE_TTL_SUGGESTIONS", 300.0),
+        # Page bundles (page_bundles.py); the social page shows leaderboards
+        "insights_page": _env_float("FITNESS_CACHE_TTL_INSIGHTS_PAGE", 60.0),
+        "history_page": _env_float("FITNESS_CACHE_TTL_HISTORY_PAGE", 60.0),
+        "social_page": _env_float("FITNESS_CACHE_TTL_SOCIAL_PAGE", 30.0),
+    },
+}
+
+# Query/page instrumentation (see instrumentation.py)
+INSTRUMENTATION_SETTINGS = {
+    "enabled": os.environ.get("FITNESS_INSTRUMENTATION_ENABLED", "1") not in ("0", "false", "no"),
+    # Append one JSON line per page render here ("" = off)
+    "json_log_path": os.environ.get("FITNESS_METRICS_LOG", ""),
+    # Rewrite this file with Prometheus text after each page render, for the
+    # node_exporter textfile collector ("" = off)
+    "prometheus_textfile": os.environ.get("FITNESS_METRICS_PROM_FILE", ""),
+    # Statements slower than this are logged as warnings
+    "slow_query_ms": _env_float("FITNESS_SLOW_QUERY_MS", 200.0),
+    # Default per-page budgets; a render over either is logged and counted
+    "page_budget_queries": _env_int("FITNESS_PAGE_BUDGET_QUERIES", 10),
+    "page_budget_ms": _env_float("FITNESS_PAGE_BUDGET_MS", 500.0),
+    # Per-page overrides, e.g. FITNESS_PAGE_BUDGETS='{"view_history": {"queries": 4, "ms": 200}}'
+    "page_budgets": json.loads(os.environ.get("FITNESS_PAGE_BUDGETS") or "{}"),
+    # Show each page's query count and timings in the Streamlit sidebar
+    "show_page_cost": os.environ.get("FITNESS_SHOW_PAGE_COST", "0") not in ("0", "false", "no"),
+}
+
+# Monthly partitions of the workouts and exercises tables
+PARTITION_SETTINGS = {
+    # Months past the current one kept created in advance
+    "months_ahead": _env_int("FITNESS_PARTITION_MONTHS_AHEAD", 3),
+}
+
+# Goal evaluation job (manage.py evaluate-goals)
+GOAL_SETTINGS = {
+    # Active goals evaluated and updated per transaction
+    "batch_size": _env_int("FITNESS_GOAL_BATCH_SIZE", 5000),
+}
+
+# Personal records rebuild (manage.py rebuild-records)
+RECORD_SETTINGS = {
+    # Users whose records are recomputed per transaction
+    "batch_users": _env_int("FITNESS_RECORDS_BATCH_USERS", 1000),
+}
+
+# Calorie estimates for workouts logged without calories (see calories.py)
+CALORIE_SETTINGS = {
+    # Estimate calories when a workout is logged or imported without them
+    "estimate_on_log": os.environ.get("FITNESS_ESTIMATE_CALORIES", "1") not in ("0", "false", "no"),
+    # Body weight assumed for users whose profile has none
+    "default_weight_kg": _env_float("FITNESS_DEFAULT_WEIGHT_KG", 70.0),
+    # Stored workouts estimated per transaction (manage.py backfill-calories)
+    "backfill_batch_size": _env_int("FITNESS_CALORIE_BATCH_SIZE", 10000),
+}
+
+# Archival of old workouts into the archive tables (manage.py archive-workouts)
+ARCHIVE_SETTINGS = {
+    # Months of history kept in the hot tables before the current one
+    "horizon_months": _env_int("FITNESS_ARCHIVE_HORIZON_MONTHS", 24),
+    # Users whose old workouts are moved per transaction
+    "batch_users": _env_int("FITNESS_ARCHIVE_BATCH_USERS", 500),
+    # Days a restored history stays in the hot tables before it may be archived again
+    "restore_days": _env_int("FITNESS_ARCHIVE_RESTORE_DAYS", 30),
+}
+
+# Write-behind workout logging: log_workout queues workouts and a background
+# thread commits them in batches
+WRITE_BEHIND_SETTINGS = {
+    "enabled": os.environ.get("FITNESS_WRITE_BEHIND", "0") not in ("0", "false", "no"),
+    # Queued workouts beyond this make log_workout wait (backpressure)
+    "max_queue": _env_int("FITNESS_WRITE_BEHIND_MAX_QUEUE", 10000),
+    # Workouts committed per transaction
+    "batch_size": _env_int("FITNESS_WRITE_BEHIND_BATCH_SIZE", 500),
+    # Seconds the oldest queued workout may wait for its batch to fill
+    "flush_interval": _env_float("FITNESS_WRITE_BEHIND_FLUSH_INTERVAL", 0.05),
+    # Seconds log_workout waits for room in a full queue before reporting an error
+    "put_timeout": _env_float("FITNESS_WRITE_BEHIND_PUT_TIMEOUT", 5.0),
+    # Seconds allowed at process exit for writing what is still queued
+    "shutdown_timeout": _env_float("FITNESS_WRITE_BEHIND_SHUTDOWN_TIMEOUT", 30.0),
+}
@@ -0,0 +1,215 @@
+# db_pool.py
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+
+class PoolTimeoutError(psycopg2.OperationalError):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class ConnectionPool:
+    """A thread-safe PostgreSQL connection pool.
+
+    Connections are opened lazily up to ``max_size`` and reused across calls.
+    Callers that find the pool exhausted wait (up to ``timeout`` seconds) for a
+    connection to be returned. Connections that have sat idle for a while are
+    pinged before being handed out so a dropped server connection never reaches
+    application code.
+    """
+
+    def __init__(self, min_size=1, max_size=10, timeout=30.0, check_idle_seconds=30.0, **connect_kwargs):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle_seconds = check_idle_seconds
+        self._connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, returned_at) pairs, most recently used on the right
+        self._size = 0        # open connections, idle and in use
+        self._in_use = 0
+        self._closed = False
+        self._stats = {
+            "connections_created": 0,
+            "connections_discarded": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+        }
+
+        for _ in range(min_size):
+            conn = self._connect()
+            with self._cond:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self._connect_kwargs)
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_for):
+        """Cheap checks on every checkout, a round-trip ping only for stale connections."""
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if idle_for < self.check_idle_seconds:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats["connections_discarded"] += 1
+            self._cond.notify()
+
+    def getconn(self):
+        """Checks a healthy connection out of the pool, waiting if it is exhausted."""
+        deadline = None
+        wait_started = None
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.pool.PoolError("connection pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    now = time.monotonic()
+                    if wait_started is None:
+                        wait_started = now
+                        deadline = now + self.timeout
+                        self._stats["waits"] += 1
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"no database connection available after {self.timeout:.1f}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._cond.wait(remaining)
+                    if self._closed:
+                        raise psycopg2.pool.PoolError("connection pool is closed")
+
+                if wait_started is not None:
+                    waited = time.monotonic() - wait_started
+                    self._stats["wait_time_total"] += waited
+                    self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+                    wait_started = None
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    self._in_use += 1
+                    self._stats["checkouts"] += 1
+                    new_connection = False
+                else:
+                    # Reserve a slot now so concurrent callers cannot overshoot max_size
+                    self._size += 1
+                    self._in_use += 1
+                    self._stats["checkouts"] += 1
+                    new_connection = True
+
+            if new_connection:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._is_healthy(conn, time.monotonic() - returned_at):
+                return conn
+
+            # Stale connection: drop it and try again
+            with self._cond:
+                self._in_use -= 1
+                self._stats["health_check_failures"] += 1
+            self._discard(conn)
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection to the pool, rolling back any open transaction."""
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            keep = not (discard or conn.closed or self._closed)
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+        if not keep:
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except psycopg2.InterfaceError:
+            broken = True
+            raise
+        except psycopg2.OperationalError:
+            # Usually a lost server connection; do not hand it to the next caller
+            broken = conn.closed != 0
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def stats(self):
+        """Returns a snapshot of pool usage counters for sizing and monitoring."""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+            })
+        checkouts = snapshot["checkouts"]
+        snapshot["wait_time_avg"] = snapshot["wait_time_total"] / snapshot["waits"] if snapshot["waits"] else 0.0
+        snapshot["wait_ratio"] = snapshot["waits"] / checkouts if checkouts else 0.0
+        return snapshot
+
+    def closeall(self):
+        """Closes every idle connection; in-use connections are closed when returned."""
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
@@ -1,236 +1,436 @@
-# Frontend_ft.py
-
-import streamlit as st
-import pandas as pd
-from datetime import date, timedelta
-import Backend_fft as be # Import the backend logic
-
-# --- App Configuration ---
-st.set_page_config(page_title="Fitness Tracker", layout="wide", initial_sidebar_state="expanded")
-
-# For this single-user demo, we'll hardcode the current user's ID.
-# In a real app, this would come from a login system.
-CURRENT_USER_ID = 1 
-
-# --- Helper Functions ---
-def get_current_user_name():
-    """Fetches the current user's name for display."""
-    profile = be.get_user_profile(CURRENT_USER_ID)
-    return profile[0] if profile else "User"
-
-# --- UI Sections ---
-
-def show_profile():
-    st.header("👤 My Profile")
-    profile = be.get_user_profile(CURRENT_USER_ID)
-    if profile:
-        with st.form("profile_form"):
-            name = st.text_input("Name", value=profile[0])
-            email = st.text_input("Email", value=profile[1])
-            weight = st.number_input("Weight (kg)", value=float(profile[2]))
-            height = st.number_input("Height (cm)", value=float(profile[3]))
-            
-            submitted = st.form_submit_button("Update Profile")
-            if submitted:
-                be.update_user_profile(CURRENT_USER_ID, name, email, weight, height)
-                st.success("Profile updated successfully!")
-                st.experimental_rerun()
-    else:
-        st.warning("Could not load user profile.")
-
-def log_workout():
-    st.header("🏋️ Log a New Workout")
-    with st.form("workout_form"):
-        workout_date = st.date_input("Workout Date", value=date.today())
-        duration = st.number_input("Duration (minutes)", min_value=1, step=1)
-        calories = st.number_input("Calories Burned (optional)", min_value=0, step=1)
-        st.markdown("---")
-        st.subheader("Exercises")
-        
-        # Use a list in session state to manage exercises dynamically
-        if 'exercises' not in st.session_state:
-            st.session_state.exercises = [{'name': '', 'sets': 3, 'reps': 10, 'weight': 20.0}]
-
-        for i, ex in enumerate(st.session_state.exercises):
-            cols = st.columns([3, 1, 1, 1])
-            ex['name'] = cols[0].text_input("Exercise Name", value=ex['name'], key=f"name_{i}")
-            ex['sets'] = cols[1].number_input("Sets", min_value=1, value=ex['sets'], key=f"sets_{i}")
-            ex['reps'] = cols[2].number_input("Reps", min_value=1, value=ex['reps'], key=f"reps_{i}")
-            ex['weight'] = cols[3].number_input("Weight (kg)", min_value=0.0, value=ex['weight'], step=0.5, key=f"weight_{i}")
-        
-        cols_buttons = st.columns(2)
-        if cols_buttons[0].form_submit_button("Add Another Exercise"):
-             st.session_state.exercises.append({'name': '', 'sets': 3, 'reps': 10, 'weight': 20.0})
-             st.experimental_rerun()
-
-        submitted = cols_buttons[1].form_submit_button("Log Workout", type="primary")
-
-        if submitted:
-            # Filter out empty exercises before logging
-            valid_exercises = [ex for ex in st.session_state.exercises if ex['name'].strip() != ""]
-            if valid_exercises:
-                be.log_workout(CURRENT_USER_ID, workout_date, duration, calories, valid_exercises)
-                st.success("Workout logged successfully!")
-                # Clear exercises from state after logging
-                del st.session_state.exercises
-            else:
-                st.error("Please add at least one exercise with a name.")
-
-def view_history():
-    st.header("📈 My Workout History")
-    workouts = be.get_user_workouts(CURRENT_USER_ID)
-    if not workouts:
-        st.info("No workouts logged yet. Go log one!")
-        return
-
-    df_workouts = pd.DataFrame(workouts, columns=['ID', 'Date', 'Duration (min)', 'Calories Burned'])
-    df_workouts['Date'] = pd.to_datetime(df_workouts['Date'])
-    
-    st.subheader("Progress Over Time")
-    st.line_chart(df_workouts.set_index('Date')['Duration (min)'])
-    
-    st.subheader("Workout Logs")
-    for index, row in df_workouts.iterrows():
-        with st.expander(f"{row['Date'].strftime('%Y-%m-%d')} - {row['Duration (min)']} minutes"):
-            exercises = be.get_workout_details(row['ID'])
-            df_exercises = pd.DataFrame(exercises, columns=['Exercise', 'Sets', 'Reps', 'Weight (kg)'])
-            st.table(df_exercises)
-
-def set_goals():
-    st.header("🎯 Set & View Goals")
-    
-    with st.form("goal_form"):
-        st.subheader("Set a New Goal")
-        description = st.text_area("Goal Description (e.g., 'Workout 5 times a week')")
-        target_value = st.number_input("Target Value (optional)", min_value=0)
-        cols = st.columns(2)
-        start_date = cols[0].date_input("Start Date", date.today())
-        end_date = cols[1].date_input("End Date", date.today() + timedelta(days=30))
-
-        submitted = st.form_submit_button("Set Goal")
-        if submitted:
-            be.set_goal(CURRENT_USER_ID, description, target_value, start_date, end_date)
-            st.success("Goal set!")
-
-    st.markdown("---")
-    st.subheader("Active Goals")
-    goals = be.get_user_goals(CURRENT_USER_ID)
-    if goals:
-        df_goals = pd.DataFrame(goals, columns=['ID', 'Description', 'Target', 'Start', 'End', 'Status'])
-        st.table(df_goals[['Description', 'Target', 'Start', 'End', 'Status']])
-    else:
-        st.info("You have no active goals.")
-
-def social_leaderboard():
-    st.header("🏆 Friends & Leaderboard")
-    
-    tab1, tab2 = st.tabs(["Leaderboard", "Manage Friends"])
-
-    with tab1:
-        st.subheader("This Week's Leaderboard")
-        st.caption("Ranking based on total workout minutes this week.")
-        leaderboard_data = be.get_weekly_leaderboard(CURRENT_USER_ID)
-        if leaderboard_data:
-            df_leaderboard = pd.DataFrame(leaderboard_data, columns=['Name', 'Total Minutes'])
-            df_leaderboard.index = df_leaderboard.index + 1 # Rank
-            st.dataframe(df_leaderboard, use_container_width=True)
-        else:
-            st.info("Not enough data for a leaderboard yet.")
-
-    with tab2:
-        st.subheader("My Friends")
-        friends = be.get_user_friends(CURRENT_USER_ID)
-        friend_ids = [f[0] for f in friends]
-
-        if friends:
-            for friend_id, friend_name in friends:
-                cols = st.columns([4, 1])
-                cols[0].write(friend_name)
-                if cols[1].button("Remove", key=f"remove_{friend_id}"):
-                    be.remove_friend(CURRENT_USER_ID, friend_id)
-                    st.success(f"Removed {friend_name} from friends.")
-                    st.experimental_rerun()
-        else:
-            st.info("You haven't added any friends yet.")
-
-        st.markdown("---")
-        st.subheader("Add a Friend")
-        all_users = be.get_all_users()
-        # Exclude self and current friends from the list of potential friends
-        potential_friends = [u for u in all_users if u[0] != CURRENT_USER_ID and u[0] not in friend_ids]
-        
-        if potential_friends:
-            selected_user_id = st.selectbox("Select a user to add", options=potential_friends, format_func=lambda x: x[1])
-            if st.button("Add Friend"):
-                be.add_friend(CURRENT_USER_ID, selected_user_id[0])
-                st.success(f"Added {selected_user_id[1]} as a friend!")
-                st.experimental_rerun()
-        else:
-            st.write("No other users to add.")
-
-def show_fitness_insights():
-    st.header("📊 Fitness Insights")
-    st.subheader(f"Your Personal Fitness Dashboard")
-
-    stats = be.get_user_dashboard_stats(CURRENT_USER_ID)
-    workouts = be.get_user_workouts(CURRENT_USER_ID)
-
-    if not stats or stats.get('total_workouts', 0) == 0:
-        st.warning("Log a workout to see your insights!")
-        return
-
-    # Calculate weekly stats
-    today = date.today()
-    start_of_week = today - timedelta(days=today.weekday())
-    
-    workouts_this_week = [w for w in workouts if w[1] >= start_of_week]
-    minutes_this_week = sum(w[2] for w in workouts_this_week)
-
-    cols = st.columns(3)
-    cols[0].metric(label="Workouts This Week", value=len(workouts_this_week))
-    cols[1].metric(label="Total Minutes This Week", value=minutes_this_week)
-    
-    avg_duration = stats.get('avg_duration', 0)
-    cols[2].metric(label="Average Workout Length", value=f"{avg_duration:.1f} min")
-
-    st.markdown("---")
-    st.subheader("Recent Activity")
-    if workouts:
-        latest_workout = workouts[0]
-        st.write(f"Your last workout was on **{latest_workout[1].strftime('%B %d, %Y')}** for **{latest_workout[2]} minutes**.")
-        
-        with st.expander("View details of your last workout"):
-            exercises = be.get_workout_details(latest_workout[0])
-            if exercises:
-                df_exercises = pd.DataFrame(exercises, columns=['Exercise', 'Sets', 'Reps', 'Weight (kg)'])
-                st.table(df_exercises)
-            else:
-                st.write("No specific exercises were logged for this workout.")
-    else:
-        st.info("No recent workouts found.")
-
-
-# --- Main App ---
-def main():
-    # Run setup on first load
-    be.create_tables()
-    be.seed_data()
-    
-    st.sidebar.title(f"Welcome, {get_current_user_name()}!")
-    
-    menu = {
-        "📊 Fitness Insights": show_fitness_insights,
-        "🏋️ Log Workout": log_workout,
-        "📈 My History": view_history,
-        "🏆 Friends & Leaderboard": social_leaderboard,
-        "🎯 Goals": set_goals,
-        "👤 My Profile": show_profile,
-    }
-
-    choice = st.sidebar.radio("Navigation", list(menu.keys()))
-    
-    # Call the selected page function
-    menu[choice]()
-
-if __name__ == '__main__':
-    main()
+# Frontend_ft.py
+
+import io
+import streamlit as st
+import pandas as pd
+from datetime import date, timedelta
+import async_backend as ab # Concurrent page reads
+import config
+import storage
+
+be = storage.backend() # Import the backend logic (PostgreSQL or SQLite, per FITNESS_STORAGE_ENGINE)
+pb = storage.bundles() # One-query page loads
+
+# --- App Configuration ---
+st.set_page_config(page_title="Fitness Tracker", layout="wide", initial_sidebar_state="expanded")
+
+# For this single-user demo, we'll hardcode the current user's ID.
+# In a real app, this would come from a login system.
+CURRENT_USER_ID = 1 
+
+# Number of workouts fetched per "Load more" click on the history page
+HISTORY_PAGE_SIZE = 20
+
+# How many past weeks can be picked on the leaderboard
+LEADERBOARD_WEEKS = 8
+
+# Maximum matches shown by the "Add a Friend" search
+FRIEND_SEARCH_RESULTS = 10
+
+# --- Helper Functions ---
+def get_current_user_name():
+    """Fetches the current user's name for display."""
+    profile = be.get_user_profile(CURRENT_USER_ID)
+    return profile[0] if profile else "User"
+
+# --- UI Sections ---
+
+def show_profile():
+    st.header("👤 My Profile")
+    profile = be.get_user_profile(CURRENT_USER_ID)
+    if profile:
+        with st.form("profile_form"):
+            name = st.text_input("Name", value=profile[0])
+            email = st.text_input("Email", value=profile[1])
+            weight = st.number_input("Weight (kg)", value=float(profile[2]))
+            height = st.number_input("Height (cm)", value=float(profile[3]))
+            
+            submitted = st.form_submit_button("Update Profile")
+            if submitted:
+                be.update_user_profile(CURRENT_USER_ID, name, email, weight, height)
+                st.success("Profile updated successfully!")
+                st.experimental_rerun()
+    else:
+        st.warning("Could not load user profile.")
+
+def log_workout():
+    st.header("🏋️ Log a New Workout")
+    with st.form("workout_form"):
+        workout_date = st.date_input("Workout Date", value=date.today())
+        duration = st.number_input("Duration (minutes)", min_value=1, step=1)
+        calories = st.number_input(
+            "Calories Burned (optional)", min_value=0, step=1,
+            help="Leave at 0 to have it estimated from the duration, exercises and your weight.",
+        )
+        st.markdown("---")
+        st.subheader("Exercises")
+        
+        # Use a list in session state to manage exercises dynamically
+        if 'exercises' not in st.session_state:
+            st.session_state.exercises = [{'name': '', 'sets': 3, 'reps': 10, 'weight': 20.0}]
+
+        for i, ex in enumerate(st.session_state.exercises):
+            cols = st.columns([3, 1, 1, 1])
+            ex['name'] = cols[0].text_input("Exercise Name", value=ex['name'], key=f"name_{i}")
+            ex['sets'] = cols[1].number_input("Sets", min_value=1, value=ex['sets'], key=f"sets_{i}")
+            ex['reps'] = cols[2].number_input("Reps", min_value=1, value=ex['reps'], key=f"reps_{i}")
+            ex['weight'] = cols[3].number_input("Weight (kg)", min_value=0.0, value=ex['weight'], step=0.5, key=f"weight_{i}")
+        
+        cols_buttons = st.columns(2)
+        if cols_buttons[0].form_submit_button("Add Another Exercise"):
+             st.session_state.exercises.append({'name': '', 'sets': 3, 'reps': 10, 'weight': 20.0})
+             st.experimental_rerun()
+
+        submitted = cols_buttons[1].form_submit_button("Log Workout", type="primary")
+
+        if submitted:
+            # Filter out empty exercises before logging
+            valid_exercises = [ex for ex in st.session_state.exercises if ex['name'].strip() != ""]
+            if valid_exercises:
+                be.log_workout(CURRENT_USER_ID, workout_date, duration, calories, valid_exercises)
+                # In write-behind mode, make sure the other pages already show it
+                be.flush_workout_writes()
+                st.success("Workout logged successfully!")
+                # Clear exercises from state after logging
+                del st.session_state.exercises
+                reset_history()
+            else:
+                st.error("Please add at least one exercise with a name.")
+
+def reset_history():
+    """Drops the extra history pages so the next visit shows only the first page."""
+    for key in ('history_workouts', 'history_cursor'):
+        st.session_state.pop(key, None)
+
+def exercises_table(exercises):
+    return pd.DataFrame(
+        [(ex.name, ex.sets, ex.reps, ex.weight_kg) for ex in exercises],
+        columns=['Exercise', 'Sets', 'Reps', 'Weight (kg)'],
+    )
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+def activity_heatmap(calendar):
+    # Weekdays down, weeks (labelled by their Monday) across; greener means more workouts
+    df = pd.DataFrame(calendar, columns=['Date', 'Workouts'])
+    df['Week'] = [d - timedelta(days=d.weekday()) for d in df['Date']]
+    df['Day'] = [WEEKDAYS[d.weekday()] for d in df['Date']]
+    grid = df.pivot(index='Day', columns='Week', values='Workouts').reindex(WEEKDAYS)
+    grid.columns = [week.strftime('%b %d') for week in grid.columns]
+    return grid.style.map(
+        lambda n: '' if pd.isna(n) else f"background-color: rgba(46, 160, 67, {min(n, 4) / 4:.2f})"
+    ).format(lambda n: '' if pd.isna(n) or n == 0 else f"{n:.0f}")
+
+def archived_history(archive):
+    # Shown once the loaded history runs out: older workouts stay in the archive
+    # until the user asks for them
+    if not archive['workouts']:
+        return
+    st.caption(f"{archive['workouts']} older workouts "
+               f"({archive['first_month']:%b %Y} - {archive['last_month']:%b %Y}) are archived.")
+    if st.button("Load archived workouts"):
+        be.restore_archived_workouts(CURRENT_USER_ID)
+        reset_history()
+        st.experimental_rerun()
+
+def view_history():
+    st.header("📈 My Workout History")
+    # The first page of workouts (with their exercises) and the chart come from one
+    # query, run alongside the exercise list and archive summary; pages added
+    # with "Load more" are kept in session state.
+    resolution = st.session_state.get('history_resolution', "Week")
+    bundle, exercises, archive = ab.gather_reads(
+        (pb.get_history_bundle, CURRENT_USER_ID, resolution.lower(), HISTORY_PAGE_SIZE),
+        (be.get_user_exercises, CURRENT_USER_ID),
+        (be.get_archive_summary, CURRENT_USER_ID),
+    )
+    if 'history_workouts' not in st.session_state:
+        st.session_state.history_workouts = []
+        st.session_state.history_cursor = bundle.next_cursor
+
+    if not bundle.workouts:
+        st.info("No workouts logged yet. Go log one!")
+        archived_history(archive)
+        return
+
+    st.subheader("Progress Over Time")
+    st.radio("Resolution", ["Day", "Week", "Month"], index=1, horizontal=True, key="history_resolution")
+    df_series = pd.DataFrame(
+        [(p.bucket, p.workouts, p.minutes, p.calories) for p in bundle.series],
+        columns=['Date', 'Workouts', 'Duration (min)', 'Calories Burned'],
+    )
+    df_series['Date'] = pd.to_datetime(df_series['Date'])
+    st.line_chart(df_series.set_index('Date')['Duration (min)'])
+
+    st.subheader("Exercise Progress")
+    if exercises:
+        catalog_id = st.selectbox(
+            "Exercise", [ex[0] for ex in exercises], format_func=dict((ex[0], ex[1]) for ex in exercises).get,
+            key="history_exercise",
+        )
+        df_exercise = be.get_exercise_history(CURRENT_USER_ID, catalog_id, as_frame=True).rename(columns={
+            'workout_date': 'Date', 'best_weight_kg': 'Best Weight (kg)', 'volume_kg': 'Volume (kg)',
+        }).set_index('Date').sort_index()
+        cols = st.columns(2)
+        cols[0].line_chart(df_exercise['Best Weight (kg)'])
+        cols[1].line_chart(df_exercise['Volume (kg)'])
+
+    st.subheader("Workout Logs")
+    for workout in bundle.workouts + st.session_state.history_workouts:
+        with st.expander(f"{workout.workout_date.strftime('%Y-%m-%d')} - {workout.duration_minutes} minutes"):
+            st.table(exercises_table(workout.exercises))
+            if st.button("Delete Workout", key=f"delete_{workout.workout_id}"):
+                be.delete_workout(workout.workout_id)
+                reset_history()
+                st.success("Workout deleted.")
+                st.experimental_rerun()
+
+    if st.session_state.history_cursor is not None:
+        if st.button("Load more"):
+            more = pb.get_history_bundle(
+                CURRENT_USER_ID, resolution.lower(), HISTORY_PAGE_SIZE, before=st.session_state.history_cursor
+            )
+            st.session_state.history_workouts.extend(more.workouts)
+            st.session_state.history_cursor = more.next_cursor
+            st.experimental_rerun()
+    else:
+        archived_history(archive)
+
+    st.subheader("Export")
+    # Streamed from the database; the file holds every workout, not just the loaded pages
+    cols = st.columns([1, 1, 2])
+    fmt = cols[0].selectbox("Format", be.available_export_formats(), format_func=str.upper, key="export_format")
+    if cols[1].button("Prepare export"):
+        buffer = io.BytesIO()
+        if be.export_workouts(buffer, fmt, user_id=CURRENT_USER_ID) is not None:
+            st.session_state.export_file = (fmt, buffer.getvalue())
+        else:
+            st.error("The export failed. Please try again.")
+    if 'export_file' in st.session_state:
+        fmt, data = st.session_state.export_file
+        cols[2].download_button(
+            f"Download {fmt.upper()}", data, file_name=f"workouts.{fmt}",
+            mime="text/csv" if fmt == 'csv' else "application/octet-stream",
+        )
+
+GOAL_METRICS = {"Workouts": 'workouts', "Minutes": 'minutes', "Calories": 'calories'}
+
+def set_goals():
+    st.header("🎯 Set & View Goals")
+    
+    with st.form("goal_form"):
+        st.subheader("Set a New Goal")
+        description = st.text_area("Goal Description (e.g., 'Workout 5 times a week')")
+        cols = st.columns(2)
+        metric = cols[0].selectbox("Count", list(GOAL_METRICS))
+        target_value = cols[1].number_input("Target Value (optional)", min_value=0)
+        cols = st.columns(2)
+        start_date = cols[0].date_input("Start Date", date.today())
+        end_date = cols[1].date_input("End Date", date.today() + timedelta(days=30))
+
+        submitted = st.form_submit_button("Set Goal")
+        if submitted:
+            be.set_goal(CURRENT_USER_ID, description, target_value, start_date, end_date, GOAL_METRICS[metric])
+            st.success("Goal set!")
+
+    st.markdown("---")
+    st.subheader("My Goals")
+    # Progress for every goal comes from a single query
+    goals = be.get_goal_progress(CURRENT_USER_ID)
+    if goals:
+        for goal_id, description, metric, target, progress, start, end, status in goals:
+            cols = st.columns([3, 2, 1])
+            cols[0].write(f"**{description}**  \n{start:%b %d} – {end:%b %d, %Y}")
+            if target:
+                cols[1].progress(min(float(progress / target), 1.0), text=f"{progress:,.0f} / {target:,.0f} {metric}")
+            else:
+                cols[1].write(f"{progress:,.0f} {metric}")
+            cols[2].write(status)
+    else:
+        st.info("You have no goals yet.")
+
+def social_leaderboard():
+    st.header("🏆 Friends & Leaderboard")
+    
+    # Everything on the three tabs comes from one query; the week and period
+    # pickers below are read from session state before it runs
+    this_week = date.today() - timedelta(days=date.today().weekday())
+    period = st.session_state.get('global_period', "This Week")
+    bundle = pb.get_social_bundle(
+        CURRENT_USER_ID, st.session_state.get('leaderboard_week', this_week),
+        'week' if period == "This Week" else 'month',
+    )
+
+    tab1, tab_global, tab2 = st.tabs(["Leaderboard", "Global Leaderboard", "Manage Friends"])
+
+    with tab1:
+        st.subheader("Weekly Leaderboard")
+        week_options = [this_week - timedelta(weeks=n) for n in range(LEADERBOARD_WEEKS)]
+        st.selectbox(
+            "Week", options=week_options, key="leaderboard_week",
+            format_func=lambda d: "This week" if d == this_week else f"Week of {d.strftime('%b %d, %Y')}",
+        )
+        st.caption("Ranking based on total workout minutes in the selected week.")
+        if bundle.weekly_leaderboard:
+            df_leaderboard = pd.DataFrame(
+                [(entry.name, entry.minutes) for entry in bundle.weekly_leaderboard], columns=['Name', 'Total Minutes'],
+            )
+            df_leaderboard.index = df_leaderboard.index + 1 # Rank
+            st.dataframe(df_leaderboard, use_container_width=True)
+        else:
+            st.info("Not enough data for a leaderboard yet.")
+
+    with tab_global:
+        st.subheader("Global Leaderboard")
+        st.radio("Period", ["This Week", "This Month"], horizontal=True, key="global_period")
+        st.caption("Ranking of everyone on the site by total workout minutes. Refreshed every few minutes.")
+        if bundle.user_rank:
+            st.metric(
+                label="Your Rank",
+                value=f"#{bundle.user_rank:,} of {bundle.ranked_users:,}",
+                help=f"{bundle.user_minutes:,} minutes",
+            )
+        else:
+            st.info("Log a workout to get on the board!")
+        if bundle.global_top:
+            df_global = pd.DataFrame(
+                [(entry.rank, entry.name, entry.minutes) for entry in bundle.global_top],
+                columns=['Rank', 'Name', 'Total Minutes'],
+            )
+            st.dataframe(df_global.set_index('Rank'), use_container_width=True)
+
+    with tab2:
+        st.subheader("My Friends")
+        if bundle.friends:
+            for friend in bundle.friends:
+                cols = st.columns([4, 1])
+                cols[0].write(friend.name)
+                if cols[1].button("Remove", key=f"remove_{friend.user_id}"):
+                    be.remove_friend(CURRENT_USER_ID, friend.user_id)
+                    st.success(f"Removed {friend.name} from friends.")
+                    st.experimental_rerun()
+        else:
+            st.info("You haven't added any friends yet.")
+
+        st.markdown("---")
+        st.subheader("Add a Friend")
+        search = st.text_input("Search by name or email", key="friend_search", placeholder="Start typing a name...")
+        if search.strip():
+            # The backend leaves out you and your current friends
+            matches = be.search_users(search, user_id=CURRENT_USER_ID, limit=FRIEND_SEARCH_RESULTS)
+            if matches:
+                selected_user = st.selectbox("Select a user to add", options=matches, format_func=lambda x: x[1])
+                if st.button("Add Friend"):
+                    be.add_friend(CURRENT_USER_ID, selected_user[0])
+                    st.success(f"Added {selected_user[1]} as a friend!")
+                    st.experimental_rerun()
+            else:
+                st.write("No matching users found.")
+
+        if bundle.suggestions:
+            st.markdown("---")
+            st.subheader("People You May Know")
+            for person in bundle.suggestions:
+                mutual = person.mutual_friends
+                cols = st.columns([4, 1])
+                cols[0].write(f"{person.name} · {mutual} mutual friend{'s' if mutual != 1 else ''}")
+                if cols[1].button("Add", key=f"suggest_{person.user_id}"):
+                    be.add_friend(CURRENT_USER_ID, person.user_id)
+                    st.success(f"Added {person.name} as a friend!")
+                    st.experimental_rerun()
+
+def show_fitness_insights():
+    st.header("📊 Fitness Insights")
+    st.subheader("Your Personal Fitness Dashboard")
+
+    # Stats, this week's sessions, the latest workout and personal records all come from one query
+    bundle = pb.get_insights_bundle(CURRENT_USER_ID)
+    stats = bundle.stats
+
+    if stats.total_workouts == 0:
+        st.warning("Log a workout to see your insights!")
+        return
+
+    # Weekly stats come precomputed from the backend rollups
+    cols = st.columns(3)
+    cols[0].metric(label="Workouts This Week", value=stats.workouts_this_week)
+    cols[1].metric(label="Total Minutes This Week", value=stats.minutes_this_week)
+    cols[2].metric(label="Average Workout Length", value=f"{stats.avg_duration:.1f} min")
+
+    if bundle.week_workouts:
+        df_week = pd.DataFrame(
+            [(w.workout_date, w.duration_minutes, w.calories_burned, len(w.exercises)) for w in bundle.week_workouts],
+            columns=['Date', 'Duration (min)', 'Calories Burned', 'Exercises'],
+        )
+        st.dataframe(df_week.set_index('Date'), use_container_width=True)
+
+    # Streaks and the activity calendar are kept up to date as workouts are logged
+    activity = bundle.activity
+    st.subheader("Streaks")
+    cols = st.columns(2)
+    cols[0].metric(label="Current Streak", value=f"{activity.current_streak} days")
+    cols[1].metric(label="Longest Streak", value=f"{activity.longest_streak} days")
+    if activity.longest_start:
+        st.caption(f"Longest streak: {activity.longest_start.strftime('%B %d, %Y')} to "
+                   f"{activity.longest_end.strftime('%B %d, %Y')}")
+    if activity.calendar:
+        st.dataframe(activity_heatmap(activity.calendar), use_container_width=True)
+
+    if bundle.records:
+        st.subheader("Personal Records")
+        df_records = pd.DataFrame(
+            [(r.exercise_name, r.max_weight_kg, r.best_e1rm_kg, r.best_e1rm_date, r.best_volume_kg) for r in bundle.records],
+            columns=['Exercise', 'Heaviest (kg)', 'Est. 1RM (kg)', 'Set On', 'Best Session Volume (kg)'],
+        )
+        st.dataframe(df_records.set_index('Exercise'), use_container_width=True)
+
+    st.markdown("---")
+    st.subheader("Recent Activity")
+    latest_workout = bundle.latest_workout
+    if latest_workout:
+        st.write(f"Your last workout was on **{latest_workout.workout_date.strftime('%B %d, %Y')}** for **{latest_workout.duration_minutes} minutes**.")
+        
+        with st.expander("View details of your last workout"):
+            if latest_workout.exercises:
+                st.table(exercises_table(latest_workout.exercises))
+            else:
+                st.write("No specific exercises were logged for this workout.")
+    else:
+        st.info("No recent workouts found.")
+
+
+# --- Main App ---
+def main():
+    # Migrate the schema and seed demo data once per process; later reruns skip it
+    be.bootstrap()
+    
+    # Filled in below, once the page render is being measured
+    welcome = st.sidebar.empty()
+    
+    menu = {
+        "📊 Fitness Insights": show_fitness_insights,
+        "🏋️ Log Workout": log_workout,
+        "📈 My History": view_history,
+        "🏆 Friends & Leaderboard": social_leaderboard,
+        "🎯 Goals": set_goals,
+        "👤 My Profile": show_profile,
+    }
+
+    choice = st.sidebar.radio("Navigation", list(menu.keys()))
+    
+    # Call the selected page function, counting its queries against the page budget
+    page = menu[choice]
+    with be.page_scope(page.__name__) as cost:
+        welcome.title(f"Welcome, {get_current_user_name()}!")
+        page()
+
+    if cost is not None and config.INSTRUMENTATION_SETTINGS["show_page_cost"]:
+        st.sidebar.caption(
+            f"{cost.queries} queries, {cost.db_seconds * 1000:.0f} ms in SQL, "
+            f"{cost.wall_seconds * 1000:.0f} ms total"
+        )
+        for reason in cost.over_budget:
+            st.sidebar.warning(f"Over budget: {reason}")
+
+if __name__ == '__main__':
+    main()
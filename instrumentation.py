@@ -0,0 +1,489 @@
+# instrumentation.py
+#
+# Hot-path instrumentation for the backend: every SQL statement, connection
+# checkout and backend call is timed and attributed to the backend function and
+# Streamlit page that caused it. Totals are kept in process and exported as
+# Prometheus text (export_prometheus) and as one JSON line per page render.
+
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import psycopg2.extensions
+
+import config
+
+logger = logging.getLogger("fitness.instrumentation")
+
+SETTINGS = config.INSTRUMENTATION_SETTINGS
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Histogram bucket upper bounds for per-page query counts
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+# Histogram bucket upper bounds for write-behind batch sizes
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+# --- Metrics Registry ---
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.n += 1
+
+
+class MetricsRegistry:
+    """Thread-safe counters, gauges and histograms keyed by metric name and label values."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> float
+        self._gauges = {}      # (name, labels) -> float
+        self._histograms = {}  # (name, labels) -> _Histogram
+        self._help = {}
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def inc(self, name, labels=(), amount=1):
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name, value, labels=()):
+        with self._lock:
+            self._gauges[(name, labels)] = value
+
+    def observe(self, name, value, labels=(), buckets=LATENCY_BUCKETS):
+        with self._lock:
+            key = (name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self):
+        """Returns counters, gauges and histograms as plain dicts (for JSON export)."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            gauges = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._gauges.items())
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), "count": h.n, "sum": h.total,
+                 "buckets": dict(zip([str(b) for b in h.buckets] + ["+Inf"], h.counts))}
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def to_prometheus(self):
+        """Renders every metric in the Prometheus text exposition format."""
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines = []
+        with self._lock:
+            seen = set()
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                for (name, labels), value in sorted(values.items()):
+                    if name not in seen:
+                        seen.add(name)
+                        if name in self._help:
+                            lines.append(f"# HELP {name} {self._help[name]}")
+                        lines.append(f"# TYPE {name} {kind}")
+                    lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                if name not in seen:
+                    seen.add(name)
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {h.total}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {h.n}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe("fitness_backend_calls_total", "Backend function calls.")
+metrics.describe("fitness_backend_errors_total", "Backend function calls that reported an error.")
+metrics.describe("fitness_backend_call_seconds", "Backend function wall time.")
+metrics.describe("fitness_db_queries_total", "SQL statements executed, by calling backend function.")
+metrics.describe("fitness_db_rows_total", "Rows returned or affected by SQL statements.")
+metrics.describe("fitness_db_query_seconds", "SQL statement execution time.")
+metrics.describe("fitness_db_acquire_seconds", "Time spent waiting for a pooled connection.")
+metrics.describe("fitness_page_render_seconds", "Streamlit page render wall time.")
+metrics.describe("fitness_page_queries", "SQL statements per page render.")
+metrics.describe("fitness_page_budget_exceeded_total", "Page renders over their query or latency budget.")
+metrics.describe("fitness_write_queue_depth", "Workouts waiting in the write-behind queue.")
+metrics.describe("fitness_write_queue_full_total", "Enqueues that had to wait for room in the write-behind queue.")
+metrics.describe("fitness_write_queue_rejected_total", "Enqueues refused because the write-behind queue stayed full.")
+metrics.describe("fitness_write_batch_size", "Items committed per write-behind transaction.")
+metrics.describe("fitness_write_commit_seconds", "Write-behind batch commit time.")
+metrics.describe("fitness_write_delay_seconds", "Time from enqueue to commit for write-behind items.")
+metrics.describe("fitness_write_failed_total", "Write-behind items that could not be written.")
+
+
+# --- Query Fingerprints ---
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?(?![\w$])")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_TUPLE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def _fingerprint_text(query):
+    text = _PLACEHOLDER.sub("?", query)
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _WHITESPACE.sub(" ", text).strip().rstrip(";")
+    # Multi-row VALUES lists of any length share one fingerprint
+    text = _TUPLE_LIST.sub("(...)", text)
+    return text
+
+
+def fingerprint(query):
+    """Normalizes a SQL statement (literals and placeholders -> ?) and returns (id, text)."""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)
+    # Literal-heavy statements (execute_values) would flood the lru_cache
+    text = _fingerprint_text(query) if len(query) < 4096 else _fingerprint_text.__wrapped__(query)
+    return hashlib.md5(text.encode()).hexdigest()[:12], text
+
+
+# --- Call and Page Context ---
+
+_current_function = contextvars.ContextVar("fitness_current_function", default=None)
+_current_page = contextvars.ContextVar("fitness_current_page", default=None)
+
+_query_stats_lock = threading.Lock()
+_query_stats = {}  # fingerprint id -> {"text", "calls", "total_ms", "max_ms", "rows"}
+
+
+class _PageStats:
+    def __init__(self, name):
+        self.name = name
+        self.queries = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+        self.acquire_seconds = 0.0
+        self.connections = 0
+        self.calls = {}
+        self.errors = 0
+        self.fingerprints = {}
+        # Reads fanned out to worker threads (async_backend) report concurrently
+        self.lock = threading.Lock()
+
+
+def record_query(query, seconds, rows):
+    """Records one executed statement against the current backend call and page."""
+    if not SETTINGS["enabled"]:
+        return
+    function = _current_function.get() or "unattributed"
+    fp_id, fp_text = fingerprint(query)
+    metrics.inc("fitness_db_queries_total", (("function", function),))
+    if rows and rows > 0:
+        metrics.inc("fitness_db_rows_total", (("function", function),), rows)
+    metrics.observe("fitness_db_query_seconds", seconds, (("function", function),))
+    with _query_stats_lock:
+        stats = _query_stats.get(fp_id)
+        if stats is None:
+            stats = _query_stats[fp_id] = {"text": fp_text[:500], "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0}
+        stats["calls"] += 1
+        stats["total_ms"] += seconds * 1000.0
+        stats["max_ms"] = max(stats["max_ms"], seconds * 1000.0)
+        stats["rows"] += max(rows or 0, 0)
+    page = _current_page.get()
+    if page is not None:
+        with page.lock:
+            page.queries += 1
+            page.rows += max(rows or 0, 0)
+            page.db_seconds += seconds
+            page.fingerprints[fp_id] = page.fingerprints.get(fp_id, 0) + 1
+    if seconds * 1000.0 >= SETTINGS["slow_query_ms"]:
+        logger.warning("Slow query (%.1f ms) in %s: %s", seconds * 1000.0, function, fp_text[:300])
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """psycopg2 cursor that times every statement it runs."""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - started, self.rowcount)
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            return super().copy_expert(sql, file, size)
+        finally:
+            record_query(sql, time.perf_counter() - started, self.rowcount)
+
+
+class InstrumentedSQLiteCursor(sqlite3.Cursor):
+    """sqlite3 cursor that times every statement it runs (used by sqlite_backend).
+
+    It is also a context manager, like psycopg2 cursors, so code written as
+    `with conn.cursor() as cur:` runs on either engine.
+    """
+
+    def execute(self, sql, parameters=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, () if parameters is None else parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started, self.rowcount)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def record_acquire(seconds):
+    """Records how long a caller waited for a pooled connection."""
+    if not SETTINGS["enabled"]:
+        return
+    function = _current_function.get() or "unattributed"
+    metrics.observe("fitness_db_acquire_seconds", seconds, (("function", function),))
+    page = _current_page.get()
+    if page is not None:
+        with page.lock:
+            page.acquire_seconds += seconds
+            page.connections += 1
+
+
+def record_error():
+    """Counts an error reported by the backend function currently running."""
+    function = _current_function.get() or "unattributed"
+    metrics.inc("fitness_backend_errors_total", (("function", function),))
+    page = _current_page.get()
+    if page is not None:
+        with page.lock:
+            page.errors += 1
+
+
+def instrumented(func):
+    """Decorator for backend functions (plain or async): counts and times calls, attributes their queries."""
+    name = func.__name__
+
+    def finish(started):
+        elapsed = time.perf_counter() - started
+        metrics.inc("fitness_backend_calls_total", (("function", name),))
+        metrics.observe("fitness_backend_call_seconds", elapsed, (("function", name),))
+        page = _current_page.get()
+        if page is not None:
+            with page.lock:
+                page.calls[name] = page.calls.get(name, 0) + 1
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not SETTINGS["enabled"] or _current_function.get() is not None:
+                return await func(*args, **kwargs)
+            token = _current_function.set(name)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _current_function.reset(token)
+                finish(started)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not SETTINGS["enabled"] or _current_function.get() is not None:
+            # Nested backend calls are attributed to the outermost function
+            return func(*args, **kwargs)
+        token = _current_function.set(name)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_function.reset(token)
+            finish(started)
+    return wrapper
+
+
+def current_page():
+    """Returns the stats of the page render in progress in this context, if any."""
+    return _current_page.get()
+
+
+def bind_page(page):
+    """Attributes work done in the current context (e.g. an asyncio task or worker thread) to `page`."""
+    _current_page.set(page)
+
+
+def _page_budget(page_name):
+    budget = {"queries": SETTINGS["page_budget_queries"], "ms": SETTINGS["page_budget_ms"]}
+    budget.update(SETTINGS["page_budgets"].get(page_name, {}))
+    return budget
+
+
+@contextmanager
+def page_scope(page_name):
+    """Aggregates every backend call made while rendering one page.
+
+    On exit the render is checked against its query/latency budget, recorded in
+    the page histograms and appended to the JSON log. Yields the live stats.
+    """
+    if not SETTINGS["enabled"]:
+        yield None
+        return
+    page = _PageStats(page_name)
+    token = _current_page.set(page)
+    started = time.perf_counter()
+    try:
+        yield page
+    finally:
+        wall = time.perf_counter() - started
+        _current_page.reset(token)
+        _finish_page(page, wall)
+
+
+def _finish_page(page, wall):
+    labels = (("page", page.name),)
+    metrics.observe("fitness_page_render_seconds", wall, labels)
+    metrics.observe("fitness_page_queries", page.queries, labels, buckets=COUNT_BUCKETS)
+
+    budget = _page_budget(page.name)
+    over_budget = []
+    if budget.get("queries") is not None and page.queries > budget["queries"]:
+        over_budget.append(f"{page.queries} queries > budget {budget['queries']}")
+    if budget.get("ms") is not None and wall * 1000.0 > budget["ms"]:
+        over_budget.append(f"{wall * 1000.0:.0f} ms > budget {budget['ms']} ms")
+    if over_budget:
+        metrics.inc("fitness_page_budget_exceeded_total", labels)
+        logger.warning("Page %s over budget: %s", page.name, "; ".join(over_budget))
+    page.over_budget = over_budget
+    page.wall_seconds = wall
+
+    if SETTINGS["json_log_path"]:
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "page": page.name,
+            "wall_ms": round(wall * 1000.0, 3),
+            "queries": page.queries,
+            "rows": page.rows,
+            "db_ms": round(page.db_seconds * 1000.0, 3),
+            "acquire_ms": round(page.acquire_seconds * 1000.0, 3),
+            "connections": page.connections,
+            "calls": page.calls,
+            "errors": page.errors,
+            "fingerprints": page.fingerprints,
+            "over_budget": over_budget,
+        }
+        _append_line(SETTINGS["json_log_path"], json.dumps(record))
+    if SETTINGS["prometheus_textfile"]:
+        write_prometheus_textfile(SETTINGS["prometheus_textfile"])
+
+
+_file_lock = threading.Lock()
+
+
+def _append_line(path, line):
+    try:
+        with _file_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as error:
+        logger.error("Could not write metrics log %s: %s", path, error)
+
+
+def write_prometheus_textfile(path):
+    """Atomically writes the current metrics for a node_exporter textfile collector."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with _file_lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(export_prometheus())
+            os.replace(tmp, path)
+    except OSError as error:
+        logger.error("Could not write Prometheus textfile %s: %s", path, error)
+
+
+# --- Export ---
+
+def export_prometheus():
+    """Returns all counters and histograms in the Prometheus text format."""
+    return metrics.to_prometheus()
+
+
+def query_stats():
+    """Returns per-fingerprint totals, most expensive first."""
+    with _query_stats_lock:
+        items = [dict(stats, fingerprint=fp_id) for fp_id, stats in _query_stats.items()]
+    return sorted(items, key=lambda s: s["total_ms"], reverse=True)
+
+
+def export_json():
+    """Returns metrics and per-fingerprint query totals as a JSON-serialisable dict."""
+    return {"metrics": metrics.snapshot(), "queries": query_stats()}
+
+
+def reset():
+    """Clears all collected metrics (e.g. between benchmark runs)."""
+    metrics.reset()
+    with _query_stats_lock:
+        _query_stats.clear()
@@ -0,0 +1,191 @@
+# manage.py
+#
+# Maintenance commands for the fitness tracker database.
+#
+#   python manage.py migrate [--status]
+#   python manage.py rebuild-rollups [--user-id N]
+#   python manage.py check-rollups [--user-id N]
+#   python manage.py refresh-leaderboard [--period week|month] [--date YYYY-MM-DD]
+#   python manage.py create-partitions [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+#   python manage.py evaluate-goals [--batch-size N] [--date YYYY-MM-DD]
+#   python manage.py alias-exercise ALIAS EXERCISE
+#   python manage.py rebuild-records [--user-id N] [--batch-users N]
+#   python manage.py backfill-calories [--batch-size N]
+#   python manage.py archive-workouts [--months N] [--batch-users N] [--date YYYY-MM-DD]
+#   python manage.py restore-archive --user-id N
+
+import argparse
+import sys
+
+import storage
+
+be = storage.backend()  # Backend_fft or sqlite_backend, per FITNESS_STORAGE_ENGINE
+
+
+def migrate(args):
+    if args.status:
+        pending = be.get_pending_migrations()
+        if not pending:
+            print("Schema is up to date.")
+        for version, description in pending:
+            print(f"pending: {version:>4}  {description}")
+        return 0
+    if not be.create_tables():
+        return 1
+    print("Schema is up to date.")
+    return 0
+
+
+def rebuild_rollups(args):
+    if not be.rebuild_rollups(args.user_id):
+        return 1
+    print("Rollups rebuilt" + (f" for user {args.user_id}." if args.user_id else " for all users."))
+    return 0
+
+
+def check_rollups(args):
+    mismatches = be.check_rollups(args.user_id)
+    if not mismatches:
+        print("Rollups are consistent with the workouts table.")
+        return 0
+    for table, key, stored, expected in mismatches:
+        print(f"{table} {key}: stored={stored} expected={expected}")
+    print(f"{len(mismatches)} inconsistent rollup rows; run 'python manage.py rebuild-rollups' to repair.")
+    return 1
+
+
+def refresh_leaderboard(args):
+    periods = [args.period] if args.period else ["week", "month"]
+    for period_type in periods:
+        ranked = be.refresh_global_leaderboard(period_type, args.date)
+        if ranked is None:
+            return 1
+        print(f"Global {period_type} leaderboard refreshed: {ranked} users ranked.")
+    return 0
+
+
+def create_partitions(args):
+    if not be.ensure_schema():
+        return 1
+    created = be.create_partitions(args.start, args.end)
+    if created is None:
+        return 1
+    print(f"Workout partitions up to date: {created} months created.")
+    return 0
+
+
+def evaluate_goals(args):
+    counts = be.evaluate_goals(args.batch_size, args.date)
+    if counts is None:
+        return 1
+    print(f"Evaluated {counts['evaluated']} active goals: {counts['completed']} completed, "
+          f"{counts['expired']} expired, {counts['updated']} updated.")
+    return 0
+
+
+def alias_exercise(args):
+    exercise = int(args.exercise) if args.exercise.isdigit() else args.exercise
+    if not be.add_exercise_alias(args.alias, exercise):
+        return 1
+    print(f"'{args.alias}' is now logged as '{args.exercise}'.")
+    return 0
+
+
+def rebuild_records(args):
+    written = be.rebuild_personal_records(args.user_id, args.batch_users)
+    if written is None:
+        return 1
+    print(f"Personal records rebuilt: {written} records" + (f" for user {args.user_id}." if args.user_id else "."))
+    return 0
+
+
+def backfill_calories(args):
+    if not be.ensure_schema():
+        return 1
+    counts = be.backfill_calories(args.batch_size)
+    if counts is None:
+        return 1
+    print(f"Estimated calories for {counts['workouts']} workouts ({counts['calories']} kcal added) "
+          f"in {counts['batches']} batches.")
+    return 0
+
+
+def archive_workouts(args):
+    if not be.ensure_schema():
+        return 1
+    counts = be.archive_workouts(args.months, args.batch_users, args.date)
+    if counts is None:
+        return 1
+    print(f"Archived {counts['workouts']} workouts ({counts['exercises']} exercises) of {counts['users']} users.")
+    return 0
+
+
+def restore_archive(args):
+    restored = be.restore_archived_workouts(args.user_id)
+    if restored is None:
+        return 1
+    print(f"Restored {restored} archived workouts for user {args.user_id}.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fitness tracker maintenance commands.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser("migrate", help="apply pending schema migrations")
+    cmd.add_argument("--status", action="store_true", help="only list pending migrations")
+    cmd.set_defaults(func=migrate)
+
+    cmd = commands.add_parser("rebuild-rollups", help="recompute dashboard rollups from the workouts table")
+    cmd.add_argument("--user-id", type=int, help="only rebuild this user's rollups")
+    cmd.set_defaults(func=rebuild_rollups)
+
+    cmd = commands.add_parser("check-rollups", help="report rollup rows that disagree with the workouts table")
+    cmd.add_argument("--user-id", type=int, help="only check this user's rollups")
+    cmd.set_defaults(func=check_rollups)
+
+    cmd = commands.add_parser("refresh-leaderboard", help="recompute the site-wide leaderboard snapshot")
+    cmd.add_argument("--period", choices=["week", "month"], help="only refresh this period (default: both)")
+    cmd.add_argument("--date", help="any date inside the period to refresh (default: today)")
+    cmd.set_defaults(func=refresh_leaderboard)
+
+    cmd = commands.add_parser("create-partitions", help="create monthly workout partitions ahead of time")
+    cmd.add_argument("--from", dest="start", help="first month to create (default: this month)")
+    cmd.add_argument("--to", dest="end", help="last month to create (default: FITNESS_PARTITION_MONTHS_AHEAD ahead)")
+    cmd.set_defaults(func=create_partitions)
+
+    cmd = commands.add_parser("evaluate-goals", help="update progress and status of every active goal")
+    cmd.add_argument("--batch-size", type=int, help="goals per transaction (default: FITNESS_GOAL_BATCH_SIZE)")
+    cmd.add_argument("--date", help="evaluate as of this date (default: today)")
+    cmd.set_defaults(func=evaluate_goals)
+
+    cmd = commands.add_parser("alias-exercise", help="treat another spelling as an existing exercise")
+    cmd.add_argument("alias", help="the other spelling, e.g. 'BP'")
+    cmd.add_argument("exercise", help="name or catalog id of the exercise it stands for")
+    cmd.set_defaults(func=alias_exercise)
+
+    cmd = commands.add_parser("rebuild-records", help="recompute personal records from the exercises table")
+    cmd.add_argument("--user-id", type=int, help="only rebuild this user's records")
+    cmd.add_argument("--batch-users", type=int, help="users per transaction (default: FITNESS_RECORDS_BATCH_USERS)")
+    cmd.set_defaults(func=rebuild_records)
+
+    cmd = commands.add_parser("backfill-calories", help="estimate calories for workouts logged without them")
+    cmd.add_argument("--batch-size", type=int, help="workouts per transaction (default: FITNESS_CALORIE_BATCH_SIZE)")
+    cmd.set_defaults(func=backfill_calories)
+
+    cmd = commands.add_parser("archive-workouts", help="move workouts older than the archive horizon to the archive")
+    cmd.add_argument("--months", type=int, help="months of history kept (default: FITNESS_ARCHIVE_HORIZON_MONTHS)")
+    cmd.add_argument("--batch-users", type=int, help="users per transaction (default: FITNESS_ARCHIVE_BATCH_USERS)")
+    cmd.add_argument("--date", help="archive as of this date (default: today)")
+    cmd.set_defaults(func=archive_workouts)
+
+    cmd = commands.add_parser("restore-archive", help="move a user's archived workouts back into the workouts table")
+    cmd.add_argument("--user-id", type=int, required=True, help="the user whose archive to restore")
+    cmd.set_defaults(func=restore_archive)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
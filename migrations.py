@@ -0,0 +1,640 @@
+# migrations.py
+#
+# Versioned schema migrations. Each migration is applied once, in order, in its
+# own transaction, and recorded in the schema_version table. Steps are either SQL
+# strings or callables that receive an open cursor (for data backfills).
+#
+# Every statement is written to be safe on databases that were created by the
+# old create_tables() code, which ran CREATE TABLE IF NOT EXISTS on each start.
+# Append new migrations to the end of MIGRATIONS; never edit an applied one.
+
+import config
+
+# Arbitrary key for the advisory lock that serializes concurrent migrators
+MIGRATION_LOCK_ID = 724_130_001
+# ...and for the one that serializes creation of workout partitions
+PARTITION_LOCK_ID = 724_130_002
+
+
+# Creates the monthly workouts/exercises partitions covering [from_month, to_month].
+# Called by the backend before writing into a month it has not seen, by
+# `manage.py create-partitions` (schedule it to stay ahead of the calendar) and
+# by migration 6. Returns the number of months created.
+_ENSURE_PARTITIONS_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION ensure_workout_partitions(from_month DATE, to_month DATE)
+RETURNS INTEGER LANGUAGE plpgsql AS $$
+DECLARE
+    month DATE := date_trunc('month', from_month)::date;
+    suffix TEXT;
+    created INTEGER := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock({PARTITION_LOCK_ID});
+    WHILE month <= to_month LOOP
+        suffix := to_char(month, '"y"YYYY"m"MM');
+        -- CREATE + ATTACH rather than CREATE ... PARTITION OF: attaching only takes
+        -- a SHARE UPDATE EXCLUSIVE lock on the parent, so it neither waits for nor
+        -- blocks the readers and writers of other months
+        IF to_regclass('workouts_' || suffix) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE workouts INCLUDING DEFAULTS)', 'workouts_' || suffix);
+            EXECUTE format('ALTER TABLE workouts ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           'workouts_' || suffix, month, (month + interval '1 month')::date);
+            created := created + 1;
+        END IF;
+        IF to_regclass('exercises_' || suffix) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE exercises INCLUDING DEFAULTS)', 'exercises_' || suffix);
+            EXECUTE format('ALTER TABLE exercises ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                           'exercises_' || suffix, month, (month + interval '1 month')::date);
+        END IF;
+        month := (month + interval '1 month')::date;
+    END LOOP;
+    RETURN created;
+END $$
+"""
+
+
+def _partition_workouts(cur):
+    """Rebuilds workouts and exercises as tables range-partitioned by workout month.
+
+    Existing rows are copied into the new partitions and the id sequences are
+    carried over, so workout and exercise ids are unchanged. Partitioned primary
+    keys must contain the partition key, hence (workout_id, workout_date), and
+    exercises gain a workout_date column so they partition with their workout.
+    """
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = 'workouts'::regclass;")
+    if cur.fetchone()[0]:
+        cur.execute(_ENSURE_PARTITIONS_FUNCTION)
+        return
+
+    cur.execute("SELECT pg_get_serial_sequence('workouts', 'workout_id'), pg_get_serial_sequence('exercises', 'exercise_id');")
+    workout_seq, exercise_seq = cur.fetchone()
+    cur.execute(f"""
+        ALTER SEQUENCE {workout_seq} OWNED BY NONE;
+        ALTER SEQUENCE {exercise_seq} OWNED BY NONE;
+        ALTER TABLE exercises RENAME TO exercises_unpartitioned;
+        ALTER TABLE workouts RENAME TO workouts_unpartitioned;
+
+        CREATE TABLE workouts (
+            workout_id INTEGER NOT NULL DEFAULT nextval('{workout_seq}'),
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            workout_date DATE NOT NULL,
+            duration_minutes INTEGER,
+            calories_burned INTEGER,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        ) PARTITION BY RANGE (workout_date);
+
+        CREATE TABLE exercises (
+            exercise_id INTEGER NOT NULL DEFAULT nextval('{exercise_seq}'),
+            workout_id INTEGER NOT NULL,
+            workout_date DATE NOT NULL,
+            exercise_name VARCHAR(255) NOT NULL,
+            sets INTEGER,
+            reps INTEGER,
+            weight_kg NUMERIC(6, 2)
+        ) PARTITION BY RANGE (workout_date);
+    """)
+    cur.execute(_ENSURE_PARTITIONS_FUNCTION)
+    cur.execute(
+        """
+        SELECT ensure_workout_partitions(
+            COALESCE(MIN(workout_date), CURRENT_DATE),
+            GREATEST(COALESCE(MAX(workout_date), CURRENT_DATE),
+                     (CURRENT_DATE + make_interval(months => %s))::date)
+        ) FROM workouts_unpartitioned;
+        """,
+        (config.PARTITION_SETTINGS["months_ahead"],),
+    )
+    # Keys, indexes and the foreign key are built after the copy, which is much
+    # faster than maintaining them row by row
+    cur.execute(f"""
+        INSERT INTO workouts (workout_id, user_id, workout_date, duration_minutes, calories_burned, created_at)
+        SELECT workout_id, user_id, workout_date, duration_minutes, calories_burned, created_at
+        FROM workouts_unpartitioned;
+
+        INSERT INTO exercises (exercise_id, workout_id, workout_date, exercise_name, sets, reps, weight_kg)
+        SELECT e.exercise_id, e.workout_id, w.workout_date, e.exercise_name, e.sets, e.reps, e.weight_kg
+        FROM exercises_unpartitioned e
+        JOIN workouts_unpartitioned w ON w.workout_id = e.workout_id;
+
+        DROP TABLE exercises_unpartitioned;
+        DROP TABLE workouts_unpartitioned;
+
+        ALTER TABLE workouts ADD PRIMARY KEY (workout_id, workout_date);
+        ALTER TABLE exercises ADD PRIMARY KEY (exercise_id, workout_date);
+        ALTER TABLE exercises ADD CONSTRAINT exercises_workout_fkey
+            FOREIGN KEY (workout_id, workout_date) REFERENCES workouts(workout_id, workout_date) ON DELETE CASCADE;
+        ALTER SEQUENCE {workout_seq} OWNED BY workouts.workout_id;
+        ALTER SEQUENCE {exercise_seq} OWNED BY exercises.exercise_id;
+
+        ANALYZE workouts;
+        ANALYZE exercises;
+    """)
+
+
+def _trigram_indexes(cur):
+    """Adds trigram indexes for substring/fuzzy user search when pg_trgm is available.
+
+    The extension is optional: it may not be installed on the server, or the
+    migrating role may not be allowed to create it. Search then falls back to
+    prefix matching only.
+    """
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm');")
+    if not cur.fetchone()[0]:
+        return
+    cur.execute("SAVEPOINT trigram;")
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    except Exception:
+        cur.execute("ROLLBACK TO SAVEPOINT trigram;")
+        return
+    cur.execute("RELEASE SAVEPOINT trigram;")
+    # GiST rather than GIN so results can be ordered by similarity (<->) from the index
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_name_trgm ON users USING gist (lower(name) gist_trgm_ops);")
+
+
+def _intern_exercise_names(cur):
+    """Moves exercise names into exercise_catalog and points exercises at it by id.
+
+    Names are interned by their normalized form (trimmed, inner whitespace
+    collapsed, lower-cased), so "Squat", "squat" and "Squat " become one catalog
+    entry, displayed with the most common spelling. Exercises also get their
+    workout's user_id, so one index serves a user's history of one exercise.
+    """
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM information_schema.columns
+                       WHERE table_name = 'exercises' AND column_name = 'exercise_name');
+    """)
+    if not cur.fetchone()[0]:
+        return
+    cur.execute("""
+        INSERT INTO exercise_catalog (name, normalized_name)
+        SELECT DISTINCT ON (normalized_name) name, normalized_name
+        FROM (
+            SELECT regexp_replace(btrim(exercise_name), '\\s+', ' ', 'g') AS name,
+                   normalize_exercise_name(exercise_name) AS normalized_name,
+                   COUNT(*) AS uses
+            FROM exercises
+            GROUP BY 1, 2
+        ) spellings
+        ORDER BY normalized_name, uses DESC, name
+        ON CONFLICT (normalized_name) DO NOTHING;
+
+        ALTER TABLE exercises ADD COLUMN IF NOT EXISTS user_id INTEGER;
+        ALTER TABLE exercises ADD COLUMN IF NOT EXISTS catalog_id INTEGER;
+
+        UPDATE exercises e
+        SET user_id = w.user_id, catalog_id = c.catalog_id
+        FROM workouts w, exercise_catalog c
+        WHERE w.workout_id = e.workout_id AND w.workout_date = e.workout_date
+          AND c.normalized_name = normalize_exercise_name(e.exercise_name);
+
+        ALTER TABLE exercises ALTER COLUMN user_id SET NOT NULL;
+        ALTER TABLE exercises ALTER COLUMN catalog_id SET NOT NULL;
+        ALTER TABLE exercises ADD CONSTRAINT exercises_catalog_fkey
+            FOREIGN KEY (catalog_id) REFERENCES exercise_catalog(catalog_id);
+        ALTER TABLE exercises DROP COLUMN exercise_name;
+
+        ANALYZE exercise_catalog;
+        ANALYZE exercises;
+    """)
+
+
+MIGRATIONS = [
+    (1, "Initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            weight_kg NUMERIC(5, 2),
+            height_cm NUMERIC(5, 2),
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS friends (
+            user_id_1 INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            user_id_2 INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            PRIMARY KEY (user_id_1, user_id_2)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS workouts (
+            workout_id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            workout_date DATE NOT NULL,
+            duration_minutes INTEGER,
+            calories_burned INTEGER,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS exercises (
+            exercise_id SERIAL PRIMARY KEY,
+            workout_id INTEGER NOT NULL REFERENCES workouts(workout_id) ON DELETE CASCADE,
+            exercise_name VARCHAR(255) NOT NULL,
+            sets INTEGER,
+            reps INTEGER,
+            weight_kg NUMERIC(6, 2)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS goals (
+            goal_id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            goal_description TEXT NOT NULL,
+            target_value NUMERIC,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            status VARCHAR(50) DEFAULT 'Active'
+        )
+        """,
+    ]),
+    (2, "Constraints and foreign-key indexes from SQL_Schema", [
+        # Self-friendships were never created by the app; drop any strays first
+        "DELETE FROM friends WHERE user_id_1 = user_id_2",
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'check_different_users') THEN
+                ALTER TABLE friends ADD CONSTRAINT check_different_users CHECK (user_id_1 <> user_id_2);
+            END IF;
+        END $$
+        """,
+        # friends(user_id_1) is already served by the primary key, and
+        # workouts(user_id) by idx_workouts_user_date (migration 4)
+        "CREATE INDEX IF NOT EXISTS idx_friends_user_id_2 ON friends(user_id_2)",
+        "CREATE INDEX IF NOT EXISTS idx_exercises_workout_id ON exercises(workout_id)",
+        "CREATE INDEX IF NOT EXISTS idx_goals_user_id ON goals(user_id)",
+    ]),
+    (3, "Dashboard rollups", [
+        # Per-user running totals, maintained incrementally by every workout write
+        """
+        CREATE TABLE IF NOT EXISTS user_workout_rollups (
+            user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            total_workouts INTEGER NOT NULL DEFAULT 0,
+            total_minutes BIGINT NOT NULL DEFAULT 0,
+            total_calories BIGINT NOT NULL DEFAULT 0,
+            duration_count INTEGER NOT NULL DEFAULT 0,
+            min_duration INTEGER,
+            max_duration INTEGER
+        )
+        """,
+        # Per-user weekly (ISO, Monday-start) and monthly buckets
+        """
+        CREATE TABLE IF NOT EXISTS user_period_rollups (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            period_type VARCHAR(5) NOT NULL CHECK (period_type IN ('week', 'month')),
+            period_start DATE NOT NULL,
+            workouts INTEGER NOT NULL DEFAULT 0,
+            minutes BIGINT NOT NULL DEFAULT 0,
+            calories BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, period_type, period_start)
+        )
+        """,
+        # Fill both from the existing workouts (the backfills below, like every
+        # migration step, only use the schema as of their own version)
+        """
+        INSERT INTO user_workout_rollups
+            (user_id, total_workouts, total_minutes, total_calories, duration_count, min_duration, max_duration)
+        SELECT user_id, COUNT(*), COALESCE(SUM(duration_minutes), 0), COALESCE(SUM(calories_burned), 0),
+               COUNT(duration_minutes), MIN(duration_minutes), MAX(duration_minutes)
+        FROM workouts
+        WHERE NOT EXISTS (SELECT 1 FROM user_workout_rollups)
+        GROUP BY user_id
+        """,
+        """
+        INSERT INTO user_period_rollups (user_id, period_type, period_start, workouts, minutes, calories)
+        SELECT user_id, period_type, period_start,
+               COUNT(*), COALESCE(SUM(duration_minutes), 0), COALESCE(SUM(calories_burned), 0)
+        FROM workouts
+        CROSS JOIN LATERAL (VALUES
+            ('week', date_trunc('week', workout_date)::date),
+            ('month', date_trunc('month', workout_date)::date)
+        ) AS period(period_type, period_start)
+        WHERE NOT EXISTS (SELECT 1 FROM user_period_rollups)
+        GROUP BY user_id, period_type, period_start
+        """,
+    ]),
+    (4, "History pagination index", [
+        "CREATE INDEX IF NOT EXISTS idx_workouts_user_date ON workouts(user_id, workout_date DESC, workout_id DESC)",
+    ]),
+    (5, "Global leaderboard snapshots", [
+        """
+        CREATE TABLE IF NOT EXISTS global_leaderboard (
+            period_type VARCHAR(5) NOT NULL,
+            period_start DATE NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            minutes BIGINT NOT NULL,
+            rank INTEGER NOT NULL,
+            PRIMARY KEY (period_type, period_start, user_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_global_leaderboard_rank ON global_leaderboard(period_type, period_start, rank)",
+        """
+        CREATE TABLE IF NOT EXISTS global_leaderboard_refreshes (
+            period_type VARCHAR(5) NOT NULL,
+            period_start DATE NOT NULL,
+            ranked_users INTEGER NOT NULL,
+            refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (period_type, period_start)
+        )
+        """,
+        # Ranking a whole period reads the rollups in minutes order
+        "CREATE INDEX IF NOT EXISTS idx_period_rollups_ranking ON user_period_rollups(period_type, period_start, minutes DESC)",
+    ]),
+    (6, "Monthly partitions and covering indexes for workouts and exercises", [
+        _partition_workouts,
+        # Per-user history, rollup rebuilds and min/max recomputes are index-only scans
+        """
+        CREATE INDEX IF NOT EXISTS idx_workouts_user_date ON workouts(user_id, workout_date DESC, workout_id DESC)
+            INCLUDE (duration_minutes, calories_burned)
+        """,
+        # Lookups by id alone (delete, details) probe each partition's index
+        "CREATE INDEX IF NOT EXISTS idx_workouts_workout_id ON workouts(workout_id)",
+        "CREATE INDEX IF NOT EXISTS idx_exercises_workout_id ON exercises(workout_id)",
+    ]),
+    (7, "User search indexes", [
+        # Case-insensitive prefix search; the "C" collation lets one index serve
+        # both LIKE 'abc%' and ORDER BY, so a LIMITed search reads LIMIT rows
+        'CREATE INDEX IF NOT EXISTS idx_users_name_prefix ON users ((lower(name) COLLATE "C"))',
+        'CREATE INDEX IF NOT EXISTS idx_users_email_prefix ON users ((lower(email) COLLATE "C"))',
+        _trigram_indexes,
+    ]),
+    (8, "Goal metrics, stored progress and the active-goal index", [
+        "ALTER TABLE goals ADD COLUMN IF NOT EXISTS goal_metric VARCHAR(10) NOT NULL DEFAULT 'workouts'",
+        "ALTER TABLE goals ADD COLUMN IF NOT EXISTS progress NUMERIC NOT NULL DEFAULT 0",
+        "ALTER TABLE goals ADD COLUMN IF NOT EXISTS progress_updated_at TIMESTAMP WITH TIME ZONE",
+        # Goals created before metrics existed: guess from the description
+        "UPDATE goals SET goal_metric = 'minutes' WHERE goal_description ILIKE '%minute%'",
+        "UPDATE goals SET goal_metric = 'calories' WHERE goal_description ILIKE '%calorie%'",
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'check_goal_metric') THEN
+                ALTER TABLE goals ADD CONSTRAINT check_goal_metric
+                    CHECK (goal_metric IN ('workouts', 'minutes', 'calories'));
+            END IF;
+        END $$
+        """,
+        "UPDATE goals SET status = 'Active' WHERE status IS NULL",
+        # The evaluation job walks active goals in goal_id order, a batch at a time
+        "CREATE INDEX IF NOT EXISTS idx_goals_active ON goals(goal_id) WHERE status = 'Active'",
+    ]),
+    (9, "Exercise catalog with aliases; exercises reference it by id", [
+        """
+        CREATE OR REPLACE FUNCTION normalize_exercise_name(name TEXT) RETURNS TEXT
+        LANGUAGE sql IMMUTABLE STRICT AS $$
+            SELECT lower(regexp_replace(btrim(name), '\\s+', ' ', 'g'))
+        $$
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS exercise_catalog (
+            catalog_id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            normalized_name VARCHAR(255) NOT NULL UNIQUE
+        )
+        """,
+        # Extra spellings (normalized) of a catalog entry, e.g. 'back squat' -> Squat
+        """
+        CREATE TABLE IF NOT EXISTS exercise_aliases (
+            alias VARCHAR(255) PRIMARY KEY,
+            catalog_id INTEGER NOT NULL REFERENCES exercise_catalog(catalog_id) ON DELETE CASCADE
+        )
+        """,
+        _intern_exercise_names,
+        # A user's history of one exercise is an index-only range scan, newest first
+        """
+        CREATE INDEX IF NOT EXISTS idx_exercises_user_catalog
+            ON exercises(user_id, catalog_id, workout_date DESC, workout_id DESC)
+            INCLUDE (sets, reps, weight_kg)
+        """,
+    ]),
+    (10, "Personal records per user and exercise", [
+        """
+        CREATE TABLE IF NOT EXISTS personal_records (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            catalog_id INTEGER NOT NULL REFERENCES exercise_catalog(catalog_id) ON DELETE CASCADE,
+            max_weight_kg NUMERIC(6, 2),
+            max_weight_date DATE,
+            best_e1rm_kg NUMERIC(7, 2),
+            best_e1rm_date DATE,
+            best_volume_kg NUMERIC(12, 2),
+            best_volume_date DATE,
+            PRIMARY KEY (user_id, catalog_id)
+        )
+        """,
+        # Each record is the best session of its exercise; ties keep the earliest date
+        """
+        INSERT INTO personal_records (user_id, catalog_id, max_weight_kg, max_weight_date,
+                                      best_e1rm_kg, best_e1rm_date, best_volume_kg, best_volume_date)
+        WITH sessions AS (
+            SELECT user_id, catalog_id, workout_date,
+                   MAX(weight_kg) AS max_weight,
+                   MAX(ROUND(CASE WHEN reps = 1 THEN weight_kg WHEN reps > 1 THEN weight_kg * (30 + reps) / 30 END, 2))
+                       AS best_e1rm,
+                   NULLIF(ROUND(SUM(COALESCE(sets, 1) * COALESCE(reps, 0) * weight_kg), 2), 0) AS best_volume
+            FROM exercises
+            WHERE weight_kg > 0 AND NOT EXISTS (SELECT 1 FROM personal_records)
+            GROUP BY user_id, catalog_id, workout_id, workout_date
+        )
+        SELECT user_id, catalog_id,
+               MAX(max_weight),
+               (array_agg(workout_date ORDER BY max_weight DESC, workout_date))[1],
+               MAX(best_e1rm),
+               (array_agg(workout_date ORDER BY best_e1rm DESC, workout_date) FILTER (WHERE best_e1rm IS NOT NULL))[1],
+               MAX(best_volume),
+               (array_agg(workout_date ORDER BY best_volume DESC, workout_date) FILTER (WHERE best_volume IS NOT NULL))[1]
+        FROM sessions
+        GROUP BY user_id, catalog_id
+        """,
+    ]),
+    (11, "Activity calendars and workout streaks", [
+        """
+        CREATE TABLE IF NOT EXISTS user_activity_years (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            year SMALLINT NOT NULL,
+            day_counts BYTEA NOT NULL,
+            PRIMARY KEY (user_id, year)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_streaks (
+            user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            current_start DATE,
+            last_active_date DATE,
+            longest_start DATE,
+            longest_end DATE
+        )
+        """,
+        # One byte per day of the year (January 1st is byte 0) holding that day's
+        # workout count, capped at 255
+        """
+        INSERT INTO user_activity_years (user_id, year, day_counts)
+        WITH days AS (
+            SELECT user_id, EXTRACT(YEAR FROM workout_date)::int AS year,
+                   EXTRACT(DOY FROM workout_date)::int - 1 AS day_index, LEAST(COUNT(*), 255)::int AS workouts
+            FROM workouts
+            WHERE NOT EXISTS (SELECT 1 FROM user_activity_years)
+            GROUP BY user_id, workout_date
+        )
+        SELECT y.user_id, y.year,
+               string_agg(set_byte('\\x00'::bytea, 0, COALESCE(d.workouts, 0)), ''::bytea ORDER BY i.day_index)
+        FROM (SELECT DISTINCT user_id, year FROM days) AS y
+        CROSS JOIN generate_series(0, 365) AS i(day_index)
+        LEFT JOIN days d ON d.user_id = y.user_id AND d.year = y.year AND d.day_index = i.day_index
+        GROUP BY y.user_id, y.year
+        """,
+        # Runs of consecutive active days; the current one is the latest and of
+        # equally long ones the earliest is the longest
+        """
+        INSERT INTO user_streaks (user_id, current_start, last_active_date, longest_start, longest_end)
+        SELECT user_id,
+               (array_agg(run_start ORDER BY run_end DESC))[1],
+               MAX(run_end),
+               (array_agg(run_start ORDER BY run_end - run_start DESC, run_start))[1],
+               (array_agg(run_end ORDER BY run_end - run_start DESC, run_start))[1]
+        FROM (
+            SELECT user_id, MIN(workout_date) AS run_start, MAX(workout_date) AS run_end
+            FROM (
+                SELECT user_id, workout_date,
+                       workout_date - (ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY workout_date))::int AS run
+                FROM (SELECT DISTINCT user_id, workout_date FROM workouts) AS days
+            ) AS numbered
+            GROUP BY user_id, run
+        ) AS runs
+        WHERE NOT EXISTS (SELECT 1 FROM user_streaks)
+        GROUP BY user_id
+        """,
+    ]),
+    (12, "Estimated calories flag on workouts", [
+        # FALSE: calories_burned is what the user entered (or NULL/0 for none)
+        "ALTER TABLE workouts ADD COLUMN IF NOT EXISTS calories_estimated BOOLEAN NOT NULL DEFAULT FALSE",
+        # The workouts still waiting for an estimate, in backfill order
+        """
+        CREATE INDEX IF NOT EXISTS idx_workouts_missing_calories ON workouts(workout_id)
+            WHERE COALESCE(calories_burned, 0) = 0 AND NOT calories_estimated AND duration_minutes > 0
+        """,
+    ]),
+    (13, "Workout archive and archived-period summaries", [
+        # Cold copies of workouts and exercises moved out by archive_workouts.
+        # Unpartitioned, and each keyed by one index that serves both the
+        # per-user restore and cascading user deletes. catalog_id has no foreign
+        # key: rows only arrive from exercises, and catalog entries are never
+        # deleted.
+        """
+        CREATE TABLE IF NOT EXISTS archived_workouts (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            workout_date DATE NOT NULL,
+            workout_id INTEGER NOT NULL,
+            duration_minutes INTEGER,
+            calories_burned INTEGER,
+            calories_estimated BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMP WITH TIME ZONE,
+            PRIMARY KEY (user_id, workout_date, workout_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS archived_exercises (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            workout_id INTEGER NOT NULL,
+            exercise_id INTEGER NOT NULL,
+            workout_date DATE NOT NULL,
+            catalog_id INTEGER NOT NULL,
+            sets INTEGER,
+            reps INTEGER,
+            weight_kg NUMERIC(6, 2),
+            PRIMARY KEY (user_id, workout_id, exercise_id)
+        )
+        """,
+        # What the archived workouts add to each user's weekly and monthly
+        # rollups (the monthly rows also carry the duration count and extremes)
+        """
+        CREATE TABLE IF NOT EXISTS workout_summaries (
+            user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+            period_type VARCHAR(5) NOT NULL CHECK (period_type IN ('week', 'month')),
+            period_start DATE NOT NULL,
+            workouts INTEGER NOT NULL DEFAULT 0,
+            minutes BIGINT NOT NULL DEFAULT 0,
+            calories BIGINT NOT NULL DEFAULT 0,
+            duration_count INTEGER NOT NULL DEFAULT 0,
+            min_duration INTEGER,
+            max_duration INTEGER,
+            PRIMARY KEY (user_id, period_type, period_start)
+        )
+        """,
+        # Users who brought their archive back, skipped by the archiver for a while
+        """
+        CREATE TABLE IF NOT EXISTS archive_restores (
+            user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            restored_at TIMESTAMP WITH TIME ZONE NOT NULL
+        )
+        """,
+    ]),
+]
+
+
+def _ensure_version_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
+            );
+        """)
+    conn.commit()
+
+
+def applied_versions(conn):
+    """Returns the set of migration versions already recorded in schema_version."""
+    _ensure_version_table(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM schema_version;")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def pending_migrations(conn):
+    """Returns the (version, description) of every migration not yet applied."""
+    applied = applied_versions(conn)
+    return [(version, description) for version, description, _ in MIGRATIONS if version not in applied]
+
+
+def migrate(conn):
+    """Applies every pending migration in order and returns the versions applied.
+
+    Each migration commits on its own, so a failure leaves the database at the
+    last good version; the failing migration is rolled back and the error raised.
+    A session advisory lock makes concurrent callers wait rather than race.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+    conn.commit()
+    applied_now = []
+    try:
+        applied = applied_versions(conn)
+        for version, description, steps in MIGRATIONS:
+            if version in applied:
+                continue
+            try:
+                with conn.cursor() as cur:
+                    for step in steps:
+                        if callable(step):
+                            step(cur)
+                        else:
+                            cur.execute(step)
+                    cur.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (%s, %s);",
+                        (version, description),
+                    )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied_now.append(version)
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+        conn.commit()
+    return applied_now
@@ -0,0 +1,375 @@
+# page_bundles.py
+#
+# One-round-trip data loaders for the Streamlit pages. Each bundle function runs
+# a single SQL statement that gathers everything its page shows (CTEs combined
+# with json_build_object / json_agg) and decodes the JSON into the dataclasses
+# below. The CTEs reuse the Backend_fft queries, so a bundle always agrees with
+# the individual read functions. Bundles are served from the Backend_fft read
+# cache, and dropped by the writes that drop the entries they are built from
+# (see Backend_fft._PAGE_ENTITIES).
+
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import List, Optional, Tuple
+
+import psycopg2
+
+import Backend_fft as be
+import config
+from instrumentation import instrumented
+
+
+# --- Typed Results ---
+
+@dataclass(frozen=True)
+class Exercise:
+    name: str
+    sets: Optional[int]
+    reps: Optional[int]
+    weight_kg: Optional[float]
+
+
+@dataclass(frozen=True)
+class Workout:
+    workout_id: int
+    workout_date: date
+    duration_minutes: Optional[int]
+    calories_burned: Optional[int]
+    exercises: List[Exercise] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class DashboardStats:
+    total_workouts: int = 0
+    total_minutes: int = 0
+    total_calories: int = 0
+    avg_duration: float = 0.0
+    max_duration: int = 0
+    min_duration: int = 0
+    workouts_this_week: int = 0
+    minutes_this_week: int = 0
+    calories_this_week: int = 0
+    workouts_this_month: int = 0
+    minutes_this_month: int = 0
+    calories_this_month: int = 0
+
+
+@dataclass(frozen=True)
+class SeriesPoint:
+    bucket: date
+    workouts: int
+    minutes: int
+    calories: int
+
+
+@dataclass(frozen=True)
+class Friend:
+    user_id: int
+    name: str
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    user_id: int
+    name: str
+    mutual_friends: int
+
+
+@dataclass(frozen=True)
+class LeaderboardEntry:
+    name: str
+    minutes: int
+
+
+@dataclass(frozen=True)
+class RankedEntry:
+    rank: int
+    name: str
+    minutes: int
+
+
+@dataclass(frozen=True)
+class PersonalRecord:
+    exercise_name: str
+    max_weight_kg: Optional[float]
+    max_weight_date: Optional[date]
+    best_e1rm_kg: Optional[float]
+    best_e1rm_date: Optional[date]
+    best_volume_kg: Optional[float]
+    best_volume_date: Optional[date]
+
+
+@dataclass(frozen=True)
+class ActivitySummary:
+    current_streak: int = 0  # 0 unless the user worked out today or yesterday
+    current_start: Optional[date] = None
+    last_active_date: Optional[date] = None
+    longest_streak: int = 0
+    longest_start: Optional[date] = None
+    longest_end: Optional[date] = None
+    calendar: List[Tuple[date, int]] = field(default_factory=list)  # (day, workouts), oldest first
+
+
+@dataclass(frozen=True)
+class InsightsBundle:
+    stats: DashboardStats = field(default_factory=DashboardStats)
+    week_workouts: List[Workout] = field(default_factory=list)  # newest first
+    latest_workout: Optional[Workout] = None
+    records: List[PersonalRecord] = field(default_factory=list)  # strongest estimated 1RM first
+    activity: ActivitySummary = field(default_factory=ActivitySummary)
+
+
+@dataclass(frozen=True)
+class HistoryBundle:
+    workouts: List[Workout] = field(default_factory=list)  # newest first
+    next_cursor: Optional[Tuple[date, int]] = None          # pass as `before` for the next page
+    series: List[SeriesPoint] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class SocialBundle:
+    friends: List[Friend] = field(default_factory=list)
+    suggestions: List[Suggestion] = field(default_factory=list)
+    weekly_leaderboard: List[LeaderboardEntry] = field(default_factory=list)
+    global_top: List[RankedEntry] = field(default_factory=list)
+    user_rank: Optional[int] = None
+    user_minutes: Optional[int] = None
+    ranked_users: int = 0
+    refreshed_at: Optional[datetime] = None
+
+
+# --- Decoding ---
+
+def _statement(sql):
+    # A Backend_fft query, ready to be embedded as a CTE
+    return sql.strip().rstrip(";")
+
+def _day(value):
+    return date.fromisoformat(value[:10])
+
+def _record(obj):
+    return PersonalRecord(**{k: (_day(v) if k.endswith("_date") and v else v) for k, v in obj.items()})
+
+def _activity(rows, today):
+    # day_counts arrives as bytea text ("\\x0001...")
+    return ActivitySummary(**be._activity_summary([
+        (*(_day(r[k]) if r[k] else None for k in ("current_start", "last_active_date", "longest_start", "longest_end")),
+         r["year"], bytes.fromhex(r["day_counts"][2:]) if r["day_counts"] else None)
+        for r in rows
+    ], be.ACTIVITY_CALENDAR_DAYS, today))
+
+def _workout(obj):
+    return Workout(
+        workout_id=obj["workout_id"],
+        workout_date=_day(obj["workout_date"]),
+        duration_minutes=obj["duration_minutes"],
+        calories_burned=obj["calories_burned"],
+        exercises=[Exercise(*ex) for ex in obj["exercises"]],
+    )
+
+def _history_bundle(rows, page_size, series):
+    # rows: up to page_size + 1 (workout_id, workout_date, duration, calories, exercises) rows;
+    # series: (bucket, workouts, minutes, calories) rows. Also used by sqlite_backend.
+    workouts, next_cursor = be._history_page(rows, page_size)
+    return HistoryBundle(
+        workouts=[Workout(*row[:4], [Exercise(*ex) for ex in row[4]]) for row in workouts],
+        next_cursor=next_cursor,
+        series=[SeriesPoint(*point) for point in series],
+    )
+
+def _social_bundle(friends, suggestions, weekly, board):
+    # Row lists as the Backend_fft reads return them, and `board` shaped like
+    # Backend_fft.get_global_leaderboard's result. Also used by sqlite_backend.
+    return SocialBundle(
+        friends=[Friend(*row) for row in friends],
+        suggestions=[Suggestion(*row) for row in suggestions],
+        weekly_leaderboard=[LeaderboardEntry(*row) for row in weekly],
+        global_top=[RankedEntry(*row) for row in board['top']],
+        user_rank=board['user_rank'],
+        user_minutes=board['user_minutes'],
+        ranked_users=board['ranked_users'] or 0,
+        refreshed_at=board['refreshed_at'],
+    )
+
+# Adds each workout's exercises (as a JSON array of [name, sets, reps, weight]) to a CTE of workouts
+_WITH_EXERCISES = """
+    SELECT src.*,
+           COALESCE((SELECT json_agg(json_build_array(c.name, x.sets, x.reps, x.weight_kg)
+                                     ORDER BY x.exercise_id)
+                     FROM exercises x
+                     JOIN exercise_catalog c ON c.catalog_id = x.catalog_id
+                     WHERE x.workout_id = src.workout_id AND x.workout_date = src.workout_date),
+                    '[]'::json) AS exercises
+    FROM {source} src
+"""
+
+
+# --- Bundles ---
+
+_INSIGHTS_SQL = f"""
+    WITH stats AS ({_statement(be._DASHBOARD_SQL)}),
+    week_workouts AS (
+        SELECT workout_id, workout_date, duration_minutes, calories_burned
+        FROM workouts
+        WHERE user_id = %(user_id)s AND workout_date >= %(week)s AND workout_date < %(week)s::date + 7
+    ),
+    latest AS (
+        SELECT workout_id, workout_date, duration_minutes, calories_burned
+        FROM workouts
+        WHERE user_id = %(user_id)s
+        ORDER BY workout_date DESC, workout_id DESC
+        LIMIT 1
+    ),
+    records AS ({_statement(be._PERSONAL_RECORDS_SQL)}),
+    activity AS ({_statement(be._ACTIVITY_SQL)})
+    SELECT json_build_object(
+        'stats', (SELECT row_to_json(s) FROM stats s),
+        'week_workouts', COALESCE(
+            (SELECT json_agg(w ORDER BY w.workout_date DESC, w.workout_id DESC)
+             FROM ({_WITH_EXERCISES.format(source="week_workouts")}) w),
+            '[]'::json),
+        'latest_workout', (SELECT row_to_json(l) FROM ({_WITH_EXERCISES.format(source="latest")}) l),
+        'records', COALESCE(
+            (SELECT json_agg(r ORDER BY r.best_e1rm_kg DESC NULLS LAST, r.exercise_name) FROM records r),
+            '[]'::json),
+        'activity', (SELECT json_agg(a) FROM activity a)
+    );
+"""
+
+@instrumented
+@be._cached('insights_page')
+def get_insights_bundle(user_id):
+    """Loads everything show_fitness_insights displays in one query.
+
+    Returns an InsightsBundle: dashboard stats, this week's workouts (with
+    exercises), the most recent workout (with exercises, or None), the user's
+    personal records and their streaks and activity calendar.
+    """
+    today = date.today()
+    params = dict(be._dashboard_params(user_id), **be._activity_params(user_id, be.ACTIVITY_CALENDAR_DAYS, today))
+    try:
+        with be.db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_INSIGHTS_SQL, params)
+            data = cur.fetchone()[0]
+        return InsightsBundle(
+            stats=DashboardStats(**{k: (float(v) if k == "avg_duration" else v) for k, v in data["stats"].items()}),
+            week_workouts=[_workout(w) for w in data["week_workouts"]],
+            latest_workout=_workout(data["latest_workout"]) if data["latest_workout"] else None,
+            records=[_record(r) for r in data["records"]],
+            activity=_activity(data["activity"], today),
+        )
+    except (Exception, psycopg2.DatabaseError) as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching insights page data", error)
+    return InsightsBundle()
+
+@instrumented
+@be._cached('history_page')
+def get_history_bundle(user_id, resolution='week', page_size=20, before=None):
+    """Loads a page of workout history and the progress chart in one query.
+
+    Returns a HistoryBundle with up to `page_size` workouts (newest first, older
+    than the `before` cursor if given), the cursor of the next page (None on the
+    last page) and the `resolution` time series of get_workout_timeseries. The
+    series is only loaded for the first page; later pages (`before` given)
+    leave it empty.
+    """
+    chart_sql, params = be._timeseries_query(user_id, resolution, None, None, 400)
+    before_date, before_id = before if before else (None, None)
+    params.update(before_date=before_date, before_id=before_id, limit=page_size + 1)
+    # Later pages are appended below the first page's chart
+    chart = "" if before else f""",
+        chart AS ({_statement(chart_sql)})"""
+    series = "'[]'::json" if before else "COALESCE((SELECT json_agg(c ORDER BY c.bucket) FROM chart c), '[]'::json)"
+    sql = f"""
+        WITH page AS ({_statement(be._HISTORY_PAGE_SQL)}){chart}
+        SELECT json_build_object(
+            'workouts', COALESCE((SELECT json_agg(p ORDER BY p.workout_date DESC, p.workout_id DESC) FROM page p), '[]'::json),
+            'series', {series}
+        );
+    """
+    try:
+        with be.db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            data = cur.fetchone()[0]
+        rows = [(w["workout_id"], _day(w["workout_date"]), w["duration_minutes"], w["calories_burned"], w["exercises"])
+                for w in data["workouts"]]
+        series = [(_day(p["bucket"]), p["workouts"], p["minutes"], p["calories"]) for p in data["series"]]
+        return _history_bundle(rows, page_size, series)
+    except (Exception, psycopg2.DatabaseError) as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching history page data", error)
+    return HistoryBundle()
+
+_SOCIAL_SQL = f"""
+    WITH friend_list AS ({_statement(be._FRIENDS_SQL)}),
+    suggestions AS ({_statement(be._SUGGESTIONS_SQL)}),
+    weekly AS ({_statement(be._WEEKLY_LEADERBOARD_SQL)}),
+    snapshot AS (
+        SELECT ranked_users, refreshed_at,
+               refreshed_at < CURRENT_TIMESTAMP - %(refresh_seconds)s * INTERVAL '1 second' AS stale
+        FROM global_leaderboard_refreshes
+        WHERE period_type = %(period_type)s AND period_start = %(period_start)s
+    ),
+    global_top AS (
+        SELECT g.rank, u.name, g.minutes
+        FROM global_leaderboard g
+        JOIN users u ON u.user_id = g.user_id
+        WHERE g.period_type = %(period_type)s AND g.period_start = %(period_start)s AND g.rank <= %(top_k)s
+    ),
+    my_rank AS (
+        SELECT rank, minutes FROM global_leaderboard
+        WHERE period_type = %(period_type)s AND period_start = %(period_start)s AND user_id = %(user_id)s
+    )
+    SELECT json_build_object(
+        'friends', COALESCE((SELECT json_agg(f ORDER BY f.name) FROM friend_list f), '[]'::json),
+        'suggestions', COALESCE((SELECT json_agg(s ORDER BY s.mutual_friends DESC, s.name) FROM suggestions s), '[]'::json),
+        'weekly', COALESCE((SELECT json_agg(w ORDER BY w.total_minutes DESC, w.name) FROM weekly w), '[]'::json),
+        'snapshot', (SELECT row_to_json(sn) FROM snapshot sn),
+        'global_top', COALESCE((SELECT json_agg(t ORDER BY t.rank, t.name) FROM global_top t), '[]'::json),
+        'my_rank', (SELECT row_to_json(m) FROM my_rank m)
+    );
+"""
+
+@instrumented
+@be._cached('social_page')
+def get_social_bundle(user_id, week_start=None, period_type='week'):
+    """Loads the friends list, suggestions and both leaderboards in one query.
+
+    `week_start` picks the friends leaderboard week (default: this week) and
+    `period_type` ('week' or 'month') the current global leaderboard. When the
+    global snapshot is missing or stale, it is refreshed through
+    Backend_fft.get_global_leaderboard, which costs extra queries only then.
+    """
+    today = date.today()
+    refresh_seconds = config.LEADERBOARD_SETTINGS['refresh_seconds']
+    params = {
+        'user_id': user_id, 'limit': 10, 'fanout': be.SUGGESTION_FANOUT,
+        'week': be._week_start(be._parse_date(week_start or today)),
+        'period_type': period_type, 'period_start': be._period_start(period_type, today),
+        'refresh_seconds': refresh_seconds, 'top_k': config.LEADERBOARD_SETTINGS['top_k'],
+    }
+    try:
+        with be.db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_SOCIAL_SQL, params)
+            data = cur.fetchone()[0]
+        snapshot, my_rank = data["snapshot"], data["my_rank"] or {"rank": None, "minutes": None}
+        if snapshot is None or (refresh_seconds > 0 and snapshot["stale"]):
+            board = be.get_global_leaderboard(period_type, user_id=user_id)
+        else:
+            refreshed_at = snapshot["refreshed_at"]
+            board = {
+                'top': [(t["rank"], t["name"], t["minutes"]) for t in data["global_top"]],
+                'user_rank': my_rank["rank"],
+                'user_minutes': my_rank["minutes"],
+                'ranked_users': snapshot["ranked_users"],
+                'refreshed_at': datetime.fromisoformat(refreshed_at) if isinstance(refreshed_at, str) else refreshed_at,
+            }
+        friends = [(f["user_id"], f["name"]) for f in data["friends"]]
+        suggestions = [(s["user_id"], s["name"], s["mutual_friends"]) for s in data["suggestions"]]
+        weekly = [(w["name"], w["total_minutes"]) for w in data["weekly"]]
+        return _social_bundle(friends, suggestions, weekly, board)
+    except (Exception, psycopg2.DatabaseError) as error:
+        be._cache.do_not_cache()
+        be._report_error("Error fetching social page data", error)
+    return SocialBundle()
@@ -0,0 +1,183 @@
+# read_cache.py
+
+import contextvars
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+
+class ReadCache:
+    """An in-process, thread-safe LRU cache with per-entity TTLs.
+
+    Entries are grouped by entity (e.g. 'profile', 'friends') and scope (usually
+    the user_id the data belongs to), so writes can drop exactly the entries
+    they make stale. Values are shared between callers and must be treated as
+    read-only. `derived` maps an entity built from other entities (e.g. a page
+    combining 'friends' and 'leaderboard') to those sources; invalidating a
+    source also drops the derived entity's entries for the same scopes.
+    """
+
+    def __init__(self, max_entries=1024, ttls=None, default_ttl=60.0, enabled=True, derived=None):
+        self.max_entries = max_entries
+        self.ttls = dict(ttls or {})
+        self._derived = {}             # source entity -> entities derived from it
+        for entity, sources in (derived or {}).items():
+            for source in sources:
+                self._derived.setdefault(source, []).append(entity)
+        self.default_ttl = default_ttl
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (entity, scope, key) -> (expires_at, value)
+        self._scopes = {}              # (entity, scope) -> set of entry keys
+        self._generations = {}         # (entity, scope or None) -> invalidation counter
+        # Per thread / asyncio task: set by do_not_cache() while a loader runs
+        self._skip = contextvars.ContextVar(f"read_cache_skip_{id(self)}", default=False)
+        self._stats = {}
+
+    def _entity_stats(self, entity):
+        return self._stats.setdefault(entity, {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0})
+
+    def _remove(self, entry_key):
+        self._entries.pop(entry_key, None)
+        scope_key = entry_key[:2]
+        keys = self._scopes.get(scope_key)
+        if keys is not None:
+            keys.discard(entry_key)
+            if not keys:
+                del self._scopes[scope_key]
+
+    def do_not_cache(self):
+        """Called by a loader that failed, so its fallback result is not stored."""
+        self._skip.set(True)
+
+    def _lookup(self, entity, scope, key):
+        # Returns (True, value) on a hit, else (False, generation to store under)
+        entry_key = (entity, scope, key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(entry_key)
+                self._entity_stats(entity)["hits"] += 1
+                return True, entry[1]
+            if entry is not None:
+                self._remove(entry_key)
+            self._entity_stats(entity)["misses"] += 1
+            return False, self._generation(entity, scope)
+
+    def _store(self, entity, scope, key, generation, value):
+        ttl = self.ttls.get(entity, self.default_ttl)
+        entry_key = (entity, scope, key)
+        with self._lock:
+            # An invalidation that raced with the load makes this value stale already
+            if self._generation(entity, scope) != generation:
+                return
+            self._entries[entry_key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(entry_key)
+            self._scopes.setdefault(entry_key[:2], set()).add(entry_key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._entity_stats(oldest[0])["evictions"] += 1
+
+    def get_or_load(self, entity, scope, key, loader):
+        """Returns the cached value for (entity, scope, key) or calls loader() to fill it."""
+        if not self.enabled:
+            return loader()
+        hit, found = self._lookup(entity, scope, key)
+        if hit:
+            return found
+        token = self._skip.set(False)
+        try:
+            value = loader()
+            if not self._skip.get():
+                self._store(entity, scope, key, found, value)
+        finally:
+            self._skip.reset(token)
+        return value
+
+    async def aget_or_load(self, entity, scope, key, loader):
+        """Like get_or_load for a coroutine function `loader`; shares entries with it."""
+        if not self.enabled:
+            return await loader()
+        hit, found = self._lookup(entity, scope, key)
+        if hit:
+            return found
+        token = self._skip.set(False)
+        try:
+            value = await loader()
+            if not self._skip.get():
+                self._store(entity, scope, key, found, value)
+        finally:
+            self._skip.reset(token)
+        return value
+
+    def cached(self, entity):
+        """Decorator caching a read function under `entity`, scoped by its first argument (the user_id).
+
+        Calls with as_frame=True get a copy of the cached DataFrame, which they may modify.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                scope = args[0] if args else None
+                key = (func.__name__, args, tuple(sorted(kwargs.items())))
+                value = self.get_or_load(entity, scope, key, lambda: func(*args, **kwargs))
+                return value.copy() if kwargs.get('as_frame') else value
+            return wrapper
+        return decorator
+
+    def acached(self, entity):
+        """Like cached for coroutine functions; a function of the same name shares its entries."""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                scope = args[0] if args else None
+                key = (func.__name__, args, tuple(sorted(kwargs.items())))
+                value = await self.aget_or_load(entity, scope, key, lambda: func(*args, **kwargs))
+                return value.copy() if kwargs.get('as_frame') else value
+            return wrapper
+        return decorator
+
+    def _generation(self, entity, scope):
+        return (self._generations.get((entity, None), 0), self._generations.get((entity, scope), 0))
+
+    def invalidate(self, entity, *scopes):
+        """Drops cached entries of an entity, for the given scopes or (none given) all of them.
+
+        The same scopes of the entities derived from it are dropped as well.
+        """
+        with self._lock:
+            for target_entity in (entity, *self._derived.get(entity, ())):
+                self._invalidate(target_entity, scopes)
+
+    def _invalidate(self, entity, scopes):
+        targets = [(entity, scope) for scope in scopes] or [(entity, None)]
+        for target in targets:
+            self._generations[target] = self._generations.get(target, 0) + 1
+        if scopes:
+            doomed = [k for scope in scopes for k in self._scopes.get((entity, scope), ())]
+        else:
+            doomed = [k for scope_key, keys in self._scopes.items() if scope_key[0] == entity for k in keys]
+        for entry_key in doomed:
+            self._remove(entry_key)
+        self._entity_stats(entity)["invalidations"] += len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self):
+        """Returns hit/miss/eviction/invalidation counters per entity plus totals."""
+        with self._lock:
+            per_entity = {entity: dict(counts) for entity, counts in self._stats.items()}
+            size = len(self._entries)
+        totals = {name: sum(counts[name] for counts in per_entity.values())
+                  for name in ("hits", "misses", "evictions", "invalidations")}
+        lookups = totals["hits"] + totals["misses"]
+        totals["hit_ratio"] = totals["hits"] / lookups if lookups else 0.0
+        totals["size"] = size
+        totals["max_entries"] = self.max_entries
+        return {"totals": totals, "entities": per_entity}
@@ -0,0 +1,2369 @@
+# sqlite_backend.py
+#
+# Embedded SQLite storage engine. Implements the Backend_fft API (and the page
+# loaders of page_bundles.py) with the same signatures and result shapes on a
+# single database file, so the app runs without a database server. Select it
+# with FITNESS_STORAGE_ENGINE=sqlite (see storage.py); FITNESS_SQLITE_PATH names
+# the file.
+#
+# The schema mirrors the PostgreSQL one table for table and index for index, in
+# WAL mode so readers never block the writer. PostgreSQL features map as
+# follows: INCLUDE columns of covering indexes become trailing key columns; the
+# monthly partitions are not needed (create_partitions is a no-op); the
+# workouts and exercises sequences are the `sequences` table; array parameters
+# are passed as JSON and expanded with json_each(); pg_trgm fuzzy search is not
+# available (prefix search only). NUMERIC values come back as float rather than
+# Decimal.
+
+import csv
+import functools
+import io
+import json
+import logging
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+
+import Backend_fft as pg
+import columnar
+import config
+import instrumentation
+import page_bundles as pb
+from Backend_fft import (
+    EXPORT_CHUNK_ROWS, EXPORT_FORMATS, GOAL_METRICS, SUGGESTION_FANOUT, TIMESERIES_RESOLUTIONS,
+    available_export_formats, estimated_one_rep_max,
+)
+from instrumentation import instrumented, page_scope
+from read_cache import ReadCache
+
+logger = logging.getLogger("fitness.sqlite_backend")
+
+# Dates are stored as ISO text and read back as datetime.date (columns declared
+# DATE, or expressions aliased "name [date]"); timestamps are UTC
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+sqlite3.register_converter("date", lambda value: date.fromisoformat(value.decode()))
+sqlite3.register_converter(
+    "timestamp", lambda value: datetime.fromisoformat(value.decode()).replace(tzinfo=timezone.utc),
+)
+
+# --- Database Connection ---
+# Each thread keeps one connection to the database file, opened on first use.
+# SQLite allows many readers next to a single writer; writes start with BEGIN
+# IMMEDIATE so a second writer waits (up to busy_timeout_ms) for the write lock
+# instead of failing halfway through its transaction.
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # bumped by close_pool() so threads reopen their connection
+_stats = {"connections_created": 0, "checkouts": 0}
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_exercise_name(name):
+    """Trims, collapses whitespace and lower-cases an exercise name (as the PostgreSQL function does)."""
+    if name is None:
+        return None
+    return _WHITESPACE.sub(" ", name.strip(" ")).lower()
+
+class _Connection(sqlite3.Connection):
+    """sqlite3 connection whose cursors are instrumented (and usable in `with` blocks)."""
+
+    def cursor(self, factory=instrumentation.InstrumentedSQLiteCursor):
+        return super().cursor(factory)
+
+def _connect():
+    settings = config.SQLITE_SETTINGS
+    conn = sqlite3.connect(
+        settings["path"], timeout=settings["busy_timeout_ms"] / 1000.0,
+        detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        isolation_level="IMMEDIATE", check_same_thread=False, factory=_Connection,
+    )
+    conn.create_function("normalize_exercise_name", 1, normalize_exercise_name, deterministic=True)
+    for pragma in (
+        "PRAGMA journal_mode = WAL;",
+        f"PRAGMA synchronous = {settings['synchronous']};",
+        "PRAGMA foreign_keys = ON;",
+        f"PRAGMA cache_size = -{settings['cache_size_kb']};",
+        f"PRAGMA mmap_size = {settings['mmap_size']};",
+        "PRAGMA temp_store = MEMORY;",
+    ):
+        conn.execute(pragma)
+    return conn
+
+@contextmanager
+def db_connection():
+    """Yields this thread's connection for the duration of a `with` block.
+
+    Uncommitted work is rolled back when the outermost block exits.
+    """
+    started = time.perf_counter()
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _local.conn = _connect()
+        _local.generation = _generation
+        _local.depth = 0
+        with _connections_lock:
+            _connections.append(conn)
+            _stats["connections_created"] += 1
+    _stats["checkouts"] += 1
+    instrumentation.record_acquire(time.perf_counter() - started)
+    _local.depth += 1
+    try:
+        yield conn
+    finally:
+        _local.depth -= 1
+        if _local.depth == 0 and conn.in_transaction:
+            conn.rollback()
+
+def _begin(cur):
+    # Takes the write lock up front, for writes that read before they write
+    cur.execute("BEGIN IMMEDIATE;")
+
+def get_pool_stats():
+    """Returns connection counters in the shape of Backend_fft.get_pool_stats()."""
+    with _connections_lock:
+        size = len(_connections)
+    return dict(
+        _stats, min_size=0, max_size=None, size=size, idle=None, in_use=None, waits=0,
+        wait_time_total=0.0, wait_time_max=0.0, wait_time_avg=0.0, wait_ratio=0.0, timeouts=0,
+    )
+
+def _report_error(message, error):
+    """Logs a backend error and counts it against the calling function."""
+    instrumentation.record_error()
+    logger.error("%s: %s", message, error)
+
+def close_pool():
+    """Closes every thread's connection (after updating the planner statistics)."""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        connections, _connections[:] = list(_connections), []
+    for conn in connections:
+        try:
+            conn.execute("PRAGMA optimize;")
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+# --- Read Cache ---
+_cache = ReadCache(**config.CACHE_SETTINGS, derived=pg._PAGE_ENTITIES)
+_cached = _cache.cached
+
+def get_cache_stats():
+    """Returns read cache hit/miss/eviction/invalidation counters."""
+    return _cache.stats()
+
+def clear_cache():
+    """Drops every cached read, e.g. after editing the database by hand."""
+    _cache.clear()
+
+# --- Instrumentation ---
+
+get_metrics_text = pg.get_metrics_text
+get_query_stats = pg.get_query_stats
+
+# --- Schema Setup ---
+# Versioned like migrations.py, with the version kept in PRAGMA user_version.
+# Each entry is (version, description, steps), applied in one transaction; a
+# step is an SQL script or a callable that receives an open cursor (backfills).
+
+_SCHEMA_V1 = """
+CREATE TABLE users (
+    user_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    weight_kg REAL,
+    height_cm REAL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE friends (
+    user_id_1 INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    user_id_2 INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    PRIMARY KEY (user_id_1, user_id_2),
+    CHECK (user_id_1 <> user_id_2)
+) WITHOUT ROWID;
+
+CREATE TABLE workouts (
+    workout_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    workout_date DATE NOT NULL,
+    duration_minutes INTEGER,
+    calories_burned INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE exercise_catalog (
+    catalog_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    normalized_name TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE exercise_aliases (
+    alias TEXT PRIMARY KEY,
+    catalog_id INTEGER NOT NULL REFERENCES exercise_catalog(catalog_id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE exercises (
+    exercise_id INTEGER PRIMARY KEY,
+    workout_id INTEGER NOT NULL REFERENCES workouts(workout_id) ON DELETE CASCADE,
+    workout_date DATE NOT NULL,
+    user_id INTEGER NOT NULL,
+    catalog_id INTEGER NOT NULL REFERENCES exercise_catalog(catalog_id),
+    sets INTEGER,
+    reps INTEGER,
+    weight_kg REAL
+);
+
+CREATE TABLE goals (
+    goal_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    goal_description TEXT NOT NULL,
+    target_value REAL,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    status TEXT DEFAULT 'Active',
+    goal_metric TEXT NOT NULL DEFAULT 'workouts' CHECK (goal_metric IN ('workouts', 'minutes', 'calories')),
+    progress REAL NOT NULL DEFAULT 0,
+    progress_updated_at TIMESTAMP
+);
+
+CREATE TABLE user_workout_rollups (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    total_workouts INTEGER NOT NULL DEFAULT 0,
+    total_minutes INTEGER NOT NULL DEFAULT 0,
+    total_calories INTEGER NOT NULL DEFAULT 0,
+    duration_count INTEGER NOT NULL DEFAULT 0,
+    min_duration INTEGER,
+    max_duration INTEGER
+);
+
+CREATE TABLE user_period_rollups (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    period_type TEXT NOT NULL CHECK (period_type IN ('week', 'month')),
+    period_start DATE NOT NULL,
+    workouts INTEGER NOT NULL DEFAULT 0,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    calories INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, period_type, period_start)
+) WITHOUT ROWID;
+
+CREATE TABLE personal_records (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    catalog_id INTEGER NOT NULL REFERENCES exercise_catalog(catalog_id) ON DELETE CASCADE,
+    max_weight_kg REAL,
+    max_weight_date DATE,
+    best_e1rm_kg REAL,
+    best_e1rm_date DATE,
+    best_volume_kg REAL,
+    best_volume_date DATE,
+    PRIMARY KEY (user_id, catalog_id)
+) WITHOUT ROWID;
+
+CREATE TABLE global_leaderboard (
+    period_type TEXT NOT NULL,
+    period_start DATE NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    minutes INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    PRIMARY KEY (period_type, period_start, user_id)
+) WITHOUT ROWID;
+
+CREATE TABLE global_leaderboard_refreshes (
+    period_type TEXT NOT NULL,
+    period_start DATE NOT NULL,
+    ranked_users INTEGER NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (period_type, period_start)
+) WITHOUT ROWID;
+
+-- Next id to hand out per table (PostgreSQL sequences)
+CREATE TABLE sequences (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+) WITHOUT ROWID;
+INSERT INTO sequences (name, next_id) VALUES ('workouts', 1);
+
+-- The PostgreSQL indexes; workout_id and goal_id are the tables' rowids
+CREATE INDEX idx_friends_user_id_2 ON friends(user_id_2);
+CREATE INDEX idx_workouts_user_date
+    ON workouts(user_id, workout_date DESC, workout_id DESC, duration_minutes, calories_burned);
+CREATE INDEX idx_exercises_workout_id ON exercises(workout_id);
+CREATE INDEX idx_exercises_user_catalog
+    ON exercises(user_id, catalog_id, workout_date DESC, workout_id DESC, sets, reps, weight_kg);
+CREATE INDEX idx_goals_user_id ON goals(user_id);
+CREATE INDEX idx_goals_active ON goals(goal_id) WHERE status = 'Active';
+CREATE INDEX idx_users_name_prefix ON users(lower(name));
+CREATE INDEX idx_users_email_prefix ON users(lower(email));
+CREATE INDEX idx_global_leaderboard_rank ON global_leaderboard(period_type, period_start, rank);
+CREATE INDEX idx_period_rollups_ranking ON user_period_rollups(period_type, period_start, minutes DESC);
+"""
+
+_SCHEMA_V2 = """
+-- One byte per day of the year (January 1st is byte 0): that day's workouts
+CREATE TABLE user_activity_years (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    year INTEGER NOT NULL,
+    day_counts BLOB NOT NULL,
+    PRIMARY KEY (user_id, year)
+) WITHOUT ROWID;
+
+CREATE TABLE user_streaks (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    current_start DATE,
+    last_active_date DATE,
+    longest_start DATE,
+    longest_end DATE
+);
+"""
+
+def _populate_activity_years(cur):
+    # One byte per day of the year (January 1st is byte 0) holding that day's
+    # workout count, capped at 255. Like every step here it only relies on the
+    # schema as of its own version.
+    cur.execute("""
+        SELECT user_id, CAST(strftime('%Y', workout_date) AS INTEGER),
+               CAST(strftime('%j', workout_date) AS INTEGER) - 1, MIN(COUNT(*), 255)
+        FROM workouts
+        GROUP BY user_id, workout_date;
+    """)
+    years = {}
+    for user_id, year, day_index, workouts in cur.fetchall():
+        years.setdefault((user_id, year), bytearray(366))[day_index] = workouts
+    cur.executemany(
+        "INSERT INTO user_activity_years (user_id, year, day_counts) VALUES (?, ?, ?);",
+        [(user_id, year, bytes(day_counts)) for (user_id, year), day_counts in sorted(years.items())],
+    )
+
+# Runs of consecutive active days; the current one is the latest and of equally
+# long ones the earliest is the longest
+_POPULATE_STREAKS_V2 = """
+INSERT INTO user_streaks (user_id, current_start, last_active_date, longest_start, longest_end)
+WITH runs AS (
+    SELECT user_id, MIN(workout_date) AS run_start, MAX(workout_date) AS run_end
+    FROM (
+        SELECT user_id, workout_date,
+               julianday(workout_date) - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY workout_date) AS run
+        FROM (SELECT DISTINCT user_id, workout_date FROM workouts)
+    )
+    GROUP BY user_id, run
+),
+ranked AS (
+    SELECT user_id, run_start, run_end,
+           ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY run_end DESC) AS latest,
+           ROW_NUMBER() OVER (
+               PARTITION BY user_id ORDER BY julianday(run_end) - julianday(run_start) DESC, run_start
+           ) AS longest
+    FROM runs
+)
+SELECT user_id,
+       MAX(CASE WHEN latest = 1 THEN run_start END),
+       MAX(run_end),
+       MAX(CASE WHEN longest = 1 THEN run_start END),
+       MAX(CASE WHEN longest = 1 THEN run_end END)
+FROM ranked
+GROUP BY user_id;
+"""
+
+_SCHEMA_V3 = """
+-- 1 when calories_burned was estimated rather than entered (calories.py)
+ALTER TABLE workouts ADD COLUMN calories_estimated BOOLEAN NOT NULL DEFAULT 0;
+
+-- Workouts still waiting for a calorie estimate, in backfill order
+CREATE INDEX idx_workouts_missing_calories ON workouts(workout_id)
+    WHERE COALESCE(calories_burned, 0) = 0 AND NOT calories_estimated AND duration_minutes > 0;
+"""
+
+_SCHEMA_V4 = """
+-- Workouts and exercises moved out of the hot tables by archive_workouts
+CREATE TABLE archived_workouts (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    workout_date DATE NOT NULL,
+    workout_id INTEGER NOT NULL,
+    duration_minutes INTEGER,
+    calories_burned INTEGER,
+    calories_estimated BOOLEAN NOT NULL DEFAULT 0,
+    created_at TIMESTAMP,
+    PRIMARY KEY (user_id, workout_date, workout_id)
+) WITHOUT ROWID;
+
+CREATE TABLE archived_exercises (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    workout_id INTEGER NOT NULL,
+    exercise_id INTEGER NOT NULL,
+    workout_date DATE NOT NULL,
+    catalog_id INTEGER NOT NULL,
+    sets INTEGER,
+    reps INTEGER,
+    weight_kg REAL,
+    PRIMARY KEY (user_id, workout_id, exercise_id)
+) WITHOUT ROWID;
+
+-- What the archived workouts add to each user's weekly and monthly rollups
+CREATE TABLE workout_summaries (
+    user_id INTEGER NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+    period_type TEXT NOT NULL CHECK (period_type IN ('week', 'month')),
+    period_start DATE NOT NULL,
+    workouts INTEGER NOT NULL DEFAULT 0,
+    minutes INTEGER NOT NULL DEFAULT 0,
+    calories INTEGER NOT NULL DEFAULT 0,
+    duration_count INTEGER NOT NULL DEFAULT 0,
+    min_duration INTEGER,
+    max_duration INTEGER,
+    PRIMARY KEY (user_id, period_type, period_start)
+) WITHOUT ROWID;
+
+CREATE TABLE archive_restores (
+    user_id INTEGER PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+    restored_at TIMESTAMP NOT NULL
+);
+"""
+
+_SCHEMA_V5 = """
+-- Exercise ids come from the sequences table too, so the ids of archived
+-- exercises are not reused as rowids. Archived exercises that already got their
+-- id reused move above every id in use, so they can be restored.
+UPDATE archived_exercises
+SET exercise_id = exercise_id + (
+    SELECT MAX(max_id) FROM (
+        SELECT MAX(exercise_id) AS max_id FROM exercises
+        UNION ALL
+        SELECT MAX(exercise_id) FROM archived_exercises
+    )
+)
+WHERE exercise_id IN (SELECT exercise_id FROM exercises);
+
+INSERT INTO sequences (name, next_id)
+SELECT 'exercises', COALESCE(MAX(max_id), 0) + 1 FROM (
+    SELECT MAX(exercise_id) AS max_id FROM exercises
+    UNION ALL
+    SELECT MAX(exercise_id) FROM archived_exercises
+);
+
+UPDATE sequences
+SET next_id = MAX(next_id, (SELECT COALESCE(MAX(workout_id), 0) + 1 FROM archived_workouts))
+WHERE name = 'workouts';
+"""
+
+MIGRATIONS = [
+    (1, "Full schema (users, workouts, exercise catalog, goals, rollups, records, leaderboards)", [_SCHEMA_V1]),
+    (2, "Activity calendars and workout streaks", [_SCHEMA_V2, _populate_activity_years, _POPULATE_STREAKS_V2]),
+    (3, "Estimated calories flag on workouts", [_SCHEMA_V3]),
+    (4, "Workout archive and archived-period summaries", [_SCHEMA_V4]),
+    (5, "Exercise ids drawn from the sequences table", [_SCHEMA_V5]),
+]
+
+def _statements(script):
+    # A cursor runs one statement at a time; split the script where each one ends
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+
+def _schema_version(cur):
+    cur.execute("PRAGMA user_version;")
+    return cur.fetchone()[0]
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+@instrumented
+def ensure_schema():
+    """Applies pending schema versions the first time it is called in this process."""
+    global _schema_ready
+    if _schema_ready:
+        return True
+    with _schema_lock:
+        if _schema_ready:
+            return True
+        try:
+            with db_connection() as conn, conn.cursor() as cur:
+                applied = []
+                for version, _, steps in MIGRATIONS:
+                    _begin(cur)
+                    if version <= _schema_version(cur):
+                        conn.rollback()
+                        continue
+                    for step in steps:
+                        if callable(step):
+                            step(cur)
+                        else:
+                            for statement in _statements(step):
+                                cur.execute(statement)
+                    cur.execute(f"PRAGMA user_version = {version};")
+                    conn.commit()
+                    applied.append(version)
+            if applied:
+                logger.info("Applied schema migrations: %s", ", ".join(map(str, applied)))
+            _schema_ready = True
+        except (Exception, sqlite3.DatabaseError) as error:
+            _report_error("Error migrating schema", error)
+    return _schema_ready
+
+def create_tables():
+    """Creates or upgrades all tables by applying any pending schema versions."""
+    global _schema_ready
+    _schema_ready = False
+    return ensure_schema()
+
+@instrumented
+def get_pending_migrations():
+    """Lists (version, description) for schema versions that have not been applied yet."""
+    pending = []
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            current = _schema_version(cur)
+            pending = [(version, description) for version, description, _ in MIGRATIONS if version > current]
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error reading schema version", error)
+    return pending
+
+def create_partitions(start=None, end=None):
+    """SQLite tables are not partitioned; kept for API parity. Returns 0."""
+    return 0
+
+_bootstrapped = False
+
+def bootstrap():
+    """One-time process startup: creates the schema and seeds demo data if empty."""
+    global _bootstrapped
+    if not _bootstrapped and ensure_schema():
+        seed_data()
+        _bootstrapped = True
+
+# --- CRUD Operations ---
+
+# CREATE
+@instrumented
+def add_user(name, email, weight, height):
+    """Adds a new user to the database."""
+    sql = "INSERT INTO users(name, email, weight_kg, height_cm) VALUES(?, ?, ?, ?);"
+    user_id = None
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (name, email, weight, height))
+            user_id = cur.lastrowid
+            conn.commit()
+        _cache.invalidate('users')
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error adding user", error)
+    return user_id
+
+def _reserve_ids(cur, table, column, count):
+    """Draws `count` consecutive ids for `table` from the sequences table.
+
+    The counter never falls behind MAX(column), so rows inserted with explicit
+    ids (imports, the benchmark generator) cannot be handed out again. Unlike
+    the rowid, it does not go back when the newest rows are deleted or archived.
+    """
+    cur.execute(f"""
+        UPDATE sequences
+        SET next_id = MAX(next_id, (SELECT COALESCE(MAX({column}), 0) + 1 FROM {table})) + ?
+        WHERE name = ?;
+    """, (count, table))
+    cur.execute("SELECT next_id FROM sequences WHERE name = ?;", (table,))
+    last = cur.fetchone()[0]
+    return list(range(last - count, last))
+
+def _sync_sequence(cur, table, column):
+    # Moves the counter past every id in `table`, before rows leave it for the archive
+    _reserve_ids(cur, table, column, 0)
+
+def _catalog_ids(cur, names):
+    """Returns {name: catalog_id} for exercise names, adding unknown exercises to the catalog."""
+    keys = {name: normalize_exercise_name(name) for name in set(names)}
+    lookup = """
+        SELECT k.value, COALESCE(a.catalog_id, c.catalog_id)
+        FROM json_each(?) k
+        LEFT JOIN exercise_aliases a ON a.alias = k.value
+        LEFT JOIN exercise_catalog c ON c.normalized_name = k.value;
+    """
+    cur.execute(lookup, (json.dumps(sorted(set(keys.values()))),))
+    by_key = {key: catalog_id for key, catalog_id in cur.fetchall() if catalog_id is not None}
+    new = {}
+    for name in sorted(keys):  # the first spelling of a new exercise names it
+        if keys[name] not in by_key:
+            new.setdefault(keys[name], _WHITESPACE.sub(" ", name.strip(" ")))
+    if new:
+        cur.executemany(
+            "INSERT OR IGNORE INTO exercise_catalog (name, normalized_name) VALUES (?, ?);",
+            [(name, key) for key, name in new.items()],
+        )
+        cur.execute(lookup, (json.dumps(sorted(new)),))
+        by_key.update(cur.fetchall())
+    return {name: by_key[key] for name, key in keys.items()}
+
+def _apply_rollup_deltas(cur, workouts, sign):
+    """Adds (sign=1) or subtracts (sign=-1) workouts from the rollup tables."""
+    totals, periods = pg._rollup_deltas(workouts)
+    if sign > 0:
+        cur.executemany("""
+            INSERT INTO user_workout_rollups AS r
+                (user_id, total_workouts, total_minutes, total_calories, duration_count, min_duration, max_duration)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                total_workouts = r.total_workouts + excluded.total_workouts,
+                total_minutes = r.total_minutes + excluded.total_minutes,
+                total_calories = r.total_calories + excluded.total_calories,
+                duration_count = r.duration_count + excluded.duration_count,
+                min_duration = COALESCE(MIN(r.min_duration, excluded.min_duration), r.min_duration, excluded.min_duration),
+                max_duration = COALESCE(MAX(r.max_duration, excluded.max_duration), r.max_duration, excluded.max_duration);
+        """, [(user_id, *t) for user_id, t in sorted(totals.items())])
+        cur.executemany("""
+            INSERT INTO user_period_rollups AS p (user_id, period_type, period_start, workouts, minutes, calories)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, period_type, period_start) DO UPDATE SET
+                workouts = p.workouts + excluded.workouts,
+                minutes = p.minutes + excluded.minutes,
+                calories = p.calories + excluded.calories;
+        """, [(*key, *p) for key, p in sorted(periods.items())])
+        return
+
+    # Removal: counts and sums subtract exactly; min/max are recomputed only for
+    # users whose extreme value may have been removed.
+    cur.executemany("""
+        UPDATE user_workout_rollups SET
+            total_workouts = total_workouts - ?, total_minutes = total_minutes - ?,
+            total_calories = total_calories - ?, duration_count = duration_count - ?
+        WHERE user_id = ?;
+    """, [(t[0], t[1], t[2], t[3], user_id) for user_id, t in sorted(totals.items())])
+    cur.executemany("""
+        UPDATE user_period_rollups SET workouts = workouts - ?, minutes = minutes - ?, calories = calories - ?
+        WHERE user_id = ? AND period_type = ? AND period_start = ?;
+    """, [(*p, *key) for key, p in sorted(periods.items())])
+    # A rebuild has no rows for periods or users left without workouts
+    user_ids = json.dumps(sorted(totals))
+    cur.execute(
+        "DELETE FROM user_period_rollups WHERE user_id IN (SELECT value FROM json_each(?)) AND workouts <= 0;",
+        (user_ids,),
+    )
+    cur.execute(
+        "DELETE FROM user_workout_rollups WHERE user_id IN (SELECT value FROM json_each(?)) AND total_workouts <= 0;",
+        (user_ids,),
+    )
+    cur.executemany("""
+        UPDATE user_workout_rollups SET
+            min_duration = (SELECT MIN(value) FROM (
+                SELECT MIN(duration_minutes) AS value FROM workouts WHERE user_id = :user_id
+                UNION ALL
+                SELECT MIN(min_duration) FROM workout_summaries WHERE user_id = :user_id AND period_type = 'month')),
+            max_duration = (SELECT MAX(value) FROM (
+                SELECT MAX(duration_minutes) AS value FROM workouts WHERE user_id = :user_id
+                UNION ALL
+                SELECT MAX(max_duration) FROM workout_summaries WHERE user_id = :user_id AND period_type = 'month'))
+        WHERE user_id = :user_id
+          AND (duration_count = 0 OR :removed_min <= min_duration OR :removed_max >= max_duration);
+    """, [{'user_id': user_id, 'removed_min': t[4], 'removed_max': t[5]} for user_id, t in sorted(totals.items())])
+
+_RECORD_INSERT_SQL = (
+    f"INSERT INTO personal_records AS pr ({', '.join(pg._RECORD_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * len(pg._RECORD_COLUMNS))})"
+)
+
+def _apply_personal_records(cur, exercise_rows):
+    """Raises personal records beaten by newly inserted exercise rows."""
+    candidates = pg._record_candidates(exercise_rows)
+    if candidates:
+        cur.executemany(
+            f"{_RECORD_INSERT_SQL} ON CONFLICT (user_id, catalog_id) DO UPDATE SET {pg._RECORD_UPSERT_SET};",
+            candidates,
+        )
+
+def _fill_missing_calories(cur, workouts):
+    """Estimates calories for the workouts logged without them, when CALORIE_SETTINGS enables it."""
+    if not config.CALORIE_SETTINGS['estimate_on_log']:
+        return
+    user_ids = sorted({w["user_id"] for w in workouts if pg._needs_calorie_estimate(w)})
+    if user_ids:
+        cur.execute(
+            "SELECT user_id, weight_kg FROM users WHERE user_id IN (SELECT value FROM json_each(?));",
+            (json.dumps(user_ids),),
+        )
+        pg._estimate_missing_calories(workouts, dict(cur.fetchall()))
+
+def _insert_workouts(cur, workouts):
+    """Inserts normalized workouts and their exercises on an open cursor.
+
+    Workout ids are reserved up front unless the workout dicts already carry
+    one; workouts without calories get an estimate. Returns the new workout
+    ids; committing is left to the caller.
+    """
+    if not workouts:
+        return []
+    _fill_missing_calories(cur, workouts)
+    missing = sum(1 for w in workouts if w.get("workout_id") is None)
+    reserved = iter(_reserve_ids(cur, "workouts", "workout_id", missing) if missing else ())
+    workout_ids = [w.get("workout_id") or next(reserved) for w in workouts]
+    catalog_ids = _catalog_ids(cur, [ex["name"] for w in workouts for ex in w["exercises"]])
+    exercise_rows = [
+        (workout_id, w["workout_date"], w["user_id"], catalog_ids[ex["name"]], ex["sets"], ex["reps"],
+         round(ex["weight"], 2) if ex["weight"] is not None else None)  # as NUMERIC(6, 2) stores it
+        for workout_id, w in zip(workout_ids, workouts)
+        for ex in w["exercises"]
+    ]
+    # Drawn from the sequences table: a rowid would reuse the ids of archived exercises
+    exercise_ids = _reserve_ids(cur, "exercises", "exercise_id", len(exercise_rows)) if exercise_rows else []
+    cur.executemany(
+        "INSERT INTO workouts (workout_id, user_id, workout_date, duration_minutes, calories_burned, calories_estimated) "
+        "VALUES (?, ?, ?, ?, ?, ?);",
+        [(workout_id, w["user_id"], w["workout_date"], w["duration"], w["calories"], w.get("calories_estimated", False))
+         for workout_id, w in zip(workout_ids, workouts)],
+    )
+    if exercise_rows:
+        cur.executemany(
+            "INSERT INTO exercises (exercise_id, workout_id, workout_date, user_id, catalog_id, sets, reps, weight_kg) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+            [(exercise_id, *row) for exercise_id, row in zip(exercise_ids, exercise_rows)],
+        )
+    _apply_rollup_deltas(cur, workouts, sign=1)
+    _apply_activity(cur, workouts, sign=1)
+    _apply_personal_records(cur, exercise_rows)
+    return workout_ids
+
+_invalidate_workout_reads = functools.partial(pg._invalidate_workout_reads, cache=_cache)
+
+# --- Write-Behind Logging ---
+# As in Backend_fft: with FITNESS_WRITE_BEHIND=1 log_workout queues workouts and
+# a background thread commits them in batches, one write transaction each.
+_writer = pg._WorkoutWriter(sys.modules[__name__])
+
+@instrumented
+def flush_workout_writes(timeout=None):
+    """Waits until every queued workout is committed; returns False on timeout or a failed batch."""
+    return _writer.flush(timeout)
+
+def get_write_queue_stats():
+    """Returns write-behind queue depth, batch and commit latency counters (None when unused)."""
+    return _writer.stats()
+
+@instrumented
+def log_workout(user_id, workout_date, duration, calories, exercises):
+    """Logs a new workout and its associated exercises. Returns the new workout_id."""
+    workout_id = None
+    try:
+        workout = pg._normalize_workout({
+            "user_id": user_id, "workout_date": workout_date,
+            "duration": duration, "calories": calories, "exercises": exercises,
+        })
+        if config.WRITE_BEHIND_SETTINGS['enabled']:
+            return _writer.put(workout)
+        with db_connection() as conn, conn.cursor() as cur:
+            workout_id = _insert_workouts(cur, [workout])[0]
+            conn.commit()
+        _invalidate_workout_reads(workout['user_id'])
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error logging workout", error)
+    return workout_id
+
+def _suggestion_scopes(cur, user_id, friend_id):
+    """The two users and their friends, whose suggestions change (see Backend_fft._suggestion_scopes)."""
+    cur.execute("SELECT user_id_2 FROM friends WHERE user_id_1 IN (?, ?);", (user_id, friend_id))
+    return {user_id, friend_id, *(row[0] for row in cur.fetchall())}
+
+@instrumented
+def add_friend(user_id, friend_id):
+    """Connects two users as friends."""
+    sql = "INSERT INTO friends(user_id_1, user_id_2) VALUES(?, ?);"
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id, friend_id))
+            cur.execute(sql, (friend_id, user_id))
+            scopes = _suggestion_scopes(cur, user_id, friend_id)
+            conn.commit()
+        _cache.invalidate('friends', user_id, friend_id)
+        _cache.invalidate('leaderboard', user_id, friend_id)
+        _cache.invalidate('suggestions', *scopes)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error adding friend", error)
+
+@instrumented
+def set_goal(user_id, description, target_value, start_date, end_date, metric='workouts'):
+    """Sets a new fitness goal for a user ('workouts', 'minutes' or 'calories' count towards the target)."""
+    if metric not in GOAL_METRICS:
+        raise ValueError(f"metric must be one of {', '.join(GOAL_METRICS)}")
+    sql = """
+        INSERT INTO goals(user_id, goal_description, target_value, start_date, end_date, goal_metric)
+        VALUES(?, ?, ?, ?, ?, ?);
+    """
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id, description, target_value, start_date, end_date, metric))
+            conn.commit()
+        _cache.invalidate('goals', user_id)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error setting goal", error)
+
+# READ
+# as_frame=True builds the DataFrame column by column from the cursor, as in
+# Backend_fft. Date expressions are aliased "name [date]" so they are read back
+# as dates.
+
+_fetch_all = pg._fetch_all
+_no_rows = pg._no_rows
+
+@instrumented
+@_cached('users')
+def get_all_users(*, as_frame=False):
+    """Retrieves all users from the database."""
+    users = _no_rows(pg._USERS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            users = _fetch_all(cur, "SELECT user_id, name, email FROM users ORDER BY name;", None,
+                               pg._USERS_COLUMNS, as_frame)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching users", error)
+    return users
+
+@instrumented
+@_cached('profile')
+def get_user_profile(user_id):
+    """Retrieves a specific user's profile."""
+    user = None
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT name, email, weight_kg, height_cm FROM users WHERE user_id = ?;", (user_id,))
+            user = cur.fetchone()
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching user profile", error)
+    return user
+
+_USER_WORKOUTS_SQL = """
+    SELECT workout_id, workout_date, duration_minutes, calories_burned
+    FROM workouts
+    WHERE user_id = ?
+    ORDER BY workout_date DESC, workout_id DESC
+    LIMIT COALESCE(?, -1);
+"""
+
+@instrumented
+def get_user_workouts(user_id, limit=None, *, as_frame=False):
+    """Retrieves workouts for a specific user, newest first (all of them unless `limit` is given)."""
+    workouts = _no_rows(pg._WORKOUT_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            workouts = _fetch_all(cur, _USER_WORKOUTS_SQL, (user_id, limit), pg._WORKOUT_COLUMNS, as_frame)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error fetching workouts", error)
+    return workouts
+
+_WORKOUT_DETAILS_SQL = """
+    SELECT c.name AS exercise_name, e.sets, e.reps, e.weight_kg
+    FROM exercises e
+    JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+    WHERE e.workout_id = ?
+    ORDER BY e.exercise_id;
+"""
+
+@instrumented
+def get_workout_details(workout_id, *, as_frame=False):
+    """Retrieves all exercises for a specific workout."""
+    exercises = _no_rows(pg._EXERCISE_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            exercises = _fetch_all(cur, _WORKOUT_DETAILS_SQL, (workout_id,), pg._EXERCISE_COLUMNS, as_frame)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error fetching workout details", error)
+    return exercises
+
+_HISTORY_PAGE_SQL = """
+    SELECT workout_id, workout_date, duration_minutes, calories_burned
+    FROM workouts
+    WHERE user_id = :user_id
+      AND (:before_date IS NULL OR (workout_date, workout_id) < (:before_date, :before_id))
+    ORDER BY workout_date DESC, workout_id DESC
+    LIMIT :limit;
+"""
+
+def _workout_exercises(cur, workout_ids):
+    """Returns {workout_id: [(exercise_name, sets, reps, weight_kg), ...]} for the given workouts."""
+    exercises = {workout_id: [] for workout_id in workout_ids}
+    if workout_ids:
+        cur.execute("""
+            SELECT x.workout_id, c.name, x.sets, x.reps, x.weight_kg
+            FROM exercises x
+            JOIN exercise_catalog c ON c.catalog_id = x.catalog_id
+            WHERE x.workout_id IN (SELECT value FROM json_each(?))
+            ORDER BY x.workout_id, x.exercise_id;
+        """, (json.dumps(list(workout_ids)),))
+        for workout_id, *exercise in cur.fetchall():
+            exercises[workout_id].append(tuple(exercise))
+    return exercises
+
+def _history_rows(cur, user_id, page_size, before):
+    # page_size + 1 workouts with their exercises, for Backend_fft._history_page
+    before_date, before_id = before if before else (None, None)
+    cur.execute(_HISTORY_PAGE_SQL, {
+        'user_id': user_id, 'before_date': before_date, 'before_id': before_id, 'limit': page_size + 1,
+    })
+    rows = cur.fetchall()
+    exercises = _workout_exercises(cur, [row[0] for row in rows])
+    return [(*row, exercises[row[0]]) for row in rows]
+
+@instrumented
+def get_workout_history_page(user_id, page_size=20, before=None):
+    """Retrieves one page of a user's workouts, newest first, with their exercises.
+
+    Same cursor and result shape as Backend_fft.get_workout_history_page; the
+    exercises of the whole page are read with one extra query.
+    """
+    workouts, next_cursor = [], None
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            rows = _history_rows(cur, user_id, page_size, before)
+        workouts, next_cursor = pg._history_page(rows, page_size)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error fetching workout history", error)
+    return workouts, next_cursor
+
+# --- Exercise Catalog ---
+
+# The catalog id of :catalog_id, or else of the exercise named :name
+_RESOLVE_EXERCISE = """
+    COALESCE(
+        :catalog_id,
+        (SELECT catalog_id FROM exercise_aliases WHERE alias = normalize_exercise_name(:name)),
+        (SELECT catalog_id FROM exercise_catalog WHERE normalized_name = normalize_exercise_name(:name))
+    )
+"""
+
+_USER_EXERCISES_SQL = """
+    SELECT c.catalog_id, c.name, COUNT(DISTINCT e.workout_id) AS sessions, MAX(e.workout_date) AS "last_date [date]"
+    FROM exercises e
+    JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+    WHERE e.user_id = ?
+    GROUP BY c.catalog_id, c.name
+    ORDER BY MAX(e.workout_date) DESC, c.name;
+"""
+
+@instrumented
+@_cached('exercises')
+def get_user_exercises(user_id, *, as_frame=False):
+    """Returns (catalog_id, name, sessions, last_date) for each exercise a user has logged, most recent first."""
+    exercises = _no_rows(pg._USER_EXERCISES_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            exercises = _fetch_all(cur, _USER_EXERCISES_SQL, (user_id,), pg._USER_EXERCISES_COLUMNS, as_frame)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching exercises", error)
+    return exercises
+
+_EXERCISE_HISTORY_SQL = f"""
+    SELECT e.workout_id, e.workout_date,
+           SUM(COALESCE(e.sets, 1)) AS sets,
+           SUM(COALESCE(e.sets, 1) * COALESCE(e.reps, 0)) AS reps,
+           SUM(COALESCE(e.sets, 1) * COALESCE(e.reps, 0) * COALESCE(e.weight_kg, 0)) AS volume_kg,
+           MAX(e.weight_kg) AS best_weight_kg,
+           (SELECT b.reps FROM exercises b
+            WHERE b.workout_id = e.workout_id AND b.catalog_id = e.catalog_id
+            ORDER BY b.weight_kg DESC NULLS LAST, b.reps DESC NULLS LAST
+            LIMIT 1) AS best_set_reps
+    FROM exercises e
+    WHERE e.user_id = :user_id AND e.catalog_id = {_RESOLVE_EXERCISE}
+    GROUP BY e.workout_date, e.workout_id
+    ORDER BY e.workout_date DESC, e.workout_id DESC
+    LIMIT COALESCE(:limit, -1);
+"""
+
+@instrumented
+def get_exercise_history(user_id, exercise, limit=None, *, as_frame=False):
+    """Returns a user's sessions of one exercise, newest first (all of them unless `limit` is given).
+
+    Rows are (workout_id, workout_date, sets, reps, volume_kg, best_weight_kg,
+    best_set_reps), as in Backend_fft.get_exercise_history.
+    """
+    sessions = _no_rows(pg._EXERCISE_HISTORY_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            params = {'user_id': user_id, 'limit': limit, **pg._exercise_params(exercise)}
+            sessions = _fetch_all(cur, _EXERCISE_HISTORY_SQL, params, pg._EXERCISE_HISTORY_COLUMNS, as_frame)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error fetching exercise history", error)
+    return sessions
+
+@instrumented
+def add_exercise_alias(alias, exercise):
+    """Makes `alias` another name of `exercise` (a catalog id or name); returns True on success.
+
+    A duplicate catalog entry for the alias is merged into `exercise`, as in
+    Backend_fft.add_exercise_alias.
+    """
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            _begin(cur)
+            cur.execute(f"SELECT {_RESOLVE_EXERCISE}, normalize_exercise_name(:alias);",
+                        {'alias': alias, **pg._exercise_params(exercise)})
+            catalog_id, key = cur.fetchone()
+            if catalog_id is None:
+                raise ValueError(f"unknown exercise {exercise!r}")
+            if not key:
+                raise ValueError("alias must not be empty")
+            cur.execute(
+                "SELECT catalog_id FROM exercise_catalog WHERE normalized_name = ? AND catalog_id <> ?;",
+                (key, catalog_id),
+            )
+            duplicate = cur.fetchone()
+            if duplicate:
+                cur.execute("SELECT user_id FROM personal_records WHERE catalog_id = ?;", duplicate)
+                record_users = [row[0] for row in cur.fetchall()]
+                for sql in (
+                    "UPDATE exercises SET catalog_id = ? WHERE catalog_id = ?;",
+                    "UPDATE exercise_aliases SET catalog_id = ? WHERE catalog_id = ?;",
+                    # No foreign key here; restoring them needs a catalog_id that still exists
+                    "UPDATE archived_exercises SET catalog_id = ? WHERE catalog_id = ?;",
+                ):
+                    cur.execute(sql, (catalog_id, duplicate[0]))
+                cur.execute("DELETE FROM exercise_catalog WHERE catalog_id = ?;", duplicate)
+                if record_users:
+                    _rebuild_personal_records(
+                        cur, "user_id IN (SELECT value FROM json_each(:user_ids)) AND catalog_id = :catalog_id",
+                        {'user_ids': json.dumps(record_users), 'catalog_id': catalog_id},
+                    )
+            cur.execute("SELECT normalized_name FROM exercise_catalog WHERE catalog_id = ?;", (catalog_id,))
+            if cur.fetchone()[0] != key:
+                cur.execute("""
+                    INSERT INTO exercise_aliases (alias, catalog_id) VALUES (?, ?)
+                    ON CONFLICT (alias) DO UPDATE SET catalog_id = excluded.catalog_id;
+                """, (key, catalog_id))
+            conn.commit()
+        _cache.invalidate('exercises')
+        _cache.invalidate('records')
+        return True
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error adding exercise alias", error)
+        return False
+
+_FRIENDS_SQL = """
+    SELECT u.user_id, u.name
+    FROM users u
+    JOIN friends f ON u.user_id = f.user_id_2
+    WHERE f.user_id_1 = :user_id
+    ORDER BY u.name;
+"""
+
+@instrumented
+@_cached('friends')
+def get_user_friends(user_id, *, as_frame=False):
+    """Retrieves all friends for a specific user."""
+    friends = _no_rows(pg._FRIENDS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            friends = _fetch_all(cur, _FRIENDS_SQL, {'user_id': user_id}, pg._FRIENDS_COLUMNS, as_frame)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching friends", error)
+    return friends
+
+@instrumented
+def search_users(query, user_id=None, limit=10):
+    """Finds users whose name or email starts with `query` (case-insensitive for ASCII letters).
+
+    When user_id is given, that user and their friends are left out. Each
+    branch is a range scan of a lower(name)/lower(email) index that stops
+    after `limit` rows. Returns up to `limit` (user_id, name) tuples.
+    """
+    term = (query or "").strip().lower()
+    if not term:
+        return []
+    # lower(x) LIKE 'term%' as an index range: term <= lower(x) < term with its last character bumped
+    params = {"low": term, "high": term[:-1] + chr(ord(term[-1]) + 1), "user_id": user_id, "limit": limit}
+    not_self_or_friend = """
+        users.user_id IS NOT :user_id
+        AND NOT EXISTS (SELECT 1 FROM friends f WHERE f.user_id_1 = :user_id AND f.user_id_2 = users.user_id)
+    """
+    sql = f"""
+        SELECT user_id, name FROM (
+            SELECT * FROM (
+                SELECT user_id, name, lower(name) AS sort_key FROM users
+                WHERE lower(name) >= :low AND lower(name) < :high AND {not_self_or_friend}
+                ORDER BY lower(name) LIMIT :limit)
+            UNION
+            SELECT * FROM (
+                SELECT user_id, name, lower(name) AS sort_key FROM users
+                WHERE lower(email) >= :low AND lower(email) < :high AND {not_self_or_friend}
+                ORDER BY lower(email) LIMIT :limit)
+        )
+        ORDER BY sort_key, user_id
+        LIMIT :limit;
+    """
+    users = []
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            users = cur.fetchall()
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error searching users", error)
+    return users
+
+# At most :fanout friends, and the first :fanout friends of each (bounded by
+# the fanout-th friend's id), are looked at, all through the friends primary key
+_SUGGESTIONS_SQL = """
+    WITH my_friends AS (
+        SELECT f.user_id_2 AS friend_id,
+               (SELECT user_id_2 FROM friends WHERE user_id_1 = f.user_id_2
+                ORDER BY user_id_2 LIMIT 1 OFFSET :fanout - 1) AS last_fof
+        FROM friends f
+        WHERE f.user_id_1 = :user_id
+        LIMIT :fanout
+    ), candidates AS (
+        SELECT fof.user_id_2 AS candidate_id, COUNT(*) AS mutual_friends
+        FROM my_friends m
+        JOIN friends fof ON fof.user_id_1 = m.friend_id AND (m.last_fof IS NULL OR fof.user_id_2 <= m.last_fof)
+        WHERE fof.user_id_2 <> :user_id
+          AND NOT EXISTS (SELECT 1 FROM friends f WHERE f.user_id_1 = :user_id AND f.user_id_2 = fof.user_id_2)
+        GROUP BY fof.user_id_2
+        ORDER BY mutual_friends DESC, candidate_id
+        LIMIT :limit
+    )
+    SELECT u.user_id, u.name, c.mutual_friends
+    FROM candidates c
+    JOIN users u ON u.user_id = c.candidate_id
+    ORDER BY c.mutual_friends DESC, u.name;
+"""
+
+@instrumented
+@_cached('suggestions')
+def get_friend_suggestions(user_id, limit=10):
+    """Suggests friends of the user's friends, most mutual friends first.
+
+    Returns (user_id, name, mutual_friends) tuples.
+    """
+    suggestions = []
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_SUGGESTIONS_SQL, {"user_id": user_id, "limit": limit, "fanout": SUGGESTION_FANOUT})
+            suggestions = cur.fetchall()
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching friend suggestions", error)
+    return suggestions
+
+@instrumented
+@_cached('goals')
+def get_user_goals(user_id, *, as_frame=False):
+    """Retrieves all goals for a specific user."""
+    sql = "SELECT goal_id, goal_description, target_value, start_date, end_date, status FROM goals WHERE user_id = ?;"
+    goals = _no_rows(pg._GOALS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            goals = _fetch_all(cur, sql, (user_id,), pg._GOALS_COLUMNS, as_frame)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching goals", error)
+    return goals
+
+# UPDATE
+@instrumented
+def update_user_profile(user_id, name, email, weight, height):
+    """Updates a user's profile information."""
+    sql = "UPDATE users SET name = ?, email = ?, weight_kg = ?, height_cm = ? WHERE user_id = ?;"
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (name, email, weight, height, user_id))
+            conn.commit()
+        _cache.invalidate('profile', user_id)
+        _cache.invalidate('users')
+        _cache.invalidate('friends')
+        _cache.invalidate('leaderboard')
+        _cache.invalidate('suggestions')
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error updating profile", error)
+
+# DELETE
+@instrumented
+def delete_workout(workout_id):
+    """Deletes a workout (and its exercises) and removes it from the user's rollups."""
+    deleted = False
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            _begin(cur)
+            cur.execute(
+                "SELECT user_id, workout_date, duration_minutes, calories_burned FROM workouts WHERE workout_id = ?;",
+                (workout_id,),
+            )
+            row = cur.fetchone()
+            if row:
+                cur.execute("SELECT DISTINCT catalog_id FROM exercises WHERE workout_id = ?;", (workout_id,))
+                catalog_ids = [r[0] for r in cur.fetchall()]
+                cur.execute("DELETE FROM workouts WHERE workout_id = ?;", (workout_id,))
+                removed = [{'user_id': row[0], 'workout_date': row[1], 'duration': row[2], 'calories': row[3]}]
+                _apply_rollup_deltas(cur, removed, sign=-1)
+                _apply_activity(cur, removed, sign=-1)
+                if catalog_ids:
+                    _rebuild_personal_records(
+                        cur, "user_id = :user_id AND catalog_id IN (SELECT value FROM json_each(:catalog_ids))",
+                        {'user_id': row[0], 'catalog_ids': json.dumps(catalog_ids)},
+                    )
+                deleted = True
+            conn.commit()
+        if deleted:
+            _invalidate_workout_reads(row[0])
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error deleting workout", error)
+    return deleted
+
+@instrumented
+def remove_friend(user_id, friend_id):
+    """Removes a friend connection."""
+    sql = "DELETE FROM friends WHERE (user_id_1 = ? AND user_id_2 = ?) OR (user_id_1 = ? AND user_id_2 = ?);"
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, (user_id, friend_id, friend_id, user_id))
+            scopes = _suggestion_scopes(cur, user_id, friend_id)
+            conn.commit()
+        _cache.invalidate('friends', user_id, friend_id)
+        _cache.invalidate('leaderboard', user_id, friend_id)
+        _cache.invalidate('suggestions', *scopes)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error removing friend", error)
+
+# --- Business Insights & Leaderboard ---
+
+# Rollups as recomputed from the workouts table plus the summaries that
+# archived workouts left behind (see Backend_fft)
+_ROLLUP_TOTALS_SQL = """
+    SELECT user_id,
+           SUM(workouts) AS total_workouts,
+           SUM(minutes) AS total_minutes,
+           SUM(calories) AS total_calories,
+           SUM(duration_count) AS duration_count,
+           MIN(min_duration) AS min_duration,
+           MAX(max_duration) AS max_duration
+    FROM (
+        SELECT user_id, COUNT(*) AS workouts,
+               COALESCE(SUM(duration_minutes), 0) AS minutes,
+               COALESCE(SUM(calories_burned), 0) AS calories,
+               COUNT(duration_minutes) AS duration_count,
+               MIN(duration_minutes) AS min_duration,
+               MAX(duration_minutes) AS max_duration
+        FROM workouts {where}
+        GROUP BY user_id
+        UNION ALL
+        SELECT user_id, workouts, minutes, calories, duration_count, min_duration, max_duration
+        FROM (SELECT * FROM workout_summaries WHERE period_type = 'month') {where}
+    )
+    GROUP BY user_id
+"""
+
+# Each workout once per period it falls in. Week buckets start on Monday:
+# back up 6 days, then forward to the next Monday
+_WORKOUT_PERIODS_SQL = """
+    SELECT user_id, 'week' AS period_type, date(workout_date, '-6 days', 'weekday 1') AS period_start,
+           duration_minutes, calories_burned
+    FROM workouts {where}
+    UNION ALL
+    SELECT user_id, 'month', date(workout_date, 'start of month'), duration_minutes, calories_burned
+    FROM workouts {where}
+"""
+
+_ROLLUP_PERIODS_SQL = f"""
+    SELECT user_id, period_type, period_start AS "period_start [date]",
+           SUM(workouts) AS workouts,
+           SUM(minutes) AS minutes,
+           SUM(calories) AS calories
+    FROM (
+        SELECT user_id, period_type, period_start,
+               COUNT(*) AS workouts,
+               COALESCE(SUM(duration_minutes), 0) AS minutes,
+               COALESCE(SUM(calories_burned), 0) AS calories
+        FROM ({_WORKOUT_PERIODS_SQL})
+        GROUP BY user_id, period_type, period_start
+        UNION ALL
+        SELECT user_id, period_type, period_start, workouts, minutes, calories FROM workout_summaries {{where}}
+    )
+    GROUP BY user_id, period_type, period_start
+"""
+
+def _rebuild_rollups(cur, user_id=None):
+    where = "WHERE user_id = :user_id" if user_id is not None else ""
+    params = {'user_id': user_id}
+    cur.execute(f"DELETE FROM user_period_rollups {where};", params)
+    cur.execute(f"DELETE FROM user_workout_rollups {where};", params)
+    cur.execute(f"""
+        INSERT INTO user_workout_rollups
+            (user_id, total_workouts, total_minutes, total_calories, duration_count, min_duration, max_duration)
+        {_ROLLUP_TOTALS_SQL.format(where=where)};
+    """, params)
+    cur.execute(f"""
+        INSERT INTO user_period_rollups (user_id, period_type, period_start, workouts, minutes, calories)
+        {_ROLLUP_PERIODS_SQL.format(where=where)};
+    """, params)
+    _rebuild_activity(cur, user_id)
+
+@instrumented
+def rebuild_rollups(user_id=None):
+    """Recomputes the rollup tables (and activity calendars and streaks) from the workouts table."""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            _rebuild_rollups(cur, user_id)
+            conn.commit()
+        if user_id is None:
+            _invalidate_workout_reads()
+        else:
+            _invalidate_workout_reads(user_id)
+        return True
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error rebuilding rollups", error)
+    return False
+
+def _row_text(values, width):
+    # A row as PostgreSQL's ROW(...)::text prints it, e.g. (3,120,,5)
+    return "(" + ",".join("" if v is None else str(v) for v in (values or (None,) * width)) + ")"
+
+def _mismatches(table, stored, expected, width):
+    return [
+        (table, key, _row_text(stored.get(key), width), _row_text(expected.get(key), width))
+        for key in sorted(stored.keys() | expected.keys())
+        if stored.get(key) != expected.get(key)
+    ]
+
+@instrumented
+def check_rollups(user_id=None):
+    """Compares stored rollups with values recomputed from workouts.
+
+    Returns a list of (table, key, stored, expected) tuples; empty means consistent.
+    """
+    where = "WHERE user_id = :user_id" if user_id is not None else ""
+    params = {'user_id': user_id}
+    mismatches = []
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT user_id, total_workouts, total_minutes, total_calories, duration_count, min_duration, max_duration
+                FROM user_workout_rollups {where};
+            """, params)
+            stored = {(row[0],): row[1:] for row in cur.fetchall()}
+            cur.execute(_ROLLUP_TOTALS_SQL.format(where=where), params)
+            expected = {(row[0],): row[1:] for row in cur.fetchall()}
+            mismatches += _mismatches('user_workout_rollups', stored, expected, 6)
+            cur.execute(f"""
+                SELECT user_id, period_type, period_start, workouts, minutes, calories
+                FROM user_period_rollups {where};
+            """, params)
+            stored = {row[:3]: row[3:] for row in cur.fetchall()}
+            cur.execute(_ROLLUP_PERIODS_SQL.format(where=where), params)
+            expected = {row[:3]: row[3:] for row in cur.fetchall()}
+            mismatches += _mismatches('user_period_rollups', stored, expected, 3)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error checking rollups", error)
+    return mismatches
+
+# Activity calendar and streaks, maintained as in Backend_fft (see _activity_update there)
+
+# The whole history, hot and archived, for rebuilds, day charts and goals
+# (filter on user_id and workout_date outside; both tables are indexed on them)
+_ALL_WORKOUTS_SQL = """(
+    SELECT user_id, workout_date, duration_minutes, calories_burned FROM workouts
+    UNION ALL
+    SELECT user_id, workout_date, duration_minutes, calories_burned FROM archived_workouts
+)"""
+
+_ACTIVITY_UPSERT_SQL = """
+    INSERT INTO user_activity_years (user_id, year, day_counts) VALUES (?, ?, ?)
+    ON CONFLICT (user_id, year) DO UPDATE SET day_counts = excluded.day_counts;
+"""
+_STREAKS_UPSERT_SQL = """
+    INSERT INTO user_streaks (user_id, current_start, last_active_date, longest_start, longest_end)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        current_start = excluded.current_start, last_active_date = excluded.last_active_date,
+        longest_start = excluded.longest_start, longest_end = excluded.longest_end;
+"""
+
+def _apply_activity(cur, workouts, sign):
+    """Adds (sign=1) or removes (sign=-1) workouts from day counts and streaks."""
+    deltas = pg._activity_deltas(workouts, sign)
+    user_ids = json.dumps(sorted({user_id for user_id, _ in deltas}))
+    cur.execute(
+        "SELECT user_id, year, day_counts FROM user_activity_years WHERE user_id IN (SELECT value FROM json_each(?));",
+        (user_ids,),
+    )
+    year_rows = cur.fetchall()
+    cur.execute("""
+        SELECT user_id, current_start, last_active_date, longest_start, longest_end
+        FROM user_streaks
+        WHERE user_id IN (SELECT value FROM json_each(?)) AND last_active_date IS NOT NULL;
+    """, (user_ids,))
+    streaks = {row[0]: row[1:] for row in cur.fetchall()}
+    year_rows, empty_years, streak_rows, inactive_users = pg._activity_update(year_rows, streaks, deltas)
+    cur.executemany(_ACTIVITY_UPSERT_SQL, year_rows)
+    cur.executemany("DELETE FROM user_activity_years WHERE user_id = ? AND year = ?;", empty_years)
+    cur.executemany(_STREAKS_UPSERT_SQL, streak_rows)
+    cur.executemany("DELETE FROM user_streaks WHERE user_id = ?;", [(user_id,) for user_id in inactive_users])
+
+def _rebuild_activity(cur, user_id=None):
+    """Recomputes day counts and streaks from the workouts, archived ones included (one user or everyone)."""
+    where = "WHERE user_id = :user_id" if user_id is not None else ""
+    params = {'user_id': user_id}
+    cur.execute(f"DELETE FROM user_activity_years {where};", params)
+    cur.execute(f"DELETE FROM user_streaks {where};", params)
+    with cur.connection.cursor() as days:
+        days.execute(f"""
+            SELECT user_id, workout_date AS "workout_date [date]", COUNT(*) FROM {_ALL_WORKOUTS_SQL} {where}
+            GROUP BY user_id, workout_date
+            ORDER BY user_id, workout_date;
+        """, params)
+        for year_rows, streak_rows in pg._activity_batches(days):
+            cur.executemany(_ACTIVITY_UPSERT_SQL, year_rows)
+            cur.executemany(_STREAKS_UPSERT_SQL, streak_rows)
+
+_ACTIVITY_SQL = """
+    SELECT s.current_start, s.last_active_date, s.longest_start, s.longest_end, a.year, a.day_counts
+    FROM (SELECT CAST(:user_id AS INTEGER) AS user_id) AS u
+    LEFT JOIN user_streaks s ON s.user_id = u.user_id
+    LEFT JOIN user_activity_years a
+      ON a.user_id = u.user_id AND a.year BETWEEN :first_year AND :last_year
+    ORDER BY a.year;
+"""
+
+@instrumented
+@_cached('activity')
+def get_activity_summary(user_id, days=pg.ACTIVITY_CALENDAR_DAYS):
+    """Returns a user's streaks and their daily workout counts for the last `days` days, in one lookup.
+
+    Same dict as Backend_fft.get_activity_summary.
+    """
+    today = date.today()
+    summary = pg._activity_summary((), days, today)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_ACTIVITY_SQL, pg._activity_params(user_id, days, today))
+            summary = pg._activity_summary(cur.fetchall(), days, today)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching activity summary", error)
+    return summary
+
+def _rebuild_personal_records(cur, where="1", params=None):
+    """Recomputes the personal_records rows matching `where` (on user_id/catalog_id); returns rows written.
+
+    The exercise rows are reduced with the same code that raises records on
+    insert, so rebuilt and incrementally kept records agree exactly.
+    """
+    cur.execute(f"DELETE FROM personal_records WHERE {where};", params)
+    cur.execute(f"""
+        SELECT workout_id, workout_date AS "workout_date [date]", user_id, catalog_id, sets, reps, weight_kg
+        FROM (
+            SELECT workout_id, workout_date, user_id, catalog_id, sets, reps, weight_kg FROM exercises
+            UNION ALL
+            SELECT workout_id, workout_date, user_id, catalog_id, sets, reps, weight_kg FROM archived_exercises
+        )
+        WHERE weight_kg > 0 AND {where};
+    """, params)
+    candidates = pg._record_candidates(cur.fetchall())
+    cur.executemany(f"{_RECORD_INSERT_SQL};", candidates)
+    return len(candidates)
+
+@instrumented
+def rebuild_personal_records(user_id=None, batch_users=None):
+    """Recomputes personal records from the exercises table, archived ones included (one user or everyone).
+
+    Everyone's records are rebuilt `batch_users` users per transaction (default
+    config.RECORD_SETTINGS['batch_users']). Returns the number of records
+    written, or None on error.
+    """
+    batch_users = batch_users or config.RECORD_SETTINGS['batch_users']
+    written = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            if user_id is not None:
+                written = _rebuild_personal_records(cur, "user_id = :user_id", {'user_id': user_id})
+                conn.commit()
+            else:
+                after = 0
+                while True:
+                    cur.execute(
+                        "SELECT MAX(user_id) FROM (SELECT user_id FROM users WHERE user_id > ? "
+                        "ORDER BY user_id LIMIT ?);", (after, batch_users),
+                    )
+                    last = cur.fetchone()[0]
+                    if last is None:
+                        break
+                    written += _rebuild_personal_records(
+                        cur, "user_id > :after AND user_id <= :last", {'after': after, 'last': last},
+                    )
+                    conn.commit()
+                    after = last
+        if user_id is None:
+            _cache.invalidate('records')
+        else:
+            _cache.invalidate('records', user_id)
+        return written
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error rebuilding personal records", error)
+    return None
+
+_PERSONAL_RECORDS_SQL = """
+    SELECT c.name AS exercise_name, pr.max_weight_kg, pr.max_weight_date, pr.best_e1rm_kg, pr.best_e1rm_date,
+           pr.best_volume_kg, pr.best_volume_date
+    FROM personal_records pr
+    JOIN exercise_catalog c ON c.catalog_id = pr.catalog_id
+    WHERE pr.user_id = :user_id
+    ORDER BY pr.best_e1rm_kg DESC NULLS LAST, c.name;
+"""
+
+@instrumented
+@_cached('records')
+def get_personal_records(user_id, *, as_frame=False):
+    """Returns a user's personal record per exercise, strongest estimated 1RM first.
+
+    Rows are (exercise_name, max_weight_kg, max_weight_date, best_e1rm_kg,
+    best_e1rm_date, best_volume_kg, best_volume_date).
+    """
+    records = _no_rows(pg._PERSONAL_RECORDS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            records = _fetch_all(cur, _PERSONAL_RECORDS_SQL, {'user_id': user_id},
+                                 pg._PERSONAL_RECORDS_COLUMNS, as_frame)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching personal records", error)
+    return records
+
+_DASHBOARD_SQL = """
+    SELECT COALESCE(r.total_workouts, 0) AS total_workouts,
+           COALESCE(r.total_minutes, 0) AS total_minutes,
+           COALESCE(r.total_calories, 0) AS total_calories,
+           COALESCE(r.total_minutes * 1.0 / NULLIF(r.duration_count, 0), 0) AS avg_duration,
+           COALESCE(r.max_duration, 0) AS max_duration,
+           COALESCE(r.min_duration, 0) AS min_duration,
+           COALESCE(w.workouts, 0) AS workouts_this_week,
+           COALESCE(w.minutes, 0) AS minutes_this_week,
+           COALESCE(w.calories, 0) AS calories_this_week,
+           COALESCE(m.workouts, 0) AS workouts_this_month,
+           COALESCE(m.minutes, 0) AS minutes_this_month,
+           COALESCE(m.calories, 0) AS calories_this_month
+    FROM (SELECT CAST(:user_id AS INTEGER) AS user_id) AS u
+    LEFT JOIN user_workout_rollups r ON r.user_id = u.user_id
+    LEFT JOIN user_period_rollups w
+      ON w.user_id = u.user_id AND w.period_type = 'week' AND w.period_start = :week
+    LEFT JOIN user_period_rollups m
+      ON m.user_id = u.user_id AND m.period_type = 'month' AND m.period_start = :month;
+"""
+
+@instrumented
+@_cached('dashboard')
+def get_user_dashboard_stats(user_id):
+    """Calculates key fitness statistics for the user's dashboard from the rollups."""
+    stats = {}
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_DASHBOARD_SQL, pg._dashboard_params(user_id))
+            stats = pg._dashboard_stats(cur.fetchone())
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching dashboard stats", error)
+    return stats
+
+# date() modifiers truncating a date to its bucket, and stepping to the next bucket
+_BUCKET_START = {'day': "date({})", 'week': "date({}, '-6 days', 'weekday 1')", 'month': "date({}, 'start of month')"}
+_BUCKET_STEP = {'day': ('+1 day', 'days', 1), 'week': ('+7 days', 'days', 7), 'month': ('+1 month', 'months', 1)}
+
+def _timeseries_query(user_id, resolution, start, end, max_points):
+    # Returns (sql, params) for get_workout_timeseries; the buckets come from a recursive CTE
+    if resolution not in TIMESERIES_RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {', '.join(TIMESERIES_RESOLUTIONS)}")
+    step, unit, size = _BUCKET_STEP[resolution]
+    if resolution == 'day':
+        # Days before the archive horizon are in archived_workouts
+        source = f"""
+            SELECT workout_date AS bucket, COUNT(*) AS workouts,
+                   COALESCE(SUM(duration_minutes), 0) AS minutes,
+                   COALESCE(SUM(calories_burned), 0) AS calories
+            FROM {_ALL_WORKOUTS_SQL}
+            WHERE user_id = :user_id
+              AND workout_date <= COALESCE(:end, '9999-12-31')
+              -- Only the last max_points days can be shown; skip older history
+              AND workout_date > date((SELECT COALESCE(:end, MAX(workout_date)) FROM {_ALL_WORKOUTS_SQL}
+                                       WHERE user_id = :user_id), :history)
+            GROUP BY workout_date
+        """
+    else:
+        source = """
+            SELECT period_start AS bucket, workouts, minutes, calories
+            FROM user_period_rollups
+            WHERE user_id = :user_id AND period_type = :resolution
+        """
+    bucket_start = _BUCKET_START[resolution]
+    sql = f"""
+        WITH RECURSIVE series AS ({source}),
+        bounds AS (
+            SELECT {bucket_start.format('COALESCE(:start, MIN(bucket))')} AS first_bucket,
+                   {bucket_start.format('COALESCE(:end, MAX(bucket))')} AS last_bucket
+            FROM series
+        ),
+        window_bounds AS (
+            SELECT COALESCE(MAX(first_bucket, date(last_bucket, :window)), date(last_bucket, :window)) AS first_bucket,
+                   last_bucket
+            FROM bounds
+        ),
+        buckets(bucket) AS (
+            SELECT first_bucket FROM window_bounds WHERE first_bucket <= last_bucket
+            UNION ALL
+            SELECT date(b.bucket, :step) FROM buckets b, window_bounds wb WHERE date(b.bucket, :step) <= wb.last_bucket
+        )
+        SELECT b.bucket AS "bucket [date]", COALESCE(s.workouts, 0) AS workouts,
+               COALESCE(s.minutes, 0) AS minutes, COALESCE(s.calories, 0) AS calories
+        FROM buckets b
+        LEFT JOIN series s ON s.bucket = b.bucket
+        ORDER BY b.bucket;
+    """
+    return sql, {
+        'user_id': user_id, 'resolution': resolution, 'start': start, 'end': end, 'step': step,
+        'window': f"-{(max_points - 1) * size} {unit}", 'history': f"-{max_points} days",
+    }
+
+@instrumented
+def get_workout_timeseries(user_id, resolution='week', start=None, end=None, max_points=400, *, as_frame=False):
+    """Aggregates a user's workouts into day/week/month buckets for charting.
+
+    Returns (bucket_start, workouts, minutes, calories) rows with empty buckets
+    filled in with zeros, at most `max_points` of them ending at `end`
+    (default: latest workout), as Backend_fft.get_workout_timeseries does.
+    """
+    sql, params = _timeseries_query(user_id, resolution, start, end, max_points)
+    series = _no_rows(pg._TIMESERIES_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            series = _fetch_all(cur, sql, params, pg._TIMESERIES_COLUMNS, as_frame)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error fetching workout time series", error)
+    return series
+
+_WEEKLY_LEADERBOARD_SQL = """
+    SELECT u.name, p.minutes AS total_minutes
+    FROM (
+        SELECT CAST(:user_id AS INTEGER) AS user_id
+        UNION
+        SELECT user_id_2 FROM friends WHERE user_id_1 = :user_id
+    ) AS members
+    JOIN user_period_rollups p
+      ON p.user_id = members.user_id AND p.period_type = 'week' AND p.period_start = :week
+    JOIN users u ON u.user_id = members.user_id
+    ORDER BY total_minutes DESC, u.name;
+"""
+
+@instrumented
+@_cached('leaderboard')
+def get_weekly_leaderboard(user_id, week_start=None, *, as_frame=False):
+    """Ranks the user and their friends by total workout minutes in a week (default: this week)."""
+    week = pg._week_start(pg._parse_date(week_start or date.today()))
+    leaderboard = _no_rows(pg._LEADERBOARD_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            leaderboard = _fetch_all(
+                cur, _WEEKLY_LEADERBOARD_SQL, {'user_id': user_id, 'week': week}, pg._LEADERBOARD_COLUMNS, as_frame,
+            )
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching leaderboard", error)
+    return leaderboard
+
+def _refresh_global_leaderboard(cur, period_type, period_start):
+    cur.execute(
+        "DELETE FROM global_leaderboard WHERE period_type = ? AND period_start = ?;", (period_type, period_start),
+    )
+    cur.execute("""
+        INSERT INTO global_leaderboard (period_type, period_start, user_id, minutes, rank)
+        SELECT period_type, period_start, user_id, minutes, RANK() OVER (ORDER BY minutes DESC)
+        FROM user_period_rollups
+        WHERE period_type = ? AND period_start = ? AND minutes > 0;
+    """, (period_type, period_start))
+    ranked_users = cur.rowcount
+    cur.execute("""
+        INSERT INTO global_leaderboard_refreshes (period_type, period_start, ranked_users, refreshed_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (period_type, period_start) DO UPDATE SET
+            ranked_users = excluded.ranked_users, refreshed_at = excluded.refreshed_at;
+    """, (period_type, period_start, ranked_users))
+    return ranked_users
+
+@instrumented
+def refresh_global_leaderboard(period_type='week', period_start=None):
+    """Recomputes the site-wide ranking for one week or month (default: the current one).
+
+    Returns the number of ranked users, or None on error.
+    """
+    start = pg._period_start(period_type, pg._parse_date(period_start or date.today()))
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            ranked_users = _refresh_global_leaderboard(cur, period_type, start)
+            conn.commit()
+            return ranked_users
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error refreshing global leaderboard", error)
+    return None
+
+_SNAPSHOT_SQL = """
+    SELECT ranked_users, refreshed_at, refreshed_at < datetime('now', :max_age)
+    FROM global_leaderboard_refreshes
+    WHERE period_type = :period_type AND period_start = :period_start;
+"""
+
+@instrumented
+def get_global_leaderboard(period_type='week', user_id=None, limit=None, period_start=None):
+    """Returns the site-wide top-K for a week or month and, optionally, one user's rank.
+
+    Same result dict as Backend_fft.get_global_leaderboard. A missing or stale
+    snapshot is rebuilt under the database write lock, so concurrent readers
+    rebuild it once.
+    """
+    limit = limit or config.LEADERBOARD_SETTINGS['top_k']
+    refresh_seconds = config.LEADERBOARD_SETTINGS['refresh_seconds']
+    start = pg._period_start(period_type, pg._parse_date(period_start or date.today()))
+    result = {
+        'top': [], 'user_rank': None, 'user_minutes': None, 'ranked_users': 0,
+        'period_start': start, 'refreshed_at': None,
+    }
+    params = {'period_type': period_type, 'period_start': start, 'max_age': f"-{refresh_seconds} seconds"}
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(_SNAPSHOT_SQL, params)
+            snapshot = cur.fetchone()
+            if snapshot is None or (refresh_seconds > 0 and snapshot[2]):
+                _begin(cur)
+                # Another caller may have rebuilt it while we waited for the lock
+                cur.execute(_SNAPSHOT_SQL, params)
+                snapshot = cur.fetchone()
+                if snapshot is None or (refresh_seconds > 0 and snapshot[2]):
+                    _refresh_global_leaderboard(cur, period_type, start)
+                    cur.execute(_SNAPSHOT_SQL, params)
+                    snapshot = cur.fetchone()
+                conn.commit()
+            if snapshot:
+                result['ranked_users'], result['refreshed_at'] = snapshot[0], snapshot[1]
+
+            cur.execute("""
+                SELECT g.rank, u.name, g.minutes
+                FROM global_leaderboard g
+                JOIN users u ON u.user_id = g.user_id
+                WHERE g.period_type = ? AND g.period_start = ? AND g.rank <= ?
+                ORDER BY g.rank, u.name;
+            """, (period_type, start, limit))
+            result['top'] = cur.fetchall()
+
+            if user_id is not None:
+                cur.execute("""
+                    SELECT rank, minutes FROM global_leaderboard
+                    WHERE period_type = ? AND period_start = ? AND user_id = ?;
+                """, (period_type, start, user_id))
+                row = cur.fetchone()
+                if row:
+                    result['user_rank'], result['user_minutes'] = row
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error fetching global leaderboard", error)
+    return result
+
+
+# --- Goal Evaluation ---
+
+# A goal's progress, for a row of `goals g`, archived workouts included. The
+# goal's range is repeated in each branch: SQLite does not push a correlated
+# predicate into a UNION ALL subquery, and would scan both tables otherwise
+_GOAL_WORKOUTS = """
+    SELECT duration_minutes, calories_burned FROM {table}
+    WHERE user_id = g.user_id AND workout_date BETWEEN g.start_date AND g.end_date
+"""
+_GOAL_PROGRESS = f"""
+    (SELECT CASE g.goal_metric
+                WHEN 'minutes' THEN COALESCE(SUM(w.duration_minutes), 0)
+                WHEN 'calories' THEN COALESCE(SUM(w.calories_burned), 0)
+                ELSE COUNT(*)
+            END
+     FROM ({_GOAL_WORKOUTS.format(table='workouts')}
+           UNION ALL
+           {_GOAL_WORKOUTS.format(table='archived_workouts')}) w)
+"""
+
+# A goal's status given its progress, as of :today
+_GOAL_STATUS = """
+    CASE
+        WHEN status <> 'Active' THEN status
+        WHEN target_value > 0 AND progress >= target_value THEN 'Completed'
+        WHEN end_date < :today THEN 'Expired'
+        ELSE 'Active'
+    END
+"""
+
+_GOAL_PROGRESS_SQL = f"""
+    SELECT goal_id, goal_description, goal_metric, target_value, progress,
+           start_date AS "start_date [date]", end_date AS "end_date [date]", {_GOAL_STATUS} AS status
+    FROM (
+        SELECT g.goal_id, g.goal_description, g.goal_metric, g.target_value, {_GOAL_PROGRESS} AS progress,
+               g.start_date, g.end_date, g.status
+        FROM goals g
+        WHERE g.user_id = :user_id
+    )
+    ORDER BY end_date, goal_id;
+"""
+
+@instrumented
+@_cached('goals')
+def get_goal_progress(user_id, *, as_frame=False):
+    """Returns every goal of a user with its current progress, in one query.
+
+    Rows are (goal_id, description, metric, target_value, progress, start_date,
+    end_date, status), soonest deadline first, computed live from the workouts.
+    """
+    goals = _no_rows(pg._GOAL_PROGRESS_COLUMNS, as_frame)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            goals = _fetch_all(
+                cur, _GOAL_PROGRESS_SQL, {'user_id': user_id, 'today': date.today()},
+                pg._GOAL_PROGRESS_COLUMNS, as_frame,
+            )
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching goal progress", error)
+    return goals
+
+# One batch of Active goals after goal_id :after, with old and new progress and status
+_EVALUATE_GOALS_SQL = f"""
+    SELECT goal_id, user_id, old_progress, old_status, progress, {_GOAL_STATUS} AS new_status
+    FROM (
+        SELECT g.goal_id, g.user_id, g.progress AS old_progress, g.status AS old_status, g.status,
+               g.target_value, g.end_date, {_GOAL_PROGRESS} AS progress
+        FROM goals g
+        WHERE g.status = 'Active' AND g.goal_id > :after
+        ORDER BY g.goal_id
+        LIMIT :batch_size
+    );
+"""
+
+@instrumented
+def evaluate_goals(batch_size=None, today=None):
+    """Recomputes progress for every Active goal and marks reached or past-due ones.
+
+    Goals are processed in goal_id order, `batch_size` (default
+    GOAL_SETTINGS['batch_size']) per transaction. Returns counts of goals
+    'evaluated', 'updated', 'completed' and 'expired', or None on error.
+    """
+    batch_size = batch_size or config.GOAL_SETTINGS['batch_size']
+    today = pg._parse_date(today or date.today())
+    totals = {'evaluated': 0, 'updated': 0, 'completed': 0, 'expired': 0}
+    after = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            while True:
+                _begin(cur)
+                cur.execute(_EVALUATE_GOALS_SQL, {'after': after, 'batch_size': batch_size, 'today': today})
+                rows = cur.fetchall()
+                if not rows:
+                    conn.commit()
+                    return totals
+                changed = [row for row in rows if row[2] != row[4] or row[3] != row[5]]
+                cur.executemany(
+                    "UPDATE goals SET progress = ?, status = ?, progress_updated_at = CURRENT_TIMESTAMP "
+                    "WHERE goal_id = ?;",
+                    [(row[4], row[5], row[0]) for row in changed],
+                )
+                conn.commit()
+                if changed:
+                    _cache.invalidate('goals', *{row[1] for row in changed})
+                after = rows[-1][0]
+                totals['evaluated'] += len(rows)
+                totals['updated'] += len(changed)
+                totals['completed'] += sum(1 for row in changed if row[5] == 'Completed')
+                totals['expired'] += sum(1 for row in changed if row[5] == 'Expired')
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error evaluating goals", error)
+    return None
+
+
+# --- Calorie Backfill ---
+# As in Backend_fft: workouts stored without calories are estimated in
+# workout_id order, one write transaction per batch.
+
+_CALORIE_BACKFILL_SQL = """
+    SELECT w.workout_id, w.workout_date, w.user_id, w.duration_minutes, u.weight_kg
+    FROM workouts w
+    JOIN users u ON u.user_id = w.user_id
+    WHERE w.workout_id > :after
+      AND COALESCE(w.calories_burned, 0) = 0 AND NOT w.calories_estimated AND w.duration_minutes > 0
+    ORDER BY w.workout_id
+    LIMIT :batch_size;
+"""
+
+_CALORIE_EXERCISES_SQL = """
+    SELECT e.workout_id, c.normalized_name, e.sets
+    FROM exercises e
+    JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+    WHERE e.workout_id IN (SELECT value FROM json_each(:workout_ids));
+"""
+
+def _apply_calorie_deltas(cur, changes):
+    """Adds the calories of `changes` to the rollup totals and period buckets."""
+    totals, periods = pg._rollup_deltas(changes)
+    cur.executemany(
+        "UPDATE user_workout_rollups SET total_calories = total_calories + ? WHERE user_id = ?;",
+        [(t[2], user_id) for user_id, t in sorted(totals.items())],
+    )
+    cur.executemany(
+        "UPDATE user_period_rollups SET calories = calories + ? "
+        "WHERE user_id = ? AND period_type = ? AND period_start = ?;",
+        [(p[2], *key) for key, p in sorted(periods.items())],
+    )
+
+@instrumented
+def backfill_calories(batch_size=None):
+    """Estimates calories for stored workouts that have none and marks them as estimated.
+
+    Workouts are processed in workout_id order, `batch_size` (default
+    CALORIE_SETTINGS['backfill_batch_size']) per transaction, and rollups are
+    adjusted by the calories added. Returns counts of 'workouts' estimated,
+    'calories' added and 'batches', or None on error.
+    """
+    batch_size = batch_size or config.CALORIE_SETTINGS['backfill_batch_size']
+    totals = {'workouts': 0, 'calories': 0, 'batches': 0}
+    after = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            while True:
+                _begin(cur)
+                batch = columnar.fetch_columns(
+                    cur, _CALORIE_BACKFILL_SQL, {'after': after, 'batch_size': batch_size},
+                    pg._CALORIE_BACKFILL_COLUMNS,
+                )
+                if not len(batch['workout_id']):
+                    conn.commit()
+                    return totals
+                exercises = columnar.fetch_columns(
+                    cur, _CALORIE_EXERCISES_SQL, {'workout_ids': json.dumps(batch['workout_id'].tolist())},
+                    pg._CALORIE_EXERCISE_COLUMNS,
+                )
+                changes = pg._calorie_changes(batch, pg._estimate_stored_calories(batch, exercises))
+                cur.executemany(
+                    "UPDATE workouts SET calories_burned = ?, calories_estimated = 1 WHERE workout_id = ?;",
+                    [(c['calories'], c['workout_id']) for c in changes],
+                )
+                _apply_calorie_deltas(cur, changes)
+                conn.commit()
+                user_ids = sorted({c['user_id'] for c in changes})
+                _cache.invalidate('dashboard', *user_ids)
+                _cache.invalidate('goals', *user_ids)
+                after = changes[-1]['workout_id']
+                totals['workouts'] += len(changes)
+                totals['calories'] += sum(c['calories'] for c in changes)
+                totals['batches'] += 1
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error backfilling calories", error)
+    return None
+
+
+# --- Archival ---
+# As in Backend_fft: old workouts move into the archive tables (schema version
+# 4) a batch of users per write transaction, leaving per-period summaries that
+# rollup rebuilds and checks count alongside the hot tables.
+
+_ARCHIVE_USERS_SQL = """
+    SELECT u.user_id FROM users u
+    WHERE u.user_id > :after
+      AND NOT EXISTS (
+          SELECT 1 FROM archive_restores r
+          WHERE r.user_id = u.user_id AND r.restored_at > datetime('now', :restore_window)
+      )
+    ORDER BY u.user_id
+    LIMIT :batch_users;
+"""
+
+_ARCHIVE_WHERE = "user_id IN (SELECT value FROM json_each(:user_ids)) AND workout_date < :cutoff"
+
+_ARCHIVE_SUMMARIES_SQL = f"""
+    INSERT INTO workout_summaries AS s
+        (user_id, period_type, period_start, workouts, minutes, calories, duration_count, min_duration, max_duration)
+    SELECT user_id, period_type, period_start, COUNT(*),
+           COALESCE(SUM(duration_minutes), 0), COALESCE(SUM(calories_burned), 0),
+           COUNT(duration_minutes), MIN(duration_minutes), MAX(duration_minutes)
+    FROM ({_WORKOUT_PERIODS_SQL.format(where="WHERE " + _ARCHIVE_WHERE)})
+    GROUP BY user_id, period_type, period_start
+    ON CONFLICT (user_id, period_type, period_start) DO UPDATE SET
+        workouts = s.workouts + excluded.workouts,
+        minutes = s.minutes + excluded.minutes,
+        calories = s.calories + excluded.calories,
+        duration_count = s.duration_count + excluded.duration_count,
+        min_duration = COALESCE(MIN(s.min_duration, excluded.min_duration), s.min_duration, excluded.min_duration),
+        max_duration = COALESCE(MAX(s.max_duration, excluded.max_duration), s.max_duration, excluded.max_duration);
+"""
+
+def _archive_batch(cur, params):
+    # The ids of archived rows must never be handed out again: restoring puts them back
+    _sync_sequence(cur, "workouts", "workout_id")
+    _sync_sequence(cur, "exercises", "exercise_id")
+    # Summaries first: they are computed from the rows about to be moved
+    cur.execute(_ARCHIVE_SUMMARIES_SQL, params)
+    cur.execute(f"""
+        INSERT INTO archived_workouts
+            (user_id, workout_date, workout_id, duration_minutes, calories_burned, calories_estimated, created_at)
+        SELECT user_id, workout_date, workout_id, duration_minutes, calories_burned, calories_estimated, created_at
+        FROM workouts WHERE {_ARCHIVE_WHERE};
+    """, params)
+    workouts = cur.rowcount
+    cur.execute(f"""
+        INSERT INTO archived_exercises
+            (user_id, workout_id, exercise_id, workout_date, catalog_id, sets, reps, weight_kg)
+        SELECT user_id, workout_id, exercise_id, workout_date, catalog_id, sets, reps, weight_kg
+        FROM exercises WHERE {_ARCHIVE_WHERE};
+    """, params)
+    exercises = cur.rowcount
+    cur.execute(f"SELECT COUNT(DISTINCT user_id) FROM workouts WHERE {_ARCHIVE_WHERE};", params)
+    users = cur.fetchone()[0]
+    cur.execute(f"DELETE FROM exercises WHERE {_ARCHIVE_WHERE};", params)
+    cur.execute(f"DELETE FROM workouts WHERE {_ARCHIVE_WHERE};", params)
+    return workouts, exercises, users
+
+@instrumented
+def archive_workouts(horizon_months=None, batch_users=None, today=None):
+    """Moves workouts from before the archive horizon, and their exercises, into the archive tables.
+
+    Same arguments and result as Backend_fft.archive_workouts.
+    """
+    settings = config.ARCHIVE_SETTINGS
+    horizon_months = settings['horizon_months'] if horizon_months is None else horizon_months
+    batch_users = batch_users or settings['batch_users']
+    cutoff = pg._archive_cutoff(horizon_months, pg._parse_date(today or date.today()))
+    totals = {'workouts': 0, 'exercises': 0, 'users': 0}
+    after = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            while True:
+                _begin(cur)
+                cur.execute(_ARCHIVE_USERS_SQL, {
+                    'after': after, 'batch_users': batch_users,
+                    'restore_window': f"-{int(settings['restore_days'])} days",
+                })
+                user_ids = [row[0] for row in cur.fetchall()]
+                if not user_ids:
+                    conn.commit()
+                    break
+                counts = _archive_batch(cur, {'user_ids': json.dumps(user_ids), 'cutoff': cutoff})
+                for key, count in zip(totals, counts):
+                    totals[key] += count
+                conn.commit()
+                after = user_ids[-1]
+        _cache.invalidate('exercises')
+        return totals
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error archiving workouts", error)
+    return None
+
+@instrumented
+def restore_archived_workouts(user_id):
+    """Moves a user's archived workouts and exercises back into the workouts tables.
+
+    Returns the number of workouts restored, or None on error.
+    """
+    params = {'user_id': user_id}
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            _begin(cur)
+            cur.execute("""
+                INSERT INTO workouts
+                    (workout_id, user_id, workout_date, duration_minutes, calories_burned, calories_estimated, created_at)
+                SELECT workout_id, user_id, workout_date, duration_minutes, calories_burned, calories_estimated, created_at
+                FROM archived_workouts WHERE user_id = :user_id;
+            """, params)
+            restored = cur.rowcount
+            if not restored:
+                conn.rollback()
+                return 0
+            cur.execute("""
+                INSERT INTO exercises (exercise_id, workout_id, workout_date, user_id, catalog_id, sets, reps, weight_kg)
+                SELECT exercise_id, workout_id, workout_date, user_id, catalog_id, sets, reps, weight_kg
+                FROM archived_exercises WHERE user_id = :user_id;
+            """, params)
+            cur.execute("DELETE FROM archived_exercises WHERE user_id = :user_id;", params)
+            cur.execute("DELETE FROM archived_workouts WHERE user_id = :user_id;", params)
+            cur.execute("DELETE FROM workout_summaries WHERE user_id = :user_id;", params)
+            cur.execute("""
+                INSERT INTO archive_restores (user_id, restored_at) VALUES (:user_id, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE SET restored_at = excluded.restored_at;
+            """, params)
+            conn.commit()
+        _cache.invalidate('exercises', user_id)
+        return restored
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error restoring archived workouts", error)
+    return None
+
+@instrumented
+def get_archive_summary(user_id):
+    """Returns how much of a user's history is archived (see Backend_fft.get_archive_summary)."""
+    summary = pg._archive_summary((0, None, None))
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT COALESCE(SUM(workouts), 0), MIN(period_start) AS "first_month [date]",
+                       MAX(period_start) AS "last_month [date]"
+                FROM workout_summaries
+                WHERE user_id = ? AND period_type = 'month';
+            """, (user_id,))
+            summary = pg._archive_summary(cur.fetchone())
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error fetching archive summary", error)
+    return summary
+
+
+# --- Bulk Ingestion ---
+
+def _bulk_insert_batch(conn, batch, report):
+    """Loads one batch in its own transaction, isolating bad rows on failure."""
+    try:
+        with conn.cursor() as cur:
+            _insert_workouts(cur, [w for _, w in batch])
+        conn.commit()
+        _invalidate_workout_reads(*{w['user_id'] for _, w in batch})
+        report['workouts_inserted'] += len(batch)
+        report['exercises_inserted'] += sum(len(w['exercises']) for _, w in batch)
+        return
+    except sqlite3.DatabaseError:
+        conn.rollback()
+
+    # The batch was rejected as a whole (e.g. an unknown user_id). Retry it row by
+    # row under savepoints so the valid rows still commit together.
+    with conn.cursor() as cur:
+        _begin(cur)
+        for index, workout in batch:
+            cur.execute("SAVEPOINT bulk_row;")
+            try:
+                _insert_workouts(cur, [workout])
+                cur.execute("RELEASE SAVEPOINT bulk_row;")
+                report['workouts_inserted'] += 1
+                report['exercises_inserted'] += len(workout['exercises'])
+            except sqlite3.DatabaseError as error:
+                cur.execute("ROLLBACK TO SAVEPOINT bulk_row;")
+                cur.execute("RELEASE SAVEPOINT bulk_row;")
+                report['rejected'].append({'index': index, 'error': str(error)})
+    conn.commit()
+    _invalidate_workout_reads(*{w['user_id'] for _, w in batch})
+
+@instrumented
+def bulk_log_workouts(records, batch_size=1000, on_batch=None):
+    """Loads many workouts (with their exercises) from any iterable of dicts.
+
+    Same records and report as Backend_fft.bulk_log_workouts; each batch is
+    one transaction of multi-row inserts.
+    """
+    return pg._bulk_load(sys.modules[__name__], records, batch_size, on_batch)
+
+
+# --- Export ---
+# Same layout as Backend_fft.export_workouts; rows are read EXPORT_CHUNK_ROWS at
+# a time and written as CSV text or Parquet row groups.
+
+def _export_query(user_id):
+    # Returns (sql, params) for one user's workouts, or everyone's when user_id is None;
+    # archived workouts are exported along with the hot ones
+    where = "WHERE w.user_id = :user_id" if user_id is not None else ""
+    return f"""
+        SELECT workout_ref, user_id, workout_date AS "workout_date [date]", duration_minutes, calories_burned,
+               exercise_name, sets, reps, weight_kg
+        FROM (
+            SELECT w.workout_id AS workout_ref, w.user_id, w.workout_date, w.duration_minutes, w.calories_burned,
+                   c.name AS exercise_name, e.sets, e.reps, e.weight_kg, e.exercise_id
+            FROM workouts w
+            LEFT JOIN exercises e ON e.workout_id = w.workout_id
+            LEFT JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+            {where}
+            UNION ALL
+            SELECT w.workout_id, w.user_id, w.workout_date, w.duration_minutes, w.calories_burned,
+                   c.name, e.sets, e.reps, e.weight_kg, e.exercise_id
+            FROM archived_workouts w
+            LEFT JOIN archived_exercises e ON e.user_id = w.user_id AND e.workout_id = w.workout_id
+            LEFT JOIN exercise_catalog c ON c.catalog_id = e.catalog_id
+            {where}
+        )
+        ORDER BY user_id, workout_date, workout_ref, exercise_id
+    """, {'user_id': user_id}
+
+@instrumented
+def export_workouts(out, fmt='csv', user_id=None, on_progress=None, progress_every=EXPORT_CHUNK_ROWS):
+    """Streams one user's (or, with user_id=None, everyone's) workouts and exercises to a file.
+
+    Same arguments and report as Backend_fft.export_workouts.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"fmt must be one of {', '.join(EXPORT_FORMATS)}")
+    if fmt == 'parquet' and pg.pa is None:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    report = {'rows': 0, 'bytes': 0, 'elapsed_seconds': 0.0, 'rows_per_second': 0.0, 'mb_per_second': 0.0}
+    started = time.perf_counter()
+    next_report = progress_every
+    sink = pg._CountingWriter(out)
+
+    def update(rows):
+        nonlocal next_report
+        report['rows'], report['bytes'] = rows, sink.bytes
+        report['elapsed_seconds'] = time.perf_counter() - started
+        if report['elapsed_seconds']:
+            report['rows_per_second'] = report['rows'] / report['elapsed_seconds']
+            report['mb_per_second'] = report['bytes'] / report['elapsed_seconds'] / 1e6
+        if on_progress and rows >= next_report:
+            next_report = rows + progress_every
+            on_progress(report)
+
+    sql, params = _export_query(user_id)
+    rows = 0
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+            if fmt == 'csv':
+                text = io.StringIO()
+                writer = csv.writer(text, lineterminator="\n")
+                writer.writerow(pg._EXPORT_COLUMNS)
+                while True:
+                    chunk = cur.fetchmany(EXPORT_CHUNK_ROWS)
+                    writer.writerows(chunk)
+                    sink.write(text.getvalue().encode())
+                    text.seek(0)
+                    text.truncate()
+                    if not chunk:
+                        break
+                    rows += len(chunk)
+                    update(rows)
+            else:
+                schema = pg._parquet_schema()
+                with pg.pq.ParquetWriter(sink, schema) as parquet:
+                    for chunk in columnar.iter_chunks(cur, pg._EXPORT_COLUMNS, EXPORT_CHUNK_ROWS):
+                        arrays = [
+                            pg.pa.array(chunk[field.name], from_pandas=True).cast(field.type) for field in schema
+                        ]
+                        parquet.write_batch(pg.pa.RecordBatch.from_arrays(arrays, schema=schema))
+                        rows += len(chunk['workout_ref'])
+                        update(rows)
+        update(rows)
+        return report
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error exporting workouts", error)
+    return None
+
+
+# --- Page Bundles ---
+# The page loaders of page_bundles.py, returning the same dataclasses. There is
+# no network round trip to save, so each bundle runs the engine's own queries,
+# inside one read transaction so all sections come from the same snapshot.
+
+def _workout(row, exercises):
+    return pb.Workout(row[0], row[1], row[2], row[3], [pb.Exercise(*ex) for ex in exercises[row[0]]])
+
+@instrumented
+@_cached('insights_page')
+def get_insights_bundle(user_id):
+    """Loads everything show_fitness_insights displays; returns an InsightsBundle."""
+    today = date.today()
+    params = pg._dashboard_params(user_id)
+    activity_params = pg._activity_params(user_id, pg.ACTIVITY_CALENDAR_DAYS, today)
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("BEGIN;")
+            cur.execute(_DASHBOARD_SQL, params)
+            stats = pg._dashboard_stats(cur.fetchone())
+            cur.execute("""
+                SELECT workout_id, workout_date, duration_minutes, calories_burned
+                FROM workouts
+                WHERE user_id = :user_id AND workout_date >= :week AND workout_date < date(:week, '+7 days')
+                ORDER BY workout_date DESC, workout_id DESC;
+            """, params)
+            week = cur.fetchall()
+            cur.execute(_USER_WORKOUTS_SQL, (user_id, 1))
+            latest = cur.fetchone()
+            exercises = _workout_exercises(cur, {row[0] for row in week} | ({latest[0]} if latest else set()))
+            cur.execute(_PERSONAL_RECORDS_SQL, params)
+            records = cur.fetchall()
+            cur.execute(_ACTIVITY_SQL, activity_params)
+            activity = pg._activity_summary(cur.fetchall(), pg.ACTIVITY_CALENDAR_DAYS, today)
+        return pb.InsightsBundle(
+            stats=pb.DashboardStats(**stats),
+            week_workouts=[_workout(row, exercises) for row in week],
+            latest_workout=_workout(latest, exercises) if latest else None,
+            records=[pb.PersonalRecord(*row) for row in records],
+            activity=pb.ActivitySummary(**activity),
+        )
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching insights page data", error)
+    return pb.InsightsBundle()
+
+@instrumented
+@_cached('history_page')
+def get_history_bundle(user_id, resolution='week', page_size=20, before=None):
+    """Loads a page of workout history and (first page only) the progress chart; returns a HistoryBundle."""
+    chart_sql, chart_params = _timeseries_query(user_id, resolution, None, None, 400)
+    series = []
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("BEGIN;")
+            rows = _history_rows(cur, user_id, page_size, before)
+            if not before:
+                cur.execute(chart_sql, chart_params)
+                series = cur.fetchall()
+        return pb._history_bundle(rows, page_size, series)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching history page data", error)
+    return pb.HistoryBundle()
+
+@instrumented
+@_cached('social_page')
+def get_social_bundle(user_id, week_start=None, period_type='week'):
+    """Loads the friends list, suggestions and both leaderboards; returns a SocialBundle."""
+    week = pg._week_start(pg._parse_date(week_start or date.today()))
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("BEGIN;")
+            cur.execute(_FRIENDS_SQL, {'user_id': user_id})
+            friends = cur.fetchall()
+            cur.execute(_SUGGESTIONS_SQL, {'user_id': user_id, 'limit': 10, 'fanout': SUGGESTION_FANOUT})
+            suggestions = cur.fetchall()
+            cur.execute(_WEEKLY_LEADERBOARD_SQL, {'user_id': user_id, 'week': week})
+            weekly = cur.fetchall()
+            conn.rollback()
+        # Refreshes a missing or stale snapshot first
+        board = get_global_leaderboard(period_type, user_id=user_id)
+        return pb._social_bundle(friends, suggestions, weekly, board)
+    except (Exception, sqlite3.DatabaseError) as error:
+        _cache.do_not_cache()
+        _report_error("Error fetching social page data", error)
+    return pb.SocialBundle()
+
+
+# --- Initial Data Seeding (for demonstration) ---
+def seed_data():
+    """Adds some initial data to the database for demonstration purposes."""
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM users);")
+            has_users = cur.fetchone()[0]
+    except (Exception, sqlite3.DatabaseError) as error:
+        _report_error("Error checking for existing users", error)
+        return
+    if not has_users:
+        print("Seeding initial data...")
+        u1 = add_user("Alice", "alice@email.com", 60.5, 165)
+        u2 = add_user("Bob", "bob@email.com", 85.0, 180)
+        u3 = add_user("Charlie", "charlie@email.com", 72.3, 175)
+        add_friend(u1, u2)
+        add_friend(u1, u3)
+        today = date.today()
+        log_workout(u1, today - pg.timedelta(days=1), 60, 300, [{'name': 'Squat', 'sets': 3, 'reps': 10, 'weight': 50}])
+        log_workout(u1, today - pg.timedelta(days=3), 45, 250,
+                    [{'name': 'Bench Press', 'sets': 3, 'reps': 8, 'weight': 60}])
+        log_workout(u2, today - pg.timedelta(days=2), 90, 500, [{'name': 'Deadlift', 'sets': 5, 'reps': 5, 'weight': 120}])
+        log_workout(u3, today, 75, 400, [{'name': 'Running', 'sets': 1, 'reps': 1, 'weight': 0}])
+        set_goal(u1, "Workout 3 times this week", 3, today - pg.timedelta(days=today.weekday()),
+                 today + pg.timedelta(days=6 - today.weekday()))
+        print("Seeding complete.")
+
+
+if __name__ == "__main__":
+    bootstrap()
@@ -0,0 +1,69 @@
+# storage.py
+#
+# Selects the storage engine behind the backend API. An engine is a module
+# exposing every name in API (and the page loaders in BUNDLE_API) with the same
+# signatures and result shapes, so callers do
+#
+#   be = storage.backend()
+#   pb = storage.bundles()
+#
+# and run unchanged on PostgreSQL (Backend_fft and page_bundles) or on the
+# embedded SQLite engine (sqlite_backend). The engine is chosen by
+# config.STORAGE_SETTINGS['engine'] (FITNESS_STORAGE_ENGINE).
+
+import importlib
+
+import config
+
+# engine name -> (backend module, page bundle module)
+ENGINES = {
+    'postgres': ('Backend_fft', 'page_bundles'),
+    'sqlite': ('sqlite_backend', 'sqlite_backend'),
+}
+
+# Everything callers may use from a backend module
+API = (
+    # Connections, cache and instrumentation
+    'db_connection', 'get_pool_stats', 'close_pool', 'get_cache_stats', 'clear_cache',
+    'get_metrics_text', 'get_query_stats', 'page_scope',
+    # Schema
+    'ensure_schema', 'create_tables', 'get_pending_migrations', 'create_partitions', 'bootstrap', 'seed_data',
+    # Writes
+    'add_user', 'log_workout', 'flush_workout_writes', 'get_write_queue_stats', 'add_friend', 'set_goal',
+    'update_user_profile', 'delete_workout', 'remove_friend', 'add_exercise_alias', 'bulk_log_workouts',
+    # Reads
+    'get_all_users', 'get_user_profile', 'get_user_workouts', 'get_workout_details', 'get_workout_history_page',
+    'get_user_exercises', 'get_exercise_history', 'get_user_friends', 'search_users', 'get_friend_suggestions',
+    'get_user_goals', 'get_goal_progress', 'get_personal_records', 'get_user_dashboard_stats',
+    'get_workout_timeseries', 'get_weekly_leaderboard', 'get_global_leaderboard', 'get_activity_summary',
+    # Maintenance
+    'rebuild_rollups', 'check_rollups', 'rebuild_personal_records', 'refresh_global_leaderboard',
+    'evaluate_goals', 'estimated_one_rep_max', 'backfill_calories', 'archive_workouts',
+    'restore_archived_workouts', 'get_archive_summary',
+    # Export
+    'EXPORT_FORMATS', 'available_export_formats', 'export_workouts',
+)
+
+BUNDLE_API = ('get_insights_bundle', 'get_history_bundle', 'get_social_bundle')
+
+def engine_name(engine=None):
+    """Returns the configured engine name (or `engine`), checked against ENGINES."""
+    engine = (engine or config.STORAGE_SETTINGS['engine']).lower()
+    if engine not in ENGINES:
+        raise ValueError(f"storage engine must be one of {', '.join(ENGINES)}, not {engine!r}")
+    return engine
+
+def _load(module_name, names):
+    module = importlib.import_module(module_name)
+    missing = [name for name in names if not hasattr(module, name)]
+    if missing:
+        raise NotImplementedError(f"{module_name} does not implement {', '.join(missing)}")
+    return module
+
+def backend(engine=None):
+    """Returns the backend module of the configured (or given) storage engine."""
+    return _load(ENGINES[engine_name(engine)][0], API)
+
+def bundles(engine=None):
+    """Returns the module with the page loaders (get_insights_bundle, ...) of the storage engine."""
+    return _load(ENGINES[engine_name(engine)][1], BUNDLE_API)
@@ -0,0 +1,61 @@
+# conftest.py
+#
+# Every test gets an empty database. The embedded SQLite engine needs no
+# server, so its tests always run, each on a fresh file. PostgreSQL tests run
+# against the scratch database named by FITNESS_TEST_DB_NAME (its tables are
+# emptied before each test) and are skipped when it is not set.
+#
+#   python -m pytest tests
+#   FITNESS_TEST_DB_NAME=fitness_test python -m pytest tests
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+
+# Emptied before each PostgreSQL test; the rest of the app's tables reference
+# these and are emptied along with them
+_PG_TABLES = "users, exercise_catalog, global_leaderboard_refreshes"
+
+
+@pytest.fixture
+def sqlite_be(tmp_path, monkeypatch):
+    """The SQLite engine on a new database file."""
+    import sqlite_backend
+    monkeypatch.setitem(config.SQLITE_SETTINGS, "path", str(tmp_path / "fitness.db"))
+    monkeypatch.setattr(sqlite_backend, "_schema_ready", False)
+    sqlite_backend.close_pool()
+    sqlite_backend.clear_cache()
+    assert sqlite_backend.ensure_schema()
+    yield sqlite_backend
+    sqlite_backend.close_pool()
+    sqlite_backend.clear_cache()
+
+
+@pytest.fixture
+def pg_be(monkeypatch):
+    """The PostgreSQL engine on the emptied FITNESS_TEST_DB_NAME database."""
+    dbname = os.environ.get("FITNESS_TEST_DB_NAME")
+    if not dbname:
+        pytest.skip("FITNESS_TEST_DB_NAME is not set")
+    import Backend_fft
+    monkeypatch.setitem(config.DB_SETTINGS, "dbname", dbname)
+    Backend_fft.close_pool()
+    Backend_fft.clear_cache()
+    assert Backend_fft.ensure_schema()
+    with Backend_fft.db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {_PG_TABLES} RESTART IDENTITY CASCADE;")
+        conn.commit()
+    yield Backend_fft
+    Backend_fft.close_pool()
+    Backend_fft.clear_cache()
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def be(request):
+    """Each storage engine in turn (see storage.ENGINES)."""
+    return request.getfixturevalue("sqlite_be" if request.param == "sqlite" else "pg_be")
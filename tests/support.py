@@ -0,0 +1,84 @@
+# support.py
+#
+# Helpers shared by the tests: seeding users and workouts, and reading the
+# derived tables (rollups, records, activity) in an engine-neutral form so an
+# incrementally maintained state can be compared with a rebuild, or one engine
+# with the other.
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+EXERCISES = ["Bench Press", "Squat", "Deadlift", "Overhead Press", "Running", "Yoga"]
+
+# Derived tables and the columns that order their rows
+DERIVED_TABLES = {
+    "user_workout_rollups": "user_id",
+    "user_period_rollups": "user_id, period_type, period_start",
+    "personal_records": "user_id, catalog_id",
+    "user_activity_years": "user_id, year",
+    "user_streaks": "user_id",
+}
+
+
+def add_users(be, count):
+    """Adds `count` users and returns their ids."""
+    user_ids = [be.add_user(f"User {i}", f"user{i}@test.example", 60 + i, 175) for i in range(count)]
+    assert None not in user_ids
+    return user_ids
+
+
+def random_exercises(rng):
+    return [
+        {"name": rng.choice(EXERCISES), "sets": rng.randint(1, 5), "reps": rng.randint(1, 12),
+         "weight": rng.choice([None, 0, rng.randint(20, 200) / 2])}
+        for _ in range(rng.randint(0, 3))
+    ]
+
+
+def log_random_workout(be, rng, user_id, day):
+    workout_id = be.log_workout(user_id, day, rng.choice([None, rng.randint(10, 120)]),
+                                rng.choice([0, rng.randint(100, 900)]), random_exercises(rng))
+    assert workout_id is not None
+    return workout_id
+
+
+def random_day(rng, today=None, days=900):
+    return (today or date.today()) - timedelta(days=rng.randint(0, days))
+
+
+def plain_value(value):
+    """Converts engine-specific values (Decimal, memoryview) to float and bytes."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, memoryview):
+        return bytes(value)
+    return value
+
+
+def snapshot(be, tables=DERIVED_TABLES):
+    """Returns {table: [row, ...]} for the derived tables, with engine-specific types normalized."""
+    rows = {}
+    with be.db_connection() as conn, conn.cursor() as cur:
+        for table, order in tables.items():
+            cur.execute(f"SELECT * FROM {table} ORDER BY {order};")
+            rows[table] = [tuple(plain_value(value) for value in row) for row in cur.fetchall()]
+        conn.rollback()
+    return rows
+
+
+def assert_matches_rebuild(be):
+    """Asserts the incrementally maintained tables equal a rebuild from the workouts.
+
+    Whole row sets are compared, so a row the rebuild would not write (e.g. a
+    zeroed rollup left by deleting a user's last workout) fails the assertion.
+    """
+    before = snapshot(be)
+    assert be.rebuild_rollups()
+    assert be.rebuild_personal_records() is not None
+    after = snapshot(be)
+    for table in DERIVED_TABLES:
+        extra = [row for row in before[table] if row not in after[table]]
+        missing = [row for row in after[table] if row not in before[table]]
+        assert (extra, missing) == ([], []), f"{table}: rows not in the rebuild {extra}, rebuilt rows missing {missing}"
+        assert before[table] == after[table], table
+    assert be.check_rollups() == []
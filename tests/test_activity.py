@@ -0,0 +1,91 @@
+import random
+from datetime import date, timedelta
+
+from support import add_users, assert_matches_rebuild, log_random_workout, random_day, snapshot
+
+TODAY = date.today()
+
+
+def _log(be, user_id, days_ago):
+    workout_id = be.log_workout(user_id, TODAY - timedelta(days=days_ago), 30, 200, [])
+    assert workout_id is not None
+    return workout_id
+
+
+def _streaks(be, user_id):
+    summary = be.get_activity_summary(user_id, days=7)
+    return summary['current_streak'], summary['longest_streak']
+
+
+def test_backdated_workouts_join_streaks(be):
+    (user,) = add_users(be, 1)
+    for days_ago in (0, 1, 3, 4, 5):
+        _log(be, user, days_ago)
+    assert _streaks(be, user) == (2, 3)
+    # Filling the gap joins both runs
+    _log(be, user, 2)
+    assert _streaks(be, user) == (6, 6)
+    assert_matches_rebuild(be)
+
+
+def test_deleting_a_days_last_workout_splits_the_streak(be):
+    (user,) = add_users(be, 1)
+    ids = {days_ago: _log(be, user, days_ago) for days_ago in range(5)}
+    extra = _log(be, user, 2)
+    assert be.delete_workout(ids[2])
+    # Another workout still fills the day
+    assert _streaks(be, user) == (5, 5)
+    assert be.delete_workout(extra)
+    assert _streaks(be, user) == (2, 2)
+    summary = be.get_activity_summary(user, days=3)
+    assert summary['calendar'] == [(TODAY - timedelta(days=2), 0), (TODAY - timedelta(days=1), 1), (TODAY, 1)]
+    assert_matches_rebuild(be)
+
+
+def test_calendar_counts_workouts_per_day(be):
+    (user,) = add_users(be, 1)
+    for _ in range(3):
+        _log(be, user, 1)
+    summary = be.get_activity_summary(user, days=2)
+    assert summary['calendar'] == [(TODAY - timedelta(days=1), 3), (TODAY, 0)]
+    # Yesterday still counts towards the current streak
+    assert summary['current_streak'] == 1
+    assert summary['last_active_date'] == TODAY - timedelta(days=1)
+
+
+def test_year_emptied_by_deletes_is_dropped(be):
+    (user,) = add_users(be, 1)
+    old = _log(be, user, 800)
+    _log(be, user, 0)
+    assert len(snapshot(be)['user_activity_years']) == 2
+    assert be.delete_workout(old)
+    assert [row[1] for row in snapshot(be)['user_activity_years']] == [TODAY.year]
+    assert_matches_rebuild(be)
+
+
+def test_deleting_the_only_workout_drops_the_streak(be):
+    (user,) = add_users(be, 1)
+    only = _log(be, user, 3)
+    assert be.delete_workout(only)
+    rows = snapshot(be)
+    assert (rows['user_streaks'], rows['user_activity_years']) == ([], [])
+    assert _streaks(be, user) == (0, 0)
+    assert_matches_rebuild(be)
+    # Logging again starts from scratch
+    _log(be, user, 0)
+    assert _streaks(be, user) == (1, 1)
+    assert_matches_rebuild(be)
+
+
+def test_random_logs_and_deletes_match_rebuild(be):
+    rng = random.Random(23)
+    users = add_users(be, 3)
+    workout_ids = []
+    for step in range(150):
+        if rng.random() < 0.65 or not workout_ids:
+            workout_ids.append(log_random_workout(be, rng, rng.choice(users), random_day(rng, days=60)))
+        else:
+            assert be.delete_workout(workout_ids.pop(rng.randrange(len(workout_ids))))
+        if step % 25 == 24:
+            assert_matches_rebuild(be)
+    assert_matches_rebuild(be)
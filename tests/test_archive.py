@@ -0,0 +1,94 @@
+import random
+from datetime import date, timedelta
+
+from support import add_users, assert_matches_rebuild, log_random_workout, random_day, snapshot
+
+SQUAT = [{"name": "Squat", "sets": 3, "reps": 5, "weight": 100}]
+
+
+def _workout_count(be, table):
+    with be.db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {table};")
+        count = cur.fetchone()[0]
+        conn.rollback()
+    return count
+
+
+def test_archive_keeps_rollups_and_restore_brings_workouts_back(be):
+    user, other = add_users(be, 2)
+    old = date.today() - timedelta(days=800)
+    for offset in range(5):
+        assert be.log_workout(user, old + timedelta(days=offset), 30, 200, SQUAT)
+    assert be.log_workout(user, date.today(), 45, 300, SQUAT)
+    assert be.log_workout(other, date.today(), 20, 100, [])
+    before = snapshot(be)
+
+    assert be.archive_workouts(horizon_months=12) == {'workouts': 5, 'exercises': 5, 'users': 1}
+    assert be.get_archive_summary(user)['workouts'] == 5
+    assert snapshot(be) == before
+    assert_matches_rebuild(be)
+
+    assert be.restore_archived_workouts(user) == 5
+    assert be.get_archive_summary(user)['workouts'] == 0
+    assert _workout_count(be, "workouts") == 7
+    assert snapshot(be) == before
+    assert_matches_rebuild(be)
+    # Restored users are left alone for a while
+    assert be.archive_workouts(horizon_months=12)['workouts'] == 0
+
+
+def test_goals_and_day_charts_include_archived_workouts(be):
+    (user,) = add_users(be, 1)
+    old = date.today() - timedelta(days=800)
+    for offset in range(4):
+        assert be.log_workout(user, old + timedelta(days=offset), 30, 200, SQUAT)
+    be.set_goal(user, "Old month", 3, old, old + timedelta(days=30))
+    be.set_goal(user, "Across the horizon", 1000, old, date.today(), metric='minutes')
+    assert be.log_workout(user, date.today(), 45, 300, SQUAT)
+    end = old + timedelta(days=10)
+    goals = be.get_goal_progress(user)
+    days = be.get_workout_timeseries(user, 'day', start=old, end=end)
+    assert [goal[4] for goal in goals] == [4, 165]
+
+    assert be.archive_workouts(horizon_months=12)['workouts'] == 4
+    be.clear_cache()
+    assert be.get_goal_progress(user) == goals
+    assert be.get_workout_timeseries(user, 'day', start=old, end=end) == days
+    assert be.evaluate_goals()['completed'] == 1
+
+
+def test_restore_after_new_workouts_reuses_no_ids(be):
+    user, other = add_users(be, 2)
+    assert be.log_workout(other, date.today(), 30, 200, SQUAT * 2)
+    # Backdated last, so the archived workouts and exercises hold the highest ids
+    old = date.today() - timedelta(days=800)
+    archived_ids = [be.log_workout(user, old + timedelta(days=offset), 30, 200, SQUAT * 3) for offset in range(3)]
+    assert be.archive_workouts(horizon_months=12)['workouts'] == 3
+
+    new_ids = [be.log_workout(other, date.today(), 30, 200, SQUAT * 3) for _ in range(3)]
+    assert not set(new_ids) & set(archived_ids)
+
+    assert be.restore_archived_workouts(user) == 3
+    assert _workout_count(be, "workouts") == 7
+    assert _workout_count(be, "exercises") == 20
+    assert_matches_rebuild(be)
+
+
+def test_random_log_delete_archive_restore_matches_rebuild(be):
+    rng = random.Random(25)
+    users = add_users(be, 4)
+    workout_ids = []
+    for step in range(120):
+        action = rng.random()
+        if action < 0.6 or not workout_ids:
+            workout_ids.append(log_random_workout(be, rng, rng.choice(users), random_day(rng)))
+        elif action < 0.8:
+            # Archived workouts are not found, and stay archived
+            be.delete_workout(workout_ids.pop(rng.randrange(len(workout_ids))))
+        elif action < 0.9:
+            assert be.archive_workouts(horizon_months=rng.choice([6, 12, 24])) is not None
+        else:
+            assert be.restore_archived_workouts(rng.choice(users)) is not None
+        if step % 20 == 19:
+            assert_matches_rebuild(be)
+    assert_matches_rebuild(be)
@@ -0,0 +1,52 @@
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+import async_backend as ab
+import storage
+from support import add_users
+
+SQUAT = [{"name": "Squat", "sets": 3, "reps": 5, "weight": 100}]
+
+
+@pytest.fixture
+def seeded(be):
+    user, friend = add_users(be, 2)
+    be.add_friend(user, friend)
+    for offset in range(3):
+        assert be.log_workout(user, date.today() - timedelta(days=offset), 30 + offset, 200, SQUAT)
+    yield be, user
+    ab.close_pool()
+
+
+def test_gather_reads_matches_sequential_reads(seeded):
+    be, user = seeded
+    pb = storage.bundles('sqlite' if be.__name__ == 'sqlite_backend' else 'postgres')
+    calls = [
+        (pb.get_history_bundle, user, 'week', 2), (be.get_user_exercises, user), (be.get_archive_summary, user),
+        (be.get_user_dashboard_stats, user), (be.get_user_workouts, user, 2), (be.get_user_friends, user),
+    ]
+    gathered = ab.gather_reads(*calls)
+    be.clear_cache()
+    assert gathered == [func(*args) for func, *args in calls]
+
+
+def test_async_reads_match_backend_fft(pg_be):
+    if not ab.available():
+        pytest.skip("asyncpg is not installed")
+    be = pg_be
+    (user,) = add_users(be, 1)
+    for offset in range(3):
+        assert be.log_workout(user, date.today() - timedelta(days=offset), None if offset else 30, 200, SQUAT)
+    try:
+        for name, args in [('get_user_workouts', (user,)), ('get_user_exercises', (user,)),
+                           ('get_workout_timeseries', (user, 'day'))]:
+            async_read = ab.ASYNC_READS[name]
+            rows, frame = ab.run(async_read(*args), async_read(*args, as_frame=True))
+            be.clear_cache()
+            assert rows == getattr(be, name)(*args), name
+            pd.testing.assert_frame_equal(frame, getattr(be, name)(*args, as_frame=True), check_dtype=True)
+        assert ab.run(ab.get_archive_summary(user)) == [be.get_archive_summary(user)]
+    finally:
+        ab.close_pool()
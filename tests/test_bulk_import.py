@@ -0,0 +1,98 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+
+import bulk_import
+from support import add_users, assert_matches_rebuild
+
+DAY = (date.today() - timedelta(days=3)).isoformat()
+
+
+@pytest.fixture
+def importer(be, monkeypatch):
+    """bulk_import.main running against the engine under test."""
+    monkeypatch.setattr(bulk_import, "be", be)
+    return bulk_import.main
+
+
+def _workout(user_id, **fields):
+    return dict({"user_id": user_id, "workout_date": DAY, "duration": 30, "calories": 200,
+                 "exercises": [{"name": "Squat", "sets": 3, "reps": 5, "weight": 100}]}, **fields)
+
+
+def _user_workouts(be, user_id):
+    return len(be.get_user_workouts(user_id))
+
+
+def test_jsonl_rejects_are_reported_and_the_rest_loaded(be, importer, tmp_path, capsys):
+    (user,) = add_users(be, 1)
+    lines = [
+        json.dumps(_workout(user)),
+        "{not json",
+        json.dumps(_workout("abc")),
+        "",
+        json.dumps(_workout(user, workout_date="yesterday")),
+        json.dumps(_workout(user, exercises=[{"sets": 3}])),
+        json.dumps(_workout(user, duration=45, exercises=[])),
+    ]
+    path, errors = tmp_path / "in.jsonl", tmp_path / "rejected.jsonl"
+    path.write_text("\n".join(lines) + "\n")
+
+    assert importer([str(path), "--errors", str(errors)]) == 1
+    rejected = [json.loads(line) for line in errors.read_text().splitlines()]
+    assert [item["index"] for item in rejected] == [1, 2, 3, 4]
+    assert "not valid JSON" in rejected[0]["error"]
+    assert "user_id" in rejected[1]["error"]
+    assert "workout_date" in rejected[2]["error"]
+    assert "no name" in rejected[3]["error"]
+    assert "Imported 2 workouts and 1 exercises" in capsys.readouterr().out
+    assert _user_workouts(be, user) == 2
+
+
+def test_csv_rows_group_by_workout_ref(be, importer, tmp_path, capsys):
+    user, other = add_users(be, 2)
+    path = tmp_path / "in.csv"
+    path.write_text(
+        "workout_ref,user_id,workout_date,duration_minutes,calories_burned,exercise_name,sets,reps,weight_kg\n"
+        f"a,{user},{DAY},30,200,Squat,3,5,100\n"
+        f"a,{user},{DAY},30,200,Bench Press,3,5,80\n"
+        f"b,{other},{DAY},20,,,,,\n"
+        f"c,{user},{DAY},25,150,Deadlift,three,5,120\n"
+    )
+    assert importer([str(path)]) == 1
+    out = capsys.readouterr().out
+    assert "Imported 2 workouts and 2 exercises" in out
+    assert "record 2: could not convert string to float: 'three'" in out
+    assert _user_workouts(be, user) == 1 and _user_workouts(be, other) == 1
+    details = be.get_workout_details(be.get_user_workouts(user)[0][0])
+    assert sorted(row[0] for row in details) == ["Bench Press", "Squat"]
+
+    path.write_text(
+        "user_id,workout_date,duration_minutes,calories_burned,exercise_name,sets,reps,weight_kg\n"
+        f"{other},{DAY},30,200,Squat,3,5,100\n"
+        f"{other},{DAY},30,200,Squat,3,5,100\n"
+    )
+    # Without workout_ref every row is a workout
+    assert importer([str(path)]) == 0
+    assert _user_workouts(be, other) == 3
+
+
+def test_refused_rows_fall_back_to_per_row_inserts(be, importer, tmp_path):
+    (user,) = add_users(be, 1)
+    unknown = user + 1000
+    records = [_workout(user), _workout(unknown), _workout(user), _workout(user), _workout(unknown)]
+    path, errors = tmp_path / "in.jsonl", tmp_path / "rejected.jsonl"
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+
+    # The first batch is refused as a whole and retried row by row; valid rows still commit
+    assert importer([str(path), "--batch-size", "3", "--errors", str(errors)]) == 1
+    rejected = [json.loads(line) for line in errors.read_text().splitlines()]
+    assert [item["index"] for item in rejected] == [1, 4]
+    assert all("foreign key" in item["error"].lower() for item in rejected)
+    assert _user_workouts(be, user) == 3
+    assert_matches_rebuild(be)
+
+    report = be.bulk_log_workouts(records[:1] * 4, batch_size=3)
+    assert (report['workouts_inserted'], report['exercises_inserted'], report['batches']) == (4, 4, 2)
+    assert report['rejected'] == []
@@ -0,0 +1,43 @@
+from datetime import date, timedelta
+
+import pytest
+
+import storage
+from support import add_users
+
+SQUAT = [{"name": "Squat", "sets": 3, "reps": 5, "weight": 100}]
+
+
+@pytest.fixture
+def pb(be):
+    """The page loaders of the engine under test."""
+    if not be._cache.enabled:
+        pytest.skip("read cache disabled")
+    return storage.bundles('sqlite' if be.__name__ == 'sqlite_backend' else 'postgres')
+
+
+def test_bundles_are_cached_until_a_write_drops_them(be, pb):
+    user, friend = add_users(be, 2)
+    assert be.log_workout(user, date.today(), 30, 200, SQUAT)
+    insights, history, social = pb.get_insights_bundle(user), pb.get_history_bundle(user), pb.get_social_bundle(user)
+    assert insights.stats.total_workouts == 1 and len(history.workouts) == 1 and not social.friends
+    assert pb.get_insights_bundle(user) is insights
+    assert pb.get_history_bundle(user) is history
+    assert pb.get_social_bundle(user) is social
+
+    assert be.log_workout(user, date.today(), 45, 300, SQUAT)
+    assert pb.get_insights_bundle(user).stats.total_workouts == 2
+    assert len(pb.get_history_bundle(user).workouts) == 2
+    be.add_friend(user, friend)
+    assert [f.user_id for f in pb.get_social_bundle(user).friends] == [friend]
+    assert [f.user_id for f in pb.get_social_bundle(friend).friends] == [user]
+
+
+def test_later_history_pages_skip_the_chart(be, pb):
+    (user,) = add_users(be, 1)
+    for offset in range(5):
+        assert be.log_workout(user, date.today() - timedelta(days=offset), 30, 200, [])
+    first = pb.get_history_bundle(user, page_size=3)
+    assert len(first.workouts) == 3 and first.series and first.next_cursor
+    second = pb.get_history_bundle(user, page_size=3, before=first.next_cursor)
+    assert len(second.workouts) == 2 and second.series == [] and second.next_cursor is None
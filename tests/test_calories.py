@@ -0,0 +1,69 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+import calories
+import config
+from support import add_users, assert_matches_rebuild, snapshot
+
+RUN = [{"name": "Running", "sets": 1, "reps": 1, "weight": None}]
+
+
+def _stored(be, workout_id):
+    """Returns (calories_burned, calories_estimated) as stored."""
+    with be.db_connection() as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT calories_burned, calories_estimated FROM workouts WHERE workout_id = {int(workout_id)};")
+        kcal, estimated = cur.fetchone()
+        conn.rollback()
+    return kcal, bool(estimated)
+
+
+def test_estimates_follow_met_duration_and_weight():
+    # 9.8 MET running and the 5.0 MET default, 30 minutes at 70 kg
+    assert calories.estimate_workouts([30, 30], [70, np.nan], [0], ["Running"]).tolist() == [360, 184]
+    # Sets weight the exercise mix: (3 * 5.0 + 1 * 2.5) / 4 MET
+    assert calories.estimate_workouts([60], [80], [0, 0], ["Squat", "Yoga"], [3, 1]).tolist() == [368]
+    assert calories.estimate_workouts([None], [70], [], []).tolist() == [0]
+
+
+def test_missing_calories_are_estimated_on_log(be):
+    (user,) = add_users(be, 1)
+    weight = 60
+    expected = calories.estimate_workouts([30], [weight], [0], ["Running"]).tolist()[0]
+    for logged in (0, None):
+        workout_id = be.log_workout(user, date.today(), 30, logged, RUN)
+        assert _stored(be, workout_id) == (expected, True)
+    # Nothing to estimate from without a duration
+    assert _stored(be, be.log_workout(user, date.today(), None, 0, RUN)) == (0, False)
+    assert be.get_user_dashboard_stats(user)['total_calories'] == 2 * expected
+    assert_matches_rebuild(be)
+
+
+def test_explicit_calories_are_kept(be):
+    (user,) = add_users(be, 1)
+    workout_id = be.log_workout(user, date.today(), 30, 250, RUN)
+    assert _stored(be, workout_id) == (250, False)
+    assert be.backfill_calories()['workouts'] == 0
+    assert _stored(be, workout_id) == (250, False)
+
+
+def test_backfill_runs_in_batches_and_only_once(be, monkeypatch):
+    user, other = add_users(be, 2)
+    monkeypatch.setitem(config.CALORIE_SETTINGS, "estimate_on_log", False)
+    missing = [be.log_workout(user, date.today() - timedelta(days=day), 20 + day, 0, RUN) for day in range(4)]
+    missing.append(be.log_workout(other, date.today(), 45, None, []))
+    kept = be.log_workout(other, date.today(), 45, 300, RUN)
+    assert [_stored(be, workout_id) for workout_id in missing] == [(0, False)] * 4 + [(None, False)]
+
+    report = be.backfill_calories(batch_size=2)
+    estimates = [_stored(be, workout_id) for workout_id in missing]
+    assert all(estimated for _, estimated in estimates)
+    assert report == {'workouts': 5, 'calories': sum(kcal for kcal, _ in estimates), 'batches': 3}
+    assert _stored(be, kept) == (300, False)
+    assert be.get_user_dashboard_stats(other)['total_calories'] == 300 + estimates[-1][0]
+    assert_matches_rebuild(be)
+
+    before = snapshot(be)
+    assert be.backfill_calories(batch_size=2) == {'workouts': 0, 'calories': 0, 'batches': 0}
+    assert [_stored(be, workout_id) for workout_id in missing] == estimates
+    assert snapshot(be) == before
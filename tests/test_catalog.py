@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+
+from support import add_users, assert_matches_rebuild, plain_value
+
+TODAY = date.today()
+
+
+def _bench(weight, reps=5):
+    return {"sets": 3, "reps": reps, "weight": weight}
+
+
+def _records(be, user_id):
+    return [tuple(plain_value(value) for value in row[:4]) for row in be.get_personal_records(user_id)]
+
+
+def test_names_are_interned_case_and_space_insensitively(be):
+    (user,) = add_users(be, 1)
+    assert be.log_workout(user, TODAY - timedelta(days=1), 30, 200, [{"name": "Bench Press", **_bench(80)}])
+    assert be.log_workout(user, TODAY, 30, 200, [{"name": "  bench   PRESS ", **_bench(85)}])
+    assert [(row[1], row[2]) for row in be.get_user_exercises(user)] == [("Bench Press", 2)]
+    history = be.get_exercise_history(user, "BENCH press")
+    assert [(row[1], row[5]) for row in history] == [(TODAY, 85), (TODAY - timedelta(days=1), 80)]
+    assert be.get_exercise_history(user, "Bench Press", limit=1) == history[:1]
+
+
+def test_merging_an_alias_moves_exercises_and_records(be):
+    user, other = add_users(be, 2)
+    assert be.log_workout(user, TODAY - timedelta(days=2), 30, 200, [{"name": "Bench Press", **_bench(90)}])
+    assert be.log_workout(user, TODAY - timedelta(days=1), 30, 200, [{"name": "BP", **_bench(100)}])
+    assert be.log_workout(other, TODAY, 30, 200, [{"name": "BP", **_bench(60)}])
+    assert {row[1] for row in be.get_user_exercises(user)} == {"Bench Press", "BP"}
+    assert len(_records(be, user)) == 2
+
+    assert be.add_exercise_alias("BP", "Bench Press")
+    (bench,) = be.get_user_exercises(user)
+    assert (bench[1], bench[2]) == ("Bench Press", 2)
+    assert _records(be, user) == [("Bench Press", 100.0, TODAY - timedelta(days=1), be.estimated_one_rep_max(100, 5))]
+    assert [row[0] for row in _records(be, other)] == ["Bench Press"]
+    # The alias now finds the merged history, and new logs under it land there too
+    assert len(be.get_exercise_history(user, "bp")) == 2
+    assert be.log_workout(user, TODAY, 30, 200, [{"name": "bp", **_bench(110)}])
+    assert [(row[1], row[2]) for row in be.get_user_exercises(user)] == [("Bench Press", 3)]
+    assert_matches_rebuild(be)
+
+
+def test_merging_reaches_archived_exercises(be):
+    (user,) = add_users(be, 1)
+    old = TODAY - timedelta(days=800)
+    assert be.log_workout(user, old, 30, 200, [{"name": "BP", **_bench(120)}])
+    assert be.log_workout(user, TODAY, 30, 200, [{"name": "Bench Press", **_bench(90)}])
+    assert be.archive_workouts(horizon_months=12)['workouts'] == 1
+
+    assert be.add_exercise_alias("BP", "Bench Press")
+    assert _records(be, user) == [("Bench Press", 120.0, old, be.estimated_one_rep_max(120, 5))]
+    assert_matches_rebuild(be)
+    assert be.restore_archived_workouts(user) == 1
+    assert len(be.get_exercise_history(user, "Bench Press")) == 2
+    assert_matches_rebuild(be)
+
+
+def test_bad_aliases_are_refused(be):
+    (user,) = add_users(be, 1)
+    assert be.log_workout(user, TODAY, 30, 200, [{"name": "Squat", **_bench(100)}])
+    assert not be.add_exercise_alias("Sq", "No such exercise")
+    assert not be.add_exercise_alias("   ", "Squat")
+    assert be.add_exercise_alias("Sq", "Squat")
+    assert len(be.get_exercise_history(user, "sq")) == 1
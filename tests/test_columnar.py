@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+import numpy as np
+
+from support import add_users, plain_value
+
+
+def _rows(frame):
+    # DataFrame rows as the tuples the list reads return (NaN -> None, dates as date)
+    return [
+        tuple(None if value is None or (isinstance(value, float) and np.isnan(value))
+              else value.date() if hasattr(value, "date") else value for value in row)
+        for row in frame.itertuples(index=False)
+    ]
+
+
+def test_frames_match_the_list_results(be):
+    user, friend = add_users(be, 2)
+    be.add_friend(user, friend)
+    today = date.today()
+    assert be.log_workout(user, today, None, 0, [{"name": "Bench Press", "sets": 3, "reps": 8, "weight": 62.5}])
+    assert be.log_workout(user, today - timedelta(days=3), 40, 350, [{"name": "Yoga", "sets": None, "reps": None}])
+    be.set_goal(user, "Ten, \"quoted\"", 10, today - timedelta(days=7), today + timedelta(days=7))
+
+    for read, args in [(be.get_user_workouts, (user,)), (be.get_user_friends, (user,)), (be.get_user_goals, (user,)),
+                       (be.get_goal_progress, (user,)), (be.get_workout_timeseries, (user, 'day'))]:
+        frame = read(*args, as_frame=True)
+        rows = read(*args)
+        assert len(frame) == len(rows) > 0, read.__name__
+        assert _rows(frame) == [tuple(plain_value(value) for value in row) for row in rows], read.__name__
+
+    details = be.get_workout_details(be.get_user_workouts(user)[0][0], as_frame=True)
+    assert details['weight_kg'].dtype == np.float64 and details['sets'].dtype == np.float64
+
+
+def test_empty_frames_keep_their_dtypes(be):
+    (user,) = add_users(be, 1)
+    frame = be.get_user_workouts(user, as_frame=True)
+    assert frame.empty and frame['workout_id'].dtype == np.int64
+    assert np.issubdtype(frame['workout_date'].dtype, np.datetime64)
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.closed or self.conn.server_gone:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for the pool."""
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = 0
+        self.server_gone = False
+        self.info = type("Info", (), {"transaction_status": psycopg2.extensions.TRANSACTION_STATUS_IDLE})()
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        self.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Every connection the pool opens, in order."""
+    connections = []
+
+    def connect(**kwargs):
+        connections.append(FakeConnection(len(connections)))
+        return connections[-1]
+
+    monkeypatch.setattr(db_pool.psycopg2, "connect", connect)
+    return connections
+
+
+def test_checkout_times_out_when_exhausted(opened):
+    pool = ConnectionPool(min_size=0, max_size=1, timeout=0.05)
+    conn = pool.getconn()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    assert time.monotonic() - started >= 0.05
+    assert (pool.stats()["timeouts"], pool.stats()["size"]) == (1, 1)
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert len(opened) == 1
+
+
+def test_waiter_gets_the_returned_connection(opened):
+    pool = ConnectionPool(min_size=1, max_size=1, timeout=5)
+    conn = pool.getconn()
+    releaser = threading.Timer(0.05, pool.putconn, (conn,))
+    releaser.start()
+    assert pool.getconn() is conn
+    releaser.join()
+    stats = pool.stats()
+    assert (stats["waits"], stats["timeouts"], stats["connections_created"]) == (1, 0, 1)
+    assert stats["wait_time_max"] > 0
+
+
+def test_connection_is_released_when_the_caller_raises(opened):
+    pool = ConnectionPool(min_size=0, max_size=1, timeout=0.05)
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE users SET name = name;")
+            raise ValueError("caller bug")
+    # Returned rolled back, and handed out again
+    assert conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    assert (pool.stats()["in_use"], pool.stats()["idle"]) == (0, 1)
+    with pool.connection() as again:
+        assert again is conn
+
+
+def test_broken_connections_are_discarded(opened):
+    pool = ConnectionPool(min_size=0, max_size=2, timeout=0.05)
+    # Lost mid-use: not returned to the pool
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.connection() as conn:
+            conn.close()
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+    with pytest.raises(psycopg2.InterfaceError):
+        with pool.connection() as conn:
+            raise psycopg2.InterfaceError("connection already closed")
+    stats = pool.stats()
+    assert (stats["size"], stats["idle"], stats["connections_discarded"]) == (0, 0, 2)
+
+    # Closed while idle: dropped at checkout
+    first = pool.getconn()
+    pool.putconn(first)
+    first.close()
+    assert pool.getconn() is opened[-1] is not first
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_stale_idle_connections_are_pinged(opened):
+    pool = ConnectionPool(min_size=2, max_size=2, timeout=0.05, check_idle_seconds=0)
+    dead, alive = opened
+    dead.server_gone = True
+    # The most recently returned connection is handed out first
+    assert pool.getconn() is alive
+    assert alive.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    replacement = pool.getconn()
+    assert replacement not in (dead, alive) and dead.closed
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_closed_pool_refuses_checkouts(opened):
+    pool = ConnectionPool(min_size=1, max_size=2)
+    conn = pool.getconn()
+    idle = pool.getconn()
+    pool.putconn(idle)
+    pool.closeall()
+    assert idle.closed and not conn.closed
+    with pytest.raises(psycopg2.pool.PoolError):
+        pool.getconn()
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()["size"] == 0
@@ -0,0 +1,79 @@
+import csv
+import random
+
+import pandas as pd
+import pytest
+
+import Backend_fft
+import bulk_export
+import bulk_import
+import config
+from support import add_users, log_random_workout, random_day
+
+
+def _rows(path):
+    """Exported rows without workout_ref (ids differ between databases), in a stable order."""
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [tuple(value for key, value in row.items() if key != "workout_ref") for row in csv.DictReader(f)]
+    return sorted(rows)
+
+
+def _seed(be):
+    rng = random.Random(18)
+    users = add_users(be, 3)
+    for _ in range(60):
+        log_random_workout(be, rng, rng.choice(users), random_day(rng))
+    assert be.log_workout(users[0], random_day(rng), 30, 200, [{"name": "Press, incline", "sets": 3, "reps": 8, "weight": 40}])
+    return users
+
+
+def _reopen(be, monkeypatch, path):
+    """Points the SQLite engine at a new, empty database file."""
+    monkeypatch.setitem(config.SQLITE_SETTINGS, "path", str(path))
+    monkeypatch.setattr(be, "_schema_ready", False)
+    be.close_pool()
+    be.clear_cache()
+    assert be.ensure_schema()
+
+
+def test_csv_export_imports_back(sqlite_be, monkeypatch, tmp_path):
+    monkeypatch.setattr(bulk_export, "be", sqlite_be)
+    monkeypatch.setattr(bulk_import, "be", sqlite_be)
+    _seed(sqlite_be)
+    exported = tmp_path / "export.csv"
+    assert bulk_export.main([str(exported)]) == 0
+
+    _reopen(sqlite_be, monkeypatch, tmp_path / "copy.db")
+    add_users(sqlite_be, 3)
+    assert bulk_import.main([str(exported), "--batch-size", "16"]) == 0
+    again = tmp_path / "again.csv"
+    assert bulk_export.main([str(again)]) == 0
+    assert _rows(again) == _rows(exported)
+    assert len(_rows(exported)) > 60
+
+
+def test_parquet_export_matches_csv(sqlite_be, monkeypatch, tmp_path):
+    monkeypatch.setattr(bulk_export, "be", sqlite_be)
+    users = _seed(sqlite_be)
+    csv_path, parquet_path = tmp_path / "user.csv", tmp_path / "user.parquet"
+    assert bulk_export.main([str(csv_path), "--user-id", str(users[0])]) == 0
+    assert bulk_export.main([str(parquet_path), "--user-id", str(users[0])]) == 0
+    from_csv = pd.read_csv(csv_path, parse_dates=["workout_date"])
+    from_parquet = pd.read_parquet(parquet_path)
+    assert set(from_csv["user_id"]) == {users[0]}
+    assert len(from_parquet) == len(from_csv)
+    pd.testing.assert_frame_equal(
+        from_parquet.astype(str).reset_index(drop=True), from_csv.astype(str).reset_index(drop=True),
+    )
+
+
+def test_parquet_needs_pyarrow(sqlite_be, monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(bulk_export, "be", sqlite_be)
+    monkeypatch.setattr(Backend_fft, "pa", None)
+    assert sqlite_be.available_export_formats() == ("csv",)
+    assert bulk_export.main([str(tmp_path / "out.parquet")]) == 1
+    assert "pip install pyarrow" in capsys.readouterr().err
+    with open(tmp_path / "out.parquet", "wb") as out, pytest.raises(RuntimeError):
+        sqlite_be.export_workouts(out, "parquet")
+    # CSV still works
+    assert bulk_export.main([str(tmp_path / "out.csv")]) == 0
@@ -0,0 +1,80 @@
+from datetime import date, datetime, timedelta, timezone
+
+import psycopg2
+
+import Backend_fft
+import config
+from support import add_users
+
+TODAY = date.today()
+
+
+def _log(be, user_id, minutes):
+    assert be.log_workout(user_id, TODAY, minutes, 100, [])
+
+
+def _age_snapshot(be, period_type='week'):
+    """Makes the current snapshot look an hour old, so the next read refreshes it."""
+    placeholder = "?" if be.__name__ == "sqlite_backend" else "%s"
+    with be.db_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            f"UPDATE global_leaderboard_refreshes SET refreshed_at = {placeholder} WHERE period_type = {placeholder};",
+            (datetime.now(timezone.utc) - timedelta(hours=1), period_type),
+        )
+        conn.commit()
+
+
+def test_ranks_share_ties(be):
+    a, b, c, idle = add_users(be, 4)
+    _log(be, a, 60)
+    _log(be, b, 40)
+    _log(be, b, 20)
+    _log(be, c, 30)
+    board = be.get_global_leaderboard('week', user_id=c)
+    assert board['top'] == [(1, "User 0", 60), (1, "User 1", 60), (3, "User 2", 30)]
+    assert (board['user_rank'], board['user_minutes'], board['ranked_users']) == (3, 30, 3)
+    assert board['period_start'] == Backend_fft._period_start('week', TODAY)
+    # Users without minutes are not ranked; a tie at the cut-off is kept whole
+    assert be.get_global_leaderboard('week', user_id=idle)['user_rank'] is None
+    assert [row[0] for row in be.get_global_leaderboard('week', limit=1)['top']] == [1, 1]
+    assert be.get_global_leaderboard('month', user_id=a)['user_rank'] == 1
+
+
+def test_new_logs_show_up_once_the_snapshot_is_refreshed(be):
+    a, b = add_users(be, 2)
+    _log(be, a, 30)
+    first = be.get_global_leaderboard('week', user_id=b)
+    assert (first['ranked_users'], first['user_rank']) == (1, None)
+
+    # A fresh snapshot is served as is until it is refreshed
+    _log(be, b, 45)
+    assert be.get_global_leaderboard('week', user_id=b)['user_rank'] is None
+    assert be.refresh_global_leaderboard('week') == 2
+    assert be.get_global_leaderboard('week', user_id=b)['top'] == [(1, "User 1", 45), (2, "User 0", 30)]
+
+    # A stale one is rebuilt by the next read
+    _log(be, a, 30)
+    _age_snapshot(be)
+    board = be.get_global_leaderboard('week', user_id=b)
+    assert board['top'] == [(1, "User 0", 60), (2, "User 1", 45)]
+    assert board['user_rank'] == 2
+    assert board['refreshed_at'] > datetime.now(timezone.utc) - timedelta(minutes=5)
+
+
+def test_stale_snapshot_is_served_while_another_session_refreshes(pg_be):
+    (user,) = add_users(pg_be, 1)
+    _log(pg_be, user, 30)
+    assert pg_be.get_global_leaderboard('week')['ranked_users'] == 1
+    _log(pg_be, user, 30)
+    _age_snapshot(pg_be)
+    key = f"week:{pg_be._period_start('week', TODAY)}"
+    other = psycopg2.connect(**config.DB_SETTINGS)
+    try:
+        with other.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(hashtext('global_leaderboard'), hashtext(%s));", (key,))
+            # The lock holder is refreshing; this reader does not wait and gets the old ranking
+            assert pg_be.get_global_leaderboard('week')['top'] == [(1, "User 0", 30)]
+            cur.execute("SELECT pg_advisory_unlock(hashtext('global_leaderboard'), hashtext(%s));", (key,))
+    finally:
+        other.close()
+    assert pg_be.get_global_leaderboard('week')['top'] == [(1, "User 0", 60)]
@@ -0,0 +1,140 @@
+import os
+import random
+from datetime import date, timedelta
+
+import psycopg2
+import pytest
+
+import Backend_fft
+import config
+import migrations
+from support import assert_matches_rebuild, snapshot
+
+TABLES = ("users", "friends", "workouts", "exercises", "goals")
+NAMES = ["Squat", "squat ", "Bench  Press", "Deadlift", "Running"]
+
+
+@pytest.fixture
+def baseline_db(monkeypatch):
+    """A new database next to FITNESS_TEST_DB_NAME, dropped afterwards."""
+    dbname = os.environ.get("FITNESS_TEST_DB_NAME")
+    if not dbname:
+        pytest.skip("FITNESS_TEST_DB_NAME is not set")
+    scratch = f"{dbname}_migrations"
+
+    def run(sql):
+        conn = psycopg2.connect(**dict(config.DB_SETTINGS, dbname=dbname))
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+        finally:
+            conn.close()
+
+    run(f"DROP DATABASE IF EXISTS {scratch};")
+    run(f"CREATE DATABASE {scratch};")
+    monkeypatch.setitem(config.DB_SETTINGS, "dbname", scratch)
+    Backend_fft.close_pool()
+    Backend_fft.clear_cache()
+    conn = psycopg2.connect(**config.DB_SETTINGS)
+    yield conn
+    conn.close()
+    Backend_fft.close_pool()
+    Backend_fft.clear_cache()
+    run(f"DROP DATABASE IF EXISTS {scratch};")
+
+
+def _seed_baseline(conn):
+    """Fills the schema as the old create_tables() left it."""
+    rng = random.Random(9)
+    today = date.today()
+    with conn.cursor() as cur:
+        for i in range(4):
+            cur.execute("INSERT INTO users (name, email, weight_kg) VALUES (%s, %s, %s);",
+                        (f"User {i}", f"user{i}@example.com", 60 + i))
+        cur.execute("INSERT INTO friends VALUES (1, 2), (2, 1), (3, 3);")
+        cur.execute("""
+            INSERT INTO goals (user_id, goal_description, target_value, start_date, end_date, status)
+            VALUES (1, 'Run 300 minutes', 300, CURRENT_DATE, CURRENT_DATE + 30, NULL),
+                   (2, 'Burn 5000 calories', 5000, CURRENT_DATE, CURRENT_DATE + 30, 'Active');
+        """)
+        for _ in range(40):
+            cur.execute(
+                "INSERT INTO workouts (user_id, workout_date, duration_minutes, calories_burned)"
+                " VALUES (%s, %s, %s, %s) RETURNING workout_id;",
+                (rng.randint(1, 3), today - timedelta(days=rng.randint(0, 500)), rng.choice([None, 30, 45]), 200),
+            )
+            workout_id = cur.fetchone()[0]
+            for _ in range(rng.randint(0, 3)):
+                cur.execute(
+                    "INSERT INTO exercises (workout_id, exercise_name, sets, reps, weight_kg) VALUES (%s, %s, %s, %s, %s);",
+                    (workout_id, rng.choice(NAMES), 3, rng.randint(1, 8), rng.choice([None, 60, 82.5])),
+                )
+    conn.commit()
+
+
+def _counts(conn):
+    with conn.cursor() as cur:
+        counts = {}
+        for table in TABLES:
+            cur.execute(f"SELECT COUNT(*) FROM {table};")
+            counts[table] = cur.fetchone()[0]
+        cur.execute("SELECT array_agg(workout_id ORDER BY workout_id) FROM workouts;")
+        counts["workout_ids"] = cur.fetchone()[0]
+    conn.commit()
+    return counts
+
+
+def test_migrating_a_baseline_keeps_its_rows(baseline_db, monkeypatch):
+    conn = baseline_db
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:1])
+        assert migrations.migrate(conn) == [1]
+    _seed_baseline(conn)
+    before = _counts(conn)
+
+    latest = migrations.MIGRATIONS[-1][0]
+    assert migrations.migrate(conn) == list(range(2, latest + 1))
+    after = _counts(conn)
+    # Migration 2 drops the one self-friendship; everything else, ids included, survives
+    assert after == dict(before, friends=before["friends"] - 1)
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE relname IN ('workouts', 'exercises');")
+        assert {row[0] for row in cur.fetchall()} == {"p"}
+        # Spellings are interned into one catalog entry each
+        cur.execute("SELECT name, normalized_name FROM exercise_catalog;")
+        catalog = dict(cur.fetchall())
+        assert set(catalog.values()) <= {"squat", "bench press", "deadlift", "running"}
+        assert catalog.get("Bench Press", "bench press") == "bench press"
+        cur.execute("SELECT goal_metric, status FROM goals ORDER BY goal_id;")
+        assert cur.fetchall() == [("minutes", "Active"), ("calories", "Active")]
+    conn.commit()
+
+    # The backfilled rollups, records and streaks agree with a rebuild
+    monkeypatch.setattr(Backend_fft, "_schema_ready", False)
+    assert Backend_fft.ensure_schema()
+    assert Backend_fft.get_pending_migrations() == []
+    assert_matches_rebuild(Backend_fft)
+    workout_id = Backend_fft.log_workout(1, date.today(), 30, 100, [{"name": "SQUAT", "sets": 1, "reps": 5, "weight": 100}])
+    assert workout_id > max(before["workout_ids"])
+
+
+def test_second_ensure_schema_is_a_no_op(baseline_db, monkeypatch):
+    conn = baseline_db
+    monkeypatch.setattr(Backend_fft, "_schema_ready", False)
+    assert Backend_fft.ensure_schema()
+    with conn.cursor() as cur:
+        cur.execute("SELECT version, applied_at FROM schema_version ORDER BY version;")
+        versions = cur.fetchall()
+    conn.commit()
+    assert [row[0] for row in versions] == [version for version, _, _ in migrations.MIGRATIONS]
+    state = snapshot(Backend_fft)
+
+    monkeypatch.setattr(Backend_fft, "_schema_ready", False)
+    assert Backend_fft.ensure_schema()
+    assert migrations.migrate(conn) == []
+    with conn.cursor() as cur:
+        cur.execute("SELECT version, applied_at FROM schema_version ORDER BY version;")
+        assert cur.fetchall() == versions
+    conn.commit()
+    assert snapshot(Backend_fft) == state
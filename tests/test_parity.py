@@ -0,0 +1,71 @@
+import dataclasses
+import random
+from datetime import date
+
+import storage
+from support import add_users, log_random_workout, plain_value, random_day, snapshot
+
+
+def _plain(value):
+    """Normalizes a read result (rows, dicts, dataclasses) for comparison across engines."""
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if hasattr(value, "__dataclass_fields__"):
+        return {name: _plain(getattr(value, name)) for name in value.__dataclass_fields__}
+    value = plain_value(value)
+    return round(value, 6) if isinstance(value, float) else value
+
+
+def _replay(be, seed):
+    """Runs the same seeded sequence of writes; returns the user ids."""
+    rng = random.Random(seed)
+    users = add_users(be, 5)
+    for user in users[1:]:
+        be.add_friend(users[0], user)
+    be.add_friend(users[1], users[2])
+    be.set_goal(users[0], "Ten sessions", 10, date.today().replace(day=1), date.today())
+    workout_ids = []
+    for _ in range(150):
+        if rng.random() < 0.8 or not workout_ids:
+            workout_ids.append(log_random_workout(be, rng, rng.choice(users), random_day(rng, days=400)))
+        else:
+            assert be.delete_workout(workout_ids.pop(rng.randrange(len(workout_ids))))
+    be.remove_friend(users[1], users[2])
+    return users
+
+
+def _reads(be, user_id):
+    pb = storage.bundles('sqlite' if be.__name__ == 'sqlite_backend' else 'postgres')
+    history = pb.get_history_bundle(user_id, page_size=5)
+    return {
+        'profile': be.get_user_profile(user_id),
+        'workouts': be.get_user_workouts(user_id),
+        'history_page': be.get_workout_history_page(user_id, page_size=5),
+        'exercises': be.get_user_exercises(user_id),
+        'friends': be.get_user_friends(user_id),
+        'suggestions': be.get_friend_suggestions(user_id),
+        'dashboard': be.get_user_dashboard_stats(user_id),
+        'records': be.get_personal_records(user_id),
+        'activity': be.get_activity_summary(user_id),
+        'weekly': be.get_workout_timeseries(user_id, 'week'),
+        'monthly': be.get_workout_timeseries(user_id, 'month'),
+        'leaderboard': be.get_weekly_leaderboard(user_id),
+        'goals': be.get_goal_progress(user_id),
+        'insights_bundle': pb.get_insights_bundle(user_id),
+        'history_bundle': history,
+        'next_history_bundle': pb.get_history_bundle(user_id, page_size=5, before=history.next_cursor),
+        # Each engine refreshes its own global leaderboard snapshot
+        'social_bundle': dataclasses.replace(pb.get_social_bundle(user_id), refreshed_at=None),
+    }
+
+
+def test_engines_agree_on_the_same_writes(sqlite_be, pg_be):
+    users = _replay(sqlite_be, 22)
+    assert _replay(pg_be, 22) == users
+    assert _plain(snapshot(sqlite_be)) == _plain(snapshot(pg_be))
+    for user_id in users:
+        lite, pg = _plain(_reads(sqlite_be, user_id)), _plain(_reads(pg_be, user_id))
+        for name in lite:
+            assert lite[name] == pg[name], (user_id, name)
@@ -0,0 +1,54 @@
+import random
+from datetime import date, timedelta
+
+from support import add_users, assert_matches_rebuild, log_random_workout, plain_value, random_day
+
+
+def _records(be, user_id):
+    return [tuple(plain_value(value) for value in row) for row in be.get_personal_records(user_id)]
+
+
+def test_deleting_the_best_workout_falls_back_to_the_next_best(be):
+    (user,) = add_users(be, 1)
+    first, second = date.today() - timedelta(days=10), date.today() - timedelta(days=5)
+    assert be.log_workout(user, first, 30, 200, [{"name": "Bench Press", "sets": 3, "reps": 5, "weight": 80}])
+    best = be.log_workout(user, second, 30, 200, [
+        {"name": "Bench Press", "sets": 1, "reps": 1, "weight": 100},
+        {"name": "Squat", "sets": 5, "reps": 5, "weight": 120},
+    ])
+    assert _records(be, user) == [
+        ("Squat", 120.0, second, be.estimated_one_rep_max(120, 5), second, 3000.0, second),
+        ("Bench Press", 100.0, second, 100.0, second, 1200.0, first),
+    ]
+
+    assert be.delete_workout(best)
+    # The Squat record is gone with its only workout; Bench Press falls back to the first one
+    assert _records(be, user) == [
+        ("Bench Press", 80.0, first, be.estimated_one_rep_max(80, 5), first, 1200.0, first),
+    ]
+    assert_matches_rebuild(be)
+
+
+def test_unweighted_sets_set_no_records(be):
+    (user,) = add_users(be, 1)
+    assert be.log_workout(user, date.today(), 30, 200, [{"name": "Running", "sets": 1, "reps": 1, "weight": None}])
+    assert be.log_workout(user, date.today(), 30, 200, [{"name": "Yoga", "sets": 2, "reps": 10, "weight": 0}])
+    assert _records(be, user) == []
+    assert_matches_rebuild(be)
+
+
+def test_random_log_delete_matches_rebuilt_records(be):
+    rng = random.Random(20)
+    users = add_users(be, 3)
+    workout_ids = []
+    for step in range(150):
+        if rng.random() < 0.65 or not workout_ids:
+            workout_ids.append(log_random_workout(be, rng, rng.choice(users), random_day(rng)))
+        else:
+            assert be.delete_workout(workout_ids.pop(rng.randrange(len(workout_ids))))
+        if step % 50 == 49:
+            assert_matches_rebuild(be)
+    reads = {user: _records(be, user) for user in users}
+    assert be.rebuild_personal_records() is not None
+    be.clear_cache()
+    assert {user: _records(be, user) for user in users} == reads
@@ -0,0 +1,61 @@
+import random
+from datetime import date, timedelta
+
+from support import add_users, assert_matches_rebuild, random_day, random_exercises, snapshot
+
+
+def test_dashboard_follows_logs_and_deletes(be):
+    (user,) = add_users(be, 1)
+    today = date.today()
+    old = today - timedelta(days=400)
+    shortest = be.log_workout(user, old, 10, 100, [])
+    longest = be.log_workout(user, old, 90, 700, [])
+    assert be.log_workout(user, today, 30, 200, [])
+    assert be.log_workout(user, today, None, 50, [])
+    stats = be.get_user_dashboard_stats(user)
+    assert (stats['total_workouts'], stats['total_minutes'], stats['total_calories']) == (4, 130, 1050)
+    assert (stats['min_duration'], stats['max_duration']) == (10, 90)
+    assert stats['avg_duration'] == 130 / 3
+    assert (stats['workouts_this_week'], stats['minutes_this_week'], stats['calories_this_week']) == (2, 30, 250)
+
+    # Removing the extremes makes the rollup look past them
+    assert be.delete_workout(shortest)
+    assert be.delete_workout(longest)
+    stats = be.get_user_dashboard_stats(user)
+    assert (stats['total_workouts'], stats['total_minutes'], stats['total_calories']) == (2, 30, 250)
+    assert (stats['min_duration'], stats['max_duration'], stats['avg_duration']) == (30, 30, 30)
+    assert_matches_rebuild(be)
+
+
+def test_deleting_the_only_workout_leaves_no_rollup_rows(be):
+    user, other, idle = add_users(be, 3)
+    only = be.log_workout(user, date.today(), 30, 200, [])
+    assert be.log_workout(other, date.today(), 20, 100, [])
+    assert be.delete_workout(only)
+    assert be.check_rollups() == []
+    # The same as a user who never logged anything
+    assert be.get_user_dashboard_stats(user) == be.get_user_dashboard_stats(idle)
+    assert_matches_rebuild(be)
+    rollups = snapshot(be)
+    assert [row[0] for row in rollups['user_workout_rollups']] == [other]
+    assert {row[0] for row in rollups['user_period_rollups']} == {other}
+
+
+def test_bulk_loads_and_deletes_match_a_rebuild(be):
+    rng = random.Random(3)
+    users = add_users(be, 4)
+    records = [
+        {"user_id": rng.choice(users), "workout_date": random_day(rng), "duration": rng.choice([None, rng.randint(5, 120)]),
+         "calories": rng.randint(0, 900), "exercises": random_exercises(rng)}
+        for _ in range(200)
+    ]
+    report = be.bulk_log_workouts(records, batch_size=64)
+    assert (report['workouts_inserted'], report['rejected'], report['batches']) == (200, [], 4)
+    assert_matches_rebuild(be)
+
+    for user in users[:2]:
+        for row in be.get_user_workouts(user)[::2]:
+            assert be.delete_workout(row[0])
+    assert_matches_rebuild(be)
+    assert be.rebuild_rollups(users[0])
+    assert be.check_rollups() == []
@@ -0,0 +1,21 @@
+from support import add_users
+
+
+def _suggested(be, user_id):
+    return [row[0] for row in be.get_friend_suggestions(user_id)]
+
+
+def test_suggestions_follow_friendships_of_friends(be):
+    alice, bob, carol, dave = add_users(be, 4)
+    be.add_friend(alice, bob)
+    assert _suggested(be, alice) == [] and _suggested(be, carol) == []
+    # Cached for alice, but bob's new friend is now a friend of a friend
+    be.add_friend(bob, carol)
+    assert _suggested(be, alice) == [carol]
+    assert _suggested(be, carol) == [alice]
+    be.add_friend(carol, dave)
+    assert _suggested(be, bob) == [dave]
+    be.remove_friend(bob, carol)
+    assert _suggested(be, alice) == []
+    assert _suggested(be, dave) == []
+    assert _suggested(be, bob) == []
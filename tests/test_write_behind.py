@@ -0,0 +1,68 @@
+import logging
+from datetime import date
+
+import pytest
+
+import config
+from support import add_users, assert_matches_rebuild
+from write_behind import WriteBehindQueue
+
+SQUAT = [{"name": "Squat", "sets": 3, "reps": 5, "weight": 100}]
+
+
+@pytest.fixture
+def writer(be, monkeypatch):
+    """Turns write-behind on for the engine under test, with a fresh queue that only writes on flush."""
+    monkeypatch.setitem(config.WRITE_BEHIND_SETTINGS, "enabled", True)
+    monkeypatch.setitem(config.WRITE_BEHIND_SETTINGS, "batch_size", 50)
+    monkeypatch.setitem(config.WRITE_BEHIND_SETTINGS, "flush_interval", 60.0)
+    monkeypatch.setattr(be, "_writer", type(be._writer)(be))
+    yield be._writer
+    be._writer.flush(5)
+
+
+def test_queued_workouts_are_written_on_flush(be, writer):
+    user, other = add_users(be, 2)
+    assert be.get_user_workouts(user) == []
+    ids = [be.log_workout(user, date.today(), 30, 200, SQUAT) for _ in range(3)]
+    ids.append(be.log_workout(other, date.today(), 45, 300, []))
+    assert len(set(ids)) == 4
+    assert be.get_write_queue_stats()["depth"] == 4
+    assert be.get_user_workouts(user) == []
+
+    assert be.flush_workout_writes(5)
+    assert sorted(row[0] for row in be.get_user_workouts(user)) == sorted(ids[:3])
+    assert be.get_user_dashboard_stats(user)['total_workouts'] == 3
+    stats = be.get_write_queue_stats()
+    assert (stats["written"], stats["failed"], stats["depth"]) == (4, 0, 0)
+    assert_matches_rebuild(be)
+
+
+def test_refused_workout_fails_the_flush_but_not_its_batch(be, writer, caplog):
+    (user,) = add_users(be, 1)
+    good = be.log_workout(user, date.today(), 30, 200, SQUAT)
+    refused = be.log_workout(user + 1000, date.today(), 30, 200, SQUAT)
+    with caplog.at_level(logging.ERROR):
+        assert not be.flush_workout_writes(5)
+    assert f"Queued workout {refused} was not saved" in caplog.text
+    assert [row[0] for row in be.get_user_workouts(user)] == [good]
+    assert be.get_write_queue_stats()["failed"] == 1
+    # Later flushes only report their own failures
+    assert be.log_workout(user, date.today(), 30, 200, [])
+    assert be.flush_workout_writes(5)
+    assert_matches_rebuild(be)
+
+
+def test_failing_batch_is_logged_and_counted(caplog):
+    def write_batch(items):
+        raise RuntimeError("database is down")
+
+    queue = WriteBehindQueue(write_batch, batch_size=10, flush_interval=60.0)
+    for item in range(3):
+        queue.put(item)
+    with caplog.at_level(logging.ERROR, logger="fitness.write_behind"):
+        assert not queue.flush(5)
+    assert "Write-behind batch of 3 items failed" in caplog.text
+    stats = queue.stats()
+    assert (stats["written"], stats["failed"], stats["depth"]) == (0, 3, 0)
+    assert queue.shutdown(5)
@@ -0,0 +1,184 @@
+# write_behind.py
+
+import logging
+import threading
+import time
+from collections import deque
+
+import instrumentation
+from instrumentation import BATCH_BUCKETS, metrics
+
+logger = logging.getLogger("fitness.write_behind")
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the queue stays full for longer than the put timeout."""
+
+
+class WriteBehindQueue:
+    """A bounded in-process queue drained by a background writer thread.
+
+    ``put`` returns as soon as the item is queued. The writer thread hands
+    ``write_batch`` up to ``batch_size`` items at a time, so many callers share
+    one transaction; write_batch may return how many of them it had to drop.
+    A batch is written once it is full, once its oldest item has waited
+    ``flush_interval`` seconds, or as soon as someone calls ``flush``. When
+    the queue holds ``max_size`` items, ``put`` blocks (up to ``put_timeout``
+    seconds, then raises QueueFullError) until the writer catches up, so a
+    burst cannot grow memory without bound. ``shutdown`` writes everything
+    still queued before the thread exits.
+    """
+
+    def __init__(self, write_batch, max_size=10000, batch_size=500, flush_interval=0.05, put_timeout=5.0):
+        if max_size < 1 or batch_size < 1:
+            raise ValueError("max_size and batch_size must be at least 1")
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._write_batch = write_batch
+
+        self._cond = threading.Condition()
+        self._items = deque()  # (item, enqueued_at) pairs, oldest on the left
+        self._in_flight = 0    # items handed to write_batch and not yet finished
+        self._flush_waiters = 0
+        self._closed = False
+        self._thread = None
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "failed": 0,
+            "batches": 0,
+            "full_waits": 0,
+            "rejected": 0,
+            "commit_time_total": 0.0,
+            "commit_time_max": 0.0,
+        }
+
+    # --- Producers ---
+
+    def put(self, item):
+        """Queues an item, waiting for room while the queue is full."""
+        deadline = time.monotonic() + self.put_timeout
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("The write-behind queue has been shut down")
+            if len(self._items) >= self.max_size:
+                self._stats["full_waits"] += 1
+                self._count("fitness_write_queue_full_total")
+            while len(self._items) >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["rejected"] += 1
+                    self._count("fitness_write_queue_rejected_total")
+                    raise QueueFullError(
+                        f"Write-behind queue still full ({self.max_size} items) after {self.put_timeout}s"
+                    )
+                self._cond.wait(remaining)
+                if self._closed:
+                    raise RuntimeError("The write-behind queue has been shut down")
+            self._items.append((item, time.monotonic()))
+            self._stats["enqueued"] += 1
+            self._record_depth()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+            if len(self._items) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Writes everything queued so far without waiting for the flush interval.
+
+        Returns True once the queue is empty and every item taken from it has
+        been written, False if that takes longer than `timeout` seconds or if a
+        batch failed in the meantime (see the writer's log for the error).
+        """
+        with self._cond:
+            failed_before = self._stats["failed"]
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                drained = self._cond.wait_for(lambda: not self._items and not self._in_flight, timeout)
+            finally:
+                self._flush_waiters -= 1
+            return drained and self._stats["failed"] == failed_before
+
+    def shutdown(self, timeout=None):
+        """Stops accepting items, writes the ones still queued and stops the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        flushed = self.flush(timeout)
+        if thread is not None:
+            thread.join(timeout)
+        return flushed
+
+    def stats(self):
+        """Returns queue depth, throughput and commit latency counters."""
+        with self._cond:
+            stats = dict(self._stats, depth=len(self._items), in_flight=self._in_flight,
+                         max_size=self.max_size, closed=self._closed)
+        stats["commit_time_avg"] = stats["commit_time_total"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    # --- Writer Thread ---
+
+    def _next_batch(self):
+        # Waits until a batch is due, then takes it off the queue (None = shut down and drained)
+        with self._cond:
+            while not self._items:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            due = self._items[0][1] + self.flush_interval
+            while len(self._items) < self.batch_size and not self._flush_waiters and not self._closed:
+                remaining = due - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [self._items.popleft() for _ in range(min(self.batch_size, len(self._items)))]
+            self._in_flight = len(batch)
+            self._record_depth()
+            # Producers blocked on a full queue can go ahead
+            self._cond.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.monotonic()
+            try:
+                failed = self._write_batch([item for item, _ in batch]) or 0
+            except Exception:
+                logger.exception("Write-behind batch of %d items failed", len(batch))
+                failed = len(batch)
+            finished = time.monotonic()
+            elapsed = finished - started
+            with self._cond:
+                self._in_flight = 0
+                self._stats["batches"] += 1
+                self._stats["written"] += len(batch) - failed
+                self._stats["failed"] += failed
+                self._stats["commit_time_total"] += elapsed
+                self._stats["commit_time_max"] = max(self._stats["commit_time_max"], elapsed)
+                self._cond.notify_all()
+            if instrumentation.SETTINGS["enabled"]:
+                metrics.observe("fitness_write_batch_size", len(batch), buckets=BATCH_BUCKETS)
+                metrics.observe("fitness_write_commit_seconds", elapsed)
+                for _, enqueued_at in batch:
+                    metrics.observe("fitness_write_delay_seconds", finished - enqueued_at)
+                if failed:
+                    metrics.inc("fitness_write_failed_total", amount=failed)
+
+    # --- Metrics ---
+
+    def _record_depth(self):
+        if instrumentation.SETTINGS["enabled"]:
+            metrics.set("fitness_write_queue_depth", len(self._items))
+
+    def _count(self, name):
+        if instrumentation.SETTINGS["enabled"]:
+            metrics.inc(name)